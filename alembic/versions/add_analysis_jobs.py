@@ -0,0 +1,72 @@
+"""add_analysis_jobs
+
+Revision ID: 8b6e1f0c2d47
+Revises: 3f2a9c4d8e51
+Create Date: 2026-10-17 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b6e1f0c2d47'
+down_revision = '3f2a9c4d8e51'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Base.metadata.create_all may already have created the tables on startup
+    inspector = sa.inspect(op.get_bind())
+
+    if not inspector.has_table('analysis_jobs'):
+        op.create_table(
+            'analysis_jobs',
+            sa.Column('job_id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('status', sa.String(), nullable=False),
+            sa.Column('model', sa.String(), nullable=True),
+            sa.Column('force', sa.Boolean(), nullable=True),
+            sa.Column('total_items', sa.Integer(), nullable=False),
+            sa.Column('completed_items', sa.Integer(), nullable=False),
+            sa.Column('failed_items', sa.Integer(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('updated_at', sa.DateTime(), nullable=True),
+            sa.Column('started_at', sa.DateTime(), nullable=True),
+            sa.Column('finished_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['user_id'], ['users.user_id']),
+            sa.PrimaryKeyConstraint('job_id')
+        )
+        op.create_index(op.f('ix_analysis_jobs_job_id'), 'analysis_jobs', ['job_id'], unique=False)
+        op.create_index(op.f('ix_analysis_jobs_user_id'), 'analysis_jobs', ['user_id'], unique=False)
+
+    if not inspector.has_table('analysis_job_items'):
+        op.create_table(
+            'analysis_job_items',
+            sa.Column('item_id', sa.Integer(), nullable=False),
+            sa.Column('job_id', sa.Integer(), nullable=False),
+            sa.Column('entry_id', sa.Integer(), nullable=False),
+            sa.Column('analysis_type', sa.String(), nullable=False),
+            sa.Column('status', sa.String(), nullable=False),
+            sa.Column('attempts', sa.Integer(), nullable=False),
+            sa.Column('error', sa.Text(), nullable=True),
+            sa.Column('available_at', sa.DateTime(), nullable=True),
+            sa.Column('updated_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['job_id'], ['analysis_jobs.job_id'], ondelete='CASCADE'),
+            sa.ForeignKeyConstraint(['entry_id'], ['entries.entry_id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('item_id')
+        )
+        op.create_index(op.f('ix_analysis_job_items_item_id'), 'analysis_job_items', ['item_id'], unique=False)
+        op.create_index(op.f('ix_analysis_job_items_job_id'), 'analysis_job_items', ['job_id'], unique=False)
+        op.create_index('ix_analysis_job_items_status_available', 'analysis_job_items', ['status', 'available_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_analysis_job_items_status_available', table_name='analysis_job_items')
+    op.drop_index(op.f('ix_analysis_job_items_job_id'), table_name='analysis_job_items')
+    op.drop_index(op.f('ix_analysis_job_items_item_id'), table_name='analysis_job_items')
+    op.drop_table('analysis_job_items')
+    op.drop_index(op.f('ix_analysis_jobs_user_id'), table_name='analysis_jobs')
+    op.drop_index(op.f('ix_analysis_jobs_job_id'), table_name='analysis_jobs')
+    op.drop_table('analysis_jobs')
@@ -0,0 +1,46 @@
+"""add_entry_analyses
+
+Revision ID: 3f2a9c4d8e51
+Revises: 7caa9d81e9b3
+Create Date: 2026-10-17 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f2a9c4d8e51'
+down_revision = '7caa9d81e9b3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Base.metadata.create_all may already have created the table on startup
+    if sa.inspect(op.get_bind()).has_table('entry_analyses'):
+        return
+
+    op.create_table(
+        'entry_analyses',
+        sa.Column('analysis_id', sa.Integer(), nullable=False),
+        sa.Column('entry_id', sa.Integer(), nullable=False),
+        sa.Column('analysis_type', sa.String(), nullable=False),
+        sa.Column('think', sa.Text(), nullable=True),
+        sa.Column('answer', sa.Text(), nullable=False),
+        sa.Column('raw_content', sa.Text(), nullable=False),
+        sa.Column('model', sa.String(), nullable=True),
+        sa.Column('prompt_version', sa.String(), nullable=False),
+        sa.Column('content_hash', sa.String(length=64), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['entry_id'], ['entries.entry_id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('analysis_id'),
+        sa.UniqueConstraint('entry_id', 'analysis_type', name='uq_entry_analyses_entry_type')
+    )
+    op.create_index(op.f('ix_entry_analyses_analysis_id'), 'entry_analyses', ['analysis_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_entry_analyses_analysis_id'), table_name='entry_analyses')
+    op.drop_table('entry_analyses')
@@ -0,0 +1,56 @@
+"""add_entry_embeddings
+
+Revision ID: b7e2f4a91c06
+Revises: 9d4c6b2f1a38
+Create Date: 2026-10-17 18:00:00.000000
+
+"""
+import os
+
+from alembic import op
+import sqlalchemy as sa
+from pgvector.sqlalchemy import Vector
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e2f4a91c06'
+down_revision = '9d4c6b2f1a38'
+branch_labels = None
+depends_on = None
+
+
+# Must match app.models.ENTRY_EMBEDDING_DIMENSIONS
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", "768"))
+
+
+def upgrade():
+    is_postgresql = op.get_bind().dialect.name == 'postgresql'
+    if is_postgresql:
+        op.execute("CREATE EXTENSION IF NOT EXISTS vector")
+
+    # Base.metadata.create_all may already have created the table on startup
+    if not sa.inspect(op.get_bind()).has_table('entry_embeddings'):
+        op.create_table(
+            'entry_embeddings',
+            sa.Column('entry_id', sa.Integer(), nullable=False),
+            sa.Column('model', sa.String(), nullable=False),
+            sa.Column('content_hash', sa.String(length=64), nullable=False),
+            sa.Column('embedding', Vector(EMBEDDING_DIMENSIONS), nullable=False),
+            sa.Column('updated_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['entry_id'], ['entries.entry_id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('entry_id')
+        )
+
+    if is_postgresql:
+        op.create_index(
+            'ix_entry_embeddings_embedding_hnsw', 'entry_embeddings', ['embedding'],
+            unique=False, if_not_exists=True,
+            postgresql_using='hnsw',
+            postgresql_with={'m': 16, 'ef_construction': 64},
+            postgresql_ops={'embedding': 'vector_cosine_ops'}
+        )
+
+
+def downgrade():
+    op.drop_index('ix_entry_embeddings_embedding_hnsw', table_name='entry_embeddings', if_exists=True)
+    op.drop_table('entry_embeddings')
@@ -0,0 +1,47 @@
+"""add_entry_search_vector
+
+Revision ID: 9d4c6b2f1a38
+Revises: 5e8b3d1a7c92
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+import os
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '9d4c6b2f1a38'
+down_revision = '5e8b3d1a7c92'
+branch_labels = None
+depends_on = None
+
+
+# Must match app.models.ENTRY_SEARCH_DOCUMENT, which search queries are ranked against
+SEARCH_TEXT_CONFIG = os.getenv("SEARCH_TEXT_CONFIG", "simple")
+SEARCH_DOCUMENT = (
+    f"setweight(to_tsvector('{SEARCH_TEXT_CONFIG}', coalesce(title, '')), 'A') || "
+    f"setweight(to_tsvector('{SEARCH_TEXT_CONFIG}', coalesce(content, '')), 'B')"
+)
+
+
+def upgrade():
+    # Full-text search needs Postgres tsvector support
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    # Stored generated column: Postgres keeps it in sync with title/content on every write
+    op.execute(
+        "ALTER TABLE entries ADD COLUMN IF NOT EXISTS search_vector tsvector "
+        f"GENERATED ALWAYS AS ({SEARCH_DOCUMENT}) STORED"
+    )
+    op.create_index(
+        'ix_entries_search_vector', 'entries', ['search_vector'],
+        unique=False, postgresql_using='gin', if_not_exists=True
+    )
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.drop_index('ix_entries_search_vector', table_name='entries', if_exists=True)
+    op.execute("ALTER TABLE entries DROP COLUMN IF EXISTS search_vector")
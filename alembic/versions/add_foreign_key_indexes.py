@@ -0,0 +1,29 @@
+"""add_foreign_key_indexes
+
+Revision ID: 5e8b3d1a7c92
+Revises: c4d7a2e9f013
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '5e8b3d1a7c92'
+down_revision = 'c4d7a2e9f013'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Foreign keys used for joins and child lookups; entries(user_id, ...) and
+    # topics(user_id, ...) are covered by the composite keyset indexes
+    op.create_index('ix_files_entry_id', 'files', ['entry_id'], unique=False, if_not_exists=True)
+    op.create_index('ix_links_entry_id', 'links', ['entry_id'], unique=False, if_not_exists=True)
+    op.create_index('ix_entry_tags_tag_id', 'entry_tags', ['tag_id'], unique=False, if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index('ix_entry_tags_tag_id', table_name='entry_tags', if_exists=True)
+    op.drop_index('ix_links_entry_id', table_name='links', if_exists=True)
+    op.drop_index('ix_files_entry_id', table_name='files', if_exists=True)
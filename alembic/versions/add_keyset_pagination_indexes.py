@@ -0,0 +1,30 @@
+"""add_keyset_pagination_indexes
+
+Revision ID: c4d7a2e9f013
+Revises: 8b6e1f0c2d47
+Create Date: 2026-10-17 13:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4d7a2e9f013'
+down_revision = '8b6e1f0c2d47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Composite indexes matching the keyset sort orders used by the listing endpoints
+    op.create_index('ix_entries_user_date_id', 'entries', ['user_id', 'entry_date', 'entry_id'], unique=False, if_not_exists=True)
+    op.create_index('ix_entries_topic_user_date_id', 'entries', ['topic_id', 'user_id', 'entry_date', 'entry_id'], unique=False, if_not_exists=True)
+    op.create_index('ix_topics_user_created_id', 'topics', ['user_id', 'created_at', 'topic_id'], unique=False, if_not_exists=True)
+    op.create_index('ix_files_uploaded_id', 'files', ['uploaded_at', 'file_id'], unique=False, if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index('ix_files_uploaded_id', table_name='files', if_exists=True)
+    op.drop_index('ix_topics_user_created_id', table_name='topics', if_exists=True)
+    op.drop_index('ix_entries_topic_user_date_id', table_name='entries', if_exists=True)
+    op.drop_index('ix_entries_user_date_id', table_name='entries', if_exists=True)
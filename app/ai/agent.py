@@ -1,6 +1,11 @@
+import asyncio
 import logging
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Sequence, Tuple
 import os
+import hashlib
+import threading
+import time
+from collections import OrderedDict
 # Import từ lm_studio
 from app.ai.lm_studio import (
     get_chatopen_ai_instance,
@@ -9,12 +14,15 @@ from app.ai.lm_studio import (
     DEFAULT_MAX_TOKENS,
     AI_MODEL,
     query_lm_studio_stream,
+    record_cancelled_generation,
     create_ai_request,
     AIRequest,
     AIMessage
 )
 # Import prompt manager
 from app.ai.prompt_manager import get_prompt_manager, get_system_prompt, get_sql_prompt
+from app.ai import prompt_budget, schema_selector
+from app.ai.stream_events import Error, Thinking, Token, ToolEnd, ToolStart
 
 # Thiết lập logger
 logger = logging.getLogger(__name__)
@@ -23,7 +31,6 @@ logger = logging.getLogger(__name__)
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables import RunnableConfig
-from langchain_core.callbacks.manager import CallbackManager
 from langchain_core.callbacks.streaming_stdout import StreamingStdOutCallbackHandler
 from langchain.agents import AgentExecutor, create_openai_functions_agent
 from langchain_core.tools import Tool
@@ -33,7 +40,16 @@ from langchain_core.callbacks.base import BaseCallbackHandler
 from langchain_core.messages import SystemMessage, HumanMessage
 
 # Import Tools
-from app.ai.sql_tool import SQLTool
+from app.ai.sql_tool import get_sql_tool
+
+
+class AgentTemplate:
+    """Immutable, shareable parts of an agent: system prompt, tools and runnable graph"""
+    def __init__(self, system_prompt: str, tools: List[Tool], agent: Any):
+        self.system_prompt = system_prompt
+        self.tools = tools
+        self.agent = agent
+        self.created_at = time.time()
 
 
 class LangChainAgent:
@@ -44,28 +60,55 @@ class LangChainAgent:
         temperature: float = DEFAULT_TEMPERATURE,
         max_tokens: int = DEFAULT_MAX_TOKENS,
         tools: Optional[List[Tool]] = None,
-        system_prompt: Optional[str] = None
+        system_prompt: Optional[str] = None,
+        template: Optional[AgentTemplate] = None,
+        schema_tables: Optional[Sequence[str]] = None
     ):
         self.model_name = model_name
         self.temperature = temperature
         self.max_tokens = max_tokens
-        self.tools = tools or []
-          # Escape curly braces in system_prompt
-        self.system_prompt = system_prompt or get_system_prompt("default_chat")
-        self.system_prompt = self.system_prompt.replace("{", "{{").replace("}", "}}")
+        # Tables described in the SQL prompt; None selects them without a question
+        self.schema_tables = schema_tables
         
-        # Log system_prompt to debug
-        logger.debug(f"System prompt content: {self.system_prompt[:500]}...")
+        # Build the prompt, tools and runnable graph unless a pre-built template is reused
+        self.template = template or self._build_template(tools, system_prompt)
+        self.system_prompt = self.template.system_prompt
+        self.tools = self.template.tools
+        self.agent = self.template.agent
         
-        # Initialize memory
+        # Initialize per-request memory
         self.memory = ConversationBufferMemory(
             memory_key="chat_history",
             return_messages=True
         )
         
-        # Initialize tools list if None
-        if self.tools is None:
-            self.tools = []
+        # Initialize streaming callback handler
+        self.streaming_handler = AgentStreamingCallbackHandler()
+        
+        try:
+            # Create agent executor with callback manager
+            self.agent_executor = AgentExecutor(
+                agent=self.agent,
+                tools=self.tools,
+                memory=self.memory,
+                verbose=False,
+                handle_parsing_errors=True,
+                callbacks=[self.streaming_handler]  # Add the streaming callback
+            )
+        except Exception as e:
+            logger.error(f"Error initializing agent: {e}")
+            logger.exception(e)
+            raise
+
+    def _build_template(self, tools: Optional[List[Tool]], system_prompt: Optional[str]) -> AgentTemplate:
+        """Build the system prompt, tool list and agent runnable"""
+        self.tools = list(tools or [])
+        # Escape curly braces in system_prompt
+        self.system_prompt = system_prompt or get_system_prompt("default_chat")
+        self.system_prompt = self.system_prompt.replace("{", "{{").replace("}", "}}")
+        
+        # Log system_prompt to debug
+        logger.debug(f"System prompt content: {self.system_prompt[:500]}...")
         
         # Always try to add SQL tools
         self.__add__postgre_sql_tool()  # Add PostgreSQL tool if available
@@ -80,9 +123,6 @@ class LangChainAgent:
             max_tokens=self.max_tokens
         )
         
-        # Initialize streaming callback handler
-        self.streaming_handler = AgentStreamingCallbackHandler()
-        
         try:
             # Create prompt template with agent_scratchpad
             prompt = ChatPromptTemplate.from_messages([
@@ -93,26 +133,17 @@ class LangChainAgent:
             ])
             
             # Create the agent with tools
-            self.agent = create_openai_functions_agent(
+            agent = create_openai_functions_agent(
                 llm=llm,
                 tools=self.tools,
                 prompt=prompt
             )
-            
-            # Create agent executor with callback manager
-            callback_manager = CallbackManager([self.streaming_handler])
-            self.agent_executor = AgentExecutor(
-                agent=self.agent,
-                tools=self.tools,
-                memory=self.memory,
-                verbose=False,
-                handle_parsing_errors=True,
-                callbacks=[self.streaming_handler]  # Add the streaming callback
-            )
         except Exception as e:
             logger.error(f"Error initializing agent: {e}")
             logger.exception(e)
             raise
+        
+        return AgentTemplate(self.system_prompt, self.tools, agent)
 
     def query(self, query_text: str) -> Dict[str, Any]:
         """Process a user query and return results"""
@@ -140,26 +171,37 @@ class LangChainAgent:
             database_url = os.getenv("DATABASE_URL")
             if database_url:
                 logger.info("Adding SQL tools to agent")
-                sql_tool = SQLTool(database_url)
+                sql_tool = get_sql_tool(database_url)
                 
                 # Get schema and add to system prompt
                 schema_result = sql_tool.get_database_schema()
                 if schema_result.get("success", False):
-                    # Format schema as text
-                    schema_text = schema_result.get("schema", "")
+                    # Describe only the relevant tables, within the schema token budget
+                    tables = schema_result.get("tables", [])
+                    selected = self.schema_tables
+                    if selected is None:
+                        selected = schema_selector.select_tables(tables)
+                    schema_text = schema_selector.render_schema(tables, selected)
                     sql_prompt = self._get_sql_prompt(schema_text)
                     self.system_prompt += sql_prompt
                     
                     # Add few-shot learning examples
                     try:
-                        few_shot_examples = sql_tool.generate_learning_prompt_addition()
+                        few_shot_examples = prompt_budget.truncate_to_tokens(
+                            sql_tool.generate_learning_prompt_addition() or "",
+                            prompt_budget.PROMPT_EXAMPLES_TOKENS
+                        )
                         if few_shot_examples:
                             self.system_prompt += few_shot_examples
                             logger.info("Added few-shot learning examples to system prompt")
                     except Exception as few_shot_error:
                         logger.warning(f"Could not add few-shot examples: {few_shot_error}")
                     
-                    logger.info("Added database schema to system prompt")
+                    logger.info(
+                        f"Added database schema to system prompt "
+                        f"({prompt_budget.count_tokens(sql_prompt)} schema tokens, "
+                        f"{prompt_budget.count_tokens(self.system_prompt)} system prompt tokens)"
+                    )
                 else:
                     logger.warning(f"Could not get database schema: {schema_result.get('error', 'Unknown error')}")
                     # Add basic SQL prompt
@@ -328,7 +370,7 @@ Remember: Your goal is to help users get actionable insights from their data by
                                 # In the future, we could implement character-by-character streaming
                                 remaining_content = full_output[len(collected_content):]
                                 if remaining_content:
-                                    yield remaining_content
+                                    yield Token(remaining_content)
                                     collected_content = full_output
                         elif "actions" in chunk:
                             # Agent is planning actions
@@ -336,32 +378,30 @@ Remember: Your goal is to help users get actionable insights from their data by
                             if actions:
                                 for action in actions:
                                     if hasattr(action, 'log') and action.log:
-                                        thinking_msg = f"🤔 Thinking: {action.log}"
-                                        yield thinking_msg
+                                        yield Thinking(f"🤔 Thinking: {action.log}")
                         elif "steps" in chunk:
                             # Agent executed tools
                             steps = chunk["steps"]
                             if steps:
                                 for step in steps:
-                                    if hasattr(step, 'action') and hasattr(step.action, 'tool'):
-                                        tool_name = step.action.tool
-                                        yield f"🔧 Using tool: {tool_name}"
+                                    tool_name = step.action.tool if hasattr(step, 'action') and hasattr(step.action, 'tool') else None
+                                    if tool_name:
+                                        yield ToolStart(tool_name)
                                     if hasattr(step, 'observation') and step.observation:
-                                        observation = str(step.observation)[:200]
-                                        yield f"📋 Tool result: {observation}{'...' if len(str(step.observation)) > 200 else ''}"
+                                        yield ToolEnd(str(step.observation), tool=tool_name)
                         elif "intermediate_steps" in chunk:
                             # Additional intermediate information
                             steps = chunk["intermediate_steps"]
                             for step in steps:
                                 if hasattr(step, 'observation'):
-                                    yield f"🔍 Processing: {str(step.observation)[:100]}..."
+                                    yield Thinking(f"🔍 Processing: {str(step.observation)[:100]}...")
                     elif isinstance(chunk, str):
                         # Direct string content
-                        yield chunk
+                        yield Token(chunk)
                 
                 # If no content was yielded, yield a default message
                 if not collected_content:
-                    yield "✅ Task completed."
+                    yield Thinking("✅ Task completed.")
             else:
                 # Non-streaming mode
                 result = self.agent_executor.invoke({"input": message})
@@ -370,7 +410,7 @@ Remember: Your goal is to help users get actionable insights from their data by
         except Exception as e:
             logger.error(f"Error in agent chat: {e}")
             error_msg = f"Agent error: {str(e)}"
-            yield error_msg
+            yield Error(error_msg) if streaming else error_msg
 
     async def astream_events(self, message: str):
         """Stream events from agent execution with more detailed control"""
@@ -389,25 +429,24 @@ Remember: Your goal is to help users get actionable insights from their data by
                     # Direct streaming from the LLM
                     chunk = event_data.get("chunk", {})
                     if hasattr(chunk, 'content') and chunk.content:
-                        yield chunk.content
+                        yield Token(chunk.content)
                 elif event_type == "on_tool_start":
                     # Tool execution started
-                    tool_name = event_data.get("input", {}).get("tool", "unknown")
-                    yield f"\n🔧 Using tool: {tool_name}...\n"
+                    yield ToolStart(event_data.get("input", {}).get("tool", "unknown"))
                 elif event_type == "on_tool_end":
                     # Tool execution completed
                     tool_result = event_data.get("output", "")
                     if tool_result:
-                        yield f"📋 Result: {str(tool_result)[:200]}...\n" if len(str(tool_result)) > 200 else f"📋 Result: {tool_result}\n"
+                        yield ToolEnd(str(tool_result), tool=event_name)
                 elif event_type == "on_agent_finish":
                     # Agent finished, get final output
                     output = event_data.get("output", "")
                     if output:
-                        yield f"\n✅ {output}"
+                        yield Thinking(f"\n✅ {output}")
                         
         except Exception as e:
             logger.error(f"Error in agent stream events: {e}")
-            yield f"\nError: {str(e)}"
+            yield Error(str(e))
 
     async def chat_with_real_streaming(self, message: str):
         """Chat with real token-level streaming using callback handler"""
@@ -427,18 +466,24 @@ Remember: Your goal is to help users get actionable insights from their data by
             )
             
             # Monitor for new tokens while agent is running
-            while not agent_task.done():
-                current_tokens = self.streaming_handler.get_tokens()
-                
-                # Yield any new tokens
-                if len(current_tokens) > tokens_yielded:
-                    new_tokens = current_tokens[tokens_yielded:]
-                    for token in new_tokens:
-                        yield token
-                    tokens_yielded = len(current_tokens)
-                
-                # Small delay to avoid busy waiting
-                await asyncio.sleep(0.01)
+            try:
+                while not agent_task.done():
+                    current_tokens = self.streaming_handler.get_tokens()
+                    
+                    # Yield any new tokens
+                    if len(current_tokens) > tokens_yielded:
+                        new_tokens = current_tokens[tokens_yielded:]
+                        for token in new_tokens:
+                            yield Token(token)
+                        tokens_yielded = len(current_tokens)
+                    
+                    # Small delay to avoid busy waiting
+                    await asyncio.sleep(0.01)
+            finally:
+                if not agent_task.done():
+                    # The consumer went away: stop the agent instead of letting it finish
+                    agent_task.cancel()
+                    record_cancelled_generation(self.max_tokens, tokens_yielded)
             
             # Get final result and yield any remaining tokens
             final_result = await agent_task
@@ -448,16 +493,16 @@ Remember: Your goal is to help users get actionable insights from their data by
             if len(final_tokens) > tokens_yielded:
                 remaining_tokens = final_tokens[tokens_yielded:]
                 for token in remaining_tokens:
-                    yield token
+                    yield Token(token)
             
             # If no tokens were captured, yield the final output
             if not final_tokens:
                 final_output = final_result.get("output", "No response generated")
-                yield final_output
+                yield Token(final_output)
                 
         except Exception as e:
             logger.error(f"Error in real streaming chat: {e}")
-            yield f"Agent error: {str(e)}"
+            yield Error(f"Agent error: {str(e)}")
 
     async def chat_with_direct_streaming(self, message: str):
         """Use direct OpenAI streaming bypass agent limitations"""
@@ -485,70 +530,73 @@ Remember: Your goal is to help users get actionable insights from their data by
             )
             
             # Stream using the working streaming method
-            async for chunk in query_lm_studio_stream(ai_request):
-                if isinstance(chunk, str) and not chunk.startswith('{"type":"stats"'):
-                    yield chunk
+            async for event in query_lm_studio_stream(ai_request):
+                yield event
             
         except Exception as e:
             logger.error(f"Error in direct streaming: {e}")
-            yield f"Streaming error: {str(e)}"
+            yield Error(f"Streaming error: {str(e)}")
 
     async def chat_with_agent_streaming(self, message: str):
         """Stream agent responses while maintaining access to tools"""
         try:
             # Use astream_events for more granular control over streaming
             collected_tokens = []
-            tool_usage_messages = []
-            
-            async for event in self.agent_executor.astream_events(
+            tools_used = 0
+            events = self.agent_executor.astream_events(
                 {"input": message}, 
                 version="v1"
-            ):
-                event_type = event.get("event", "")
-                event_data = event.get("data", {})
+            )
+            
+            try:
+                async for event in events:
+                    event_type = event.get("event", "")
+                    event_data = event.get("data", {})
                 
-                # Handle different event types
-                if event_type == "on_chat_model_stream":
-                    # Direct streaming from the LLM - this gives us real token streaming
-                    chunk = event_data.get("chunk", {})
-                    if hasattr(chunk, 'content') and chunk.content:
-                        collected_tokens.append(chunk.content)
-                        yield chunk.content
-                elif event_type == "on_tool_start":
-                    # Tool execution started
-                    tool_name = event_data.get("input", {}).get("tool", "unknown")
-                    tool_msg = f"\n🔧 Using tool: {tool_name}...\n"
-                    tool_usage_messages.append(tool_msg)
-                    yield tool_msg
-                elif event_type == "on_tool_end":
-                    # Tool execution completed
-                    tool_result = event_data.get("output", "")
-                    if tool_result:
-                        result_preview = str(tool_result)[:200] + "..." if len(str(tool_result)) > 200 else str(tool_result)
-                        tool_result_msg = f"📋 Tool result: {result_preview}\n"
-                        tool_usage_messages.append(tool_result_msg)
-                        yield tool_result_msg
-                elif event_type == "on_agent_finish":
-                    # Agent finished - get final output if no tokens were streamed
-                    output = event_data.get("output", "")
-                    if output and not collected_tokens:
-                        # If no streaming tokens were captured, yield the final output
-                        yield output
-                    elif output and collected_tokens:
-                        # Check if there's additional content not yet streamed
-                        streamed_content = "".join(collected_tokens)
-                        if len(output) > len(streamed_content):
-                            remaining_content = output[len(streamed_content):]
-                            if remaining_content.strip():
-                                yield remaining_content
+                    # Handle different event types
+                    if event_type == "on_chat_model_stream":
+                        # Direct streaming from the LLM - this gives us real token streaming
+                        chunk = event_data.get("chunk", {})
+                        if hasattr(chunk, 'content') and chunk.content:
+                            collected_tokens.append(chunk.content)
+                            yield Token(chunk.content)
+                    elif event_type == "on_tool_start":
+                        # Tool execution started
+                        tools_used += 1
+                        yield ToolStart(event_data.get("input", {}).get("tool", "unknown"))
+                    elif event_type == "on_tool_end":
+                        # Tool execution completed
+                        tool_result = event_data.get("output", "")
+                        if tool_result:
+                            tools_used += 1
+                            yield ToolEnd(str(tool_result), tool=event.get("name"))
+                    elif event_type == "on_agent_finish":
+                        # Agent finished - get final output if no tokens were streamed
+                        output = event_data.get("output", "")
+                        if output and not collected_tokens:
+                            # If no streaming tokens were captured, yield the final output
+                            yield Token(output)
+                        elif output and collected_tokens:
+                            # Check if there's additional content not yet streamed
+                            streamed_content = "".join(collected_tokens)
+                            if len(output) > len(streamed_content):
+                                remaining_content = output[len(streamed_content):]
+                                if remaining_content.strip():
+                                    yield Token(remaining_content)
+            except (asyncio.CancelledError, GeneratorExit):
+                # The consumer went away (client disconnect): stop the agent run
+                record_cancelled_generation(self.max_tokens, prompt_budget.count_tokens("".join(collected_tokens)))
+                raise
+            finally:
+                await events.aclose()
             
             # If no content was yielded at all, provide a fallback
-            if not collected_tokens and not tool_usage_messages:
-                yield "✅ Task completed."
+            if not collected_tokens and not tools_used:
+                yield Thinking("✅ Task completed.")
                         
         except Exception as e:
             logger.error(f"Error in agent streaming: {e}")
-            yield f"Agent error: {str(e)}"
+            yield Error(f"Agent error: {str(e)}")
 
 class AgentStreamingCallbackHandler(BaseCallbackHandler):
     """Custom callback handler to capture streaming tokens from agent LLM calls"""
@@ -578,4 +626,154 @@ class AgentStreamingCallbackHandler(BaseCallbackHandler):
     def clear(self) -> None:
         """Clear the collected tokens and content"""
         self.tokens = []
-        self.current_content = ""
\ No newline at end of file
+        self.current_content = ""
+
+# Agent template cache configuration
+AGENT_CACHE_SIZE = int(os.getenv("AGENT_CACHE_SIZE", "8"))
+
+
+class AgentFactory:
+    """LRU cache of agent templates handing out per-request LangChainAgent instances"""
+    
+    def __init__(self, max_size: int = AGENT_CACHE_SIZE):
+        self.max_size = max(max_size, 1)
+        self._templates: "OrderedDict[Tuple, AgentTemplate]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def _get_schema_context(self, question: Optional[str]) -> Tuple[Optional[str], Optional[Tuple[str, ...]]]:
+        """Schema fingerprint, so templates are rebuilt after DDL changes, and the tables the question needs"""
+        database_url = os.getenv("DATABASE_URL")
+        if not database_url:
+            return None, None
+        try:
+            sql_tool = get_sql_tool(database_url)
+            if sql_tool is None:
+                return None, None
+            schema_result = sql_tool.get_database_schema()
+            if not schema_result.get("success", False):
+                return None, None
+            tables = tuple(schema_selector.select_tables(schema_result["tables"], question))
+            return schema_result.get("version"), tables
+        except Exception as e:
+            logger.warning(f"Could not get schema version for agent cache: {e}")
+            return None, None
+    
+    def _make_key(
+        self,
+        model_name: str,
+        temperature: float,
+        max_tokens: int,
+        tools: Optional[List[Tool]],
+        system_prompt: Optional[str],
+        schema_version: Optional[str],
+        schema_tables: Optional[Tuple[str, ...]]
+    ) -> Tuple:
+        prompt = system_prompt or get_system_prompt("default_chat")
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        tool_names = tuple(sorted(tool.name for tool in tools or []))
+        # Editing the SQL sections of prompts.json rebuilds templates too
+        sql_prompt_version = get_prompt_manager().get_prompt_version("sql_agent")
+        return (
+            model_name, temperature, max_tokens, prompt_hash, sql_prompt_version,
+            schema_version, schema_tables, tool_names
+        )
+    
+    def get_agent(
+        self,
+        model_name: Optional[str] = None,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        tools: Optional[List[Tool]] = None,
+        system_prompt: Optional[str] = None,
+        question: Optional[str] = None
+    ) -> LangChainAgent:
+        """Get an agent with isolated memory, reusing a cached template when possible"""
+        model_name = model_name or AI_MODEL
+        temperature = temperature if temperature is not None else DEFAULT_TEMPERATURE
+        max_tokens = max_tokens or DEFAULT_MAX_TOKENS
+        # Questions needing the same tables share a template
+        schema_version, schema_tables = self._get_schema_context(question)
+        key = self._make_key(model_name, temperature, max_tokens, tools, system_prompt, schema_version, schema_tables)
+        
+        with self._lock:
+            template = self._templates.get(key)
+            if template is not None:
+                self._templates.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+        
+        if template is not None:
+            return LangChainAgent(
+                model_name=model_name,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                template=template
+            )
+        
+        # Build outside the lock; schema introspection and LLM setup can be slow
+        agent = LangChainAgent(
+            model_name=model_name,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            tools=tools,
+            system_prompt=system_prompt,
+            schema_tables=schema_tables
+        )
+        with self._lock:
+            self._templates[key] = agent.template
+            self._templates.move_to_end(key)
+            while len(self._templates) > self.max_size:
+                self._templates.popitem(last=False)
+                self.evictions += 1
+        logger.info(f"Built agent template for model {model_name}")
+        return agent
+    
+    def clear(self) -> None:
+        """Drop all cached agent templates"""
+        with self._lock:
+            self._templates.clear()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "size": len(self._templates),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+
+# Global agent factory instance
+_agent_factory = None
+
+
+def get_agent_factory() -> AgentFactory:
+    """Get the global agent factory instance"""
+    global _agent_factory
+    if _agent_factory is None:
+        _agent_factory = AgentFactory()
+    return _agent_factory
+
+
+def get_agent(
+    model_name: Optional[str] = None,
+    temperature: Optional[float] = None,
+    max_tokens: Optional[int] = None,
+    tools: Optional[List[Tool]] = None,
+    system_prompt: Optional[str] = None,
+    question: Optional[str] = None
+) -> LangChainAgent:
+    """Convenience function to get a per-request agent from the global factory"""
+    return get_agent_factory().get_agent(
+        model_name=model_name,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        tools=tools,
+        system_prompt=system_prompt,
+        question=question
+    )
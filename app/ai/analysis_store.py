@@ -0,0 +1,132 @@
+import asyncio
+import hashlib
+import logging
+from typing import Optional, Dict, Any
+
+from sqlalchemy.orm import Session
+
+from .. import crud, models
+from .lm_studio import analyze_journal_entry, AI_MODEL
+from .prompt_manager import get_prompt_manager
+
+logger = logging.getLogger(__name__)
+
+
+def compute_content_hash(title: Optional[str], content: Optional[str]) -> str:
+    """Hash the entry fields that feed the analysis prompt"""
+    payload = f"{title or ''}\x00{content or ''}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def get_prompt_version(analysis_type: str) -> str:
+    """Fingerprint of the analysis prompt so prompt edits trigger re-analysis"""
+    return get_prompt_manager().get_prompt_version(f"analysis:{analysis_type}")
+
+
+def _is_fresh(analysis: models.EntryAnalysis, content_hash: str, prompt_version: str, model: str) -> bool:
+    return (
+        analysis.content_hash == content_hash
+        and analysis.prompt_version == prompt_version
+        and analysis.model == model
+    )
+
+
+def _to_result(analysis: models.EntryAnalysis, cached: bool) -> Dict[str, Any]:
+    return {
+        "think": analysis.think,
+        "answer": analysis.answer,
+        "raw_content": analysis.raw_content,
+        "analysis_type": analysis.analysis_type,
+        "model": analysis.model,
+        "cached": cached,
+        "analyzed_at": analysis.updated_at
+    }
+
+
+def get_stored_analysis(
+    db: Session,
+    entry: models.Entry,
+    analysis_type: str,
+    model: Optional[str] = None
+) -> Optional[Dict[str, Any]]:
+    """Return the stored analysis if it is still valid for the entry's current content"""
+    analysis = crud.get_entry_analysis(db, entry.entry_id, analysis_type)
+    if analysis is None:
+        return None
+    content_hash = compute_content_hash(entry.title, entry.content)
+    if not _is_fresh(analysis, content_hash, get_prompt_version(analysis_type), model or AI_MODEL):
+        return None
+    return _to_result(analysis, cached=True)
+
+
+async def analyze_entry_incremental(
+    db: Session,
+    entry: models.Entry,
+    analysis_type: str = "general",
+    model: Optional[str] = None,
+    force: bool = False
+) -> Dict[str, Any]:
+    """Serve the stored analysis when the entry is unchanged, otherwise run and persist a new one"""
+    model_name = model or AI_MODEL
+    # Read the entry before any threaded commit expires it; a lazy refresh here would block the loop
+    entry_id = entry.entry_id
+    title = entry.title
+    content = entry.content
+    content_hash = compute_content_hash(title, content)
+    prompt_version = get_prompt_version(analysis_type)
+
+    # Database work runs in a thread so only the model call stays on the event loop
+    if not force:
+        stored = await asyncio.to_thread(get_stored_analysis, db, entry, analysis_type, model_name)
+        if stored is not None:
+            logger.debug(f"Using stored {analysis_type} analysis for entry {entry_id}")
+            return stored
+
+    result = await analyze_journal_entry(
+        entry_title=title,
+        entry_content=content or "",
+        analysis_type=analysis_type,
+        model=model,
+        entry_id=entry_id
+    )
+
+    # Failed runs are returned to the caller but never persisted
+    if result.get("error"):
+        result["cached"] = False
+        return result
+
+    analysis = await asyncio.to_thread(
+        _store_analysis,
+        db,
+        entry_id,
+        analysis_type,
+        result,
+        model_name,
+        prompt_version,
+        content_hash
+    )
+    logger.info(f"Stored {analysis_type} analysis for entry {entry_id}")
+    return analysis
+
+
+def _store_analysis(
+    db: Session,
+    entry_id: int,
+    analysis_type: str,
+    result: Dict[str, Any],
+    model_name: str,
+    prompt_version: str,
+    content_hash: str
+) -> Dict[str, Any]:
+    analysis = crud.upsert_entry_analysis(
+        db,
+        entry_id,
+        analysis_type,
+        think=result.get("think"),
+        answer=result.get("answer") or "",
+        raw_content=result.get("raw_content") or "",
+        model=model_name,
+        prompt_version=prompt_version,
+        content_hash=content_hash
+    )
+    return _to_result(analysis, cached=False)
@@ -0,0 +1,221 @@
+import asyncio
+import hashlib
+import logging
+import math
+import os
+import re
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+
+from fastapi import BackgroundTasks
+
+from .. import crud, models
+from ..database import SessionLocal
+from .analysis_store import compute_content_hash
+from .lm_studio import LM_STUDIO_BASE_URL, get_async_http_client
+
+logger = logging.getLogger(__name__)
+
+# Embedding pipeline configuration
+EMBEDDINGS_ENABLED = os.getenv("EMBEDDINGS_ENABLED", "true").lower() == "true"
+# "lm_studio" calls the /v1/embeddings endpoint; "hashing" is a dependency-free local model
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "lm_studio").lower()
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-nomic-embed-text-v1.5")
+EMBEDDING_DIMENSIONS = models.ENTRY_EMBEDDING_DIMENSIONS
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+EMBEDDING_MAX_CHARS = int(os.getenv("EMBEDDING_MAX_CHARS", "8000"))
+EMBEDDING_TIMEOUT = float(os.getenv("EMBEDDING_TIMEOUT", "60"))
+
+_stats_lock = threading.Lock()
+_embedding_stats = {"requests": 0, "texts": 0, "errors": 0, "embedded": 0, "skipped": 0}
+
+
+def _count(**increments: int) -> None:
+    with _stats_lock:
+        for key, value in increments.items():
+            _embedding_stats[key] += value
+
+
+def get_embedding_model() -> str:
+    """Name stored with each vector; only vectors of the same model are compared"""
+    if EMBEDDING_PROVIDER == "hashing":
+        return f"hashing-{EMBEDDING_DIMENSIONS}"
+    return EMBEDDING_MODEL
+
+
+def entry_embedding_text(title: Optional[str], content: Optional[str]) -> str:
+    """Text embedded for an entry"""
+    return f"{title or ''}\n\n{content or ''}".strip()[:EMBEDDING_MAX_CHARS]
+
+
+def _normalize(vector: Sequence[float]) -> List[float]:
+    norm = math.sqrt(sum(x * x for x in vector))
+    return [x / norm for x in vector] if norm else [0.0] * len(vector)
+
+
+def hashing_embedding(text: str, dimensions: int = EMBEDDING_DIMENSIONS) -> List[float]:
+    """Signed feature hashing of word unigrams and bigrams"""
+    tokens = re.findall(r"\w+", text.lower())
+    vector = [0.0] * dimensions
+    for feature in tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]:
+        value = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+        vector[value % dimensions] += 1.0 if value >> 63 else -1.0
+    return _normalize(vector)
+
+
+async def _lm_studio_embeddings(texts: List[str]) -> List[List[float]]:
+    client = get_async_http_client()
+    response = await client.post(
+        f"{LM_STUDIO_BASE_URL}/embeddings",
+        json={"model": EMBEDDING_MODEL, "input": texts},
+        timeout=EMBEDDING_TIMEOUT
+    )
+    response.raise_for_status()
+    data = sorted(response.json()["data"], key=lambda item: item["index"])
+    if len(data) != len(texts):
+        raise ValueError(f"Expected {len(texts)} embeddings, got {len(data)}")
+    return [item["embedding"] for item in data]
+
+
+async def embed_texts(texts: Sequence[str]) -> List[List[float]]:
+    """Embed texts with the configured provider, one request per EMBEDDING_BATCH_SIZE texts"""
+    vectors: List[List[float]] = []
+    batch_size = max(EMBEDDING_BATCH_SIZE, 1)
+    for start in range(0, len(texts), batch_size):
+        batch = list(texts[start:start + batch_size])
+        _count(requests=1, texts=len(batch))
+        try:
+            if EMBEDDING_PROVIDER == "hashing":
+                batch_vectors = [hashing_embedding(text) for text in batch]
+            else:
+                batch_vectors = await _lm_studio_embeddings(batch)
+        except Exception:
+            _count(errors=1)
+            raise
+        for vector in batch_vectors:
+            if len(vector) != EMBEDDING_DIMENSIONS:
+                _count(errors=1)
+                raise ValueError(
+                    f"Embedding model returned {len(vector)} dimensions, "
+                    f"EMBEDDING_DIMENSIONS is {EMBEDDING_DIMENSIONS}"
+                )
+            vectors.append(_normalize(vector))
+    return vectors
+
+
+async def embed_query(text: str) -> List[float]:
+    """Embed a search query"""
+    return (await embed_texts([text[:EMBEDDING_MAX_CHARS]]))[0]
+
+
+def _stale_entries(session_factory, entry_ids: Sequence[int], model: str, force: bool) -> List[Dict[str, Any]]:
+    db = session_factory()
+    try:
+        entries = db.query(models.Entry).filter(models.Entry.entry_id.in_(entry_ids)).all()
+        stored = {
+            row.entry_id: row for row in db.query(models.EntryEmbedding).filter(
+                models.EntryEmbedding.entry_id.in_(entry_ids)
+            )
+        }
+        pending = []
+        for entry in entries:
+            content_hash = compute_content_hash(entry.title, entry.content)
+            row = stored.get(entry.entry_id)
+            if not force and row is not None and row.model == model and row.content_hash == content_hash:
+                continue
+            pending.append({
+                "entry_id": entry.entry_id,
+                "content_hash": content_hash,
+                "text": entry_embedding_text(entry.title, entry.content)
+            })
+        return pending
+    finally:
+        db.close()
+
+
+def save_embeddings(session_factory, items: Sequence[Dict[str, Any]], model: str) -> None:
+    """Store vectors given as dicts with entry_id, content_hash and embedding"""
+    db = session_factory()
+    try:
+        crud.save_entry_embeddings(db, [
+            {
+                "entry_id": item["entry_id"],
+                "model": model,
+                "content_hash": item["content_hash"],
+                "embedding": item["embedding"]
+            }
+            for item in items
+        ])
+    finally:
+        db.close()
+
+
+async def refresh_entry_embeddings(
+    entry_ids: Sequence[int],
+    force: bool = False,
+    session_factory=None
+) -> Dict[str, int]:
+    """Embed the entries whose text or model changed since their stored vector"""
+    session_factory = session_factory or SessionLocal
+    model = get_embedding_model()
+    result = {"embedded": 0, "skipped": 0, "failed": 0}
+    batch_size = max(EMBEDDING_BATCH_SIZE, 1)
+    for start in range(0, len(entry_ids), batch_size):
+        batch = list(entry_ids[start:start + batch_size])
+        pending = await asyncio.to_thread(_stale_entries, session_factory, batch, model, force)
+        result["skipped"] += len(batch) - len(pending)
+        if not pending:
+            continue
+        try:
+            vectors = await embed_texts([item["text"] for item in pending])
+        except Exception as e:
+            logger.warning(f"Embedding {len(pending)} entries failed: {e}")
+            result["failed"] += len(pending)
+            continue
+        for item, vector in zip(pending, vectors):
+            item["embedding"] = vector
+        await asyncio.to_thread(save_embeddings, session_factory, pending, model)
+        result["embedded"] += len(pending)
+    _count(embedded=result["embedded"], skipped=result["skipped"])
+    return result
+
+
+async def _refresh_in_background(entry_ids: Sequence[int], force: bool = False) -> None:
+    try:
+        result = await refresh_entry_embeddings(entry_ids, force=force)
+        logger.debug(f"Refreshed embeddings for {len(entry_ids)} entries: {result}")
+    except Exception as e:
+        logger.error(f"Embedding refresh failed: {e}")
+
+
+def queue_entry_embeddings(background_tasks: BackgroundTasks, entry_ids: Sequence[int], force: bool = False) -> bool:
+    """Refresh entry embeddings after the response is sent"""
+    if not EMBEDDINGS_ENABLED or not entry_ids:
+        return False
+    background_tasks.add_task(_refresh_in_background, list(entry_ids), force)
+    return True
+
+
+async def _save_in_background(items: Sequence[Dict[str, Any]], model: str) -> None:
+    try:
+        await asyncio.to_thread(save_embeddings, SessionLocal, items, model)
+    except Exception as e:
+        logger.error(f"Storing embeddings failed: {e}")
+
+
+def queue_embedding_save(background_tasks: BackgroundTasks, items: Sequence[Dict[str, Any]]) -> None:
+    """Store vectors computed during a read request after the response is sent"""
+    background_tasks.add_task(_save_in_background, list(items), get_embedding_model())
+
+
+def get_embedding_stats() -> Dict[str, Any]:
+    """Get embedding pipeline configuration and counters"""
+    with _stats_lock:
+        return {
+            "enabled": EMBEDDINGS_ENABLED,
+            "provider": EMBEDDING_PROVIDER,
+            "model": get_embedding_model(),
+            "dimensions": EMBEDDING_DIMENSIONS,
+            "batch_size": EMBEDDING_BATCH_SIZE,
+            **_embedding_stats
+        }
@@ -0,0 +1,304 @@
+import os
+import time
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, List
+
+from sqlalchemy.orm import Session
+
+from .. import models
+from ..database import SessionLocal
+from .analysis_store import analyze_entry_incremental
+
+logger = logging.getLogger(__name__)
+
+# Batch analysis worker configuration
+AI_BATCH_WORKERS_ENABLED = os.getenv("AI_BATCH_WORKERS_ENABLED", "true").lower() == "true"
+AI_BATCH_CONCURRENCY = int(os.getenv("AI_BATCH_CONCURRENCY", "2"))
+AI_BATCH_MAX_RETRIES = int(os.getenv("AI_BATCH_MAX_RETRIES", "2"))
+AI_BATCH_RETRY_DELAY = float(os.getenv("AI_BATCH_RETRY_DELAY", "10"))
+AI_BATCH_POLL_INTERVAL = float(os.getenv("AI_BATCH_POLL_INTERVAL", "5"))
+# Running items untouched for this many seconds belong to a dead worker and are re-queued
+AI_BATCH_LEASE_SECONDS = float(os.getenv("AI_BATCH_LEASE_SECONDS", "900"))
+
+ACTIVE_JOB_STATUSES = ("pending", "running")
+
+
+class AnalysisJobWorker:
+    """In-process asyncio worker pool draining the analysis_job_items queue table"""
+
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        concurrency: int = AI_BATCH_CONCURRENCY,
+        max_retries: int = AI_BATCH_MAX_RETRIES,
+        retry_delay: float = AI_BATCH_RETRY_DELAY,
+        poll_interval: float = AI_BATCH_POLL_INTERVAL,
+        lease_seconds: float = AI_BATCH_LEASE_SECONDS
+    ):
+        self._session_factory = session_factory
+        self.concurrency = max(concurrency, 1)
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self._recovered_at = time.monotonic()
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopping = False
+        self.in_progress = 0
+        self.processed = 0
+        self.failed = 0
+        self.retried = 0
+
+    def start(self) -> None:
+        """Recover interrupted items and start the worker tasks"""
+        if self._tasks:
+            return
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        recovered = self.recover()
+        if recovered:
+            logger.info(f"Re-queued {recovered} interrupted analysis job items")
+        self._tasks = [
+            asyncio.create_task(self._run(worker_id)) for worker_id in range(self.concurrency)
+        ]
+        logger.info(f"Started {self.concurrency} analysis job workers")
+
+    async def stop(self) -> None:
+        """Stop the worker tasks; interrupted items are re-queued once their lease expires"""
+        self._stopping = True
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self) -> None:
+        """Wake idle workers after new items were queued"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def recover(self) -> int:
+        """Put items left running by a crashed or stopped process back in the queue
+
+        Items other live processes are still working on were claimed within
+        the lease and are left alone.
+        """
+        db = self._session_factory()
+        try:
+            expired_before = datetime.utcnow() - timedelta(seconds=self.lease_seconds)
+            count = db.query(models.AnalysisJobItem).filter(
+                models.AnalysisJobItem.status == "running",
+                models.AnalysisJobItem.updated_at < expired_before
+            ).update({"status": "pending"}, synchronize_session=False)
+            db.commit()
+            return count
+        finally:
+            db.close()
+
+    def claim_next(self) -> Optional[Dict[str, Any]]:
+        """Atomically claim the next available item of an active job"""
+        db = self._session_factory()
+        try:
+            now = datetime.utcnow()
+            query = db.query(models.AnalysisJobItem).join(models.AnalysisJob).filter(
+                models.AnalysisJobItem.status == "pending",
+                models.AnalysisJobItem.available_at <= now,
+                models.AnalysisJob.status.in_(ACTIVE_JOB_STATUSES)
+            ).order_by(models.AnalysisJobItem.item_id)
+            if db.bind.dialect.name == "postgresql":
+                # Concurrent workers (and processes) skip rows another worker holds
+                query = query.with_for_update(skip_locked=True, of=models.AnalysisJobItem)
+
+            item = query.first()
+            if item is None:
+                db.rollback()
+                return None
+
+            item.status = "running"
+            item.attempts += 1
+            # Start of the lease recover() checks
+            item.updated_at = now
+            job = item.job
+            if job.status == "pending":
+                job.status = "running"
+                job.started_at = now
+            claim = {
+                "item_id": item.item_id,
+                "job_id": item.job_id,
+                "entry_id": item.entry_id,
+                "analysis_type": item.analysis_type,
+                "attempts": item.attempts,
+                "model": job.model,
+                "force": bool(job.force)
+            }
+            db.commit()
+            return claim
+        finally:
+            db.close()
+
+    async def process(self, claim: Dict[str, Any]) -> None:
+        """Run one analysis and record its outcome"""
+        self.in_progress += 1
+        error = None
+        retryable = True
+        db = self._session_factory()
+        try:
+            # Only the model call runs on the event loop; database work goes to threads
+            entry = await asyncio.to_thread(self._load_entry, db, claim["entry_id"])
+            if entry is None:
+                error = "Entry not found"
+                retryable = False
+            else:
+                result = await analyze_entry_incremental(
+                    db,
+                    entry,
+                    analysis_type=claim["analysis_type"],
+                    model=claim["model"],
+                    force=claim["force"]
+                )
+                if result.get("error"):
+                    error = result.get("answer") or "Analysis failed"
+        except Exception as e:
+            logger.error(f"Analysis job item {claim['item_id']} failed: {e}")
+            error = str(e)
+        finally:
+            await asyncio.to_thread(db.close)
+            self.in_progress -= 1
+
+        await asyncio.to_thread(self.finish, claim, error, retryable)
+
+    @staticmethod
+    def _load_entry(db: Session, entry_id: int) -> Optional[models.Entry]:
+        return db.query(models.Entry).filter(models.Entry.entry_id == entry_id).first()
+
+    def finish(self, claim: Dict[str, Any], error: Optional[str], retryable: bool = True) -> None:
+        """Mark an item done, schedule a retry, or mark it failed, then update job progress"""
+        db = self._session_factory()
+        try:
+            item = db.get(models.AnalysisJobItem, claim["item_id"])
+            if item is None:
+                return
+            now = datetime.utcnow()
+            job_counter = None
+
+            if error is None:
+                item.status = "done"
+                item.error = None
+                job_counter = models.AnalysisJob.completed_items
+                self.processed += 1
+            elif retryable and item.attempts <= self.max_retries:
+                item.status = "pending"
+                item.error = error
+                item.available_at = now + timedelta(seconds=self.retry_delay * item.attempts)
+                self.retried += 1
+            else:
+                item.status = "failed"
+                item.error = error
+                job_counter = models.AnalysisJob.failed_items
+                self.failed += 1
+
+            if job_counter is not None:
+                # Increment in SQL so concurrent workers do not lose updates
+                db.query(models.AnalysisJob).filter(
+                    models.AnalysisJob.job_id == claim["job_id"]
+                ).update({job_counter: job_counter + 1}, synchronize_session=False)
+            db.commit()
+            self._complete_job_if_done(db, claim["job_id"])
+        finally:
+            db.close()
+
+    def _complete_job_if_done(self, db: Session, job_id: int) -> None:
+        remaining = db.query(models.AnalysisJobItem).filter(
+            models.AnalysisJobItem.job_id == job_id,
+            models.AnalysisJobItem.status.in_(("pending", "running"))
+        ).count()
+        if remaining:
+            return
+        db.query(models.AnalysisJob).filter(
+            models.AnalysisJob.job_id == job_id,
+            models.AnalysisJob.status.in_(ACTIVE_JOB_STATUSES)
+        ).update({"status": "completed", "finished_at": datetime.utcnow()}, synchronize_session=False)
+        db.commit()
+
+    async def _run(self, worker_id: int) -> None:
+        while not self._stopping:
+            self._wakeup.clear()
+            try:
+                claim = await asyncio.to_thread(self.claim_next)
+            except Exception as e:
+                logger.error(f"Analysis worker {worker_id} could not claim an item: {e}")
+                claim = None
+
+            if claim is None:
+                if worker_id == 0:
+                    await self._recover_expired()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                await self.process(claim)
+            except Exception as e:
+                # e.g. finish() hit a database error; keep this worker alive
+                logger.error(f"Analysis worker {worker_id} failed on item {claim['item_id']}: {e}")
+                try:
+                    await asyncio.to_thread(self.finish, claim, str(e), False)
+                except Exception as e:
+                    logger.error(f"Could not mark analysis job item {claim['item_id']} failed: {e}")
+
+    async def _recover_expired(self) -> None:
+        """Re-queue items of dead workers at most once per lease period"""
+        now = time.monotonic()
+        if now - self._recovered_at < self.lease_seconds:
+            return
+        self._recovered_at = now
+        try:
+            recovered = await asyncio.to_thread(self.recover)
+        except Exception as e:
+            logger.error(f"Could not re-queue expired analysis job items: {e}")
+            return
+        if recovered:
+            logger.info(f"Re-queued {recovered} analysis job items with expired leases")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "workers": len(self._tasks),
+            "concurrency": self.concurrency,
+            "in_progress": self.in_progress,
+            "processed": self.processed,
+            "failed": self.failed,
+            "retried": self.retried
+        }
+
+
+# Global job worker instance
+_job_worker = None
+
+
+def get_job_worker() -> AnalysisJobWorker:
+    """Get the global analysis job worker instance"""
+    global _job_worker
+    if _job_worker is None:
+        _job_worker = AnalysisJobWorker()
+    return _job_worker
+
+
+def start_job_workers() -> None:
+    """Start background analysis workers (called on application startup)"""
+    if not AI_BATCH_WORKERS_ENABLED:
+        logger.info("Analysis job workers disabled")
+        return
+    try:
+        get_job_worker().start()
+    except Exception as e:
+        logger.error(f"Could not start analysis job workers: {e}")
+
+
+async def stop_job_workers() -> None:
+    """Stop background analysis workers (called on application shutdown)"""
+    if _job_worker is not None:
+        await _job_worker.stop()
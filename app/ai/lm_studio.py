@@ -3,6 +3,8 @@ import logging
 from typing import Optional, List, Dict, Any, Union
 import httpx
 import re
+import threading
+from collections import OrderedDict
 from pydantic import BaseModel
 from dotenv import load_dotenv
 import asyncio
@@ -14,6 +16,13 @@ from langchain_core.messages import SystemMessage, HumanMessage, AIMessage as LC
 from langchain_core.tools import Tool
 # Import prompt manager
 from .prompt_manager import get_prompt_manager, get_system_prompt
+from .response_cache import (
+    get_response_cache, make_cache_key, make_semantic_scope,
+    AI_RESPONSE_CACHE_ENABLED, AI_RESPONSE_CACHE_SEMANTIC_THRESHOLD
+)
+from . import prompt_budget
+from .stream_parser import ThinkTagParser, split_think
+from .stream_events import Citations, Error, Sources, Stats, Thinking, Token
 
 # ANSI color codes for terminal output
 COLORS = {
@@ -49,11 +58,30 @@ LM_KEY = os.getenv("LM_STUDIO_API_KEY", "not-needed")  # Not used in LM Studio
 AI_MODEL = os.getenv("LM_STUDIO_MODEL", DEFAULT_AI_MODEL)
 MAX_INFERENCE_TIME = int(os.getenv("LM_MAX_INFERENCE_TIME", DEFAULT_MAX_INFERENCE_TIME))
 
-# Global ChatOpenAI instance for reuse
-_chatopen_ai_instance = None
+# Shared HTTP client configuration
+LM_HTTP2 = os.getenv("LM_HTTP2", "false").lower() == "true"
+LM_HTTP_MAX_CONNECTIONS = int(os.getenv("LM_HTTP_MAX_CONNECTIONS", "20"))
+LM_HTTP_MAX_KEEPALIVE = int(os.getenv("LM_HTTP_MAX_KEEPALIVE", "10"))
+LM_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("LM_HTTP_KEEPALIVE_EXPIRY", "30"))
+
+# Keyed cache of ChatOpenAI instances for reuse
+LM_LLM_CACHE_SIZE = int(os.getenv("LM_LLM_CACHE_SIZE", "8"))
+_llm_instances: "OrderedDict[tuple, ChatOpenAI]" = OrderedDict()
+_llm_lock = threading.Lock()
+_llm_stats = {"hits": 0, "builds": 0, "evictions": 0}
 _available_models_cache = None
 _cache_timestamp = 0
 
+# Application-lifetime HTTP clients for LM Studio traffic
+_async_http_client: Optional[httpx.AsyncClient] = None
+_sync_http_client: Optional[httpx.Client] = None
+_async_openai_client = None
+_http_stats = {"requests": 0, "responses": 0, "errors": 0, "clients_created": 0}
+
+# Generations stopped because the client went away; max_tokens_saved is an upper
+# bound: the max_tokens budget minus what was generated before the stop
+_generation_stats = {"cancelled": 0, "max_tokens_saved": 0}
+
 class AIMessage(BaseModel):
     """Structure for AI message content"""
     role: str  # "system", "user", or "assistant"
@@ -66,6 +94,7 @@ class AIRequest(BaseModel):
     temperature: Optional[float] = None
     max_tokens: Optional[int] = None
     tools: Optional[List[Dict[str, Any]]] = None
+    budget: Optional[Dict[str, Any]] = None  # Prompt token report from create_ai_request
 
 class AIResponse(BaseModel):
     """Structure for AI response"""
@@ -90,37 +119,191 @@ ANALYSIS_MAX_TOKENS = {
     "insights": 700
 }
 
+def _http2_enabled() -> bool:
+    """HTTP/2 needs the optional h2 package"""
+    if not LM_HTTP2:
+        return False
+    import importlib.util
+    if importlib.util.find_spec("h2") is None:
+        logger.warning("LM_HTTP2 is enabled but the h2 package is not installed, using HTTP/1.1")
+        return False
+    return True
+
+def _http_client_kwargs() -> Dict[str, Any]:
+    limits = httpx.Limits(
+        max_connections=LM_HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=LM_HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=LM_HTTP_KEEPALIVE_EXPIRY
+    )
+    return {
+        "limits": limits,
+        "http2": _http2_enabled(),
+        "timeout": httpx.Timeout(MAX_INFERENCE_TIME / 1000, connect=10.0)
+    }
+
+def _count_request(request: httpx.Request) -> None:
+    _http_stats["requests"] += 1
+
+def _count_response(response: httpx.Response) -> None:
+    _http_stats["responses"] += 1
+    if response.status_code >= 400:
+        _http_stats["errors"] += 1
+
+async def _acount_request(request: httpx.Request) -> None:
+    _count_request(request)
+
+async def _acount_response(response: httpx.Response) -> None:
+    _count_response(response)
+
+def init_http_clients() -> None:
+    """Create the shared LM Studio HTTP clients (called on application startup)"""
+    global _async_http_client, _sync_http_client, _async_openai_client
+    if _async_http_client is None or _async_http_client.is_closed:
+        _async_http_client = httpx.AsyncClient(
+            event_hooks={"request": [_acount_request], "response": [_acount_response]},
+            **_http_client_kwargs()
+        )
+        _async_openai_client = None
+        _http_stats["clients_created"] += 1
+        logger.info("Created shared async HTTP client for LM Studio")
+    if _sync_http_client is None or _sync_http_client.is_closed:
+        _sync_http_client = httpx.Client(
+            event_hooks={"request": [_count_request], "response": [_count_response]},
+            **_http_client_kwargs()
+        )
+        _http_stats["clients_created"] += 1
+        logger.info("Created shared sync HTTP client for LM Studio")
+
+async def close_http_clients() -> None:
+    """Close the shared LM Studio HTTP clients (called on application shutdown)"""
+    global _async_http_client, _sync_http_client, _async_openai_client
+    if _async_http_client is not None:
+        await _async_http_client.aclose()
+    if _sync_http_client is not None:
+        _sync_http_client.close()
+    _async_http_client = None
+    _sync_http_client = None
+    _async_openai_client = None
+    # Cached LLM instances hold references to the closed clients
+    clear_llm_cache()
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """Get the shared async HTTP client, creating it lazily outside the app lifecycle"""
+    if _async_http_client is None or _async_http_client.is_closed:
+        init_http_clients()
+    return _async_http_client
+
+def get_sync_http_client() -> httpx.Client:
+    """Get the shared sync HTTP client, creating it lazily outside the app lifecycle"""
+    if _sync_http_client is None or _sync_http_client.is_closed:
+        init_http_clients()
+    return _sync_http_client
+
+def get_async_openai_client():
+    """Get an AsyncOpenAI client for LM Studio backed by the shared HTTP client"""
+    global _async_openai_client
+    http_client = get_async_http_client()
+    if _async_openai_client is None:
+        from openai import AsyncOpenAI
+        _async_openai_client = AsyncOpenAI(
+            base_url=LM_STUDIO_BASE_URL,
+            api_key="not-needed",  # LM Studio doesn't require an API key
+            http_client=http_client
+        )
+    return _async_openai_client
+
+def _connection_pool_stats(client) -> Dict[str, Any]:
+    """Summarize the connections held by an httpx client's transport"""
+    pool = getattr(getattr(client, "_transport", None), "_pool", None)
+    connections = list(getattr(pool, "connections", []) or [])
+    idle = sum(1 for connection in connections if connection.is_idle())
+    return {
+        "connections": len(connections),
+        "idle": idle,
+        "active": len(connections) - idle
+    }
+
+def get_http_client_stats() -> Dict[str, Any]:
+    """Get shared HTTP client configuration and pool statistics"""
+    stats = {
+        "base_url": LM_STUDIO_BASE_URL,
+        "http2": _http2_enabled(),
+        "max_connections": LM_HTTP_MAX_CONNECTIONS,
+        "max_keepalive_connections": LM_HTTP_MAX_KEEPALIVE,
+        "keepalive_expiry": LM_HTTP_KEEPALIVE_EXPIRY,
+        **_http_stats
+    }
+    if _async_http_client is not None and not _async_http_client.is_closed:
+        stats["async_pool"] = _connection_pool_stats(_async_http_client)
+    if _sync_http_client is not None and not _sync_http_client.is_closed:
+        stats["sync_pool"] = _connection_pool_stats(_sync_http_client)
+    return stats
+
 # Helper function to get system prompts
 def get_system_prompts():
     """Get system prompts from prompt manager"""
     return get_prompt_manager().prompts.get("system_prompts", {})
 
 def get_chatopen_ai_instance(model: str = None, temperature: float = None, max_tokens: int = None) -> ChatOpenAI:
-    """Get a reusable ChatOpenAI instance"""
-    global _chatopen_ai_instance
-    
+    """Get a reusable ChatOpenAI instance keyed by its parameters"""
     # Use defaults if not provided
     model = model or AI_MODEL
     temperature = temperature if temperature is not None else DEFAULT_TEMPERATURE
     max_tokens = max_tokens or DEFAULT_MAX_TOKENS
     timeout = MAX_INFERENCE_TIME / 1000
+    key = (model, temperature, max_tokens, timeout)
     
-    # Create new instance if none exists or parameters changed
-    if (_chatopen_ai_instance is None or 
-        _chatopen_ai_instance.model_name != model or 
-        _chatopen_ai_instance.temperature != temperature or
-        _chatopen_ai_instance.max_tokens != max_tokens):
+    with _llm_lock:
+        llm = _llm_instances.get(key)
+        if llm is not None:
+            _llm_instances.move_to_end(key)
+            _llm_stats["hits"] += 1
+            return llm
         
-        _chatopen_ai_instance = ChatOpenAI(
+        # All instances share the application-wide HTTP clients
+        llm = ChatOpenAI(
             base_url=LM_STUDIO_BASE_URL,
             api_key="not-needed",
             model_name=model,
             temperature=temperature,
             max_tokens=max_tokens,
-            timeout=timeout
+            timeout=timeout,
+            http_client=get_sync_http_client(),
+            http_async_client=get_async_http_client()
         )
+        _llm_instances[key] = llm
+        _llm_stats["builds"] += 1
+        while len(_llm_instances) > max(LM_LLM_CACHE_SIZE, 1):
+            _llm_instances.popitem(last=False)
+            _llm_stats["evictions"] += 1
     
-    return _chatopen_ai_instance
+    logger.debug(f"Created ChatOpenAI instance for {key}")
+    return llm
+
+def clear_llm_cache() -> None:
+    """Drop all cached ChatOpenAI instances"""
+    with _llm_lock:
+        _llm_instances.clear()
+
+def get_llm_cache_stats() -> Dict[str, Any]:
+    """Get ChatOpenAI instance cache statistics"""
+    with _llm_lock:
+        return {
+            "size": len(_llm_instances),
+            "max_size": LM_LLM_CACHE_SIZE,
+            **_llm_stats
+        }
+
+def record_cancelled_generation(max_tokens: Optional[int], generated_tokens: int = 0) -> None:
+    """Count a generation stopped after the client disconnected"""
+    saved = max((max_tokens or DEFAULT_MAX_TOKENS) - generated_tokens, 0)
+    _generation_stats["cancelled"] += 1
+    _generation_stats["max_tokens_saved"] += saved
+    logger.info(f"Cancelled generation after {generated_tokens} tokens, up to {saved} tokens saved")
+
+def get_generation_stats() -> Dict[str, Any]:
+    """Get counts of generations cancelled on client disconnect"""
+    return dict(_generation_stats)
 
 def parse_ai_response(content: str) -> ParsedAIResponse:
     """Parse AI response to separate think and answer sections"""
@@ -164,18 +347,18 @@ async def get_available_models() -> List[str]:
         return _available_models_cache
     
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(f"{LM_STUDIO_BASE_URL}/models")
-            response.raise_for_status()
-            
-            models_data = response.json()
-            model_ids = [model["id"] for model in models_data.get("data", [])]
-            
-            # Update cache
-            _available_models_cache = model_ids
-            _cache_timestamp = current_time
-            
-            return model_ids
+        client = get_async_http_client()
+        response = await client.get(f"{LM_STUDIO_BASE_URL}/models", timeout=10.0)
+        response.raise_for_status()
+        
+        models_data = response.json()
+        model_ids = [model["id"] for model in models_data.get("data", [])]
+        
+        # Update cache
+        _available_models_cache = model_ids
+        _cache_timestamp = current_time
+        
+        return model_ids
     except Exception as e:
         logger.error(f"Error fetching available models: {e}")
         return []
@@ -212,14 +395,16 @@ async def create_ai_request(
     max_tokens: Optional[int] = None,
     history: Optional[List[Dict[str, str]]] = None
 ) -> AIRequest:
-    """Create a standardized AI request"""
+    """Create a standardized AI request, trimming history oldest-first to fit the context window"""
     messages = [AIMessage(role="system", content=system_prompt)]
     
     # Add conversation history if provided
-    if history:
-        for msg in history:
-            if msg["role"] in ["user", "assistant", "system"]:
-                messages.append(AIMessage(role=msg["role"], content=msg["content"]))
+    history = [msg for msg in history or [] if msg["role"] in ["user", "assistant", "system"]]
+    history, budget = prompt_budget.budget_chat_messages(
+        system_prompt, history, content, max_tokens or DEFAULT_MAX_TOKENS
+    )
+    for msg in history:
+        messages.append(AIMessage(role=msg["role"], content=msg["content"]))
     
     # Add current message
     messages.append(AIMessage(role="user", content=content))
@@ -228,9 +413,16 @@ async def create_ai_request(
         messages=messages,
         model=model,
         temperature=temperature,
-        max_tokens=max_tokens
+        max_tokens=max_tokens,
+        budget=budget
     )
 
+
+def _prompt_tokens(request: AIRequest) -> int:
+    if request.budget:
+        return request.budget["prompt_tokens"]
+    return prompt_budget.count_message_tokens([msg.dict() for msg in request.messages])
+
 async def query_lm_studio_internal(request: AIRequest, timeout: float = None) -> AIResponse:
     """Internal function to send a request to LM Studio API using LangChain"""
     model = await validate_and_get_model(request.model)
@@ -272,6 +464,11 @@ async def query_lm_studio_internal(request: AIRequest, timeout: float = None) ->
         # Extract content from LangChain response
         full_content = response.content
         
+        # Prefer the server's token usage; count with the tokenizer when it is missing
+        usage_metadata = getattr(response, "usage_metadata", None) or {}
+        prompt_tokens = usage_metadata.get("input_tokens") or _prompt_tokens(request)
+        completion_tokens = usage_metadata.get("output_tokens") or prompt_budget.count_tokens(full_content)
+        
         # Log a sample of the final content for debugging
         content_sample = full_content[:100] + "..." if len(full_content) > 100 else full_content
         logger.debug(f"Final content sample: {content_sample}")
@@ -280,8 +477,12 @@ async def query_lm_studio_internal(request: AIRequest, timeout: float = None) ->
         ai_response = AIResponse(
             content=full_content,
             model=model,
-            usage=None,  # Not directly available from LangChain
-            tokens_per_second=None,
+            usage={
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
+            },
+            tokens_per_second=completion_tokens / total_time if total_time > 0 else None,
             time_to_first_token=None,
             tool_calls=None
         )
@@ -304,6 +505,10 @@ async def query_lm_studio(request: AIRequest, max_retries: int = 3) -> AIRespons
         try:
             response = await query_lm_studio_internal(request, timeout=timeout)
             return response
+        except asyncio.CancelledError:
+            # Cancelling drops the HTTP request, so LM Studio stops generating
+            record_cancelled_generation(request.max_tokens)
+            raise
         except Exception as e:
             last_error = e
             if "Client disconnected" in str(e):
@@ -325,7 +530,8 @@ async def handle_ai_error(e: Exception, task_name: str) -> Dict[str, Any]:
     return {
         "think": None,
         "answer": error_msg,
-        "raw_content": error_msg
+        "raw_content": error_msg,
+        "error": True
     }
 
 async def process_ai_request(
@@ -335,9 +541,36 @@ async def process_ai_request(
     temperature: Optional[float] = None,
     max_tokens: Optional[int] = None,
     history: Optional[List[Dict[str, str]]] = None,
-    task_name: str = "AI request"
+    task_name: str = "AI request",
+    cache_tags: Optional[List[str]] = None
 ) -> Dict[str, Any]:
     """Generic function to process AI requests with standardized error handling"""
+    cache = get_response_cache() if AI_RESPONSE_CACHE_ENABLED else None
+    cache_key = None
+    semantic_scope = None
+    content_vector = None
+    if cache is not None:
+        cache_key = make_cache_key(system_prompt, content, model or AI_MODEL, temperature, max_tokens, history)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            logger.debug(f"Response cache hit for {task_name}")
+            return cached
+        if AI_RESPONSE_CACHE_SEMANTIC_THRESHOLD > 0:
+            # Imported here: embeddings imports this module
+            from .embeddings import embed_query, get_embedding_model
+            semantic_scope = make_semantic_scope(
+                system_prompt, model or AI_MODEL, temperature, max_tokens, history, get_embedding_model()
+            )
+            try:
+                content_vector = await embed_query(content)
+            except Exception as e:
+                logger.warning(f"Semantic cache lookup skipped for {task_name}: {e}")
+            if content_vector is not None:
+                cached = cache.get_similar(semantic_scope, content_vector, AI_RESPONSE_CACHE_SEMANTIC_THRESHOLD)
+                if cached is not None:
+                    logger.debug(f"Semantic response cache hit for {task_name}")
+                    return cached
+    
     try:
         request = await create_ai_request(
             content=content,
@@ -351,11 +584,15 @@ async def process_ai_request(
         response = await query_lm_studio(request)
         parsed_response = parse_ai_response(response.content)
         
-        return {
+        result = {
             "think": parsed_response.think,
             "answer": parsed_response.answer,
             "raw_content": parsed_response.raw_content
         }
+        # Only successful responses are cached
+        if cache is not None:
+            cache.set(cache_key, result, tags=cache_tags, scope=semantic_scope, vector=content_vector)
+        return result
     except Exception as e:
         return await handle_ai_error(e, task_name)
 
@@ -364,7 +601,8 @@ async def analyze_journal_entry(
     entry_title: str, 
     entry_content: str, 
     analysis_type: str = "general", 
-    model: Optional[str] = None
+    model: Optional[str] = None,
+    entry_id: Optional[int] = None
 ) -> Dict[str, Any]:
     """Analyze a journal entry using the AI model."""
     system_prompt = get_prompt_manager().get_analysis_prompt(analysis_type)
@@ -378,7 +616,8 @@ async def analyze_journal_entry(
         model=model,
         temperature=0.7,
         max_tokens=max_tokens,
-        task_name="journal analysis"
+        task_name="journal analysis",
+        cache_tags=[f"entry:{entry_id}"] if entry_id is not None else None
     )
     
     result["analysis_type"] = analysis_type
@@ -473,29 +712,29 @@ async def check_ai_service() -> Dict[str, Any]:
     """Check if LM Studio API is available and return status details"""
     try:
         # Check models endpoint as a basic health check
-        async with httpx.AsyncClient(timeout=5.0) as client:
-            response = await client.get(f"{LM_STUDIO_BASE_URL}/models")
+        client = get_async_http_client()
+        response = await client.get(f"{LM_STUDIO_BASE_URL}/models", timeout=5.0)
+        
+        if response.status_code == 200:
+            models_data = response.json()
+            model_count = len(models_data.get("data", []))
             
-            if response.status_code == 200:
-                models_data = response.json()
-                model_count = len(models_data.get("data", []))
-                
-                # Get a sample model if available
-                sample_model = models_data.get("data", [{}])[0].get("id", "unknown") if model_count > 0 else "none"
-                
-                return {
-                    "status": "available",
-                    "message": "LM Studio API is available",
-                    "base_url": LM_STUDIO_BASE_URL,
-                    "model_count": model_count,
-                    "sample_model": sample_model
-                }
-            else:
-                return {
-                    "status": "error",
-                    "message": f"LM Studio API returned status code {response.status_code}",
-                    "base_url": LM_STUDIO_BASE_URL
-                }
+            # Get a sample model if available
+            sample_model = models_data.get("data", [{}])[0].get("id", "unknown") if model_count > 0 else "none"
+            
+            return {
+                "status": "available",
+                "message": "LM Studio API is available",
+                "base_url": LM_STUDIO_BASE_URL,
+                "model_count": model_count,
+                "sample_model": sample_model
+            }
+        else:
+            return {
+                "status": "error",
+                "message": f"LM Studio API returned status code {response.status_code}",
+                "base_url": LM_STUDIO_BASE_URL
+            }
     except Exception as e:
         return {
             "status": "unavailable",
@@ -507,7 +746,6 @@ async def query_lm_studio_stream(request: AIRequest):
     """Query LM Studio with streaming response using direct OpenAI client"""
     try:
         import time
-        import json
         start_time = time.time()
         
         logger.debug(f"Starting streaming query to LM Studio")
@@ -522,56 +760,76 @@ async def query_lm_studio_stream(request: AIRequest):
         timeout = MAX_INFERENCE_TIME / 1000
         
         # Use direct OpenAI API streaming since LangChain streaming has issues
-        from openai import AsyncOpenAI
-        
-        # Initialize OpenAI client for LM Studio
-        openai_client = AsyncOpenAI(
-            base_url=LM_STUDIO_BASE_URL,
-            api_key="not-needed"  # LM Studio doesn't require an API key
-        )
+        openai_client = get_async_openai_client()
         
         # Convert our AIMessage objects to OpenAI format
         openai_messages = []
         for msg in request.messages:
             openai_messages.append({"role": msg.role, "content": msg.content})
         
-        # Stream response directly using OpenAI client
+        # Stream response directly using OpenAI client; include_usage makes the
+        # server send its token counts in a final chunk with no choices
         stream = await openai_client.chat.completions.create(
             model=model,
             messages=openai_messages,
             temperature=temperature,
             max_tokens=max_tokens,
             stream=True,
+            stream_options={"include_usage": True},
             timeout=timeout
         )
         
-        collected_content = ""
-        async for chunk in stream:
-            if hasattr(chunk, 'choices') and chunk.choices:
-                choice = chunk.choices[0]
-                if hasattr(choice, 'delta') and hasattr(choice.delta, 'content') and choice.delta.content is not None:
-                    content = choice.delta.content
-                    collected_content += content
-                    yield content
+        usage = None
+        first_token_time = None
+        counted_tokens = 0
+        try:
+            async for chunk in stream:
+                if chunk.usage is not None:
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                # Servers that split reasoning out of the content send it as reasoning_content
+                reasoning = getattr(delta, "reasoning_content", None)
+                if reasoning:
+                    yield Thinking(reasoning)
+                if delta.content:
+                    if first_token_time is None:
+                        first_token_time = time.time()
+                    if usage is None:
+                        counted_tokens += prompt_budget.count_tokens(delta.content)
+                    yield Token(delta.content)
+        except (asyncio.CancelledError, GeneratorExit):
+            # The consumer went away (client disconnect) before the reply was complete
+            record_cancelled_generation(max_tokens, counted_tokens)
+            raise
+        finally:
+            # Closing the response aborts the HTTP request, so LM Studio stops generating
+            await stream.close()
         
         # Calculate final stats
         end_time = time.time()
         total_time = end_time - start_time
         
-        # Estimate tokens based on content length (approximate)
-        total_tokens = len(collected_content) / 4
-        tokens_per_second = total_tokens / total_time if total_time > 0 else 0
+        if usage is not None:
+            prompt_tokens, completion_tokens, usage_source = usage.prompt_tokens, usage.completion_tokens, "server"
+        else:
+            # Older servers ignore include_usage: count with the prompt budget tokenizer
+            prompt_tokens, completion_tokens = _prompt_tokens(request), counted_tokens
+            usage_source = prompt_budget.get_tokenizer_name()
         
-        # Send stats as a separate message
-        yield json.dumps({
-            "type": "stats",
-            "inference_time": int(total_time * 1000),  # Convert to milliseconds
-            "tokens_per_second": tokens_per_second
-        })
+        yield Stats(
+            inference_time=int(total_time * 1000),  # Convert to milliseconds
+            tokens_per_second=completion_tokens / total_time if total_time > 0 else 0,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            time_to_first_token=int((first_token_time - start_time) * 1000) if first_token_time else None,
+            usage_source=usage_source
+        )
     
     except Exception as e:
         logger.error(f"Error in streaming query: {str(e)}")
-        yield f"Error: {str(e)}"
+        yield Error(str(e))
 
 # Agent functionality (simplified, keeping only what's actually used)
 
@@ -593,8 +851,8 @@ def create_default_tools() -> List[Tool]:
 async def _post_process_sql_execution(content: str, streaming: bool = False):
     """Post-process agent response to execute SQL code if provided but not executed"""
     try:
-        # Import the SQL tool for executing queries
-        from app.ai.sql_tool import SQLTool
+        # Import the shared SQL tool for executing queries
+        from app.ai.sql_tool import get_sql_tool
         import re
         import os
         
@@ -606,7 +864,7 @@ async def _post_process_sql_execution(content: str, streaming: bool = False):
             logger.warning("No DATABASE_URL found, skipping SQL post-processing")
             return None
             
-        sql_tool = SQLTool(database_url)
+        sql_tool = get_sql_tool(database_url)
         
         # Look for SQL queries in the new format from model
         # Priority order: proper code blocks first, then direct SQL patterns
@@ -670,8 +928,8 @@ async def _post_process_sql_execution(content: str, streaming: bool = False):
                     logger.info(f"🔧 Executing SQL: {sql_query[:100]}...")
                     executed_queries.add(query_key)
                     
-                    # Execute the query
-                    result = sql_tool.execute_query(sql_query)
+                    # Execute the query on the async pool so the event loop is not blocked
+                    result = await sql_tool.aexecute_query(sql_query)
                     
                     if result.get("success", False):
                         query_result = result.get("result", [])
@@ -745,10 +1003,23 @@ async def chat_with_ai(
     system_prompt: Optional[str] = None,
     streaming: bool = False,
     use_agent: bool = False,
-    tools: Optional[List[Tool]] = None
+    tools: Optional[List[Tool]] = None,
+    use_rag: bool = False,
+    user_id: Optional[int] = None
 ):
     """Process a chat message with AI."""
     try:
+        if user_id is not None:
+            from app.ai.sql_tool import set_query_user
+            # Agent and post-processed SQL read from the primary right after this user's writes
+            set_query_user(user_id)
+
+        # Retrieval-augmented mode answers from the user's entries in one LLM call
+        if use_rag and user_id is not None:
+            async for chunk in _chat_with_rag(message, user_id, history, model, system_prompt, streaming):
+                yield chunk
+            return
+
         # Kiểm tra message có liên quan đến database không để chuẩn bị thông tin schema
         is_db_related = any(keyword in message.lower() for keyword in 
                            ["database", "sql", "query", "table", "schema", "select", "insert", 
@@ -758,17 +1029,19 @@ async def chat_with_ai(
         # Lấy thông tin database schema nếu có database và câu hỏi liên quan đến database
         if is_db_related:
             try:
-                from app.ai.sql_tool import SQLTool
+                from app.ai.sql_tool import get_sql_tool
+                from app.ai.schema_selector import select_schema
                 import os
                 
                 database_url = os.getenv("DATABASE_URL")
                 if database_url:
                     logger.info("Fetching database schema for database-related question")
-                    sql_tool = SQLTool(database_url)
-                    schema_result = sql_tool.get_database_schema()
+                    sql_tool = get_sql_tool(database_url)
+                    schema_result = await asyncio.to_thread(sql_tool.get_database_schema)
                     
                     if schema_result.get("success", False):
-                        schema_text = schema_result.get("schema", "")
+                        # Describe only the tables the question needs
+                        schema_text = select_schema(schema_result.get("tables", []), message) or schema_result.get("schema", "")
                         # Tạo prompt cho database schema
                         schema_prompt_prefix = "\n\n## Database Information\nYou have access to a PostgreSQL database with the following schema:\n\n```\n"
                         schema_prompt_suffix = "```\n\n### SQL Guidelines:\n1. Always analyze the schema first to understand the data structure\n2. Use appropriate SQL statements based on the task:\n   - SELECT: To retrieve data\n   - INSERT, UPDATE, DELETE: To modify data\n3. Always use proper SQL syntax and PostgreSQL features\n4. When writing SQL queries:\n   - Use explicit column names instead of * when possible\n   - Add proper JOIN conditions when joining tables\n   - Include appropriate WHERE clauses to filter data\n   - Use ORDER BY for sorting when needed\n   - Add LIMIT to control result size\n5. Format SQL queries properly with appropriate indentation and keywords in UPPERCASE\n6. Explain your SQL approach before providing the query\n\n### When answering database questions:\n1. Explain clearly which tables and columns are relevant to the question\n2. Break down complex requests into simpler steps\n3. Provide well-formatted SQL queries with comments explaining key parts\n4. Explain what the expected result would look like\n5. When suggesting data modifications, warn about potential data integrity risks"
@@ -788,11 +1061,12 @@ async def chat_with_ai(
             logger.info(f"Using LangChainAgent for message: {message}")
             # Initialize agent with error handling
             try:
-                from app.ai.agent import LangChainAgent  # Import agent class
-                agent = LangChainAgent(
+                from app.ai.agent import get_agent  # Reuse cached agent templates
+                agent = get_agent(
                     model_name=model or AI_MODEL,
                     system_prompt=system_prompt,
-                    tools=tools  # Pass tools as-is, don't fallback to default tools
+                    tools=tools,  # Pass tools as-is, don't fallback to default tools
+                    question=message  # Describe the tables this question needs
                 )
                 print(f"{COLORS['GREEN']}✓ LangChainAgent initialized successfully{COLORS['RESET']}")
                 
@@ -800,19 +1074,19 @@ async def chat_with_ai(
                 if streaming:
                     print(f"{COLORS['CYAN']}🌊 Starting streaming response...{COLORS['RESET']}")
                     # Use agent streaming method that maintains tool access
-                    collected_content = ""
-                    async for chunk in agent.chat_with_agent_streaming(message):
-                        if chunk:  # Only yield non-empty chunks
-                            collected_content += chunk
-                            yield chunk
+                    collected_chunks = []
+                    async for event in agent.chat_with_agent_streaming(message):
+                        if isinstance(event, Token):
+                            collected_chunks.append(event.text)
+                        yield event
                     
-                    # Post-process SQL execution after all chunks are collected
-                    real_sql_result = await _post_process_sql_execution(collected_content, streaming=True)
+                    # Post-process SQL execution after all chunks are collected, ignoring the thinking
+                    real_sql_result = await _post_process_sql_execution(split_think(collected_chunks)[1], streaming=True)
                     if real_sql_result and real_sql_result.get("success", False):
                         # Yield real result as a special message
                         real_message = real_sql_result.get("message", "")
                         if real_message:
-                            yield f"\n\n{real_message}"
+                            yield Token(f"\n\n{real_message}")
                 else:
                     print(f"{COLORS['BLUE']}💬 Processing non-streaming response...{COLORS['RESET']}")
                     # Use non-streaming mode
@@ -850,19 +1124,17 @@ async def chat_with_ai(
         if streaming:
             # Add SQL post-processing for agent mode
             if use_agent:
-                collected_content = ""
-                async for chunk in query_lm_studio_stream(request):
-                    if isinstance(chunk, str) and not chunk.startswith('{"type":"stats"'):
-                        collected_content += chunk
-                        yield chunk
-                    else:
-                        yield chunk
+                collected_chunks = []
+                async for event in query_lm_studio_stream(request):
+                    if isinstance(event, Token):
+                        collected_chunks.append(event.text)
+                    yield event
                 
                 # Post-process to execute SQL if agent provided code but didn't execute it
-                await _post_process_sql_execution(collected_content, streaming=True)
+                await _post_process_sql_execution(split_think(collected_chunks)[1], streaming=True)
             else:
-                async for chunk in query_lm_studio_stream(request):
-                    yield chunk if not (isinstance(chunk, str) and chunk.startswith('{"type":"stats"')) else chunk
+                async for event in query_lm_studio_stream(request):
+                    yield event
         else:
             response = await query_lm_studio(request)
             result = {
@@ -886,6 +1158,48 @@ async def chat_with_ai(
             "error": True
         }
 
+async def _chat_with_rag(
+    message: str,
+    user_id: int,
+    history: Optional[List[Dict[str, str]]],
+    model: Optional[str],
+    system_prompt: Optional[str],
+    streaming: bool
+):
+    """Answer from the user's top-k relevant entries, citing them by id"""
+    from app.ai.rag import prepare_rag_context, extract_citations, public_sources
+    rag = await prepare_rag_context(user_id, message, system_prompt)
+    sources = rag["sources"]
+    request = await create_ai_request(
+        content=message,
+        system_prompt=rag["system_prompt"],
+        model=model,
+        temperature=0.7,
+        max_tokens=2000,
+        history=history
+    )
+
+    if streaming:
+        yield Sources(public_sources(sources))
+        # Citations count only in the answer, not in the model's thinking
+        think_parser = ThinkTagParser()
+        answer_parts = []
+        async for event in query_lm_studio_stream(request):
+            if isinstance(event, Token):
+                answer_parts.extend(text for section, text in think_parser.feed(event.text) if section == "answer")
+            yield event
+        answer_parts.extend(text for section, text in think_parser.flush() if section == "answer")
+        yield Citations(extract_citations("".join(answer_parts), sources))
+    else:
+        response = await query_lm_studio(request)
+        yield {
+            "content": response.content,
+            "model": response.model,
+            "usage": response.usage,
+            "sources": public_sources(sources),
+            "citations": extract_citations(split_think([response.content])[1], sources)
+        }
+
 async def chat_with_ai_agent_enhanced_streaming(
     message: str,
     model: Optional[str] = None,
@@ -901,24 +1215,23 @@ async def chat_with_ai_agent_enhanced_streaming(
         agent_status = f"{COLORS['GREEN']}{COLORS['BOLD']}[ENHANCED AGENT STREAMING]{COLORS['RESET']}"
         print(f"\n{agent_status} Initializing LangChainAgent with model: {model or AI_MODEL}")
         
-        from app.ai.agent import LangChainAgent
-        agent = LangChainAgent(
+        from app.ai.agent import get_agent
+        agent = get_agent(
             model_name=model or AI_MODEL,
             system_prompt=system_prompt,
-            tools=tools  # Pass tools as-is, don't fallback to default tools
+            tools=tools,  # Pass tools as-is, don't fallback to default tools
+            question=message  # Describe the tables this question needs
         )
         print(f"{COLORS['GREEN']}✓ Enhanced streaming agent initialized{COLORS['RESET']}")
         print(f"{COLORS['CYAN']}🔍 Starting detailed streaming...{COLORS['RESET']}")
         
         # Use the enhanced event streaming
-        async for event_chunk in agent.astream_events(message):
-            if event_chunk:
-                yield event_chunk
+        async for event in agent.astream_events(message):
+            yield event
                 
     except Exception as e:
         logger.error(f"Enhanced agent streaming error: {e}")
-        error_msg = f"Enhanced streaming error: {str(e)}"
-        yield error_msg
+        yield Error(f"Enhanced streaming error: {str(e)}")
 
 def _clean_sql_query(sql_query: str):
     """Clean and extract valid SQL query from text"""
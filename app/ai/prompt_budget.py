@@ -0,0 +1,145 @@
+"""
+Token-budgeted prompt assembly.
+
+Counts tokens with tiktoken (or a model's tokenizer.json when PROMPT_TOKENIZER
+points at one) and trims chat history oldest-first to fit the context window.
+"""
+import logging
+import math
+import os
+import re
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# tiktoken encoding name, or the path of a model's tokenizer.json (needs the tokenizers package)
+PROMPT_TOKENIZER = os.getenv("PROMPT_TOKENIZER", "cl100k_base")
+# Context length the model is loaded with; prompt plus completion must fit in it
+PROMPT_CONTEXT_WINDOW = int(os.getenv("PROMPT_CONTEXT_WINDOW", "4096"))
+# Budgets for the database sections of the SQL agent prompt
+PROMPT_SCHEMA_TOKENS = int(os.getenv("PROMPT_SCHEMA_TOKENS", "1200"))
+PROMPT_EXAMPLES_TOKENS = int(os.getenv("PROMPT_EXAMPLES_TOKENS", "400"))
+
+# Chat formatting overhead: role markers per message and the assistant reply priming
+MESSAGE_OVERHEAD_TOKENS = 4
+REPLY_PRIMING_TOKENS = 3
+
+_PIECES = re.compile(r"\w+|[^\w\s]")
+
+_tokenizer = None
+_tokenizer_name = None
+_tokenizer_lock = threading.Lock()
+
+
+def _load_tokenizer():
+    if PROMPT_TOKENIZER.endswith(".json"):
+        from tokenizers import Tokenizer
+        tokenizer = Tokenizer.from_file(PROMPT_TOKENIZER)
+        return lambda text: len(tokenizer.encode(text, add_special_tokens=False).ids)
+    import tiktoken
+    encoding = tiktoken.get_encoding(PROMPT_TOKENIZER)
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+
+def _heuristic_count(text: str) -> int:
+    return max(len(_PIECES.findall(text)), math.ceil(len(text) / 4))
+
+
+def get_tokenizer_name() -> str:
+    """Tokenizer in use, or "estimate" when it could not be loaded"""
+    _get_counter()
+    return _tokenizer_name
+
+
+def _get_counter():
+    global _tokenizer, _tokenizer_name
+    if _tokenizer_name is None:
+        with _tokenizer_lock:
+            if _tokenizer_name is None:
+                try:
+                    _tokenizer = _load_tokenizer()
+                    _tokenizer_name = PROMPT_TOKENIZER
+                except Exception as e:
+                    # tiktoken downloads its encodings on first use; offline hosts fall back
+                    logger.warning(f"Tokenizer {PROMPT_TOKENIZER} unavailable, estimating token counts: {e}")
+                    _tokenizer = _heuristic_count
+                    _tokenizer_name = "estimate"
+    return _tokenizer
+
+
+def count_tokens(text: Optional[str]) -> int:
+    """Number of tokens in text"""
+    if not text:
+        return 0
+    return _get_counter()(text)
+
+
+def count_message_tokens(messages: Sequence[Dict[str, str]]) -> int:
+    """Tokens of a chat prompt, including per-message formatting"""
+    return sum(count_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS for message in messages) + REPLY_PRIMING_TOKENS
+
+
+def truncate_to_tokens(text: str, max_tokens: int, marker: str = "\n…") -> str:
+    """Cut text at a line (or word) boundary so it fits max_tokens"""
+    if count_tokens(text) <= max_tokens:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(text[:middle] + marker) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    cut = text[:low]
+    boundary = max(cut.rfind("\n"), cut.rfind(" "))
+    if boundary > len(cut) // 2:
+        cut = cut[:boundary]
+    return cut.rstrip() + marker if cut.strip() else ""
+
+
+def fit_history(history: Sequence[Dict[str, str]], budget_tokens: int) -> Tuple[List[Dict[str, str]], int]:
+    """Keep the newest messages that fit the budget; returns (kept, dropped count)"""
+    kept: List[Dict[str, str]] = []
+    used = 0
+    for message in reversed(history):
+        cost = count_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+        if used + cost > budget_tokens:
+            break
+        kept.append(message)
+        used += cost
+    kept.reverse()
+    return kept, len(history) - len(kept)
+
+
+def budget_chat_messages(
+    system_prompt: str,
+    history: Sequence[Dict[str, str]],
+    message: str,
+    completion_tokens: int,
+    context_window: Optional[int] = None
+) -> Tuple[List[Dict[str, str]], Dict[str, Any]]:
+    """Trim history so system prompt, history, message and the completion fit the context window"""
+    context_window = context_window or PROMPT_CONTEXT_WINDOW
+    sections = {
+        "system": count_tokens(system_prompt) + MESSAGE_OVERHEAD_TOKENS,
+        "message": count_tokens(message) + MESSAGE_OVERHEAD_TOKENS,
+    }
+    available = context_window - completion_tokens - REPLY_PRIMING_TOKENS - sum(sections.values())
+    kept, dropped = fit_history(history, max(available, 0))
+    sections["history"] = sum(count_tokens(item["content"]) + MESSAGE_OVERHEAD_TOKENS for item in kept)
+    prompt_tokens = sum(sections.values()) + REPLY_PRIMING_TOKENS
+    if dropped:
+        logger.info(f"Dropped {dropped} oldest history messages to fit the {context_window} token context window")
+    if prompt_tokens + completion_tokens > context_window:
+        logger.warning(
+            f"Prompt of {prompt_tokens} tokens leaves less than {completion_tokens} completion tokens "
+            f"in the {context_window} token context window"
+        )
+    return kept, {
+        "prompt_tokens": prompt_tokens,
+        "sections": sections,
+        "dropped_history": dropped,
+        "context_window": context_window,
+        "tokenizer": get_tokenizer_name()
+    }
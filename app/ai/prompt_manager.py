@@ -2,169 +2,276 @@
 Prompt Manager for TCC Log AI System
 Handles loading and formatting of prompt templates from JSON files
 """
+import hashlib
 import json
 import os
 import logging
+import threading
+import time
+from collections import OrderedDict
 from typing import Dict, Any, Optional, List
 from pathlib import Path
 
 logger = logging.getLogger(__name__)
 
+# How often prompts.json is checked for edits (seconds); 0 checks on every lookup
+PROMPTS_RELOAD_INTERVAL = float(os.getenv("PROMPTS_RELOAD_INTERVAL", "2"))
+PROMPTS_HOT_RELOAD = os.getenv("PROMPTS_HOT_RELOAD", "true").lower() == "true"
+# Rendered SQL prompts kept per (prompt type, schema fingerprint)
+PROMPTS_RENDER_CACHE_SIZE = int(os.getenv("PROMPTS_RENDER_CACHE_SIZE", "32"))
+
+
+def _fingerprint(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+class CompiledPrompts:
+    """Immutable snapshot of prompts.json with its static prompt fragments prebuilt"""
+
+    def __init__(self, prompts: Dict[str, Any], builder: "PromptManager"):
+        self.prompts = prompts
+        self.loaded_at = time.time()
+        self.version = _fingerprint(json.dumps(prompts, sort_keys=True, ensure_ascii=False))
+
+        system_prompts = prompts.get("system_prompts", {})
+        sql_config = system_prompts.get("sql_agent", {})
+        self.sql_intro = sql_config.get("intro", "")
+        # Every section after the schema-dependent intro is static
+        self.sql_suffix = "".join([
+            sql_config.get("workflow", ""),
+            sql_config.get("format", ""),
+            builder._build_examples_section(sql_config.get("examples", [])),
+            builder._build_prohibited_section(sql_config.get("prohibited_behaviors", [])),
+            builder._build_best_practices_section(sql_config.get("best_practices", {})),
+            builder._build_guidelines_section(sql_config.get("parsing_guidelines", [])),
+            builder._build_remember_section(sql_config.get("remember", []))
+        ])
+        dummy_config = prompts.get("dummy_schema", {})
+        self.dummy_schema = (
+            f"{dummy_config.get('description', 'No tables found.')}\n\n"
+            f"Example table creation:\n{dummy_config.get('example_create', '')}\n\n"
+            f"Example data insertion:\n{dummy_config.get('example_insert', '')}"
+        )
+
+        self.versions = {"sql_agent": _fingerprint(self.sql_intro + self.sql_suffix + self.dummy_schema)}
+        for name, value in system_prompts.items():
+            if isinstance(value, str):
+                self.versions[name] = _fingerprint(value)
+        for group, prefix in (("analysis_prompts", "analysis"), ("writing_improvement", "writing")):
+            for name, value in system_prompts.get(group, {}).items():
+                self.versions[f"{prefix}:{name}"] = _fingerprint(value)
+
+        # Rendered prompts belong to this snapshot, so a reload drops them with it
+        self.rendered: "OrderedDict[tuple, str]" = OrderedDict()
+
+
 class PromptManager:
     """Manages AI prompts loaded from JSON configuration files"""
-    
-    def __init__(self, prompts_file: str = None):
+
+    def __init__(self, prompts_file: Optional[str] = None):
         self.prompts_file = prompts_file or os.path.join(
-            os.path.dirname(__file__), 
+            os.path.dirname(__file__),
             "prompts.json"
         )
-        self.prompts = {}
+        self._lock = threading.Lock()
+        self._compiled: Optional[CompiledPrompts] = None
+        # mtime of prompts.json at the last load attempt, including ones that failed to parse
+        self._loaded_mtime: Optional[float] = None
+        self._checked_at = 0.0
+        self.reloads = 0
+        self.render_hits = 0
+        self.render_misses = 0
         self.load_prompts()
-    
+
+    @property
+    def prompts(self) -> Dict[str, Any]:
+        """Raw prompt configuration of the current snapshot"""
+        return self._current().prompts
+
+    def _file_mtime(self) -> Optional[float]:
+        try:
+            return os.stat(self.prompts_file).st_mtime
+        except OSError:
+            return None
+
     def load_prompts(self) -> None:
-        """Load prompts from JSON file"""
+        """Load and compile prompts from JSON file, swapping them in as one snapshot"""
+        mtime = self._file_mtime()
         try:
-            if os.path.exists(self.prompts_file):
+            if mtime is not None:
                 with open(self.prompts_file, 'r', encoding='utf-8') as f:
-                    self.prompts = json.load(f)
+                    prompts = json.load(f)
                 logger.info(f"Loaded prompts from {self.prompts_file}")
             else:
                 logger.warning(f"Prompts file not found: {self.prompts_file}")
-                self.prompts = self._get_default_prompts()
+                prompts = self._get_default_prompts()
         except Exception as e:
             logger.error(f"Error loading prompts from {self.prompts_file}: {e}")
-            self.prompts = self._get_default_prompts()
-    
+            if self._compiled is not None:
+                # Keep serving the last good prompts while the file is being edited
+                self._loaded_mtime = mtime
+                return
+            prompts = self._get_default_prompts()
+
+        compiled = CompiledPrompts(prompts, self)
+        with self._lock:
+            if self._compiled is not None:
+                self.reloads += 1
+            self._compiled = compiled
+            self._loaded_mtime = mtime
+            self._checked_at = time.monotonic()
+
     def reload_prompts(self) -> None:
         """Reload prompts from file (useful for development)"""
         self.load_prompts()
-    
+
+    def _snapshot(self) -> CompiledPrompts:
+        compiled = self._compiled
+        # load_prompts() in __init__ always installs a snapshot
+        assert compiled is not None
+        return compiled
+
+    def _current(self) -> CompiledPrompts:
+        """Current snapshot, reloaded first if prompts.json changed on disk"""
+        if not PROMPTS_HOT_RELOAD:
+            return self._snapshot()
+        now = time.monotonic()
+        if now - self._checked_at < PROMPTS_RELOAD_INTERVAL:
+            return self._snapshot()
+        self._checked_at = now
+        if self._file_mtime() != self._loaded_mtime:
+            logger.info(f"Prompts file changed, reloading {self.prompts_file}")
+            self.load_prompts()
+        return self._snapshot()
+
+    def get_version(self) -> str:
+        """Fingerprint of the whole prompt configuration"""
+        return self._current().version
+
+    def get_prompt_version(self, prompt_type: str) -> str:
+        """Fingerprint of one prompt ("default_chat", "sql_agent", "analysis:mood", "writing:complete")"""
+        compiled = self._current()
+        version = compiled.versions.get(prompt_type)
+        if version is not None:
+            return version
+        # Unknown types resolve to the same fallback text their getters return
+        group, _, name = prompt_type.partition(":")
+        if group == "analysis":
+            return _fingerprint(self.get_analysis_prompt(name))
+        if group == "writing":
+            return _fingerprint(self.get_writing_improvement_prompt(name))
+        return _fingerprint(self.get_system_prompt(prompt_type))
+
     def get_system_prompt(self, prompt_type: str = "default_chat") -> str:
         """Get a system prompt by type"""
         try:
-            return self.prompts.get("system_prompts", {}).get(prompt_type, "")
+            return self._current().prompts.get("system_prompts", {}).get(prompt_type, "")
         except Exception as e:
             logger.error(f"Error getting system prompt '{prompt_type}': {e}")
             return "You are a helpful AI assistant."
-    
+
     def get_sql_prompt(self, schema_text: str = "") -> str:
         """Generate SQL prompt with schema information"""
         try:
-            sql_config = self.prompts.get("system_prompts", {}).get("sql_agent", {})
-            
+            compiled = self._current()
+            key = ("sql_agent", _fingerprint(schema_text or ""))
+            with self._lock:
+                rendered = compiled.rendered.get(key)
+                if rendered is not None:
+                    compiled.rendered.move_to_end(key)
+                    self.render_hits += 1
+                    return rendered
+                self.render_misses += 1
+
             # Handle empty schema
             if not schema_text or schema_text.strip() == "":
-                dummy_config = self.prompts.get("dummy_schema", {})
-                schema_text = (
-                    f"{dummy_config.get('description', 'No tables found.')}\n\n"
-                    f"Example table creation:\n{dummy_config.get('example_create', '')}\n\n"
-                    f"Example data insertion:\n{dummy_config.get('example_insert', '')}"
-                )
-            
+                schema_text = compiled.dummy_schema
+
             # Escape curly braces in schema_text
             safe_schema_text = schema_text.replace("{", "{{").replace("}", "}}")
-            
-            # Build the SQL prompt
-            prompt_parts = [
-                sql_config.get("intro", "").format(schema_text=safe_schema_text),
-                sql_config.get("workflow", ""),
-                sql_config.get("format", ""),
-                self._build_examples_section(sql_config.get("examples", [])),
-                self._build_prohibited_section(sql_config.get("prohibited_behaviors", [])),
-                self._build_best_practices_section(sql_config.get("best_practices", {})),
-                self._build_guidelines_section(sql_config.get("parsing_guidelines", [])),
-                self._build_remember_section(sql_config.get("remember", []))
-            ]
-            
-            return "".join(prompt_parts)
-            
+            rendered = compiled.sql_intro.format(schema_text=safe_schema_text) + compiled.sql_suffix
+
+            with self._lock:
+                compiled.rendered[key] = rendered
+                compiled.rendered.move_to_end(key)
+                while len(compiled.rendered) > PROMPTS_RENDER_CACHE_SIZE:
+                    compiled.rendered.popitem(last=False)
+            return rendered
+
         except Exception as e:
             logger.error(f"Error building SQL prompt: {e}")
             return "\n\nDatabase access available but prompt configuration error."
-    
+
     def get_analysis_prompt(self, analysis_type: str = "general") -> str:
         """Get analysis prompt for journal entries"""
         try:
-            analysis_prompts = self.prompts.get("system_prompts", {}).get("analysis_prompts", {})
+            analysis_prompts = self._current().prompts.get("system_prompts", {}).get("analysis_prompts", {})
             return analysis_prompts.get(analysis_type, analysis_prompts.get("general", ""))
         except Exception as e:
             logger.error(f"Error getting analysis prompt '{analysis_type}': {e}")
             return "Analyze this content and provide insights."
-    
+
     def get_writing_improvement_prompt(self, improvement_type: str = "complete") -> str:
         """Get writing improvement prompt"""
         try:
-            writing_prompts = self.prompts.get("system_prompts", {}).get("writing_improvement", {})
+            writing_prompts = self._current().prompts.get("system_prompts", {}).get("writing_improvement", {})
             return writing_prompts.get(improvement_type, writing_prompts.get("complete", ""))
         except Exception as e:
             logger.error(f"Error getting writing improvement prompt '{improvement_type}': {e}")
             return "Improve this text for better clarity and correctness."
-    
+
     def _build_examples_section(self, examples: List[Dict]) -> str:
         """Build examples section from JSON configuration"""
         if not examples:
             return ""
-        
-        section = "\n\n### EXAMPLES:\n\n"
-        
+
+        parts = ["\n\n### EXAMPLES:\n\n"]
         for i, example in enumerate(examples, 1):
-            section += f"**Example {i} - {example.get('title', 'Query')}:**\n\n"
-            section += f"### QUERY_INTENT: {example.get('query_intent', '')}\n"
-            section += f"SQL_NEEDED: {example.get('sql_needed', 'yes')}\n\n"
-            section += f"```\n{example.get('sql', '')}\n```\n\n"
-            section += f"EXPECTED_RESULT: {example.get('expected_result', '')}\n\n"
-            section += f"EXPLANATION: {example.get('explanation', '')}\n\n"
-        
-        return section
-    
+            parts.extend([
+                f"**Example {i} - {example.get('title', 'Query')}:**\n\n",
+                f"### QUERY_INTENT: {example.get('query_intent', '')}\n",
+                f"SQL_NEEDED: {example.get('sql_needed', 'yes')}\n\n",
+                f"```\n{example.get('sql', '')}\n```\n\n",
+                f"EXPECTED_RESULT: {example.get('expected_result', '')}\n\n",
+                f"EXPLANATION: {example.get('explanation', '')}\n\n"
+            ])
+        return "".join(parts)
+
     def _build_prohibited_section(self, prohibited: List[str]) -> str:
         """Build prohibited behaviors section"""
         if not prohibited:
             return ""
-        
-        section = "\n### PROHIBITED BEHAVIORS:\n\n"
-        for behavior in prohibited:
-            section += f"❌ **{behavior}**\n\n"
-        
-        return section
-    
+
+        return "\n### PROHIBITED BEHAVIORS:\n\n" + "".join(f"❌ **{behavior}**\n\n" for behavior in prohibited)
+
     def _build_best_practices_section(self, practices: Dict[str, List[str]]) -> str:
         """Build best practices section"""
         if not practices:
             return ""
-        
-        section = "\n### SQL BEST PRACTICES:\n\n"
-        
+
+        parts = ["\n### SQL BEST PRACTICES:\n\n"]
         for category, items in practices.items():
-            section += f"{category.replace('_', ' ').title()}:\n"
-            for item in items:
-                section += f"   - {item}\n"
-            section += "\n"
-        
-        return section
-    
+            parts.append(f"{category.replace('_', ' ').title()}:\n")
+            parts.extend(f"   - {item}\n" for item in items)
+            parts.append("\n")
+        return "".join(parts)
+
     def _build_guidelines_section(self, guidelines: List[str]) -> str:
         """Build parsing guidelines section"""
         if not guidelines:
             return ""
-        
-        section = "\n### PARSING GUIDELINES:\n\n"
-        for i, guideline in enumerate(guidelines, 1):
-            section += f"{i}. **{guideline}**\n"
-        
-        return section
-    
+
+        return "\n### PARSING GUIDELINES:\n\n" + "".join(
+            f"{i}. **{guideline}**\n" for i, guideline in enumerate(guidelines, 1)
+        )
+
     def _build_remember_section(self, remember_items: List[str]) -> str:
         """Build remember section"""
         if not remember_items:
             return ""
-        
-        section = "\n### REMEMBER:\n"
-        for item in remember_items:
-            section += f"- {item}\n"
-        
-        return section
-    
+
+        return "\n### REMEMBER:\n" + "".join(f"- {item}\n" for item in remember_items)
+
     def _get_default_prompts(self) -> Dict[str, Any]:
         """Fallback prompts if JSON file is not available"""
         return {
@@ -176,31 +283,37 @@ class PromptManager:
                 "description": "Default fallback prompts"
             }
         }
-    
-    def save_prompts(self, prompts: Dict[str, Any] = None) -> bool:
+
+    def save_prompts(self, prompts: Optional[Dict[str, Any]] = None) -> bool:
         """Save prompts to JSON file"""
         try:
             prompts_to_save = prompts or self.prompts
-            with open(self.prompts_file, 'w', encoding='utf-8') as f:
+            # Write then rename so a concurrent reload never reads a half-written file
+            temp_file = f"{self.prompts_file}.tmp"
+            with open(temp_file, 'w', encoding='utf-8') as f:
                 json.dump(prompts_to_save, f, indent=2, ensure_ascii=False)
+            os.replace(temp_file, self.prompts_file)
             logger.info(f"Saved prompts to {self.prompts_file}")
+            self.load_prompts()
             return True
         except Exception as e:
             logger.error(f"Error saving prompts: {e}")
             return False
-    
+
     def update_prompt(self, category: str, key: str, value: str) -> bool:
         """Update a specific prompt and save to file"""
         try:
-            if category not in self.prompts:
-                self.prompts[category] = {}
-            
-            self.prompts[category][key] = value
-            return self.save_prompts()
+            # Edit a copy; the live snapshot is swapped only once the file is saved
+            prompts = json.loads(json.dumps(self.prompts))
+            if category not in prompts:
+                prompts[category] = {}
+
+            prompts[category][key] = value
+            return self.save_prompts(prompts)
         except Exception as e:
             logger.error(f"Error updating prompt {category}.{key}: {e}")
             return False
-    
+
     def list_available_prompts(self) -> Dict[str, List[str]]:
         """List all available prompt categories and keys"""
         result = {}
@@ -209,6 +322,20 @@ class PromptManager:
                 result[category] = list(prompts.keys())
         return result
 
+    def get_stats(self) -> Dict[str, Any]:
+        """Get prompt snapshot and render cache statistics"""
+        compiled = self._snapshot()
+        with self._lock:
+            return {
+                "version": compiled.version,
+                "loaded_at": compiled.loaded_at,
+                "reloads": self.reloads,
+                "rendered": len(compiled.rendered),
+                "render_hits": self.render_hits,
+                "render_misses": self.render_misses,
+                "hot_reload": PROMPTS_HOT_RELOAD
+            }
+
 # Global instance
 _prompt_manager = None
 
@@ -236,6 +363,10 @@ def get_writing_improvement_prompt(improvement_type: str = "complete") -> str:
     """Get writing improvement prompt"""
     return get_prompt_manager().get_writing_improvement_prompt(improvement_type)
 
+def get_prompt_version(prompt_type: str) -> str:
+    """Get the fingerprint of one prompt"""
+    return get_prompt_manager().get_prompt_version(prompt_type)
+
 def reload_prompts() -> None:
     """Reload prompts from file"""
     get_prompt_manager().reload_prompts()
@@ -0,0 +1,170 @@
+import asyncio
+import logging
+import os
+import re
+from typing import Any, Dict, List, Optional, Sequence
+
+from .. import crud
+from ..database import ReadSessionLocal
+from . import embeddings
+from .prompt_budget import count_tokens, truncate_to_tokens
+from .prompt_manager import get_system_prompt
+
+logger = logging.getLogger(__name__)
+
+# Retrieval-augmented chat configuration
+RAG_TOP_K = int(os.getenv("RAG_TOP_K", "8"))
+# "hybrid" fuses full-text and vector results; "fulltext" or "vector" use one retriever
+RAG_RETRIEVAL = os.getenv("RAG_RETRIEVAL", "hybrid").lower()
+RAG_CONTEXT_TOKENS = int(os.getenv("RAG_CONTEXT_TOKENS", "1500"))
+RAG_ENTRY_MAX_TOKENS = int(os.getenv("RAG_ENTRY_MAX_TOKENS", "300"))
+# Reciprocal rank fusion constant; larger values flatten the weight of top ranks
+RAG_RRF_K = 60
+
+DEFAULT_RAG_PROMPT = (
+    "You answer questions about the user's own journal. Use only the journal entries below. "
+    "Cite every entry you rely on as [entry N] using its id. "
+    "If the entries do not contain the answer, say so instead of guessing."
+)
+
+CITATION_PATTERN = re.compile(r"\[entry\s+#?(\d+)\]", re.IGNORECASE)
+
+# Words that carry no topic on their own; dropped from the full-text query
+STOPWORDS = {
+    "a", "about", "all", "am", "an", "and", "any", "are", "as", "at", "be", "been", "but", "by",
+    "can", "did", "do", "does", "for", "from", "had", "has", "have", "how", "i", "if", "in", "into",
+    "is", "it", "its", "me", "my", "myself", "of", "on", "or", "our", "so", "than", "that", "the",
+    "their", "them", "then", "there", "these", "they", "this", "to", "was", "we", "were", "what",
+    "when", "where", "which", "who", "why", "will", "with", "write", "wrote", "written", "you", "your",
+}
+
+
+def keyword_query(message: str, max_terms: int = 12) -> str:
+    """Turn a question into an OR query of its topic words for websearch_to_tsquery"""
+    words = [word for word in re.findall(r"\w+", message.lower()) if word not in STOPWORDS and len(word) > 1]
+    return " or ".join(list(dict.fromkeys(words))[:max_terms])
+
+
+def _entry_source(entry) -> Dict[str, Any]:
+    return {
+        "entry_id": entry.entry_id,
+        "title": entry.title,
+        "entry_date": entry.entry_date.isoformat() if entry.entry_date else None,
+        "mood": entry.mood,
+        "content": entry.content or ""
+    }
+
+
+def _fulltext_candidates(session_factory, user_id: int, message: str, limit: int) -> List[Dict[str, Any]]:
+    query = keyword_query(message)
+    if not query:
+        return []
+    db = session_factory()
+    try:
+        rows, _ = crud.search_entries(db, user_id, query, None, limit)
+        return [_entry_source(row.Entry) for row in rows]
+    finally:
+        db.close()
+
+
+def _vector_candidates(session_factory, user_id: int, vector: Sequence[float], limit: int) -> List[Dict[str, Any]]:
+    db = session_factory()
+    try:
+        results = crud.find_similar_entries(db, user_id, vector, embeddings.get_embedding_model(), limit)
+        return [_entry_source(entry) for entry, _ in results]
+    finally:
+        db.close()
+
+
+def fuse_rankings(rankings: Sequence[Sequence[Dict[str, Any]]], limit: int) -> List[Dict[str, Any]]:
+    """Reciprocal rank fusion of several ranked candidate lists"""
+    scores: Dict[int, float] = {}
+    sources: Dict[int, Dict[str, Any]] = {}
+    for ranking in rankings:
+        for rank, source in enumerate(ranking):
+            entry_id = source["entry_id"]
+            scores[entry_id] = scores.get(entry_id, 0.0) + 1.0 / (RAG_RRF_K + rank + 1)
+            sources.setdefault(entry_id, source)
+    ordered = sorted(scores, key=lambda entry_id: (-scores[entry_id], entry_id))[:limit]
+    return [{**sources[entry_id], "score": round(scores[entry_id], 6)} for entry_id in ordered]
+
+
+async def retrieve_entries(
+    user_id: int,
+    message: str,
+    top_k: int = RAG_TOP_K,
+    retrieval: str = RAG_RETRIEVAL,
+    session_factory=None
+) -> List[Dict[str, Any]]:
+    """Top-k of the user's entries relevant to message"""
+    session_factory = session_factory or ReadSessionLocal
+    rankings = []
+    if retrieval in ("hybrid", "fulltext"):
+        try:
+            rankings.append(await asyncio.to_thread(_fulltext_candidates, session_factory, user_id, message, top_k))
+        except Exception as e:
+            logger.warning(f"Full-text retrieval failed: {e}")
+    if retrieval in ("hybrid", "vector") and embeddings.EMBEDDINGS_ENABLED:
+        try:
+            vector = await embeddings.embed_query(message)
+            rankings.append(await asyncio.to_thread(_vector_candidates, session_factory, user_id, vector, top_k))
+        except Exception as e:
+            logger.warning(f"Vector retrieval failed: {e}")
+    return fuse_rankings(rankings, top_k)
+
+
+def format_entry(source: Dict[str, Any], max_tokens: int = RAG_ENTRY_MAX_TOKENS) -> str:
+    header = f"[entry {source['entry_id']}] {source.get('entry_date') or ''} — {source['title']}"
+    if source.get("mood"):
+        header += f" (mood: {source['mood']})"
+    return f"{header}\n{truncate_to_tokens(source.get('content') or '', max_tokens, ' …')}".strip()
+
+
+def pack_context(
+    sources: Sequence[Dict[str, Any]],
+    budget_tokens: int = RAG_CONTEXT_TOKENS,
+    entry_max_tokens: int = RAG_ENTRY_MAX_TOKENS
+):
+    """Format entries best-first until the token budget is spent; returns (context, included sources)"""
+    blocks = []
+    included = []
+    used = 0
+    for source in sources:
+        block = format_entry(source, entry_max_tokens)
+        cost = count_tokens(block)
+        if used + cost > budget_tokens:
+            continue
+        blocks.append(block)
+        included.append(source)
+        used += cost
+    return "\n\n".join(blocks), included
+
+
+def build_rag_prompt(context: str, system_prompt: Optional[str] = None) -> str:
+    """System prompt grounding the answer on the packed entries"""
+    base = system_prompt or get_system_prompt("rag_chat") or DEFAULT_RAG_PROMPT
+    body = context or "No matching journal entries were found."
+    return f"{base}\n\n## Journal entries\n\n{body}"
+
+
+def extract_citations(answer: str, sources: Sequence[Dict[str, Any]]) -> List[int]:
+    """Entry ids cited in the answer, limited to the entries that were provided"""
+    allowed = {source["entry_id"] for source in sources}
+    cited = [int(match) for match in CITATION_PATTERN.findall(answer or "")]
+    return [entry_id for entry_id in dict.fromkeys(cited) if entry_id in allowed]
+
+
+def public_sources(sources: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Source metadata returned to the client (without entry content)"""
+    return [
+        {key: source.get(key) for key in ("entry_id", "title", "entry_date", "score")}
+        for source in sources
+    ]
+
+
+async def prepare_rag_context(user_id: int, message: str, system_prompt: Optional[str] = None) -> Dict[str, Any]:
+    """Retrieve, pack and build the grounded system prompt for one chat turn"""
+    candidates = await retrieve_entries(user_id, message)
+    context, sources = pack_context(candidates)
+    logger.info(f"RAG context: {len(sources)} of {len(candidates)} retrieved entries, {count_tokens(context)} tokens")
+    return {"system_prompt": build_rag_prompt(context, system_prompt), "sources": sources}
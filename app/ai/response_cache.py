@@ -0,0 +1,327 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Optional, List, Dict, Any, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Response cache configuration
+AI_RESPONSE_CACHE_ENABLED = os.getenv("AI_RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+AI_RESPONSE_CACHE_SIZE = int(os.getenv("AI_RESPONSE_CACHE_SIZE", "256"))
+AI_RESPONSE_CACHE_TTL = int(os.getenv("AI_RESPONSE_CACHE_TTL", "3600"))
+# Optional SQLite file for a second tier shared across workers and restarts
+AI_RESPONSE_CACHE_DB = os.getenv("AI_RESPONSE_CACHE_DB", "")
+AI_RESPONSE_CACHE_DB_SIZE = int(os.getenv("AI_RESPONSE_CACHE_DB_SIZE", "5000"))
+# Cosine similarity at which a cached response for near-identical content is reused; 0 disables
+AI_RESPONSE_CACHE_SEMANTIC_THRESHOLD = float(os.getenv("AI_RESPONSE_CACHE_SEMANTIC_THRESHOLD", "0"))
+
+# Cache outcome of the last lookup in the current request ("HIT" or "MISS")
+_cache_status: ContextVar[Optional[str]] = ContextVar("ai_response_cache_status", default=None)
+
+
+def get_cache_status() -> Optional[str]:
+    """Get the response cache outcome for the current request"""
+    return _cache_status.get()
+
+
+def reset_cache_status() -> None:
+    _cache_status.set(None)
+
+
+def make_cache_key(
+    system_prompt: str,
+    content: str,
+    model: str,
+    temperature: Optional[float],
+    max_tokens: Optional[int],
+    history: Optional[List[Dict[str, str]]] = None
+) -> str:
+    """Hash the inputs that determine an LLM response"""
+    payload = json.dumps(
+        [system_prompt, content, model, temperature, max_tokens, history or []],
+        ensure_ascii=False,
+        sort_keys=True
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def make_semantic_scope(
+    system_prompt: str,
+    model: str,
+    temperature: Optional[float],
+    max_tokens: Optional[int],
+    history: Optional[List[Dict[str, str]]] = None,
+    embedding_model: str = ""
+) -> str:
+    """Hash everything but the content; only responses within one scope are compared by similarity"""
+    return make_cache_key(system_prompt, "", model, temperature, max_tokens, history) + ":" + embedding_model
+
+
+class _SQLiteTier:
+    """Persistent cache tier backed by a SQLite file"""
+
+    def __init__(self, path: str, max_size: int):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS ai_response_cache ("
+            "cache_key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "expires_at REAL NOT NULL, created_at REAL NOT NULL, tags TEXT NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_ai_response_cache_created ON ai_response_cache (created_at)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[Tuple[Dict[str, Any], float, List[str]]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at, tags FROM ai_response_cache WHERE cache_key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] <= time.time():
+                self._conn.execute("DELETE FROM ai_response_cache WHERE cache_key = ?", (key,))
+                self._conn.commit()
+                return None
+        return json.loads(row[0]), row[1], [tag for tag in row[2].split("|") if tag]
+
+    def set(self, key: str, value: Dict[str, Any], expires_at: float, tags: List[str]) -> None:
+        # Tags are stored delimited on both sides so LIKE matches whole tags only
+        encoded_tags = "|" + "|".join(tags) + "|"
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO ai_response_cache VALUES (?, ?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), expires_at, time.time(), encoded_tags)
+            )
+            self._conn.execute("DELETE FROM ai_response_cache WHERE expires_at <= ?", (time.time(),))
+            self._conn.execute(
+                "DELETE FROM ai_response_cache WHERE cache_key IN ("
+                "SELECT cache_key FROM ai_response_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_size,)
+            )
+            self._conn.commit()
+
+    def invalidate_tag(self, tag: str) -> int:
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM ai_response_cache WHERE tags LIKE ?", (f"%|{tag}|%",)
+            )
+            self._conn.commit()
+            return cursor.rowcount
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM ai_response_cache")
+            self._conn.commit()
+
+    def size(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM ai_response_cache").fetchone()[0]
+
+
+class ResponseCache:
+    """Two-tier LLM response cache: in-process LRU with TTL plus optional SQLite
+
+    Exact lookups use the key hash. Entries stored with a content embedding
+    can also be found by similarity within their scope; vectors are kept in
+    the memory tier only.
+    """
+
+    def __init__(
+        self,
+        max_size: int = AI_RESPONSE_CACHE_SIZE,
+        ttl: int = AI_RESPONSE_CACHE_TTL,
+        db_path: str = AI_RESPONSE_CACHE_DB,
+        db_max_size: int = AI_RESPONSE_CACHE_DB_SIZE
+    ):
+        self.max_size = max(max_size, 1)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # Key -> (value, expires_at, tags)
+        self._entries: "OrderedDict[str, Tuple[Dict[str, Any], float, List[str]]]" = OrderedDict()
+        self._tags: Dict[str, set] = {}
+        # Key -> (semantic scope, normalized content embedding)
+        self._vectors: Dict[str, Tuple[str, List[float]]] = {}
+        self._disk: Optional[_SQLiteTier] = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+        if db_path:
+            try:
+                self._disk = _SQLiteTier(db_path, db_max_size)
+                logger.info(f"AI response cache persisted to {db_path}")
+            except Exception as e:
+                logger.warning(f"Could not open AI response cache database {db_path}: {e}")
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._vectors.pop(key, None)
+        for tag in entry[2]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def _store(self, key: str, value: Dict[str, Any], expires_at: float, tags: List[str]) -> None:
+        self._remove(key)
+        self._entries[key] = (value, expires_at, tags)
+        for tag in tags:
+            self._tags.setdefault(tag, set()).add(key)
+        while len(self._entries) > self.max_size:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Look up a cached response, checking memory before disk"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    _cache_status.set("HIT")
+                    return dict(entry[0])
+                self._remove(key)
+
+        if self._disk is not None:
+            try:
+                stored = self._disk.get(key)
+            except Exception as e:
+                logger.warning(f"AI response cache database read failed: {e}")
+                stored = None
+            if stored is not None:
+                value, expires_at, tags = stored
+                with self._lock:
+                    self._store(key, value, expires_at, tags)
+                    self.disk_hits += 1
+                _cache_status.set("HIT")
+                return dict(value)
+
+        with self._lock:
+            self.misses += 1
+        _cache_status.set("MISS")
+        return None
+
+    def get_similar(self, scope: str, vector: List[float], threshold: float) -> Optional[Dict[str, Any]]:
+        """Most similar live response in the scope, if its cosine similarity reaches the threshold"""
+        now = time.time()
+        with self._lock:
+            best_key = None
+            best_score = threshold
+            for key, (key_scope, key_vector) in self._vectors.items():
+                if key_scope != scope or self._entries[key][1] <= now:
+                    continue
+                # Vectors are normalized, so the dot product is the cosine similarity
+                score = sum(a * b for a, b in zip(vector, key_vector))
+                if score >= best_score:
+                    best_key, best_score = key, score
+            if best_key is None:
+                return None
+            self._entries.move_to_end(best_key)
+            self.semantic_hits += 1
+            value = self._entries[best_key][0]
+        _cache_status.set("HIT")
+        return dict(value)
+
+    def set(
+        self,
+        key: str,
+        value: Dict[str, Any],
+        tags: Optional[List[str]] = None,
+        scope: Optional[str] = None,
+        vector: Optional[List[float]] = None
+    ) -> None:
+        """Store a successful response in both tiers, with its embedding for similarity lookups"""
+        tags = list(tags or [])
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._store(key, dict(value), expires_at, tags)
+            if scope is not None and vector is not None:
+                self._vectors[key] = (scope, vector)
+        if self._disk is not None:
+            try:
+                self._disk.set(key, value, expires_at, tags)
+            except Exception as e:
+                logger.warning(f"AI response cache database write failed: {e}")
+
+    def invalidate_tag(self, tag: str) -> int:
+        """Drop every cached response carrying the given tag"""
+        with self._lock:
+            keys = list(self._tags.get(tag, ()))
+            for key in keys:
+                self._remove(key)
+            self.invalidations += len(keys)
+        removed = len(keys)
+        if self._disk is not None:
+            try:
+                removed = max(removed, self._disk.invalidate_tag(tag))
+            except Exception as e:
+                logger.warning(f"AI response cache database invalidation failed: {e}")
+        if removed:
+            logger.debug(f"Invalidated {removed} cached AI responses for {tag}")
+        return removed
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+            self._vectors.clear()
+        if self._disk is not None:
+            self._disk.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = {
+                "enabled": AI_RESPONSE_CACHE_ENABLED,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "semantic_hits": self.semantic_hits,
+                "semantic_threshold": AI_RESPONSE_CACHE_SEMANTIC_THRESHOLD,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations
+            }
+        if self._disk is not None:
+            try:
+                stats["disk_size"] = self._disk.size()
+            except Exception:
+                pass
+        return stats
+
+
+# Global response cache instance
+_response_cache = None
+
+
+def get_response_cache() -> ResponseCache:
+    """Get the global response cache instance"""
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = ResponseCache()
+    return _response_cache
+
+
+def invalidate_entry(entry_id: int) -> int:
+    """Drop cached analyses of a journal entry"""
+    # Even a worker that never cached anything must clear the shared SQLite tier
+    return get_response_cache().invalidate_tag(f"entry:{entry_id}")
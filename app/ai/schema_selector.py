@@ -0,0 +1,156 @@
+"""
+Relevant-table selection for SQL prompts.
+
+Scores the schema snapshot's tables against the user's question by table and
+column names, adds the tables needed to join them (foreign key closure) and
+renders only that subset, followed by a one-line index of the other tables.
+"""
+import logging
+import os
+import re
+from typing import Any, Dict, List, Optional, Sequence, Set
+
+from .prompt_budget import PROMPT_SCHEMA_TOKENS, count_tokens
+from .sql_tool import format_table_as_text
+
+logger = logging.getLogger(__name__)
+
+# Most tables whose columns are described in a SQL prompt
+SQL_SCHEMA_MAX_TABLES = int(os.getenv("SQL_SCHEMA_MAX_TABLES", "6"))
+# Tables scoring below this share of the best match are left to the foreign key closure
+SELECTION_THRESHOLD = 0.25
+
+# Words that never name a table or column
+STOPWORDS = {
+    "a", "about", "all", "an", "and", "are", "as", "at", "be", "by", "can", "count", "did", "do",
+    "does", "for", "from", "get", "give", "has", "have", "how", "i", "in", "is", "it", "list", "many",
+    "me", "much", "my", "of", "on", "or", "show", "the", "their", "there", "to", "was", "were", "what",
+    "when", "which", "who", "with", "you",
+}
+
+
+def _stem(word: str) -> str:
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def question_terms(question: Optional[str]) -> Set[str]:
+    """Stemmed words of a question that may name tables or columns"""
+    words = re.findall(r"[a-z0-9]+", (question or "").lower())
+    return {_stem(word) for word in words if word not in STOPWORDS and len(word) > 1}
+
+
+def _name_parts(name: str) -> Set[str]:
+    return {_stem(part) for part in name.lower().split("_") if part}
+
+
+def score_table(table: Dict[str, Any], terms: Set[str]) -> float:
+    """Relevance of a table to the question terms; table names weigh more than column names"""
+    if not terms:
+        return 0.0
+    name = table["table_name"].lower()
+    parts = _name_parts(name)
+    score = 5.0 if _stem(name) in terms else 0.0
+    # A word matching one part of a compound name (entry_tags) is a weaker hint
+    score += 3.0 * len(terms & parts) / len(parts)
+    # Foreign key columns name the table they point at, not this one
+    join_keys = {fk["column_name"] for fk in table.get("foreign_keys", [])}
+    columns: Set[str] = set()
+    for column in table.get("columns", []):
+        if column["column_name"] not in join_keys:
+            columns |= _name_parts(column["column_name"])
+    return score + 2.0 * len(terms & columns)
+
+
+def _references(table: Dict[str, Any]) -> List[str]:
+    return list(dict.fromkeys(fk["foreign_table"] for fk in table.get("foreign_keys", [])))
+
+
+def select_tables(
+    tables: Sequence[Dict[str, Any]],
+    question: Optional[str] = None,
+    max_tables: Optional[int] = None
+) -> List[str]:
+    """Names of the tables a question needs, most relevant first, at most max_tables"""
+    max_tables = max_tables or SQL_SCHEMA_MAX_TABLES
+    by_name = {table["table_name"]: table for table in tables}
+    if len(tables) <= max_tables:
+        return list(by_name)
+
+    terms = question_terms(question)
+    scores = {name: score_table(table, terms) for name, table in by_name.items()}
+    best = max(scores.values(), default=0.0)
+    # Weak partial matches (e.g. entry_tags for a question about entries) only add noise
+    selected = [
+        name for name in sorted(by_name, key=lambda name: -scores[name])
+        if scores[name] > 0 and scores[name] >= best * SELECTION_THRESHOLD
+    ]
+    if not selected:
+        # Nothing matched: describe the most referenced tables, they anchor most queries
+        referenced = {name: 0 for name in by_name}
+        for table in tables:
+            for name in _references(table):
+                if name in referenced:
+                    referenced[name] += 1
+        selected = sorted(by_name, key=lambda name: -referenced[name])
+    selected = selected[:max_tables]
+
+    # Foreign key closure: tables the selected ones reference, then link tables between them
+    chosen = set(selected)
+    index = 0
+    while index < len(selected) and len(selected) < max_tables:
+        for name in _references(by_name[selected[index]]):
+            if name in by_name and name not in chosen and len(selected) < max_tables:
+                selected.append(name)
+                chosen.add(name)
+        index += 1
+    for name, table in by_name.items():
+        if len(selected) >= max_tables:
+            break
+        if name not in chosen and len(chosen & set(_references(table))) >= 2:
+            selected.append(name)
+            chosen.add(name)
+    return selected
+
+
+def render_schema(
+    tables: Sequence[Dict[str, Any]],
+    selected: Sequence[str],
+    budget_tokens: Optional[int] = None
+) -> str:
+    """Describe the selected tables within the token budget and list the rest on one line"""
+    budget_tokens = budget_tokens or PROMPT_SCHEMA_TOKENS
+    by_name = {table["table_name"]: table for table in tables}
+    blocks = []
+    described = set()
+    used = 0
+    for name in selected:
+        if name not in by_name:
+            continue
+        block = format_table_as_text(by_name[name])
+        cost = count_tokens(block)
+        if blocks and used + cost > budget_tokens:
+            continue
+        blocks.append(block)
+        described.add(name)
+        used += cost
+    others = [name for name in by_name if name not in described]
+    if others:
+        # The names let the model fetch the rest with the schema tool when it needs them
+        blocks.append(f"Other tables (use get_database_schema for details): {', '.join(others)}")
+    return "\n\n".join(blocks)
+
+
+def select_schema(
+    tables: Sequence[Dict[str, Any]],
+    question: Optional[str] = None,
+    max_tables: Optional[int] = None,
+    budget_tokens: Optional[int] = None
+) -> str:
+    """Schema text limited to the tables relevant to a question"""
+    selected = select_tables(tables, question, max_tables)
+    logger.debug(f"Selected {len(selected)} of {len(tables)} tables for the SQL prompt: {selected}")
+    return render_schema(tables, selected, budget_tokens)
@@ -0,0 +1,400 @@
+"""
+Connection pools for the AI SQL tools
+Process-shared, bounded psycopg2 (sync) and asyncpg (async) pools keyed by database URL
+"""
+import os
+import time
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager, asynccontextmanager
+from typing import Dict, Any, List, Optional, Tuple
+from urllib.parse import urlparse, unquote
+
+import psycopg2
+
+logger = logging.getLogger(__name__)
+
+# Pool configuration
+SQL_POOL_MIN_SIZE = int(os.getenv("SQL_POOL_MIN_SIZE", 1))
+SQL_POOL_MAX_SIZE = int(os.getenv("SQL_POOL_MAX_SIZE", 5))
+SQL_POOL_TIMEOUT = float(os.getenv("SQL_POOL_TIMEOUT", 10))  # Seconds to wait for a free connection
+SQL_POOL_MAX_LIFETIME = float(os.getenv("SQL_POOL_MAX_LIFETIME", 1800))  # Recycle connections older than this
+SQL_POOL_HEALTH_CHECK = os.getenv("SQL_POOL_HEALTH_CHECK", "true").lower() in ("1", "true", "yes")
+SQL_POOL_HEALTH_CHECK_IDLE = float(os.getenv("SQL_POOL_HEALTH_CHECK_IDLE", 30))  # Ping connections idle longer than this
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no pooled connection becomes available in time"""
+
+
+def get_connection_kwargs(db_url: str) -> Dict[str, Any]:
+    """Build driver connection arguments from a database URL"""
+    parsed_url = urlparse(db_url)
+    return {
+        "dbname": parsed_url.path[1:],  # Remove leading '/'
+        "user": parsed_url.username,
+        "password": unquote(parsed_url.password) if parsed_url.password else '',
+        "host": parsed_url.hostname,
+        "port": parsed_url.port or 5432
+    }
+
+
+class _PoolMetrics:
+    """Counters shared by the sync and async pools"""
+
+    def __init__(self):
+        self.acquired = 0
+        self.created = 0
+        self.recycled = 0
+        self.health_check_failures = 0
+        self.timeouts = 0
+        self.waits = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+
+    def record_wait(self, wait_seconds: float) -> None:
+        wait_ms = wait_seconds * 1000
+        self.acquired += 1
+        if wait_ms >= 1:
+            self.waits += 1
+        self.total_wait_ms += wait_ms
+        self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "acquired": self.acquired,
+            "created": self.created,
+            "recycled": self.recycled,
+            "health_check_failures": self.health_check_failures,
+            "timeouts": self.timeouts,
+            "waits": self.waits,
+            "avg_wait_ms": round(self.total_wait_ms / self.acquired, 3) if self.acquired else 0.0,
+            "max_wait_ms": round(self.max_wait_ms, 3)
+        }
+
+
+class SyncConnectionPool:
+    """Bounded, thread-safe psycopg2 connection pool with recycling and health checks"""
+
+    def __init__(self, db_url: str, min_size: int = SQL_POOL_MIN_SIZE, max_size: int = SQL_POOL_MAX_SIZE):
+        self._connect_kwargs = get_connection_kwargs(db_url)
+        self.min_size = min_size
+        self.max_size = max(max_size, 1)
+        self._condition = threading.Condition()
+        # Idle entries are (connection, created_at, last_used_at)
+        self._idle: List[Tuple[Any, float, float]] = []
+        self._created_at: Dict[int, float] = {}
+        self._in_use = 0
+        self._closed = False
+        self.metrics = _PoolMetrics()
+
+    def _open_connection(self) -> Tuple[Any, float]:
+        connection = psycopg2.connect(**self._connect_kwargs)
+        created_at = time.monotonic()
+        self._created_at[id(connection)] = created_at
+        self.metrics.created += 1
+        logger.info("Opened pooled PostgreSQL connection.")
+        return connection, created_at
+
+    def _discard(self, connection) -> None:
+        self._created_at.pop(id(connection), None)
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def _is_usable(self, connection, created_at: float, last_used_at: float) -> bool:
+        """Check lifetime and liveness of an idle connection before handing it out"""
+        now = time.monotonic()
+        if connection.closed:
+            return False
+        if now - created_at > SQL_POOL_MAX_LIFETIME:
+            self.metrics.recycled += 1
+            return False
+        if SQL_POOL_HEALTH_CHECK and now - last_used_at > SQL_POOL_HEALTH_CHECK_IDLE:
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+                connection.rollback()
+            except Exception as e:
+                logger.warning(f"Pooled connection failed health check: {e}")
+                self.metrics.health_check_failures += 1
+                return False
+        return True
+
+    def acquire(self, timeout: Optional[float] = None):
+        """Borrow a connection, waiting up to `timeout` seconds for a free slot"""
+        timeout = SQL_POOL_TIMEOUT if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise PoolTimeoutError("Connection pool is closed")
+                if self._idle:
+                    connection, created_at, last_used_at = self._idle.pop()
+                    self._in_use += 1
+                    break
+                if self._in_use < self.max_size:
+                    # Reserve the slot, open the connection outside the lock
+                    self._in_use += 1
+                    connection = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.metrics.timeouts += 1
+                    raise PoolTimeoutError(
+                        f"Timed out after {timeout}s waiting for a database connection "
+                        f"(pool size {self.max_size})"
+                    )
+                self._condition.wait(remaining)
+
+        try:
+            if connection is not None and not self._is_usable(connection, created_at, last_used_at):
+                self._discard(connection)
+                connection = None
+            if connection is None:
+                connection, _ = self._open_connection()
+        except Exception:
+            with self._condition:
+                self._in_use -= 1
+                self._condition.notify()
+            raise
+
+        self.metrics.record_wait(time.monotonic() - start)
+        return connection
+
+    def release(self, connection, discard: bool = False) -> None:
+        """Return a connection to the pool, ending any open transaction"""
+        if not discard and not connection.closed:
+            try:
+                connection.rollback()
+            except Exception:
+                discard = True
+
+        with self._condition:
+            self._in_use -= 1
+            if discard or connection.closed or self._closed:
+                self._discard(connection)
+            else:
+                created_at = self._created_at.get(id(connection), time.monotonic())
+                self._idle.append((connection, created_at, time.monotonic()))
+            self._condition.notify()
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None):
+        """Context manager yielding a pooled connection"""
+        connection = self.acquire(timeout)
+        discard = False
+        try:
+            yield connection
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            # Broken connections must not go back into the pool
+            discard = True
+            raise
+        finally:
+            self.release(connection, discard=discard)
+
+    def close(self) -> None:
+        """Close all idle connections and refuse new checkouts"""
+        with self._condition:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._condition.notify_all()
+        for connection, _, _ in idle:
+            self._discard(connection)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._condition:
+            stats = {
+                "max_size": self.max_size,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+            }
+        stats.update(self.metrics.as_dict())
+        return stats
+
+
+class _ConnectionExpired(Exception):
+    """Raised from the asyncpg setup hook to make the pool reconnect"""
+
+
+class AsyncConnectionPool:
+    """asyncpg-backed pool with the same recycling, health check and wait metrics"""
+
+    def __init__(self, db_url: str, min_size: int = SQL_POOL_MIN_SIZE, max_size: int = SQL_POOL_MAX_SIZE):
+        kwargs = get_connection_kwargs(db_url)
+        self._connect_kwargs = {
+            "database": kwargs["dbname"],
+            "user": kwargs["user"],
+            "password": kwargs["password"],
+            "host": kwargs["host"],
+            "port": kwargs["port"]
+        }
+        self.min_size = min(min_size, max_size)
+        self.max_size = max(max_size, 1)
+        self._pool = None
+        self._pool_task = None
+        self._loop = None
+        # Server PID -> [created_at, last_used_at]
+        self._connection_times: Dict[int, List[float]] = {}
+        self.metrics = _PoolMetrics()
+
+    async def _get_pool(self):
+        """Create the asyncpg pool once per event loop"""
+        loop = asyncio.get_running_loop()
+        if self._pool_task is None or self._loop is not loop:
+            import asyncpg
+            self._loop = loop
+            self._pool = None
+            pool = asyncpg.create_pool(
+                min_size=self.min_size,
+                max_size=self.max_size,
+                init=self._on_connect,
+                setup=self._on_acquire,
+                **self._connect_kwargs
+            )
+            # asyncpg returns an awaitable Pool rather than a coroutine
+            self._pool_task = loop.create_task(self._initialize(pool))
+            logger.info("Creating asyncpg connection pool for SQL tools.")
+        try:
+            self._pool = await self._pool_task
+        except Exception:
+            self._pool_task = None
+            raise
+        return self._pool
+
+    @staticmethod
+    async def _initialize(pool):
+        return await pool
+
+    async def _on_connect(self, connection) -> None:
+        now = time.monotonic()
+        self._connection_times[connection.get_server_pid()] = [now, now]
+        self.metrics.created += 1
+
+    async def _on_acquire(self, connection) -> None:
+        now = time.monotonic()
+        created_at, last_used_at = self._connection_times.get(connection.get_server_pid(), [now, now])
+        if now - created_at > SQL_POOL_MAX_LIFETIME:
+            self.metrics.recycled += 1
+            self._connection_times.pop(connection.get_server_pid(), None)
+            raise _ConnectionExpired()
+        if SQL_POOL_HEALTH_CHECK and now - last_used_at > SQL_POOL_HEALTH_CHECK_IDLE:
+            try:
+                await connection.execute("SELECT 1")
+            except Exception as e:
+                logger.warning(f"Pooled async connection failed health check: {e}")
+                self.metrics.health_check_failures += 1
+                self._connection_times.pop(connection.get_server_pid(), None)
+                raise _ConnectionExpired()
+
+    @asynccontextmanager
+    async def connection(self, timeout: Optional[float] = None):
+        """Async context manager yielding a pooled asyncpg connection"""
+        timeout = SQL_POOL_TIMEOUT if timeout is None else timeout
+        pool = await self._get_pool()
+        start = time.monotonic()
+        connection = None
+
+        # Expired or unhealthy connections are closed by the pool and replaced
+        for _ in range(self.max_size + 1):
+            remaining = timeout - (time.monotonic() - start)
+            try:
+                connection = await pool.acquire(timeout=max(remaining, 0.001))
+                break
+            except _ConnectionExpired:
+                continue
+            except asyncio.TimeoutError:
+                self.metrics.timeouts += 1
+                raise PoolTimeoutError(
+                    f"Timed out after {timeout}s waiting for a database connection "
+                    f"(pool size {self.max_size})"
+                )
+        if connection is None:
+            raise PoolTimeoutError("Could not acquire a healthy database connection")
+
+        self.metrics.record_wait(time.monotonic() - start)
+        try:
+            yield connection
+        finally:
+            times = self._connection_times.get(connection.get_server_pid())
+            if times:
+                times[1] = time.monotonic()
+            await pool.release(connection)
+
+    async def close(self) -> None:
+        if self._pool is not None and self._loop is asyncio.get_running_loop():
+            await self._pool.close()
+        self._pool = None
+        self._pool_task = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = {
+            "max_size": self.max_size,
+            "in_use": (self._pool.get_size() - self._pool.get_idle_size()) if self._pool else 0,
+            "idle": self._pool.get_idle_size() if self._pool else 0,
+        }
+        stats.update(self.metrics.as_dict())
+        return stats
+
+
+# Process-wide pool registries
+_sync_pools: Dict[str, SyncConnectionPool] = {}
+_async_pools: Dict[str, AsyncConnectionPool] = {}
+_registry_lock = threading.Lock()
+
+
+def get_sync_pool(db_url: str) -> SyncConnectionPool:
+    """Get the shared sync pool for a database URL"""
+    pool = _sync_pools.get(db_url)
+    if pool is None:
+        with _registry_lock:
+            pool = _sync_pools.get(db_url)
+            if pool is None:
+                pool = SyncConnectionPool(db_url)
+                _sync_pools[db_url] = pool
+    return pool
+
+
+def get_async_pool(db_url: str) -> AsyncConnectionPool:
+    """Get the shared async pool for a database URL"""
+    pool = _async_pools.get(db_url)
+    if pool is None:
+        with _registry_lock:
+            pool = _async_pools.get(db_url)
+            if pool is None:
+                pool = AsyncConnectionPool(db_url)
+                _async_pools[db_url] = pool
+    return pool
+
+
+def get_pool_stats() -> Dict[str, Any]:
+    """Get statistics for every SQL tool pool, keyed by host/database"""
+    def label(db_url: str) -> str:
+        parsed_url = urlparse(db_url)
+        return f"{parsed_url.hostname}:{parsed_url.port or 5432}{parsed_url.path}"
+
+    return {
+        "sync": {label(url): pool.get_stats() for url, pool in _sync_pools.items()},
+        "async": {label(url): pool.get_stats() for url, pool in _async_pools.items()}
+    }
+
+
+async def close_pools() -> None:
+    """Close all SQL tool pools (called on application shutdown)"""
+    with _registry_lock:
+        sync_pools = list(_sync_pools.values())
+        async_pools = list(_async_pools.values())
+        _sync_pools.clear()
+        _async_pools.clear()
+    for sync_pool in sync_pools:
+        sync_pool.close()
+    for async_pool in async_pools:
+        try:
+            await async_pool.close()
+        except Exception as e:
+            logger.warning(f"Error closing async SQL pool: {e}")
+    logger.info("SQL tool connection pools closed.")
@@ -1,16 +1,212 @@
 import logging
+import re
 from typing import Dict, List, Any, Optional
-import psycopg2
 from psycopg2.extras import RealDictCursor
 from langchain_core.tools import Tool
 import os
-from urllib.parse import urlparse, quote_plus
+import asyncio
+import threading
+import time
+from contextvars import ContextVar
 from langchain_core.tools import BaseTool
 from langchain_core.tools.base import ArgsSchema
 from pydantic import BaseModel, Field
 
+from .sql_pool import SyncConnectionPool, AsyncConnectionPool, get_sync_pool, get_async_pool
+from ..database import get_replica_router
+
 logger = logging.getLogger(__name__)
 
+# Read-only agent queries go to this replica when set
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")
+
+# User the current chat runs for; shared agent tools read it to keep read-your-writes
+_query_user_id: ContextVar[Optional[int]] = ContextVar("sql_tool_user_id", default=None)
+
+
+def set_query_user(user_id: Optional[int]) -> None:
+    """Route this context's agent queries for the user, e.g. to the primary right after their writes"""
+    _query_user_id.set(user_id)
+
+
+# Statements that can be served by a read replica, and anything inside them that writes or locks
+_READ_ONLY_STATEMENT = re.compile(r"^\s*(select|with|explain|show|values|table)\b", re.IGNORECASE)
+_WRITE_CLAUSE = re.compile(
+    r"\b(insert|update|delete|merge|create|alter|drop|truncate|grant|revoke|copy|call|do|"
+    r"lock|vacuum|analyze|refresh|into|nextval|setval|pg_advisory_\w*)\b|\bfor\s+(no\s+key\s+)?(update|share)\b",
+    re.IGNORECASE
+)
+_SQL_LITERALS_AND_COMMENTS = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|--[^\n]*|/\*.*?\*/", re.DOTALL)
+
+
+def is_read_only_query(query: str) -> bool:
+    """Whether a statement is a plain read that a replica can serve"""
+    stripped = _SQL_LITERALS_AND_COMMENTS.sub(" ", query)
+    if not _READ_ONLY_STATEMENT.match(stripped):
+        return False
+    # Multiple statements or data-modifying CTEs must run on the primary
+    if ";" in stripped.strip().rstrip(";"):
+        return False
+    return not _WRITE_CLAUSE.search(stripped)
+
+
+# How often (seconds) a cached schema snapshot is re-validated against the catalog
+SCHEMA_CACHE_CHECK_INTERVAL = float(os.getenv("SQL_SCHEMA_CACHE_CHECK_INTERVAL", 30))
+
+# One round trip for every table, column, primary key and foreign key in the public schema
+SCHEMA_CATALOG_QUERY = """
+    SELECT
+        c.relname AS table_name,
+        a.attname AS column_name,
+        format_type(a.atttypid, a.atttypmod) AS data_type,
+        CASE WHEN a.attnotnull THEN 'NO' ELSE 'YES' END AS is_nullable,
+        pg_get_expr(d.adbin, d.adrelid) AS column_default,
+        EXISTS (
+            SELECT 1 FROM pg_constraint pk
+            WHERE pk.conrelid = c.oid AND pk.contype = 'p' AND a.attnum = ANY(pk.conkey)
+        ) AS is_primary_key,
+        fk.foreign_table,
+        fk.foreign_column
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    JOIN pg_attribute a ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+    LEFT JOIN pg_attrdef d ON d.adrelid = c.oid AND d.adnum = a.attnum
+    LEFT JOIN LATERAL (
+        SELECT fc.relname AS foreign_table, fa.attname AS foreign_column
+        FROM pg_constraint con
+        JOIN pg_class fc ON fc.oid = con.confrelid
+        JOIN pg_attribute fa ON fa.attrelid = con.confrelid
+            AND fa.attnum = con.confkey[array_position(con.conkey, a.attnum)]
+        WHERE con.conrelid = c.oid AND con.contype = 'f' AND a.attnum = ANY(con.conkey)
+    ) fk ON true
+    WHERE n.nspname = 'public' AND c.relkind IN ('r', 'p', 'v')
+    ORDER BY c.relname, a.attnum, fk.foreign_table;
+"""
+
+# pg_class/pg_attribute row versions (xmin) change on every DDL touching a table
+SCHEMA_FINGERPRINT_QUERY = """
+    SELECT
+        md5(
+            coalesce((
+                SELECT string_agg(c.oid::text || ':' || c.xmin::text, ',' ORDER BY c.oid)
+                FROM pg_class c
+                JOIN pg_namespace n ON n.oid = c.relnamespace
+                WHERE n.nspname = 'public' AND c.relkind IN ('r', 'p', 'v')
+            ), '')
+            || '|' ||
+            coalesce((
+                SELECT string_agg(a.attrelid::text || '.' || a.attnum::text || ':' || a.xmin::text, ',' ORDER BY a.attrelid, a.attnum)
+                FROM pg_attribute a
+                JOIN pg_class c ON c.oid = a.attrelid
+                JOIN pg_namespace n ON n.oid = c.relnamespace
+                WHERE n.nspname = 'public' AND c.relkind IN ('r', 'p', 'v') AND a.attnum > 0
+            ), '')
+            || '|' ||
+            coalesce((
+                SELECT string_agg(con.oid::text, ',' ORDER BY con.oid)
+                FROM pg_constraint con
+                JOIN pg_namespace n ON n.oid = con.connamespace
+                WHERE n.nspname = 'public'
+            ), '')
+        ) AS fingerprint,
+        to_regclass('public.alembic_version') IS NOT NULL AS has_alembic;
+"""
+
+class _SchemaCache:
+    """Process-wide schema snapshots shared by every SQLTool, keyed by database URL"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshots: Dict[str, Dict[str, Any]] = {}
+        self.builds = 0
+        self.validations = 0
+    
+    def get_snapshot(self, sql_tool: "SQLTool", force_refresh: bool = False) -> Dict[str, Any]:
+        """Return the cached snapshot, rebuilding it only if the schema changed"""
+        db_url = object.__getattribute__(sql_tool, '_db_url')
+        with self._lock:
+            snapshot = self._snapshots.get(db_url)
+            now = time.monotonic()
+            
+            if snapshot is not None and not force_refresh:
+                if now - snapshot["checked_at"] < SCHEMA_CACHE_CHECK_INTERVAL:
+                    return snapshot
+                
+                self.validations += 1
+                fingerprint = sql_tool._get_schema_fingerprint()
+                if fingerprint == snapshot["version"]:
+                    snapshot["checked_at"] = now
+                    return snapshot
+                logger.info("Database schema changed, rebuilding schema snapshot")
+            
+            fingerprint = sql_tool._get_schema_fingerprint()
+            tables = sql_tool._load_schema_tables()
+            snapshot = {
+                "tables": tables,
+                "table_names": [table["table_name"] for table in tables],
+                "schema": sql_tool._format_schema_as_text(tables),
+                "version": fingerprint,
+                "checked_at": now
+            }
+            self._snapshots[db_url] = snapshot
+            self.builds += 1
+            logger.info(f"Built schema snapshot with {len(tables)} tables (version {fingerprint[:12]})")
+            return snapshot
+    
+    def invalidate(self, db_url: Optional[str] = None) -> None:
+        """Drop cached snapshots for one database URL, or all of them"""
+        with self._lock:
+            if db_url is None:
+                self._snapshots.clear()
+            else:
+                self._snapshots.pop(db_url, None)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cache statistics"""
+        with self._lock:
+            return {
+                "snapshots": len(self._snapshots),
+                "builds": self.builds,
+                "validations": self.validations,
+                "versions": [snapshot["version"] for snapshot in self._snapshots.values()]
+            }
+
+_schema_cache = _SchemaCache()
+
+def invalidate_schema_cache(db_url: Optional[str] = None) -> None:
+    """Force the next schema lookup to re-introspect the database"""
+    _schema_cache.invalidate(db_url)
+    logger.info("Schema snapshot cache invalidated")
+
+def get_schema_cache_stats() -> Dict[str, Any]:
+    """Get schema snapshot cache statistics"""
+    return _schema_cache.get_stats()
+
+def format_table_as_text(table: Dict[str, Any]) -> str:
+    """Format one schema snapshot table as a prompt-ready text block"""
+    table_name = table.get("table_name", "unknown")
+    columns = table.get("columns", [])
+    primary_keys = table.get("primary_keys", [])
+    foreign_keys = table.get("foreign_keys", [])
+    
+    lines = [f"Table: {table_name}", "Columns:"]
+    for col in columns:
+        col_name = col.get("column_name", "unknown")
+        data_type = col.get("data_type", "unknown")
+        is_nullable = col.get("is_nullable", "YES")
+        pk_indicator = " (PK)" if col_name in primary_keys else ""
+        lines.append(f"  - {col_name}: {data_type}{pk_indicator} (nullable: {is_nullable})")
+    
+    if foreign_keys:
+        lines.append("Foreign Keys:")
+        for fk in foreign_keys:
+            source_col = fk.get("column_name", "unknown")
+            target_table = fk.get("foreign_table", "unknown")
+            target_col = fk.get("foreign_column", "unknown")
+            lines.append(f"  - {source_col} -> {target_table}.{target_col}")
+    
+    return "\n".join(lines)
+
 class SQLToolArgs(BaseModel):
     """Arguments for the SQL tool"""
     query: str = Field(..., description="The SQL query to execute")
@@ -22,155 +218,97 @@ class SQLTool(BaseTool):
     description: str = "Execute SQL queries against the configured PostgreSQL database."
     args_schema: ArgsSchema = SQLToolArgs
     
-    def __init__(self, db_url: str, **kwargs):
+    def __init__(self, db_url: str, replica_url: Optional[str] = None, **kwargs):
         super().__init__(**kwargs)
         # Use object.__setattr__ to bypass Pydantic validation for private attributes
         object.__setattr__(self, '_db_url', db_url)
-        object.__setattr__(self, 'connection', None)
-        self.connect()
+        object.__setattr__(self, '_replica_url', replica_url)
 
-    def __del__(self):
-        """Close connection when object is destroyed"""
-        try:
-            self._close_connection()
-        except:
-            pass
+    @property
+    def pool(self) -> SyncConnectionPool:
+        """Process-shared sync connection pool for this database"""
+        return get_sync_pool(object.__getattribute__(self, '_db_url'))
+
+    @property
+    def async_pool(self) -> AsyncConnectionPool:
+        """Process-shared asyncpg connection pool for this database"""
+        return get_async_pool(object.__getattribute__(self, '_db_url'))
+
+    def _query_url(self, query: str, user_id: Optional[int] = None) -> str:
+        """Route read-only queries to the replica so analytics do not load the primary
+
+        Reads of a user who just wrote stay on the primary, like REST reads.
+        """
+        replica_url = object.__getattribute__(self, '_replica_url')
+        if replica_url and is_read_only_query(query):
+            if user_id is None:
+                user_id = _query_user_id.get()
+            if not get_replica_router().use_primary(user_id):
+                return replica_url
+        return object.__getattribute__(self, '_db_url')
 
     def connect(self):
-        """Establish a connection to the PostgreSQL database"""
+        """Verify that a pooled connection to the PostgreSQL database can be obtained"""
         try:
-            parsed_url = urlparse(object.__getattribute__(self, '_db_url'))
-            dbname = parsed_url.path[1:]  # Remove leading '/'
-            user = parsed_url.username
-            password = quote_plus(parsed_url.password) if parsed_url.password else ''
-            host = parsed_url.hostname
-            port = parsed_url.port or 5432
-            
-            connection = psycopg2.connect(
-                dbname=dbname,
-                user=user,
-                password=password,
-                host=host,
-                port=port
-            )
-            object.__setattr__(self, 'connection', connection)
+            with self.pool.connection():
+                pass
             logger.info("Connected to the PostgreSQL database successfully.")
         except Exception as e:
             logger.error(f"Failed to connect to the database: {e}")
             raise
 
-    def _run_query(self, query: str) -> List[Dict[str, Any]]:
-        """Execute a SQL query and return the results"""
-        with self.connection.cursor(cursor_factory=RealDictCursor) as cursor:
-            cursor.execute(query)
-            return cursor.fetchall()
+    def _run_query(self, query: str, url: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Execute a SQL query on a pooled connection and return the results"""
+        with get_sync_pool(url or self._query_url(query)).connection() as connection:
+            with connection.cursor(cursor_factory=RealDictCursor) as cursor:
+                cursor.execute(query)
+                return cursor.fetchall()
 
-    def _close_connection(self):
-        """Close the database connection"""
-        if self.connection:
-            self.connection.close()
-            logger.info("Database connection closed.")
+    def _run_catalog_query(self, query: str) -> List[Dict[str, Any]]:
+        """Run a catalog query on the primary, where the schema fingerprint is also read"""
+        return self._run_query(query, url=object.__getattribute__(self, '_db_url'))
+
+    async def _arun_query(self, query: str) -> List[Dict[str, Any]]:
+        """Execute a SQL query on a pooled asyncpg connection and return the results"""
+        async with get_async_pool(self._query_url(query)).connection() as connection:
+            # asyncpg autocommits; roll back like the sync pool does on release so writes never persist
+            transaction = connection.transaction()
+            await transaction.start()
+            try:
+                rows = await connection.fetch(query)
+            finally:
+                await transaction.rollback()
+            return [dict(row) for row in rows]
 
     def _run(self, query: str) -> Dict[str, Any]:
         """Run the SQL query and return results"""
         try:
-            if not self.connection:
-                self.connect()
             results = self._run_query(query)
             return {"results": results}
         except Exception as e:
             logger.error(f"Error executing query '{query}': {e}")
             return {"error": str(e)}
 
-    def _arun(self, query: str) -> Dict[str, Any]:
-        """Asynchronous version of run method (not implemented)"""
-        raise NotImplementedError("Asynchronous execution is not implemented for SQLTool.")
+    async def _arun(self, query: str) -> Dict[str, Any]:
+        """Asynchronous version of run method using the asyncpg pool"""
+        try:
+            results = await self._arun_query(query)
+            return {"results": results}
+        except Exception as e:
+            logger.error(f"Error executing query '{query}': {e}")
+            return {"error": str(e)}
     
     # Schema inspection methods for compatibility with agent/lm_studio expectations
-    def get_database_schema(self) -> Dict[str, Any]:
-        """Get database schema information"""
+    def get_database_schema(self, force_refresh: bool = False) -> Dict[str, Any]:
+        """Get database schema information from the process-wide snapshot cache"""
         try:
-            if not self.connection:
-                self.connect()
-            
-            with self.connection.cursor(cursor_factory=RealDictCursor) as cursor:
-                # Get all tables in public schema
-                cursor.execute("""
-                    SELECT table_name 
-                    FROM information_schema.tables 
-                    WHERE table_schema = 'public' 
-                    ORDER BY table_name;
-                """)
-                tables_data = cursor.fetchall()
-                
-                schema_info = {"success": True, "tables": []}
-                
-                for table_row in tables_data:
-                    table_name = table_row['table_name']
-                    table_info = {
-                        "table_name": table_name,
-                        "columns": [],
-                        "primary_keys": [],
-                        "foreign_keys": []
-                    }
-                    
-                    # Get column information
-                    cursor.execute("""
-                        SELECT column_name, data_type, is_nullable, column_default
-                        FROM information_schema.columns 
-                        WHERE table_schema = 'public' AND table_name = %s
-                        ORDER BY ordinal_position;
-                    """, (table_name,))
-                    columns = cursor.fetchall()
-                    
-                    for col in columns:
-                        table_info["columns"].append({
-                            "column_name": col['column_name'],
-                            "data_type": col['data_type'],
-                            "is_nullable": col['is_nullable'],
-                            "column_default": col['column_default']
-                        })
-                    
-                    # Get primary keys
-                    cursor.execute("""
-                        SELECT kcu.column_name
-                        FROM information_schema.table_constraints tc
-                        JOIN information_schema.key_column_usage kcu 
-                        ON tc.constraint_name = kcu.constraint_name
-                        WHERE tc.table_schema = 'public' 
-                        AND tc.table_name = %s 
-                        AND tc.constraint_type = 'PRIMARY KEY';
-                    """, (table_name,))
-                    pk_rows = cursor.fetchall()
-                    table_info["primary_keys"] = [row['column_name'] for row in pk_rows]
-                    
-                    # Get foreign keys
-                    cursor.execute("""
-                        SELECT kcu.column_name, ccu.table_name AS foreign_table, ccu.column_name AS foreign_column
-                        FROM information_schema.table_constraints tc
-                        JOIN information_schema.key_column_usage kcu 
-                        ON tc.constraint_name = kcu.constraint_name
-                        JOIN information_schema.constraint_column_usage ccu 
-                        ON ccu.constraint_name = tc.constraint_name
-                        WHERE tc.table_schema = 'public' 
-                        AND tc.table_name = %s 
-                        AND tc.constraint_type = 'FOREIGN KEY';
-                    """, (table_name,))
-                    fk_rows = cursor.fetchall()
-                    for fk_row in fk_rows:
-                        table_info["foreign_keys"].append({
-                            "column_name": fk_row['column_name'],
-                            "foreign_table": fk_row['foreign_table'],
-                            "foreign_column": fk_row['foreign_column']
-                        })
-                    
-                    schema_info["tables"].append(table_info)
-                
-                # Create schema text for backward compatibility
-                schema_text = self._format_schema_as_text(schema_info["tables"])
-                schema_info["schema"] = schema_text
-                
-                return schema_info
+            snapshot = _schema_cache.get_snapshot(self, force_refresh=force_refresh)
+            return {
+                "success": True,
+                "tables": snapshot["tables"],
+                "schema": snapshot["schema"],
+                "version": snapshot["version"]
+            }
                 
         except Exception as e:
             logger.error(f"Error getting database schema: {e}")
@@ -181,54 +319,76 @@ class SQLTool(BaseTool):
                 "schema": "Error retrieving schema"
             }
     
-    def _format_schema_as_text(self, tables: List[Dict[str, Any]]) -> str:
-        """Format schema information as readable text"""
-        if not tables:
-            return "No tables found in database"
+    def get_schema_version(self) -> Optional[str]:
+        """Get the fingerprint of the currently cached schema snapshot"""
+        schema_result = self.get_database_schema()
+        return schema_result.get("version")
+    
+    def _load_schema_tables(self) -> List[Dict[str, Any]]:
+        """Introspect all public tables with a single pg_catalog query"""
+        rows = self._run_catalog_query(SCHEMA_CATALOG_QUERY)
         
-        schema_text = ""
-        for table in tables:
-            table_name = table.get("table_name", "unknown")
-            columns = table.get("columns", [])
-            primary_keys = table.get("primary_keys", [])
-            foreign_keys = table.get("foreign_keys", [])
+        tables: Dict[str, Dict[str, Any]] = {}
+        for row in rows:
+            table_name = row['table_name']
+            table_info = tables.get(table_name)
+            if table_info is None:
+                table_info = {
+                    "table_name": table_name,
+                    "columns": [],
+                    "primary_keys": [],
+                    "foreign_keys": []
+                }
+                tables[table_name] = table_info
             
-            schema_text += f"\nTable: {table_name}\n"
-            schema_text += "Columns:\n"
-            
-            for col in columns:
-                col_name = col.get("column_name", "unknown")
-                data_type = col.get("data_type", "unknown")
-                is_nullable = col.get("is_nullable", "YES")
-                pk_indicator = " (PK)" if col_name in primary_keys else ""
-                schema_text += f"  - {col_name}: {data_type}{pk_indicator} (nullable: {is_nullable})\n"
-            
-            if foreign_keys:
-                schema_text += "Foreign Keys:\n"
-                for fk in foreign_keys:
-                    source_col = fk.get("column_name", "unknown")
-                    target_table = fk.get("foreign_table", "unknown")
-                    target_col = fk.get("foreign_column", "unknown")
-                    schema_text += f"  - {source_col} -> {target_table}.{target_col}\n"
+            column_name = row['column_name']
+            # A column taking part in several foreign keys shows up once per key
+            if not table_info["columns"] or table_info["columns"][-1]["column_name"] != column_name:
+                table_info["columns"].append({
+                    "column_name": column_name,
+                    "data_type": row['data_type'],
+                    "is_nullable": row['is_nullable'],
+                    "column_default": row['column_default']
+                })
+                if row['is_primary_key']:
+                    table_info["primary_keys"].append(column_name)
             
-            schema_text += "\n"
+            if row['foreign_table']:
+                table_info["foreign_keys"].append({
+                    "column_name": column_name,
+                    "foreign_table": row['foreign_table'],
+                    "foreign_column": row['foreign_column']
+                })
         
-        return schema_text.strip()
+        return list(tables.values())
+    
+    def _get_schema_fingerprint(self) -> str:
+        """Get a cheap fingerprint that changes whenever the public schema changes"""
+        with self.pool.connection() as connection:
+            with connection.cursor(cursor_factory=RealDictCursor) as cursor:
+                cursor.execute(SCHEMA_FINGERPRINT_QUERY)
+                row = cursor.fetchone()
+                fingerprint = row['fingerprint'] or ""
+                
+                # Include the alembic revision so migrations always invalidate the snapshot
+                if row['has_alembic']:
+                    cursor.execute("SELECT string_agg(version_num, ',') AS revision FROM alembic_version;")
+                    revision = cursor.fetchone()['revision'] or ""
+                    fingerprint = f"{fingerprint}:{revision}"
+        
+        return fingerprint
+    
+    def _format_schema_as_text(self, tables: List[Dict[str, Any]]) -> str:
+        """Format schema information as readable text"""
+        if not tables:
+            return "No tables found in database"
+        return "\n\n".join(format_table_as_text(table) for table in tables)
     
     def get_all_tables(self) -> List[str]:
         """Get list of all table names in the database"""
         try:
-            if not self.connection:
-                self.connect()
-            
-            with self.connection.cursor() as cursor:
-                cursor.execute("""
-                    SELECT table_name 
-                    FROM information_schema.tables 
-                    WHERE table_schema = 'public' 
-                    ORDER BY table_name;
-                """)
-                return [row[0] for row in cursor.fetchall()]
+            snapshot = _schema_cache.get_snapshot(self)
+            return list(snapshot["table_names"])
         except Exception as e:
             logger.error(f"Error getting table names: {e}")
             return []
@@ -236,8 +396,6 @@ class SQLTool(BaseTool):
     def execute_query(self, query: str) -> Dict[str, Any]:
         """Execute query with success/result format for backward compatibility"""
         try:
-            if not self.connection:
-                self.connect()
             results = self._run_query(query)
             return {
                 "success": True,
@@ -253,15 +411,44 @@ class SQLTool(BaseTool):
                 "row_count": 0
             }
     
+    async def aexecute_query(self, query: str) -> Dict[str, Any]:
+        """Async version of execute_query that does not block the event loop"""
+        try:
+            results = await self._arun_query(query)
+            return {
+                "success": True,
+                "result": results,
+                "row_count": len(results) if results else 0
+            }
+        except Exception as e:
+            logger.error(f"Error executing query '{query}': {e}")
+            return {
+                "success": False,
+                "error": str(e),
+                "result": [],
+                "row_count": 0
+            }
+    
     def get_langchain_tools(self) -> List[Tool]:
         """Get LangChain tools for agent integration"""
         tools = []
         
+        async def run_sql_query(query: str) -> str:
+            return self._format_query_result(await self.aexecute_query(query))
+        
+        async def run_get_schema(_: str = "") -> str:
+            schema_result = await asyncio.to_thread(self.get_database_schema)
+            return self._format_schema_result(schema_result)
+        
+        async def run_list_tables(_: str = "") -> str:
+            return ", ".join(await asyncio.to_thread(self.get_all_tables))
+        
         # SQL execution tool
         sql_tool = Tool(
             name="sql_query",
             description="Execute SQL queries against the PostgreSQL database. Use this tool to query, insert, update, or delete data from the database.",
-            func=lambda query: self._format_query_result(self.execute_query(query))
+            func=lambda query: self._format_query_result(self.execute_query(query)),
+            coroutine=run_sql_query
         )
         tools.append(sql_tool)
         
@@ -269,7 +456,8 @@ class SQLTool(BaseTool):
         schema_tool = Tool(
             name="get_database_schema",
             description="Get the database schema including tables, columns, primary keys, and foreign keys.",
-            func=lambda _: self._format_schema_result(self.get_database_schema())
+            func=lambda _: self._format_schema_result(self.get_database_schema()),
+            coroutine=run_get_schema
         )
         tools.append(schema_tool)
         
@@ -277,7 +465,8 @@ class SQLTool(BaseTool):
         tables_tool = Tool(
             name="list_tables",
             description="Get a list of all tables in the database.",
-            func=lambda _: ", ".join(self.get_all_tables())
+            func=lambda _: ", ".join(self.get_all_tables()),
+            coroutine=run_list_tables
         )
         tools.append(tables_tool)
         
@@ -445,4 +634,21 @@ class SQLTool(BaseTool):
             
         except Exception as e:
             logger.error(f"Error generating learning prompt addition: {e}")
-            return ""
\ No newline at end of file
+            return ""
+
+# Shared SQLTool instances; the tools are stateless on top of the connection pools
+_sql_tools: Dict[str, SQLTool] = {}
+
+def get_sql_tool(db_url: Optional[str] = None) -> Optional[SQLTool]:
+    """Get a shared SQLTool for a database URL (defaults to DATABASE_URL and its replica)"""
+    default_url = os.getenv("DATABASE_URL")
+    db_url = db_url or default_url
+    if not db_url:
+        return None
+    # The replica mirrors the main database only
+    replica_url = DATABASE_REPLICA_URL if db_url == default_url else None
+    sql_tool = _sql_tools.get(db_url)
+    if sql_tool is None:
+        sql_tool = SQLTool(db_url, replica_url=replica_url)
+        _sql_tools[db_url] = sql_tool
+    return sql_tool
@@ -0,0 +1,227 @@
+"""
+Resumable chat streams.
+
+A chat stream's generation runs in its own task and appends payloads to a
+ChatStream, a bounded ring buffer of (seq, payload). Clients subscribe from
+a sequence number, so a reconnect carrying Last-Event-ID "{stream_id}:{seq}"
+replays the payloads it missed and follows the still-running generation
+instead of starting a new LM Studio request. When the last client leaves
+and none reattaches within CHAT_STREAM_RESUME_GRACE seconds, the generation
+is cancelled so it stops using the model. Finished streams are dropped
+CHAT_STREAM_TTL seconds after they end. Streams live in process memory, so
+a reconnect has to reach the same worker; they are only touched from the
+event loop, so no locking is needed.
+"""
+import asyncio
+import logging
+import os
+import secrets
+import time
+from collections import deque
+from itertools import islice
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Payloads kept per stream for replay
+CHAT_STREAM_BUFFER_EVENTS = int(os.getenv("CHAT_STREAM_BUFFER_EVENTS", "4096"))
+# Seconds a finished stream stays resumable
+CHAT_STREAM_TTL = int(os.getenv("CHAT_STREAM_TTL", "120"))
+# Finished streams beyond this count are dropped oldest first, before their TTL
+CHAT_STREAM_MAX = int(os.getenv("CHAT_STREAM_MAX", "256"))
+# Seconds a generation with no connected client waits for a reconnect before it is cancelled
+CHAT_STREAM_RESUME_GRACE = float(os.getenv("CHAT_STREAM_RESUME_GRACE", "10"))
+
+
+def parse_event_id(event_id: Optional[str]) -> Optional[Tuple[str, int]]:
+    """(stream_id, seq) of a Last-Event-ID value, or None if it is not a stream event id"""
+    if not event_id:
+        return None
+    stream_id, separator, seq = event_id.strip().rpartition(":")
+    if not separator or not stream_id or not seq.isdigit():
+        return None
+    return stream_id, int(seq)
+
+
+class ChatStream:
+    """Payloads of one generation in a bounded ring buffer"""
+
+    def __init__(self, stream_id: str, user_id: int, max_events: int = CHAT_STREAM_BUFFER_EVENTS):
+        self.stream_id = stream_id
+        self.user_id = user_id
+        self._events: Deque[Tuple[int, Dict[str, Any]]] = deque(maxlen=max(max_events, 1))
+        self._changed = asyncio.Event()
+        self.last_seq = 0
+        self.finished_at: Optional[float] = None
+        self.cancelled = False
+        self.subscribers = 0
+        # Pending cancellation while no client is connected
+        self.cancel_timer: Optional[asyncio.TimerHandle] = None
+        self.task: Optional[asyncio.Task] = None
+        # Called when the last subscriber leaves a running stream
+        self.on_abandoned: Optional[Callable[["ChatStream"], None]] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.finished_at is not None
+
+    @property
+    def first_seq(self) -> int:
+        """Oldest sequence number still buffered"""
+        return self._events[0][0] if self._events else self.last_seq + 1
+
+    def append(self, payload: Dict[str, Any]) -> None:
+        self.last_seq += 1
+        self._events.append((self.last_seq, payload))
+        self._wake()
+
+    def finish(self) -> None:
+        self.finished_at = time.monotonic()
+        self._wake()
+
+    def _wake(self) -> None:
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def can_resume(self, after_seq: int) -> bool:
+        """Whether every payload after after_seq is still buffered"""
+        return self.first_seq - 1 <= after_seq <= self.last_seq
+
+    async def subscribe(self, after_seq: int = 0) -> AsyncIterator[Tuple[int, Dict[str, Any]]]:
+        """(seq, payload) pairs after after_seq, following the generation until it ends"""
+        seq = after_seq
+        self.subscribers += 1
+        if self.cancel_timer is not None:
+            self.cancel_timer.cancel()
+            self.cancel_timer = None
+        try:
+            while True:
+                if seq < self.last_seq:
+                    if seq + 1 < self.first_seq:
+                        # The reader fell further behind than the buffer holds
+                        yield seq, {"type": "error", "content": "Stream can no longer be resumed", "chunk_id": -1}
+                        return
+                    # Copy before yielding: the generation may append meanwhile
+                    pending = list(islice(self._events, seq + 1 - self.first_seq, None))
+                    seq = pending[-1][0]
+                    for item in pending:
+                        yield item
+                    continue
+                if self.finished:
+                    return
+                await self._changed.wait()
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.finished and self.on_abandoned is not None:
+                self.on_abandoned(self)
+
+
+class ChatStreamRegistry:
+    """Running and recently finished chat streams by id"""
+
+    def __init__(
+        self,
+        max_events: int = CHAT_STREAM_BUFFER_EVENTS,
+        ttl: int = CHAT_STREAM_TTL,
+        max_streams: int = CHAT_STREAM_MAX,
+        resume_grace: float = CHAT_STREAM_RESUME_GRACE
+    ):
+        self.max_events = max_events
+        self.ttl = ttl
+        self.max_streams = max_streams
+        self.resume_grace = resume_grace
+        self._streams: Dict[str, ChatStream] = {}
+        self.started = 0
+        self.resumed = 0
+        self.expired = 0
+        self.abandoned = 0
+
+    def start(self, user_id: int, payloads: AsyncIterator[Dict[str, Any]]) -> ChatStream:
+        """Run a generation in the background, buffering its payloads"""
+        self._evict()
+        stream = ChatStream(secrets.token_urlsafe(12), user_id, self.max_events)
+        self._streams[stream.stream_id] = stream
+        stream.on_abandoned = self._schedule_cancel
+        stream.task = asyncio.get_running_loop().create_task(self._run(stream, payloads))
+        self.started += 1
+        return stream
+
+    async def _run(self, stream: ChatStream, payloads: AsyncIterator[Dict[str, Any]]) -> None:
+        try:
+            async for payload in payloads:
+                stream.append(payload)
+        except Exception as e:
+            logger.error(f"Chat stream {stream.stream_id} failed: {e}")
+            stream.append({"type": "error", "content": str(e), "chunk_id": -1})
+        finally:
+            stream.finish()
+
+    def _schedule_cancel(self, stream: ChatStream) -> None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Subscription finalized outside the loop (shutdown); nothing left to cancel
+            return
+        stream.cancel_timer = loop.call_later(self.resume_grace, self._cancel_if_abandoned, stream)
+
+    def _cancel_if_abandoned(self, stream: ChatStream) -> None:
+        """Cancel the generation if no client reattached during the grace period"""
+        stream.cancel_timer = None
+        if stream.subscribers or stream.finished or stream.task is None:
+            return
+        stream.cancelled = True
+        # Cancellation reaches query_lm_studio_stream / the agent run, which close the upstream request
+        stream.task.cancel()
+        self.abandoned += 1
+        logger.info(f"Cancelled chat stream {stream.stream_id}: client gone for {self.resume_grace}s")
+
+    def resume(self, stream_id: str, user_id: int, after_seq: int) -> Optional[ChatStream]:
+        """The user's stream if everything after after_seq can still be replayed"""
+        self._evict()
+        stream = self._streams.get(stream_id)
+        if stream is None or stream.user_id != user_id or stream.cancelled or not stream.can_resume(after_seq):
+            return None
+        self.resumed += 1
+        return stream
+
+    def _evict(self) -> None:
+        now = time.monotonic()
+        expired = [
+            stream_id for stream_id, stream in self._streams.items()
+            if stream.finished_at is not None and now - stream.finished_at > self.ttl
+        ]
+        overflow = len(self._streams) - len(expired) - self.max_streams
+        if overflow > 0:
+            # Dicts keep insertion order, so these are the oldest finished streams
+            expired += [
+                stream_id for stream_id, stream in self._streams.items()
+                if stream.finished and stream_id not in expired
+            ][:overflow]
+        for stream_id in expired:
+            del self._streams[stream_id]
+        self.expired += len(expired)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "running": sum(1 for stream in self._streams.values() if not stream.finished),
+            "buffered": len(self._streams),
+            "buffer_events": self.max_events,
+            "ttl": self.ttl,
+            "started": self.started,
+            "resumed": self.resumed,
+            "expired": self.expired,
+            "abandoned": self.abandoned,
+            "resume_grace": self.resume_grace
+        }
+
+
+# Global chat stream registry
+_stream_registry = None
+
+
+def get_stream_registry() -> ChatStreamRegistry:
+    """Get the global chat stream registry"""
+    global _stream_registry
+    if _stream_registry is None:
+        _stream_registry = ChatStreamRegistry()
+    return _stream_registry
@@ -0,0 +1,113 @@
+"""
+Typed events for streamed chat responses.
+
+Streaming generators (LM Studio, the SQL agent, RAG) yield these objects
+instead of formatted strings, so consumers dispatch on the event class and
+never scan or JSON-decode text chunks. to_payload() maps an event to the
+wire format the frontend reads (answer/thinking/stats/error/sources/
+citations); app.api.sse turns payloads into SSE frames.
+"""
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Union
+
+# Tool output shown in the thinking panel is cut to this many characters
+TOOL_OUTPUT_PREVIEW = 200
+
+
+@dataclass(slots=True)
+class Token:
+    """Model output text; may contain <think> tags split across tokens"""
+    text: str
+
+
+@dataclass(slots=True)
+class Thinking:
+    """Reasoning or agent status text shown with the thinking"""
+    text: str
+
+
+@dataclass(slots=True)
+class ToolStart:
+    """The agent started running a tool"""
+    tool: str
+
+
+@dataclass(slots=True)
+class ToolEnd:
+    """A tool finished; output is the (possibly long) tool result"""
+    output: str
+    tool: Optional[str] = None
+
+
+@dataclass(slots=True)
+class Stats:
+    """Timing and token usage of one model call"""
+    inference_time: int
+    tokens_per_second: float
+    prompt_tokens: int
+    completion_tokens: int
+    time_to_first_token: Optional[int] = None
+    # "server" when the counts come from the server's usage chunk, else the local tokenizer name
+    usage_source: str = "server"
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+
+@dataclass(slots=True)
+class Error:
+    """A failure the client should show instead of answer text"""
+    message: str
+
+
+@dataclass(slots=True)
+class Sources:
+    """Entries a RAG answer is grounded on"""
+    sources: List[Dict[str, Any]] = field(default_factory=list)
+
+
+@dataclass(slots=True)
+class Citations:
+    """Entry ids cited in a RAG answer"""
+    entry_ids: List[int] = field(default_factory=list)
+
+
+StreamEvent = Union[Token, Thinking, ToolStart, ToolEnd, Stats, Error, Sources, Citations]
+
+
+def _preview(text: str, limit: int = TOOL_OUTPUT_PREVIEW) -> str:
+    return text[:limit] + "..." if len(text) > limit else text
+
+
+def to_payload(event: StreamEvent) -> Dict[str, Any]:
+    """Wire payload of an event; Token text is routed by the think-tag parser instead"""
+    if isinstance(event, Thinking):
+        return {"type": "thinking", "content": event.text}
+    if isinstance(event, ToolStart):
+        return {"type": "thinking", "event": "tool_start", "tool": event.tool,
+                "content": f"\n🔧 Using tool: {event.tool}...\n"}
+    if isinstance(event, ToolEnd):
+        return {"type": "thinking", "event": "tool_end", "tool": event.tool,
+                "content": f"📋 Tool result: {_preview(event.output)}\n"}
+    if isinstance(event, Stats):
+        return {
+            "type": "stats",
+            "inference_time": event.inference_time,
+            "time_to_first_token": event.time_to_first_token,
+            "tokens_per_second": event.tokens_per_second,
+            "prompt_tokens": event.prompt_tokens,
+            "completion_tokens": event.completion_tokens,
+            "total_tokens": event.total_tokens,
+            "usage_source": event.usage_source
+        }
+    if isinstance(event, Error):
+        return {"type": "error", "content": event.message}
+    if isinstance(event, Sources):
+        return {"type": "sources", "sources": event.sources}
+    if isinstance(event, Citations):
+        return {"type": "citations", "entry_ids": event.entry_ids}
+    if isinstance(event, Token):
+        return {"type": "answer", "content": event.text}
+    raise TypeError(f"Not a stream event: {event!r}")
+
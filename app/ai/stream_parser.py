@@ -0,0 +1,118 @@
+"""
+Incremental parsing of streamed model output.
+
+ThinkTagParser splits text into thinking and answer segments as chunks
+arrive. Tags may be split across chunks: only a possible tag prefix (at most
+len("</think>") - 1 characters) is held back between chunks, so each step
+costs O(chunk) and memory stays constant however long the stream runs.
+ChatStreamParser routes the chat stream's typed events (see stream_events)
+to client payloads, running only Token text through the tag parser.
+"""
+import re
+from typing import Any, Dict, List, Tuple, Union
+
+from .stream_events import StreamEvent, Token, to_payload
+
+OPEN_TAG = "<think>"
+CLOSE_TAG = "</think>"
+_TAG_PATTERNS = {tag: re.compile(re.escape(tag), re.IGNORECASE) for tag in (OPEN_TAG, CLOSE_TAG)}
+
+
+def _partial_tag_length(text: str, tag: str) -> int:
+    """Length of the longest suffix of text that is a proper prefix of tag"""
+    for length in range(min(len(tag) - 1, len(text)), 0, -1):
+        if text[-length:].lower() == tag[:length]:
+            return length
+    return 0
+
+
+class ThinkTagParser:
+    """State machine routing streamed text to "thinking" or "answer" around <think> tags"""
+
+    def __init__(self):
+        self.section = "answer"
+        self._pending = ""
+        # Whitespace right after a tag (or at the start) is dropped, like the full-response parser's strip()
+        self._section_started = False
+
+    def _segment(self, text: str, segments: List[Tuple[str, str]]) -> None:
+        if not text:
+            return
+        if not self._section_started:
+            text = text.lstrip()
+            if not text:
+                return
+            self._section_started = True
+        segments.append((self.section, text))
+
+    def feed(self, chunk: str) -> List[Tuple[str, str]]:
+        """Route one chunk; returns (section, text) segments"""
+        segments: List[Tuple[str, str]] = []
+        text = self._pending + chunk
+        self._pending = ""
+        while text:
+            tag = OPEN_TAG if self.section == "answer" else CLOSE_TAG
+            match = _TAG_PATTERNS[tag].search(text)
+            if match is None:
+                held = _partial_tag_length(text, tag)
+                if held:
+                    self._pending = text[-held:]
+                    text = text[:-held]
+                self._segment(text, segments)
+                break
+            self._segment(text[:match.start()], segments)
+            self.section = "thinking" if tag == OPEN_TAG else "answer"
+            self._section_started = False
+            text = text[match.end():]
+        return segments
+
+    def flush(self) -> List[Tuple[str, str]]:
+        """Emit text held back as a possible tag once the stream ends"""
+        segments: List[Tuple[str, str]] = []
+        if self._pending:
+            self._segment(self._pending, segments)
+            self._pending = ""
+        return segments
+
+
+def split_think(chunks) -> Tuple[str, str]:
+    """Thinking and answer text of a complete sequence of chunks"""
+    parser = ThinkTagParser()
+    parts: Dict[str, List[str]] = {"thinking": [], "answer": []}
+    for chunk in chunks:
+        for section, text in parser.feed(chunk):
+            parts[section].append(text)
+    for section, text in parser.flush():
+        parts[section].append(text)
+    return "".join(parts["thinking"]), "".join(parts["answer"])
+
+
+class ChatStreamParser:
+    """Turn chat_with_ai stream events into client payloads"""
+
+    def __init__(self):
+        self.think = ThinkTagParser()
+
+    def _text_events(self, segments: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+        return [{"type": section, "content": text} for section, text in segments]
+
+    def feed(self, chunk: Union[StreamEvent, str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Payloads for one event"""
+        if isinstance(chunk, Token):
+            return self._text_events(self.think.feed(chunk.text)) if chunk.text else []
+        item: Union[StreamEvent, str, None]
+        if isinstance(chunk, dict):
+            if chunk.get("error", False):
+                return [{"type": "error", "content": chunk.get("content", "Unknown error")}]
+            item = chunk.get("content")
+        else:
+            item = chunk
+        if item is None or isinstance(item, str):
+            # Untyped text (non-streaming replies) is model output like a Token
+            return self._text_events(self.think.feed(item)) if item else []
+        # Release any held-back text first so the order of the output is kept
+        return self._text_events(self.think.flush()) + [to_payload(item)]
+
+    def close(self) -> List[Dict[str, Any]]:
+        """Payloads for text still held back when the stream ends"""
+        return self._text_events(self.think.flush())
@@ -1,24 +1,42 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, Header, HTTPException, Request, status, Response
 from sqlalchemy.orm import Session
 from typing import List, Optional, Dict, Any
 from pydantic import BaseModel
-from fastapi.responses import StreamingResponse
-import json
+import asyncio
 import logging
+import os
+from datetime import datetime
 
-from .. import models, schemas
+from .. import models, schemas, crud
 from ..api.dependencies import get_db
 from ..api.auth import get_current_active_user
 from ..ai import lm_studio
+from ..ai.analysis_store import analyze_entry_incremental
+from ..ai.jobs import get_job_worker
+from ..ai import embeddings
+from ..ai.prompt_manager import get_prompt_manager
+from ..ai.stream_parser import ChatStreamParser
+from ..ai.stream_buffer import get_stream_registry, parse_event_id
+from .sse import EventSourceResponse
+from ..ai.response_cache import get_cache_status, reset_cache_status, get_response_cache
 
 # Configure logger
 logger = logging.getLogger(__name__)
 
+# How often a non-streaming chat checks that its client is still connected
+CHAT_DISCONNECT_POLL_SECONDS = float(os.getenv("CHAT_DISCONNECT_POLL_SECONDS", "0.5"))
+
+# Comma-separated usernames allowed to rebuild the schema snapshot; nobody when unset
+SCHEMA_REFRESH_USERS = frozenset(
+    name.strip() for name in os.getenv("SCHEMA_REFRESH_USERS", "").split(",") if name.strip()
+)
+
 # Define response models for AI endpoints
 class EntryAnalysisRequest(BaseModel):
     entry_id: int
     analysis_type: str = "general"  # general, mood, summary, insights
     model: Optional[str] = None  # Optional model selection
+    force: bool = False  # Re-run the model even if a stored analysis is still valid
 
 class EntryAnalysisResponse(BaseModel):
     entry_id: int
@@ -28,6 +46,41 @@ class EntryAnalysisResponse(BaseModel):
     raw_content: str
     analysis_type: str
     model: Optional[str] = None  # Added to show which model was used
+    cached: bool = False  # True when served from stored analyses
+    analyzed_at: Optional[datetime] = None
+
+class BatchAnalysisRequest(BaseModel):
+    entry_ids: Optional[List[int]] = None  # Defaults to all of the user's entries
+    analysis_types: List[str] = ["general"]
+    model: Optional[str] = None
+    force: bool = False
+
+class AnalysisJobResponse(BaseModel):
+    job_id: int
+    status: str
+    total_items: int
+    completed_items: int
+    failed_items: int
+    progress: float
+    model: Optional[str] = None
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    errors: List[Dict[str, Any]] = []
+
+class EmbeddingBackfillRequest(BaseModel):
+    entry_ids: Optional[List[int]] = None  # Defaults to all of the user's entries
+    force: bool = False  # Re-embed entries whose stored vector is still current
+
+class EmbeddingBackfillResponse(BaseModel):
+    queued: int
+    model: str
+
+class EmbeddingStatusResponse(BaseModel):
+    model: str
+    dimensions: int
+    total_entries: int
+    embedded_entries: int
 
 class PromptsRequest(BaseModel):
     topic: Optional[str] = ""
@@ -80,10 +133,19 @@ class ChatRequest(BaseModel):
     system_prompt: Optional[str] = None
     stream: bool = False  # Enable streaming
     use_agent: bool = False  # Whether to use agent mode
+    use_rag: bool = False  # Answer from the user's own entries (takes precedence over agent mode)
 
 class ChatResponse(BaseModel):
     content: str
     model: Optional[str] = None
+    sources: Optional[List[Dict[str, Any]]] = None  # Entries given to the model in RAG mode
+    citations: Optional[List[int]] = None  # Entry ids the answer cites
+
+class SchemaRefreshResponse(BaseModel):
+    success: bool
+    message: str
+    version: Optional[str] = None
+    table_count: int = 0
 
 class ChatStreamData(BaseModel):
     type: str  # "chunk", "thinking", "answer", "done", "error"
@@ -93,6 +155,12 @@ class ChatStreamData(BaseModel):
 # Create router
 router = APIRouter(tags=["ai"])
 
+def _set_cache_header(response: Response) -> None:
+    """Expose the response cache outcome of the current request"""
+    cache_status = get_cache_status()
+    if cache_status:
+        response.headers["X-Cache"] = cache_status
+
 # Check AI service status
 @router.get("/status", response_model=AIStatusResponse)
 async def check_ai_status():
@@ -120,10 +188,94 @@ async def list_models():
             detail=f"Error fetching models: {str(e)}"
         )
 
+# Rebuild the cached database schema snapshot used by the SQL tools
+@router.post("/schema/refresh", response_model=SchemaRefreshResponse)
+async def refresh_schema_cache(
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """Invalidate and rebuild the schema snapshot after out-of-band schema changes"""
+    if current_user.username not in SCHEMA_REFRESH_USERS:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not allowed to refresh the schema cache"
+        )
+    
+    database_url = os.getenv("DATABASE_URL")
+    if not database_url:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="No DATABASE_URL configured"
+        )
+    
+    try:
+        from ..ai.sql_tool import get_sql_tool, invalidate_schema_cache
+        
+        logger.info(f"Schema cache refresh requested by {current_user.username}")
+        invalidate_schema_cache(database_url)
+        schema_result = get_sql_tool(database_url).get_database_schema(force_refresh=True)
+        if not schema_result.get("success", False):
+            return {
+                "success": False,
+                "message": f"Error rebuilding schema: {schema_result.get('error', 'Unknown error')}"
+            }
+        
+        return {
+            "success": True,
+            "message": "Schema snapshot rebuilt",
+            "version": schema_result.get("version"),
+            "table_count": len(schema_result.get("tables", []))
+        }
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error refreshing schema cache: {str(e)}"
+        )
+
+# Runtime statistics for the AI subsystem
+@router.get("/metrics")
+async def get_ai_metrics(
+    current_user: models.User = Depends(get_current_active_user)
+) -> Dict[str, Any]:
+    """Get connection pool and cache statistics for the AI subsystem"""
+    from ..ai.sql_pool import get_pool_stats
+    from ..ai.sql_tool import get_schema_cache_stats
+    from ..ai.agent import get_agent_factory
+    
+    return {
+        "sql_pools": get_pool_stats(),
+        "schema_cache": get_schema_cache_stats(),
+        "agent_cache": get_agent_factory().get_stats(),
+        "lm_studio_http": lm_studio.get_http_client_stats(),
+        "llm_cache": lm_studio.get_llm_cache_stats(),
+        "response_cache": get_response_cache().get_stats(),
+        "analysis_jobs": get_job_worker().get_stats(),
+        "embeddings": embeddings.get_embedding_stats(),
+        "prompts": get_prompt_manager().get_stats(),
+        "chat_streams": get_stream_registry().get_stats(),
+        "generations": lm_studio.get_generation_stats()
+    }
+
+async def _until_disconnected(http_request: Request, awaitable):
+    """Await a result, cancelling the work if the client disconnects first (then None)"""
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=CHAT_DISCONNECT_POLL_SECONDS)
+            if done:
+                return task.result()
+            if await http_request.is_disconnected():
+                logger.info("Client disconnected, cancelling chat generation")
+                return None
+    finally:
+        if not task.done():
+            task.cancel()
+            await asyncio.wait({task})
+
 # Chat with AI
 @router.post("/chat", response_model=ChatResponse)
 async def chat(
     request: ChatRequest,
+    http_request: Request,
     current_user: models.User = Depends(get_current_active_user)
 ):
     """Chat with the AI assistant"""
@@ -143,15 +295,24 @@ async def chat(
             ]
         
         # Process chat message
-        async for response in lm_studio.chat_with_ai(
-            message=request.message,
-            history=history,
-            model=request.model,
-            system_prompt=request.system_prompt,
-            streaming=False,
-            use_agent=request.use_agent
-        ):
-            return response
+        async def first_response():
+            async for response in lm_studio.chat_with_ai(
+                message=request.message,
+                history=history,
+                model=request.model,
+                system_prompt=request.system_prompt,
+                streaming=False,
+                use_agent=request.use_agent,
+                use_rag=request.use_rag,
+                user_id=current_user.user_id
+            ):
+                return response
+        
+        response = await _until_disconnected(http_request, first_response())
+        if response is None:
+            # Nobody is left to read the answer (499: client closed request)
+            return Response(status_code=499)
+        return response
             
     except HTTPException:
         raise
@@ -165,6 +326,7 @@ async def chat(
 @router.post("/analyze-entry", response_model=EntryAnalysisResponse)
 async def analyze_entry(
     request: EntryAnalysisRequest,
+    response: Response,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
@@ -189,23 +351,34 @@ async def analyze_entry(
             detail=f"Invalid analysis type. Must be one of: {', '.join(valid_types)}"
         )
     
+    # Storing the analysis commits the session, which expires the entry
+    entry_title = entry.title
+    
     # Perform analysis
     try:
-        analysis_result = await lm_studio.analyze_journal_entry(
-            entry_title=entry.title,
-            entry_content=entry.content or "",
+        reset_cache_status()
+        analysis_result = await analyze_entry_incremental(
+            db,
+            entry,
             analysis_type=request.analysis_type,
-            model=request.model
+            model=request.model,
+            force=request.force
         )
+        if analysis_result.get("cached"):
+            response.headers["X-Cache"] = "HIT"
+        else:
+            _set_cache_header(response)
         
         return {
-            "entry_id": entry.entry_id,
-            "title": entry.title,
+            "entry_id": request.entry_id,
+            "title": entry_title,
             "think": analysis_result.get("think"),
             "answer": analysis_result.get("answer"),
             "raw_content": analysis_result.get("raw_content"),
             "analysis_type": request.analysis_type,
-            "model": analysis_result.get("model")  # Return the model used
+            "model": analysis_result.get("model"),  # Return the model used
+            "cached": analysis_result.get("cached", False),
+            "analyzed_at": analysis_result.get("analyzed_at")
         }
     except Exception as e:
         raise HTTPException(
@@ -213,10 +386,153 @@ async def analyze_entry(
             detail=f"Error analyzing entry: {str(e)}"
         )
 
+def _job_to_response(db: Session, job: models.AnalysisJob) -> Dict[str, Any]:
+    done = job.completed_items + job.failed_items
+    failed_items = db.query(models.AnalysisJobItem).filter(
+        models.AnalysisJobItem.job_id == job.job_id,
+        models.AnalysisJobItem.status == "failed"
+    ).limit(20).all()
+    return {
+        "job_id": job.job_id,
+        "status": job.status,
+        "total_items": job.total_items,
+        "completed_items": job.completed_items,
+        "failed_items": job.failed_items,
+        "progress": round(done / job.total_items, 4) if job.total_items else 1.0,
+        "model": job.model,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+        "errors": [
+            {"entry_id": item.entry_id, "analysis_type": item.analysis_type, "error": item.error}
+            for item in failed_items
+        ]
+    }
+
+# Queue background analysis of many entries
+@router.post("/analyze-batch", response_model=AnalysisJobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def analyze_batch(
+    request: BatchAnalysisRequest,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """Queue analysis of the user's entries for background processing"""
+    valid_types = ["general", "mood", "summary", "insights"]
+    invalid_types = [t for t in request.analysis_types if t not in valid_types]
+    if not request.analysis_types or invalid_types:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid analysis type. Must be one of: {', '.join(valid_types)}"
+        )
+    
+    query = db.query(models.Entry.entry_id).filter(models.Entry.user_id == current_user.user_id)
+    if request.entry_ids is not None:
+        query = query.filter(models.Entry.entry_id.in_(request.entry_ids))
+    entry_ids = [row.entry_id for row in query.order_by(models.Entry.entry_id).all()]
+    
+    if not entry_ids:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No entries found to analyze"
+        )
+    
+    job = crud.create_analysis_job(
+        db,
+        user_id=current_user.user_id,
+        entry_ids=entry_ids,
+        analysis_types=list(dict.fromkeys(request.analysis_types)),
+        model=request.model,
+        force=request.force
+    )
+    get_job_worker().notify()
+    logger.info(f"Queued analysis job {job.job_id} with {job.total_items} items")
+    return _job_to_response(db, job)
+
+# Get batch analysis job progress
+@router.get("/jobs/{job_id}", response_model=AnalysisJobResponse)
+async def get_analysis_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """Get status and progress of a batch analysis job"""
+    job = crud.get_analysis_job(db, job_id, current_user.user_id)
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
+    return _job_to_response(db, job)
+
+# Cancel a batch analysis job
+@router.post("/jobs/{job_id}/cancel", response_model=AnalysisJobResponse)
+async def cancel_analysis_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """Cancel the queued items of a batch analysis job"""
+    job = crud.get_analysis_job(db, job_id, current_user.user_id)
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
+    if job.status in ("completed", "cancelled"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Job is already {job.status}"
+        )
+    job = crud.cancel_analysis_job(db, job)
+    return _job_to_response(db, job)
+
+# Queue embedding of the user's entries
+@router.post("/embeddings/backfill", response_model=EmbeddingBackfillResponse, status_code=status.HTTP_202_ACCEPTED)
+async def backfill_embeddings(
+    request: EmbeddingBackfillRequest,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """Embed entries without a current vector in the background, in batched model calls"""
+    if not embeddings.EMBEDDINGS_ENABLED:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Embeddings are disabled"
+        )
+    query = db.query(models.Entry.entry_id).filter(models.Entry.user_id == current_user.user_id)
+    if request.entry_ids is not None:
+        query = query.filter(models.Entry.entry_id.in_(request.entry_ids))
+    entry_ids = [row.entry_id for row in query.order_by(models.Entry.entry_id).all()]
+    embeddings.queue_entry_embeddings(background_tasks, entry_ids, force=request.force)
+    logger.info(f"Queued embedding backfill of {len(entry_ids)} entries")
+    return {"queued": len(entry_ids), "model": embeddings.get_embedding_model()}
+
+# Embedding coverage of the user's entries
+@router.get("/embeddings/status", response_model=EmbeddingStatusResponse)
+async def get_embedding_status(
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """Count the user's entries and those with a vector from the current model"""
+    model = embeddings.get_embedding_model()
+    total = db.query(models.Entry).filter(models.Entry.user_id == current_user.user_id).count()
+    embedded = db.query(models.EntryEmbedding).join(models.Entry).filter(
+        models.Entry.user_id == current_user.user_id,
+        models.EntryEmbedding.model == model
+    ).count()
+    return {
+        "model": model,
+        "dimensions": embeddings.EMBEDDING_DIMENSIONS,
+        "total_entries": total,
+        "embedded_entries": embedded
+    }
+
 # Generate journaling prompts
 @router.post("/generate-prompts", response_model=PromptsResponse)
 async def generate_prompts(
     request: PromptsRequest,
+    response: Response,
     current_user: models.User = Depends(get_current_active_user)
 ):
     """Generate journaling prompts using AI"""
@@ -228,11 +544,13 @@ async def generate_prompts(
                 detail="Count must be between 1 and 10"
             )
         
+        reset_cache_status()
         prompts = await lm_studio.generate_journaling_prompts(
             topic=request.topic,
             theme=request.theme,
             count=request.count
         )
+        _set_cache_header(response)
         
         return {"prompts": prompts}
     except HTTPException:
@@ -247,6 +565,7 @@ async def generate_prompts(
 @router.post("/improve-writing", response_model=WritingImprovementResponse)
 async def improve_writing(
     request: WritingImprovementRequest,
+    response: Response,
     current_user: models.User = Depends(get_current_active_user)
 ):
     """Improve English writing quality with grammar, style, and vocabulary enhancements"""
@@ -272,10 +591,12 @@ async def improve_writing(
                 detail="Text must be less than 5000 characters"
             )
         
+        reset_cache_status()
         improvement_result = await lm_studio.improve_writing(
             text=request.text,
             improvement_type=request.improvement_type
         )
+        _set_cache_header(response)
         
         return {
             "original_text": request.text,
@@ -296,6 +617,7 @@ async def improve_writing(
 @router.post("/writing-suggestions", response_model=WritingSuggestionsResponse)
 async def get_writing_suggestions(
     request: WritingSuggestionsRequest,
+    response: Response,
     current_user: models.User = Depends(get_current_active_user)
 ):
     """Get detailed writing improvement suggestions for English text"""
@@ -313,10 +635,12 @@ async def get_writing_suggestions(
                 detail="Text must be less than 5000 characters"
             )
         
+        reset_cache_status()
         suggestions_result = await lm_studio.suggest_writing_improvements(
             text=request.text,
             model=request.model
         )
+        _set_cache_header(response)
         
         return {
             "original_text": request.text,
@@ -335,14 +659,46 @@ async def get_writing_suggestions(
             detail=f"Error getting writing suggestions: {str(e)}"
         )
 
+_SQL_FENCE_KEYWORDS = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "CREATE", "DROP", "ALTER")
+
+
+def _fix_sql_fences(content: str) -> str:
+    """Fix broken SQL markdown blocks such as ```sqlSELECT -> ```sql\nSELECT"""
+    if "```sql" not in content:
+        return content
+    if content.count("```sql") != content.count("```"):
+        content = content.replace("```sql", "```sql\n").replace("\n\n", "\n")
+    for keyword in _SQL_FENCE_KEYWORDS:
+        content = content.replace(f"```sql{keyword}", f"```sql\n{keyword}")
+    return content
+
+
 # Streaming chat endpoint
 @router.post("/chat-stream")
 async def chat_with_ai_stream(
     request: ChatRequest,
-    current_user: models.User = Depends(get_current_active_user)
+    current_user: models.User = Depends(get_current_active_user),
+    last_event_id: Optional[str] = Header(None)
 ):
     """Stream chat response with AI, supporting think/answer separation"""
     try:
+        streams = get_stream_registry()
+        # A reconnect replays missed events and follows the running generation
+        resume = parse_event_id(last_event_id)
+        if resume:
+            stream_id, after_seq = resume
+            stream = streams.resume(stream_id, current_user.user_id, after_seq)
+            if stream is None:
+                raise HTTPException(
+                    status_code=status.HTTP_410_GONE,
+                    detail="Stream can no longer be resumed; send the message again"
+                )
+            return EventSourceResponse(
+                stream.subscribe(after_seq),
+                stream_id=stream.stream_id,
+                headers={"X-Stream-Id": stream.stream_id}
+            )
+        
         # Validate message
         if not request.message.strip():
             raise HTTPException(
@@ -367,301 +723,85 @@ async def chat_with_ai_stream(
         async def generate_stream():
             try:
                 chunk_id = 0
-                thinking_content = ""
-                answer_content = ""
-                current_section = "answer"  # "thinking" or "answer"
-                in_think_tags = False
-                sent_data = []  # Track data sent to client for later reference
-                content_buffer = ""  # Buffer to detect and remove stats from content
+                parser = ChatStreamParser()
+                stats = None
+                # Answer text is only kept when the SQL post-processing below needs it
+                collect_answer = request.use_agent and not request.use_rag
+                answer_parts = []
+                
+                def track(events):
+                    nonlocal stats
+                    for payload in events:
+                        payload["chunk_id"] = chunk_id
+                        if payload["type"] == "stats":
+                            stats = payload
+                        elif payload["type"] == "answer":
+                            payload["content"] = _fix_sql_fences(payload["content"])
+                            if collect_answer:
+                                answer_parts.append(payload["content"])
+                    return events
+                
                 async for chunk in lm_studio.chat_with_ai(
                     message=request.message,
                     history=history,
                     model=request.model,
                     system_prompt=request.system_prompt,
                     streaming=True,
-                    use_agent=request.use_agent
+                    use_agent=request.use_agent,
+                    use_rag=request.use_rag,
+                    user_id=current_user.user_id
                 ):
                     chunk_id += 1
-                    
-                    # Check if the chunk is a stats message (JSON string)
-                    if isinstance(chunk, str) and chunk.startswith('{"type":'):
-                        try:
-                            # Parse the JSON stats and forward them to the client
-                            stats_data = json.loads(chunk)
-                            # Add the chunk_id for consistency
-                            stats_data["chunk_id"] = chunk_id
-                            sent_data.append(stats_data)  # Store for later reference
-                            yield f"data: {json.dumps(stats_data)}\n\n"
-                            continue  # Skip the rest of the processing for this chunk
-                        except json.JSONDecodeError:
-                            # If it's not valid JSON, treat it as regular content
-                            pass
-                    
-                    # Handle agent mode responses (dict) vs regular streaming (str)
-                    if isinstance(chunk, dict):
-                        # Agent mode or structured response
-                        if "content" in chunk:
-                            content = chunk["content"]
-                        elif "error" in chunk and chunk.get("error", False):
-                            # Error from agent
-                            error_data = {
-                                "type": "error",
-                                "content": chunk.get("content", "Unknown error"),
-                                "chunk_id": chunk_id
-                            }
-                            yield f"data: {json.dumps(error_data)}\n\n"
-                            continue
-                        else:
-                            # Skip unknown dict structure
-                            continue
-                    else:
-                        # Regular streaming mode - content is already a string
-                        content = str(chunk)
-                    
-                    # Skip empty content
-                    if not content or content.strip() == "":
-                        continue
-                    
-                    # Fix broken SQL markdown blocks that might cause undefined
-                    # Pattern: ```sqlSELECT -> ```sql\nSELECT
-                    if "```sql" in content and not content.count("```sql") == content.count("```"):
-                        content = content.replace("```sql", "```sql\n").replace("\n\n", "\n")
-                    
-                    # Additional fix for SQL blocks without proper newlines
-                    if "```sql" in content:
-                        # Fix patterns like ```sqlSELECT or ```sqlINSERT 
-                        content = content.replace("```sqlSELECT", "```sql\nSELECT")
-                        content = content.replace("```sqlINSERT", "```sql\nINSERT") 
-                        content = content.replace("```sqlUPDATE", "```sql\nUPDATE")
-                        content = content.replace("```sqlDELETE", "```sql\nDELETE")
-                        content = content.replace("```sqlWITH", "```sql\nWITH")
-                        content = content.replace("```sqlCREATE", "```sql\nCREATE")
-                        content = content.replace("```sqlDROP", "```sql\nDROP")
-                        content = content.replace("```sqlALTER", "```sql\nALTER")
-                    
-                    # Handle special agent indicators (like 🤔, 🔧, 📋, ✅)
-                    if content.strip().startswith(('🤔', '🔧', '📋', '✅')):
-                        # Send as thinking or tool usage info
-                        data = {
-                            "type": "thinking",
-                            "content": content,
-                            "chunk_id": chunk_id
-                        }
-                        sent_data.append(data)
-                        yield f"data: {json.dumps(data)}\n\n"
-                        continue
-                    
-                    # Check if the content contains a stats JSON object at the end
-                    stats_index = content.find('{"type":"stats"')
-                    if stats_index != -1:
-                        # Extract the stats portion
-                        stats_part = content[stats_index:]
-                        # Keep only the content portion
-                        content = content[:stats_index]
-                        
-                        try:
-                            # Parse the stats JSON
-                            stats_data = json.loads(stats_part)
-                            # Add the chunk_id for consistency
-                            stats_data["chunk_id"] = chunk_id
-                            sent_data.append(stats_data)  # Store for later reference
-                            # Send the stats separately
-                            yield f"data: {json.dumps(stats_data)}\n\n"
-                        except json.JSONDecodeError:
-                            # If it's not valid JSON, just ignore
-                            pass
-                    
-                    # Add to buffer to check for stats that might be split across chunks
-                    content_buffer += content
-                    # Check if the buffer now contains stats
-                    stats_index = content_buffer.find('{"type":"stats"')
-                    if stats_index != -1:
-                        # Use regex to find the complete JSON object
-                        import re
-                        stats_match = re.search(r'(\{"type":"stats".*?\})', content_buffer[stats_index:])
-                        if stats_match:
-                            stats_str = stats_match.group(1)
-                            try:
-                                # Parse the stats JSON
-                                stats_data = json.loads(stats_str)
-                                # Add the chunk_id for consistency
-                                stats_data["chunk_id"] = chunk_id
-                                sent_data.append(stats_data)  # Store for later reference
-                                
-                                # Remove the stats from the buffer
-                                content_buffer = content_buffer[:stats_index] + content_buffer[stats_index + len(stats_str):]
-                                
-                                # Send the stats separately
-                                yield f"data: {json.dumps(stats_data)}\n\n"
-                                
-                                # Update content to be the cleaned buffer
-                                content = content_buffer
-                                # Clear buffer after processing
-                                content_buffer = ""
-                            except json.JSONDecodeError:
-                                # If it's not valid JSON, keep processing
-                                pass
-                    
-                    # Parse thinking tags
-                    if "<think>" in content and not in_think_tags:
-                        in_think_tags = True
-                        current_section = "thinking"
-                        # Send any content before <think> as answer
-                        before_think = content.split("<think>")[0]
-                        if before_think.strip():
-                            answer_content += before_think
-                            data = {
-                                "type": "answer",
-                                "content": before_think,
-                                "chunk_id": chunk_id
-                            }
-                            sent_data.append(data)
-                            yield f"data: {json.dumps(data)}\n\n"
-                        
-                        # Start thinking section
-                        thinking_part = content.split("<think>", 1)[1] if "<think>" in content else ""
-                        if "</think>" in thinking_part:
-                            # Complete thinking in one chunk
-                            think_content = thinking_part.split("</think>")[0]
-                            thinking_content += think_content
-                            data = {
-                                "type": "thinking",
-                                "content": think_content,
-                                "chunk_id": chunk_id
-                            }
-                            sent_data.append(data)
-                            yield f"data: {json.dumps(data)}\n\n"
-                            
-                            # Continue with answer after </think>
-                            after_think = thinking_part.split("</think>", 1)[1] if "</think>" in thinking_part else ""
-                            if after_think.strip():
-                                answer_content += after_think
-                                data = {
-                                    "type": "answer", 
-                                    "content": after_think,
-                                    "chunk_id": chunk_id
-                                }
-                                sent_data.append(data)
-                                yield f"data: {json.dumps(data)}\n\n"
-                            in_think_tags = False
-                            current_section = "answer"
-                        else:
-                            # Partial thinking content
-                            thinking_content += thinking_part
-                            data = {
-                                "type": "thinking",
-                                "content": thinking_part,
-                                "chunk_id": chunk_id
-                            }
-                            sent_data.append(data)
-                            yield f"data: {json.dumps(data)}\n\n"
-                    elif "</think>" in content and in_think_tags:
-                        # End of thinking section
-                        think_part = content.split("</think>")[0]
-                        thinking_content += think_part
-                        data = {
-                            "type": "thinking",
-                            "content": think_part,
-                            "chunk_id": chunk_id
-                        }
-                        sent_data.append(data)
-                        yield f"data: {json.dumps(data)}\n\n"
-                        
-                        # Continue with answer
-                        after_think = content.split("</think>", 1)[1] if "</think>" in content else ""
-                        if after_think.strip():
-                            answer_content += after_think
-                            data = {
-                                "type": "answer",
-                                "content": after_think,
-                                "chunk_id": chunk_id
-                            }
-                            sent_data.append(data)
-                            yield f"data: {json.dumps(data)}\n\n"
-                        in_think_tags = False
-                        current_section = "answer"
-                    elif in_think_tags:
-                        # Inside thinking section
-                        thinking_content += content
-                        data = {
-                            "type": "thinking",
-                            "content": content,
-                            "chunk_id": chunk_id
-                        }
-                        sent_data.append(data)
-                        yield f"data: {json.dumps(data)}\n\n"
-                    else:
-                        # Regular answer content
-                        answer_content += content
-                        data = {
-                            "type": "answer",
-                            "content": content,
-                            "chunk_id": chunk_id
-                        }
-                        sent_data.append(data)
-                        yield f"data: {json.dumps(data)}\n\n"
-                
-                # Send completion signal with any stats collected
-                inference_time = None
-                tokens_per_second = None
-                
-                # Check if we have any stats data to include with the "done" event
-                for chunk_data in reversed(sent_data):
-                    if chunk_data.get("type") == "stats":
-                        inference_time = chunk_data.get("inference_time")
-                        tokens_per_second = chunk_data.get("tokens_per_second")
-                        break
+                    for payload in track(parser.feed(chunk)):
+                        yield payload
+                # Text held back as a possible tag prefix
+                for payload in track(parser.close()):
+                    yield payload
                 
                 # Post-process: Execute SQL if agent provided code but didn't execute it
-                if request.use_agent and answer_content:
+                answer_content = "".join(answer_parts)
+                if collect_answer and answer_content:
                     try:
                         # Import the SQL tool for executing queries
                         from app.ai.lm_studio import _post_process_sql_execution
                         
-                        # Check if real results were already sent to avoid duplicates
-                        real_results_already_sent = any(
-                            data.get("is_real_result", False) for data in sent_data
-                        )
+                        # Get real SQL execution results
+                        real_sql_result = await _post_process_sql_execution(answer_content, streaming=True)
                         
-                        if not real_results_already_sent:
-                            # Get real SQL execution results
-                            real_sql_result = await _post_process_sql_execution(answer_content, streaming=True)
+                        if real_sql_result and real_sql_result.get("success", False):
+                            chunk_id += 1
+                            
+                            # Send the real execution result to frontend
+                            real_result_message = real_sql_result.get("message", "")
+                            if real_result_message:
+                                exec_data = {
+                                    "type": "answer",
+                                    "content": f"\n\n{real_result_message}\n",
+                                    "chunk_id": chunk_id,
+                                    "is_real_result": True
+                                }
+                                yield exec_data
                             
-                            if real_sql_result and real_sql_result.get("success", False):
-                                chunk_id += 1
-                                
-                                # Send the real execution result to frontend
-                                real_result_message = real_sql_result.get("message", "")
-                                if real_result_message:
-                                    exec_data = {
-                                        "type": "answer",
-                                        "content": f"\n\n{real_result_message}\n",
-                                        "chunk_id": chunk_id,
-                                        "is_real_result": True
-                                    }
-                                    sent_data.append(exec_data)
-                                    yield f"data: {json.dumps(exec_data)}\n\n"
-                                
-                                logger.info(f"Sent real SQL result to frontend: {real_sql_result.get('value', 'N/A')}")
-                            else:
-                                logger.warning("No real SQL results found to send to frontend")
+                            logger.info(f"Sent real SQL result to frontend: {real_sql_result.get('value', 'N/A')}")
                         else:
-                            logger.info("Real SQL results already sent, skipping duplicate")
+                            logger.warning("No real SQL results found to send to frontend")
                             
                     except Exception as e:
                         logger.warning(f"Error in SQL post-processing for API: {e}")
-                else:
-                    # Legacy post-processing code (commented out as we moved to function-based approach)
-                    pass
                 
+                # Send completion signal with any stats collected
                 data = {
                     "type": "done",
                     "content": "",
                     "chunk_id": chunk_id + 1,
-                    "inference_time": inference_time,
-                    "tokens_per_second": tokens_per_second
+                    "inference_time": stats.get("inference_time") if stats else None,
+                    "tokens_per_second": stats.get("tokens_per_second") if stats else None,
+                    "usage": {
+                        key: stats.get(key)
+                        for key in ("prompt_tokens", "completion_tokens", "total_tokens", "usage_source")
+                    } if stats else None
                 }
-                yield f"data: {json.dumps(data)}\n\n"
+                yield data
                 
             except Exception as e:
                 error_data = {
@@ -669,16 +809,14 @@ async def chat_with_ai_stream(
                     "content": str(e),
                     "chunk_id": -1
                 }
-                yield f"data: {json.dumps(error_data)}\n\n"
+                yield error_data
         
-        return StreamingResponse(
-            generate_stream(),
-            media_type="text/plain",
-            headers={
-                "Cache-Control": "no-cache",
-                "Connection": "keep-alive",
-                "Content-Type": "text/event-stream"
-            }
+        # The generation runs on its own so a dropped connection can resume it
+        stream = streams.start(current_user.user_id, generate_stream())
+        return EventSourceResponse(
+            stream.subscribe(),
+            stream_id=stream.stream_id,
+            headers={"X-Stream-Id": stream.stream_id}
         )
         
     except HTTPException:
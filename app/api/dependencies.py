@@ -1,8 +1,78 @@
+from typing import Any, Dict, List, Optional, Sequence
 from sqlalchemy.orm import Session
-from fastapi import Depends
-from ..database import get_db as get_db_func
+from fastapi import Depends, HTTPException, Query
+from .. import crud, models, schemas
+from ..database import (
+    get_db as get_db_func,
+    SessionLocal,
+    ReadSessionLocal,
+    DATABASE_REPLICA_URL,
+    ASYNC_DB_ENABLED,
+    db_dependency,
+    get_async_session_factory,
+    get_replica_router,
+)
+from .auth import get_current_active_user
 
 
 def get_db(db: Session = Depends(get_db_func)):
     """Dependency that provides a database session"""
-    return db 
\ No newline at end of file
+    return db
+
+
+def record_user_write(current_user: models.User = Depends(get_current_active_user)):
+    """Route dependency for writes: keeps the user's next reads on the primary"""
+    router = get_replica_router()
+    router.record_write(current_user.user_id)
+    yield
+    # Restart the window once the write has committed
+    router.record_write(current_user.user_id)
+
+
+def _get_routed_read_db(current_user: models.User = Depends(get_current_active_user)):
+    """Replica session, or a primary session right after the user's own write"""
+    use_primary = get_replica_router().use_primary(current_user.user_id)
+    db = (SessionLocal if use_primary else ReadSessionLocal)()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def _get_routed_async_read_db(current_user: models.User = Depends(get_current_active_user)):
+    """Async variant of _get_routed_read_db"""
+    use_primary = get_replica_router().use_primary(current_user.user_id)
+    async with get_async_session_factory(replica=not use_primary)() as db:
+        yield db
+
+
+# Session dependency for authenticated GET routes; plain db_dependency without a replica
+if DATABASE_REPLICA_URL:
+    routed_read_db = _get_routed_async_read_db if ASYNC_DB_ENABLED else _get_routed_read_db
+else:
+    routed_read_db = db_dependency
+
+
+def entry_includes(
+    include: Optional[str] = Query(None, description="Comma separated entry relations: tags, files, links, topic")
+) -> List[str]:
+    """Parse and validate the include= query parameter of entry listings"""
+    if not include:
+        return []
+    names = [name.strip() for name in include.split(",") if name.strip()]
+    unknown = [name for name in names if name not in crud.ENTRY_RELATIONS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown include: {', '.join(unknown)}")
+    return list(dict.fromkeys(names))
+
+
+def serialize_entries(entries: Sequence[models.Entry], include: Sequence[str]) -> List[Dict[str, Any]]:
+    """Entry payloads carrying only the requested relations, so nothing else is lazy loaded"""
+    fields = list(schemas.Entry.model_fields)
+    return [
+        {
+            **{field: getattr(entry, field) for field in fields},
+            **{name: getattr(entry, name) for name in include}
+        }
+        for entry in entries
+    ]
@@ -1,63 +1,175 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Response
+from datetime import date
+from typing import List, Optional, Union
 
-from .. import crud, schemas, models
-from ..database import get_db
+from .. import crud, crud_async, schemas, models
+from ..database import db_dependency
+from ..crud_async import AnySession
+from ..pagination import cursor_for, page_limit, set_next_cursor
+from ..ai import embeddings
+from ..ai.analysis_store import compute_content_hash
 from .auth import get_current_active_user
+from .dependencies import routed_read_db, record_user_write, entry_includes, serialize_entries
 
 router = APIRouter(tags=["entries"])
 
-@router.post("/", response_model=schemas.Entry)
-def create_entry(
+@router.post("/", response_model=schemas.Entry, dependencies=[Depends(record_user_write)])
+async def create_entry(
     entry: schemas.EntryCreate,
-    db: Session = Depends(get_db),
+    background_tasks: BackgroundTasks,
+    db: AnySession = Depends(db_dependency),
     current_user: models.User = Depends(get_current_active_user),
 ):
     # Ensure get_topic is called with topic_id and user_id
-    if not crud.get_topic(db, topic_id=entry.topic_id, user_id=current_user.user_id):
+    if not await crud_async.get_topic(db, topic_id=entry.topic_id, user_id=current_user.user_id):
         raise HTTPException(status_code=404, detail="Topic not found")
-    return crud.create_entry(db=db, entry=entry, user_id=current_user.user_id)
+    db_entry = await crud_async.create_entry(db=db, entry=entry, user_id=current_user.user_id)
+    embeddings.queue_entry_embeddings(background_tasks, [db_entry.entry_id])
+    return db_entry
 
-@router.get("/", response_model=List[schemas.Entry])
-def read_entries(
+@router.get("/", response_model=Union[List[schemas.EntryWithRelations], schemas.EntryPage], response_model_exclude_unset=True)
+async def read_entries(
+    response: Response,
     skip: int = 0, 
     limit: int = 100, 
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = None,
+    include: List[str] = Depends(entry_includes),
+    db: AnySession = Depends(routed_read_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
-    return crud.get_entries(db, current_user.user_id, skip, limit)
+    # Passing cursor (empty for the first page) switches to keyset pagination
+    if cursor is not None:
+        try:
+            entries, next_cursor = await crud_async.get_entries_page(db, current_user.user_id, cursor, page_limit(limit), include)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        set_next_cursor(response, next_cursor)
+        return {"items": serialize_entries(entries, include), "next_cursor": next_cursor}
+    
+    entries = await crud_async.get_entries(db, current_user.user_id, skip, limit, include)
+    if entries and len(entries) == limit:
+        set_next_cursor(response, cursor_for(entries[-1], crud.ENTRY_ORDER))
+    return serialize_entries(entries, include)
+
+# Declared before /{entry_id} so "search" is not parsed as an entry id
+@router.get("/search", response_model=schemas.EntrySearchPage)
+async def search_entries(
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=256),
+    topic_id: Optional[int] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    mood: Optional[str] = None,
+    tag: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = 20,
+    db: AnySession = Depends(routed_read_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """Full-text search over the user's entries, best matches first"""
+    try:
+        rows, next_cursor = await crud_async.search_entries(
+            db, current_user.user_id, q, cursor, page_limit(limit),
+            topic_id=topic_id, date_from=date_from, date_to=date_to, mood=mood, tag=tag
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    set_next_cursor(response, next_cursor)
+    entries = serialize_entries([row.Entry for row in rows], [])
+    items = [
+        {**entry, "rank": row.rank, "headline": row.headline}
+        for entry, row in zip(entries, rows)
+    ]
+    return {"items": items, "next_cursor": next_cursor}
+
+def _similar_payload(results) -> List[dict]:
+    entries = serialize_entries([entry for entry, _ in results], [])
+    return [{**entry, "similarity": similarity} for entry, (_, similarity) in zip(entries, results)]
+
+@router.get("/search/semantic", response_model=List[schemas.EntrySimilarResult])
+async def semantic_search_entries(
+    q: str = Query(..., min_length=1, max_length=1000),
+    limit: int = 10,
+    db: AnySession = Depends(routed_read_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """Entries closest in meaning to q, by embedding cosine similarity"""
+    try:
+        vector = await embeddings.embed_query(q)
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Embedding service unavailable: {e}")
+    results = await crud_async.find_similar_entries(
+        db, current_user.user_id, vector, embeddings.get_embedding_model(), page_limit(limit)
+    )
+    return _similar_payload(results)
+
+@router.get("/{entry_id}/similar", response_model=List[schemas.EntrySimilarResult])
+async def similar_entries(
+    entry_id: int,
+    background_tasks: BackgroundTasks,
+    limit: int = 10,
+    db: AnySession = Depends(routed_read_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """The user's other entries closest in meaning to this one"""
+    entry = await crud_async.get_entry(db, entry_id)
+    if entry is None or entry.user_id != current_user.user_id:
+        raise HTTPException(status_code=404, detail="Entry not found")
+
+    model = embeddings.get_embedding_model()
+    content_hash = compute_content_hash(entry.title, entry.content)
+    stored = await crud_async.get_entry_embedding(db, entry_id)
+    if stored is not None and stored.model == model and stored.content_hash == content_hash:
+        vector = [float(x) for x in stored.embedding]
+    else:
+        # Not embedded yet (or stale): embed now and store it once the response is sent
+        try:
+            vector = await embeddings.embed_query(embeddings.entry_embedding_text(entry.title, entry.content))
+        except Exception as e:
+            raise HTTPException(status_code=503, detail=f"Embedding service unavailable: {e}")
+        embeddings.queue_embedding_save(
+            background_tasks, [{"entry_id": entry_id, "content_hash": content_hash, "embedding": vector}]
+        )
+
+    results = await crud_async.find_similar_entries(
+        db, current_user.user_id, vector, model, page_limit(limit), exclude_entry_id=entry_id
+    )
+    return _similar_payload(results)
 
 @router.get("/{entry_id}", response_model=schemas.Entry)
-def read_entry(
+async def read_entry(
     entry_id: int,
-    db: Session = Depends(get_db),
+    db: AnySession = Depends(routed_read_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
-    entry = crud.get_entry(db, entry_id)
+    entry = await crud_async.get_entry(db, entry_id)
     if entry is None or entry.user_id != current_user.user_id:
         raise HTTPException(status_code=404, detail="Entry not found")
     return entry
 
-@router.put("/{entry_id}", response_model=schemas.Entry)
-def update_entry(
+@router.put("/{entry_id}", response_model=schemas.Entry, dependencies=[Depends(record_user_write)])
+async def update_entry(
     entry_id: int,
     entry_update: schemas.EntryUpdate,
-    db: Session = Depends(get_db),
+    background_tasks: BackgroundTasks,
+    db: AnySession = Depends(db_dependency),
     current_user: models.User = Depends(get_current_active_user)
 ):
-    entry = crud.get_entry(db, entry_id)
+    entry = await crud_async.get_entry(db, entry_id)
     if entry is None or entry.user_id != current_user.user_id:
         raise HTTPException(status_code=404, detail="Entry not found")
-    return crud.update_entry(db, entry_id, entry_update)
+    db_entry = await crud_async.update_entry(db, entry_id, entry_update)
+    # Skipped by the refresh when title and content are unchanged
+    embeddings.queue_entry_embeddings(background_tasks, [entry_id])
+    return db_entry
 
-@router.delete("/{entry_id}", response_model=schemas.Entry)
-def delete_entry(
+@router.delete("/{entry_id}", response_model=schemas.Entry, dependencies=[Depends(record_user_write)])
+async def delete_entry(
     entry_id: int,
-    db: Session = Depends(get_db),
+    db: AnySession = Depends(db_dependency),
     current_user: models.User = Depends(get_current_active_user)
 ):
-    entry = crud.get_entry(db, entry_id)
+    entry = await crud_async.get_entry(db, entry_id)
     if entry is None or entry.user_id != current_user.user_id:
         raise HTTPException(status_code=404, detail="Entry not found")
-    return crud.delete_entry(db, entry_id)
\ No newline at end of file
+    return await crud_async.delete_entry(db, entry_id)
\ No newline at end of file
@@ -1,16 +1,16 @@
 from fastapi import APIRouter, Depends, UploadFile, File, HTTPException
-from sqlalchemy.orm import Session
 from typing import List
 import os
 from uuid import uuid4
 
-from .. import crud, schemas
-from ..database import get_db
+from .. import crud_async, schemas
+from ..database import db_dependency
+from ..crud_async import AnySession
 
 router = APIRouter(prefix="/files", tags=["files"])
 
 @router.post("/{entry_id}", response_model=schemas.File)
-async def upload_file(entry_id: int, file: UploadFile = File(...), db: Session = Depends(get_db)):
+async def upload_file(entry_id: int, file: UploadFile = File(...), db: AnySession = Depends(db_dependency)):
     # Save file to disk
     uploads_dir = "uploads"
     os.makedirs(uploads_dir, exist_ok=True)
@@ -31,8 +31,8 @@ async def upload_file(entry_id: int, file: UploadFile = File(...), db: Session =
         file_type=file.content_type, 
         file_size=file_size
     )
-    return crud.create_file(db, file_schema, entry_id)
+    return await crud_async.create_file(db, file_schema, entry_id)
 
 @router.get("/{entry_id}", response_model=List[schemas.File])
-def read_files(entry_id: int, db: Session = Depends(get_db)):
-    return crud.get_files(db, entry_id) 
\ No newline at end of file
+async def read_files(entry_id: int, db: AnySession = Depends(db_dependency)):
+    return await crud_async.get_files(db, entry_id) 
\ No newline at end of file
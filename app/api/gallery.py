@@ -1,27 +1,36 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
-from sqlalchemy import select
+from fastapi import APIRouter, Depends, HTTPException, Response
+from typing import List, Optional, Union
 
-from .. import models, schemas
-from ..database import get_db
+from .. import crud, crud_async, models, schemas
+from ..crud_async import AnySession
+from ..pagination import cursor_for, page_limit, set_next_cursor
 from .auth import get_current_active_user
+from .dependencies import routed_read_db
 
 router = APIRouter(tags=["gallery"])
 
-@router.get("/user/files", response_model=List[schemas.File])
-def get_user_files(
-    db: Session = Depends(get_db),
+@router.get("/user/files", response_model=Union[List[schemas.File], schemas.FilePage])
+async def get_user_files(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    db: AnySession = Depends(routed_read_db),
     current_user: models.User = Depends(get_current_active_user),
 ):
     """
-    Lấy tất cả các file thuộc về user hiện tại (thông qua entries của họ).
+    Lấy các file thuộc về user hiện tại (thông qua entries của họ), mới nhất trước.
     """
-    # Query để lấy tất cả các file của user
-    query = (
-        select(models.File)
-        .join(models.Entry, models.File.entry_id == models.Entry.entry_id)
-        .where(models.Entry.user_id == current_user.user_id)
-    )
-    result = db.execute(query).scalars().all()
-    return result
+    # Passing cursor (empty for the first page) switches to keyset pagination
+    if cursor is not None:
+        try:
+            files, next_cursor = await crud_async.get_user_files_page(db, current_user.user_id, cursor, page_limit(limit))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        set_next_cursor(response, next_cursor)
+        return {"items": files, "next_cursor": next_cursor}
+    
+    files = await crud_async.get_user_files(db, current_user.user_id, skip, limit)
+    if files and len(files) == limit:
+        set_next_cursor(response, cursor_for(files[-1], crud.FILE_ORDER))
+    return files
@@ -0,0 +1,194 @@
+"""
+Server-sent events response for chat streams.
+
+Endpoints yield payload dicts, or (seq, payload) pairs from a resumable
+stream; EventSourceResponse encodes them with orjson straight to bytes.
+Consecutive answer/thinking payloads arriving within SSE_BATCH_WINDOW_MS
+are merged into one frame, every frame carries an SSE id, the stream opens
+with a retry hint, and a comment line is sent when nothing went out for
+SSE_HEARTBEAT_SECONDS (e.g. during long tool calls) so proxies keep the
+connection open. The response stops as soon as the client disconnects, which
+closes the event source and, through it, the upstream generation.
+"""
+import asyncio
+import os
+from functools import partial
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import anyio
+import orjson
+from fastapi.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+# Tokens arriving within this window share a frame; 0 sends every payload on its own
+SSE_BATCH_WINDOW_MS = float(os.getenv("SSE_BATCH_WINDOW_MS", "15"))
+# Idle time before a keep-alive comment is sent; 0 disables heartbeats
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+# Reconnect delay suggested to EventSource clients
+SSE_RETRY_MS = int(os.getenv("SSE_RETRY_MS", "3000"))
+
+HEARTBEAT_FRAME = b": keep-alive\n\n"
+BATCHABLE_TYPES = ("answer", "thinking")
+# Payloads with any other field (e.g. is_real_result) are sent as they are
+_BATCHABLE_KEYS = frozenset(("type", "content", "chunk_id"))
+
+_END = object()
+_HEARTBEAT = object()
+
+
+class _Flush:
+    """Timer marker closing the batch it was scheduled for"""
+    __slots__ = ("batch_id",)
+
+    def __init__(self, batch_id: int):
+        self.batch_id = batch_id
+
+
+def encode_event(payload: Dict[str, Any], event_id: Optional[str] = None) -> bytes:
+    """One SSE frame for a payload"""
+    data = b"data: " + orjson.dumps(payload) + b"\n\n"
+    if event_id is None:
+        return data
+    return b"id: " + event_id.encode() + b"\n" + data
+
+
+def _batchable(payload: Dict[str, Any]) -> bool:
+    return payload.get("type") in BATCHABLE_TYPES and payload.keys() <= _BATCHABLE_KEYS
+
+
+def _merge(batch: List[Dict[str, Any]]) -> Dict[str, Any]:
+    if len(batch) == 1:
+        return batch[0]
+    merged = dict(batch[-1])
+    merged["content"] = "".join(payload["content"] for payload in batch)
+    return merged
+
+
+class EventSourceResponse(StreamingResponse):
+    """Streaming response of SSE frames built from an async iterator of payload dicts"""
+
+    def __init__(
+        self,
+        events: AsyncIterator[Dict[str, Any]],
+        batch_window_ms: Optional[float] = None,
+        heartbeat_seconds: Optional[float] = None,
+        retry_ms: Optional[int] = None,
+        headers: Optional[Dict[str, str]] = None,
+        stream_id: Optional[str] = None
+    ):
+        # With a stream_id, events are (seq, payload) pairs and frame ids are "{stream_id}:{seq}"
+        self.stream_id = stream_id
+        self.batch_window = (SSE_BATCH_WINDOW_MS if batch_window_ms is None else batch_window_ms) / 1000
+        self.heartbeat_seconds = SSE_HEARTBEAT_SECONDS if heartbeat_seconds is None else heartbeat_seconds
+        self.retry_ms = SSE_RETRY_MS if retry_ms is None else retry_ms
+        super().__init__(
+            self._frames(events),
+            media_type="text/event-stream",
+            headers={
+                "Cache-Control": "no-cache",
+                "Connection": "keep-alive",
+                "X-Accel-Buffering": "no",  # Keep nginx from buffering the stream
+                **(headers or {})
+            }
+        )
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        # Starlette only notices a disconnect on ASGI 2.4 servers when a write
+        # fails, which can take a heartbeat interval while the model is quiet;
+        # listening for http.disconnect stops the stream right away
+        async with anyio.create_task_group() as task_group:
+            async def run_then_stop(func) -> None:
+                await func()
+                task_group.cancel_scope.cancel()
+
+            task_group.start_soon(run_then_stop, partial(self.stream_response, send))
+            await run_then_stop(partial(self.listen_for_disconnect, receive))
+
+        if self.background is not None:
+            await self.background()
+
+    async def _frames(self, events: AsyncIterator[Any]):
+        # A pump task moves payloads to a queue that timers also post to, so
+        # waiting for the next token never needs a per-token timeout task
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        failure: List[BaseException] = []
+
+        async def pump():
+            try:
+                if self.stream_id is not None:
+                    async for item in events:
+                        queue.put_nowait(item)
+                else:
+                    seq = 0
+                    async for payload in events:
+                        seq += 1
+                        queue.put_nowait((seq, payload))
+            except Exception as e:
+                failure.append(e)
+            finally:
+                queue.put_nowait(_END)
+
+        def schedule_heartbeat():
+            if self.heartbeat_seconds > 0:
+                return loop.call_later(self.heartbeat_seconds, queue.put_nowait, _HEARTBEAT)
+            return None
+
+        id_prefix = f"{self.stream_id}:" if self.stream_id is not None else ""
+
+        def frame(seq: int, payload: Dict[str, Any]) -> bytes:
+            return encode_event(payload, f"{id_prefix}{seq}")
+
+        batch: List[Dict[str, Any]] = []
+        batch_seq = 0
+        batch_id = 0
+        flush_timer = None
+        idle = True
+        heartbeat = schedule_heartbeat()
+        pump_task = loop.create_task(pump())
+        try:
+            yield b"retry: %d\n\n" % self.retry_ms
+            while True:
+                item = await queue.get()
+                if item is _END:
+                    break
+                if item is _HEARTBEAT:
+                    if idle:
+                        yield HEARTBEAT_FRAME
+                    idle = True
+                    heartbeat = schedule_heartbeat()
+                    continue
+                if type(item) is _Flush:
+                    if item.batch_id == batch_id and batch:
+                        yield frame(batch_seq, _merge(batch))
+                        batch = []
+                    continue
+
+                idle = False
+                seq, payload = item
+                mergeable = self.batch_window > 0 and _batchable(payload)
+                if batch and not (mergeable and payload["type"] == batch[0]["type"]):
+                    yield frame(batch_seq, _merge(batch))
+                    batch = []
+                if not mergeable:
+                    yield frame(seq, payload)
+                    continue
+                if not batch:
+                    batch_id += 1
+                    flush_timer = loop.call_later(self.batch_window, queue.put_nowait, _Flush(batch_id))
+                batch.append(payload)
+                # A merged frame's id is its last payload's, so a resume replays only what follows
+                batch_seq = seq
+
+            if batch:
+                yield frame(batch_seq, _merge(batch))
+            if failure:
+                raise failure[0]
+        finally:
+            for timer in (heartbeat, flush_timer):
+                if timer is not None:
+                    timer.cancel()
+            if not pump_task.done():
+                # Closing the response stops the upstream generator too
+                pump_task.cancel()
+                await asyncio.wait({pump_task})
@@ -1,20 +1,23 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException
 from typing import List
 
-from .. import crud, schemas
-from ..database import get_db
+from .. import crud_async, schemas
+from ..database import db_dependency
+from ..crud_async import AnySession
 
 router = APIRouter(prefix="/tags", tags=["tags"])
 
 @router.post("/", response_model=schemas.Tag)
-def create_tag(tag: schemas.TagCreate, db: Session = Depends(get_db)):
-    return crud.create_tag(db, tag)
+async def create_tag(tag: schemas.TagCreate, db: AnySession = Depends(db_dependency)):
+    return await crud_async.create_tag(db, tag)
 
 @router.get("/", response_model=List[schemas.Tag])
-def read_tags(db: Session = Depends(get_db)):
-    return crud.get_tags(db)
+async def read_tags(db: AnySession = Depends(db_dependency)):
+    return await crud_async.get_tags(db)
 
 @router.post("/{entry_id}/{tag_id}", response_model=schemas.Entry)
-def add_tag(entry_id: int, tag_id: int, db: Session = Depends(get_db)):
-    return crud.add_tag_to_entry(db, entry_id, tag_id) 
\ No newline at end of file
+async def add_tag(entry_id: int, tag_id: int, db: AnySession = Depends(db_dependency)):
+    entry = await crud_async.add_tag_to_entry(db, entry_id, tag_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Entry or tag not found")
+    return entry
@@ -1,11 +1,13 @@
 from fastapi import APIRouter, Depends, HTTPException, Request, Response
-from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional, Union
 import logging
 
-from .. import crud, schemas, models
-from ..database import get_db
+from .. import crud, crud_async, schemas, models
+from ..database import db_dependency, read_db_dependency
+from ..crud_async import AnySession
+from ..pagination import cursor_for, page_limit, set_next_cursor
 from .auth import get_current_active_user
+from .dependencies import routed_read_db, record_user_write, entry_includes, serialize_entries
 
 # Set up logger
 logger = logging.getLogger(__name__)
@@ -25,79 +27,111 @@ async def options_handler(request: Request):
     response.headers["Access-Control-Max-Age"] = "86400"
     return response
 
-@router.post("/", response_model=schemas.Topic)
-def create_topic(
+@router.post("/", response_model=schemas.Topic, dependencies=[Depends(record_user_write)])
+async def create_topic(
     topic: schemas.TopicCreate, 
-    db: Session = Depends(get_db),
+    db: AnySession = Depends(db_dependency),
     current_user: models.User = Depends(get_current_active_user)
 ):
-    return crud.create_topic(db, topic, current_user.user_id)
+    return await crud_async.create_topic(db, topic, current_user.user_id)
 
-@router.get("/", response_model=List[schemas.Topic])
-def read_topics(
+@router.get("/", response_model=Union[List[schemas.Topic], schemas.TopicPage])
+async def read_topics(
+    response: Response,
     skip: int = 0, 
     limit: int = 100, 
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = None,
+    db: AnySession = Depends(routed_read_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
     logger.debug(f"Fetching topics for user: {current_user.username}")
-    return crud.get_topics(db, current_user.user_id, skip, limit)
+    # Passing cursor (empty for the first page) switches to keyset pagination
+    if cursor is not None:
+        try:
+            topics, next_cursor = await crud_async.get_topics_page(db, current_user.user_id, cursor, page_limit(limit))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        set_next_cursor(response, next_cursor)
+        return {"items": topics, "next_cursor": next_cursor}
+    
+    topics = await crud_async.get_topics(db, current_user.user_id, skip, limit)
+    if topics and len(topics) == limit:
+        set_next_cursor(response, cursor_for(topics[-1], crud.TOPIC_ORDER))
+    return topics
 
 @router.get("/public", response_model=List[schemas.Topic])
-def read_public_topics(
+async def read_public_topics(
     skip: int = 0, 
     limit: int = 100, 
-    db: Session = Depends(get_db)
+    db: AnySession = Depends(read_db_dependency)
 ):
     """Get a list of public topics (no authentication required)"""
     logger.debug("Fetching public topics")
     # This is for testing only - in a real app, you'd have a concept of public topics
     # For now we just return all topics from a test user (user_id=1)
-    return crud.get_topics(db, user_id=1, skip=skip, limit=limit)
+    return await crud_async.get_topics(db, user_id=1, skip=skip, limit=limit)
 
 @router.get("/{topic_id}", response_model=schemas.Topic)
-def read_topic(
+async def read_topic(
     topic_id: int,
-    db: Session = Depends(get_db),
+    db: AnySession = Depends(routed_read_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
-    topic = crud.get_topic(db, topic_id, current_user.user_id)
+    topic = await crud_async.get_topic(db, topic_id, current_user.user_id)
     if topic is None:
         raise HTTPException(status_code=404, detail="Topic not found")
     return topic
 
-@router.put("/{topic_id}", response_model=schemas.Topic)
-def update_topic(
+@router.put("/{topic_id}", response_model=schemas.Topic, dependencies=[Depends(record_user_write)])
+async def update_topic(
     topic_id: int,
     topic_update: schemas.TopicUpdate,
-    db: Session = Depends(get_db),
+    db: AnySession = Depends(db_dependency),
     current_user: models.User = Depends(get_current_active_user)
 ):
-    topic = crud.get_topic(db, topic_id, current_user.user_id)
+    topic = await crud_async.get_topic(db, topic_id, current_user.user_id)
     if topic is None:
         raise HTTPException(status_code=404, detail="Topic not found")
-    return crud.update_topic(db, topic_id, topic_update)
+    return await crud_async.update_topic(db, topic_id, topic_update)
 
-@router.delete("/{topic_id}", response_model=schemas.Topic)
-def delete_topic(
+@router.delete("/{topic_id}", response_model=schemas.Topic, dependencies=[Depends(record_user_write)])
+async def delete_topic(
     topic_id: int,
-    db: Session = Depends(get_db),
+    db: AnySession = Depends(db_dependency),
     current_user: models.User = Depends(get_current_active_user)
 ):
-    topic = crud.get_topic(db, topic_id, current_user.user_id)
+    topic = await crud_async.get_topic(db, topic_id, current_user.user_id)
     if topic is None:
         raise HTTPException(status_code=404, detail="Topic not found")
-    return crud.delete_topic(db, topic_id)
+    return await crud_async.delete_topic(db, topic_id)
 
-@router.get("/{topic_id}/entries", response_model=List[schemas.Entry])
-def read_topic_entries(
+@router.get("/{topic_id}/entries", response_model=Union[List[schemas.EntryWithRelations], schemas.EntryPage], response_model_exclude_unset=True)
+async def read_topic_entries(
     topic_id: int,
+    response: Response,
     skip: int = 0, 
     limit: int = 100,
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = None,
+    include: List[str] = Depends(entry_includes),
+    db: AnySession = Depends(routed_read_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
-    topic = crud.get_topic(db, topic_id, current_user.user_id)
+    topic = await crud_async.get_topic(db, topic_id, current_user.user_id)
     if topic is None:
         raise HTTPException(status_code=404, detail="Topic not found")
-    return crud.get_entries_by_topic(db, topic_id, current_user.user_id, skip, limit)
\ No newline at end of file
+    
+    # Passing cursor (empty for the first page) switches to keyset pagination
+    if cursor is not None:
+        try:
+            entries, next_cursor = await crud_async.get_entries_by_topic_page(
+                db, topic_id, current_user.user_id, cursor, page_limit(limit), include
+            )
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        set_next_cursor(response, next_cursor)
+        return {"items": serialize_entries(entries, include), "next_cursor": next_cursor}
+    
+    entries = await crud_async.get_entries_by_topic(db, topic_id, current_user.user_id, skip, limit, include)
+    if entries and len(entries) == limit:
+        set_next_cursor(response, cursor_for(entries[-1], crud.ENTRY_ORDER))
+    return serialize_entries(entries, include)
\ No newline at end of file
@@ -1,6 +1,12 @@
-from sqlalchemy.orm import Session
+import math
+from sqlalchemy import Double, Float, String, and_, cast, func, literal, literal_column, or_, select, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, selectinload
 from passlib.context import CryptContext
+from typing import Any, List, Optional, Sequence, Tuple
 from . import models, schemas
+from .pagination import keyset_paginate, keyset_query, encode_cursor
+from datetime import date, datetime
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -29,9 +35,32 @@ def create_user(db: Session, user: schemas.UserCreate):
     db.refresh(db_user)
     return db_user
 
+# Keyset sort orders; listings and cursors must agree on them
+TOPIC_ORDER: Tuple[Any, ...] = (models.Topic.created_at, models.Topic.topic_id)
+ENTRY_ORDER: Tuple[Any, ...] = (models.Entry.entry_date, models.Entry.entry_id)
+FILE_ORDER: Tuple[Any, ...] = (models.File.uploaded_at, models.File.file_id)
+
+# Entry relationships that listings can eager load on request
+ENTRY_RELATIONS = {
+    "topic": models.Entry.topic,
+    "tags": models.Entry.tags,
+    "files": models.Entry.files,
+    "links": models.Entry.links,
+}
+
+def entry_load_options(include: Sequence[str] = ()):
+    """selectinload options for the requested entry relations (one query per relation)"""
+    return [selectinload(ENTRY_RELATIONS[name]) for name in include]
+
 # Topic CRUD
 def get_topics(db: Session, user_id: int, skip: int = 0, limit: int = 100):
-    return db.query(models.Topic).filter(models.Topic.user_id == user_id).offset(skip).limit(limit).all()
+    return db.query(models.Topic).filter(models.Topic.user_id == user_id).order_by(
+        *[column.asc() for column in TOPIC_ORDER]
+    ).offset(skip).limit(limit).all()
+
+def get_topics_page(db: Session, user_id: int, cursor: Optional[str] = None, limit: int = 100):
+    query = db.query(models.Topic).filter(models.Topic.user_id == user_id)
+    return keyset_paginate(query, TOPIC_ORDER, cursor, limit, descending=False)
 
 def create_topic(db: Session, topic: schemas.TopicCreate, user_id: int):
     db_topic = models.Topic(**topic.dict(), user_id=user_id)
@@ -67,21 +96,33 @@ def delete_topic(db: Session, topic_id: int):
     return db_topic
 
 # Entry CRUD
-def get_entries(db: Session, user_id: int, skip: int = 0, limit: int = 100):
-    return db.query(models.Entry).filter(models.Entry.user_id == user_id).offset(skip).limit(limit).all()
+def get_entries(db: Session, user_id: int, skip: int = 0, limit: int = 100, include: Sequence[str] = ()):
+    return db.query(models.Entry).options(*entry_load_options(include)).filter(
+        models.Entry.user_id == user_id
+    ).order_by(*[column.desc() for column in ENTRY_ORDER]).offset(skip).limit(limit).all()
+
+def get_entries_page(db: Session, user_id: int, cursor: Optional[str] = None, limit: int = 100, include: Sequence[str] = ()):
+    query = db.query(models.Entry).options(*entry_load_options(include)).filter(models.Entry.user_id == user_id)
+    return keyset_paginate(query, ENTRY_ORDER, cursor, limit)
 
-def get_entries_by_topic(db: Session, topic_id: int, user_id: int, skip: int = 0, limit: int = 100):
-    return db.query(models.Entry).filter(
+def get_entries_by_topic(db: Session, topic_id: int, user_id: int, skip: int = 0, limit: int = 100, include: Sequence[str] = ()):
+    return db.query(models.Entry).options(*entry_load_options(include)).filter(
         models.Entry.topic_id == topic_id,
         models.Entry.user_id == user_id
-    ).order_by(models.Entry.entry_date.desc()).offset(skip).limit(limit).all()
+    ).order_by(*[column.desc() for column in ENTRY_ORDER]).offset(skip).limit(limit).all()
 
-def create_entry(db: Session, entry: schemas.EntryCreate, user_id: int):
-    from datetime import datetime
+def get_entries_by_topic_page(db: Session, topic_id: int, user_id: int, cursor: Optional[str] = None, limit: int = 100, include: Sequence[str] = ()):
+    query = db.query(models.Entry).options(*entry_load_options(include)).filter(
+        models.Entry.topic_id == topic_id,
+        models.Entry.user_id == user_id
+    )
+    return keyset_paginate(query, ENTRY_ORDER, cursor, limit)
+
+def build_entry(entry: schemas.EntryCreate, user_id: int) -> models.Entry:
     # Convert string date to date object
     entry_date = datetime.strptime(entry.entry_date, "%Y-%m-%d").date()
     
-    db_entry = models.Entry(
+    return models.Entry(
         user_id=user_id,
         topic_id=entry.topic_id,
         title=entry.title,
@@ -92,6 +133,9 @@ def create_entry(db: Session, entry: schemas.EntryCreate, user_id: int):
         weather=entry.weather,
         is_public=entry.is_public,
     )
+
+def create_entry(db: Session, entry: schemas.EntryCreate, user_id: int):
+    db_entry = build_entry(entry, user_id)
     db.add(db_entry)
     db.commit()
     db.refresh(db_entry)
@@ -114,10 +158,228 @@ def delete_entry(db: Session, entry_id: int):
     db.commit()
     return db_entry
 
+# Entry search
+SEARCH_HEADLINE_OPTIONS = "StartSel=<mark>, StopSel=</mark>, MaxWords=35, MinWords=15, MaxFragments=2"
+
+def build_entry_search(
+    dialect: str,
+    user_id: int,
+    q: str,
+    topic_id: Optional[int] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    mood: Optional[str] = None,
+    tag: Optional[str] = None
+):
+    """Select (Entry, rank, headline) rows matching q and the filters, plus the keyset order"""
+    if dialect == "postgresql":
+        config = literal_column(f"'{models.ENTRY_SEARCH_CONFIG}'::regconfig")
+        query = func.websearch_to_tsquery(config, q)
+        search_vector = literal_column("entries.search_vector")
+        match = search_vector.op("@@")(query)
+        # ts_rank returns real; widen it so cursor values round-trip exactly
+        rank = cast(func.ts_rank(search_vector, query), Double)
+        headline = func.ts_headline(
+            config, func.coalesce(models.Entry.content, models.Entry.title), query, SEARCH_HEADLINE_OPTIONS
+        )
+    else:
+        # No tsvector outside Postgres: plain substring match, newest entries first
+        pattern = "%" + q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        match = or_(
+            models.Entry.title.ilike(pattern, escape="\\"),
+            models.Entry.content.ilike(pattern, escape="\\")
+        )
+        rank = literal(0.0, Float)
+        headline = literal(None, String)
+
+    conditions = [models.Entry.user_id == user_id, match]
+    if topic_id is not None:
+        conditions.append(models.Entry.topic_id == topic_id)
+    if date_from is not None:
+        conditions.append(models.Entry.entry_date >= date_from)
+    if date_to is not None:
+        conditions.append(models.Entry.entry_date <= date_to)
+    if mood:
+        conditions.append(models.Entry.mood == mood)
+    if tag:
+        conditions.append(models.Entry.tags.any(models.Tag.tag_name == tag))
+
+    rank = rank.label("rank")
+    stmt = select(models.Entry, rank, headline.label("headline")).where(and_(*conditions))
+    return stmt, (rank, models.Entry.entry_id)
+
+def split_search_page(rows: Sequence[Any], limit: int) -> Tuple[List[Any], Optional[str]]:
+    rows = list(rows)
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = encode_cursor([last.rank, last.Entry.entry_id])
+    return rows[:limit], next_cursor
+
+def search_entries(db: Session, user_id: int, q: str, cursor: Optional[str] = None, limit: int = 20, **filters):
+    stmt, order = build_entry_search(db.bind.dialect.name, user_id, q, **filters)
+    rows = db.execute(keyset_query(stmt, order, cursor, limit)).all()
+    return split_search_page(rows, limit)
+
+# Entry embedding CRUD
+def get_entry_embedding(db: Session, entry_id: int):
+    return db.get(models.EntryEmbedding, entry_id)
+
+def save_entry_embeddings(db: Session, rows: Sequence[dict]):
+    """Insert or replace embeddings given as dicts of EntryEmbedding columns"""
+    for row in rows:
+        db.merge(models.EntryEmbedding(**row))
+    try:
+        db.commit()
+    except IntegrityError:
+        # A concurrent refresh inserted one of the rows first; the second merge updates it
+        db.rollback()
+        for row in rows:
+            db.merge(models.EntryEmbedding(**row))
+        db.commit()
+
+def build_similar_entries(
+    dialect: str,
+    user_id: int,
+    embedding: Sequence[float],
+    model: str,
+    limit: int,
+    exclude_entry_id: Optional[int] = None
+):
+    """Select the user's entries nearest to embedding; see similar_entry_results"""
+    conditions = [models.Entry.user_id == user_id, models.EntryEmbedding.model == model]
+    if exclude_entry_id is not None:
+        conditions.append(models.Entry.entry_id != exclude_entry_id)
+    if dialect == "postgresql":
+        # ORDER BY distance LIMIT n is what the HNSW index serves
+        distance = models.EntryEmbedding.embedding.cosine_distance(embedding)
+        columns = (models.Entry, (1 - distance).label("similarity"))
+        order = (distance,)
+    else:
+        # No vector operators outside Postgres: candidates are ranked in Python
+        columns = (models.Entry, models.EntryEmbedding.embedding)
+        order = ()
+    stmt = select(*columns).join(
+        models.EntryEmbedding, models.EntryEmbedding.entry_id == models.Entry.entry_id
+    ).where(and_(*conditions))
+    return stmt.order_by(*order).limit(limit) if order else stmt
+
+def _cosine_similarity(a: Sequence[float], b: Sequence[float]) -> float:
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return sum(x * y for x, y in zip(a, b)) / norm if norm else 0.0
+
+def similar_entry_results(dialect: str, rows: Sequence[Any], embedding: Sequence[float], limit: int) -> List[Tuple[Any, float]]:
+    """(entry, similarity) pairs, most similar first"""
+    if dialect == "postgresql":
+        return [(row.Entry, float(row.similarity)) for row in rows]
+    scored = [(row.Entry, _cosine_similarity(embedding, [float(x) for x in row.embedding])) for row in rows]
+    scored.sort(key=lambda pair: (-pair[1], pair[0].entry_id))
+    return scored[:limit]
+
+def similar_entries_setup(dialect: str, limit: int) -> Optional[Any]:
+    """Per-transaction HNSW setting that lets the index return `limit` rows after filtering"""
+    if dialect != "postgresql":
+        return None
+    ef_search = min(max(models.ENTRY_EMBEDDING_EF_SEARCH, limit), 1000)
+    return text(f"SET LOCAL hnsw.ef_search = {ef_search}")
+
+def find_similar_entries(
+    db: Session,
+    user_id: int,
+    embedding: Sequence[float],
+    model: str,
+    limit: int = 10,
+    exclude_entry_id: Optional[int] = None
+):
+    if not any(embedding):
+        return []
+    dialect = db.bind.dialect.name
+    setup = similar_entries_setup(dialect, limit)
+    if setup is not None:
+        db.execute(setup)
+    rows = db.execute(build_similar_entries(dialect, user_id, embedding, model, limit, exclude_entry_id)).all()
+    return similar_entry_results(dialect, rows, embedding, limit)
+
+# Entry analysis CRUD
+def get_entry_analysis(db: Session, entry_id: int, analysis_type: str):
+    return db.query(models.EntryAnalysis).filter(
+        models.EntryAnalysis.entry_id == entry_id,
+        models.EntryAnalysis.analysis_type == analysis_type
+    ).first()
+
+def upsert_entry_analysis(db: Session, entry_id: int, analysis_type: str, **values):
+    db_analysis = get_entry_analysis(db, entry_id, analysis_type)
+    if db_analysis is None:
+        db_analysis = models.EntryAnalysis(entry_id=entry_id, analysis_type=analysis_type)
+        db.add(db_analysis)
+    for key, value in values.items():
+        setattr(db_analysis, key, value)
+    try:
+        db.commit()
+    except IntegrityError:
+        # A concurrent request stored the same (entry_id, analysis_type) first
+        db.rollback()
+        db_analysis = get_entry_analysis(db, entry_id, analysis_type)
+        for key, value in values.items():
+            setattr(db_analysis, key, value)
+        db.commit()
+    db.refresh(db_analysis)
+    return db_analysis
+
+# Analysis job CRUD
+def create_analysis_job(db: Session, user_id: int, entry_ids, analysis_types, model=None, force: bool = False):
+    db_job = models.AnalysisJob(
+        user_id=user_id,
+        status="pending",
+        model=model,
+        force=force,
+        total_items=len(entry_ids) * len(analysis_types)
+    )
+    db_job.items = [
+        models.AnalysisJobItem(entry_id=entry_id, analysis_type=analysis_type, status="pending")
+        for entry_id in entry_ids
+        for analysis_type in analysis_types
+    ]
+    db.add(db_job)
+    db.commit()
+    db.refresh(db_job)
+    return db_job
+
+def get_analysis_job(db: Session, job_id: int, user_id: int):
+    return db.query(models.AnalysisJob).filter(
+        models.AnalysisJob.job_id == job_id,
+        models.AnalysisJob.user_id == user_id
+    ).first()
+
+def cancel_analysis_job(db: Session, db_job: models.AnalysisJob):
+    # Items already running finish; everything still queued is dropped
+    db.query(models.AnalysisJobItem).filter(
+        models.AnalysisJobItem.job_id == db_job.job_id,
+        models.AnalysisJobItem.status == "pending"
+    ).update({"status": "cancelled"}, synchronize_session=False)
+    db_job.status = "cancelled"
+    db_job.finished_at = datetime.utcnow()
+    db.commit()
+    db.refresh(db_job)
+    return db_job
+
 # File CRUD
 def get_files(db: Session, entry_id: int):
     return db.query(models.File).filter(models.File.entry_id == entry_id).all()
 
+def _user_files_query(db: Session, user_id: int):
+    return db.query(models.File).join(
+        models.Entry, models.File.entry_id == models.Entry.entry_id
+    ).filter(models.Entry.user_id == user_id)
+
+def get_user_files(db: Session, user_id: int, skip: int = 0, limit: int = 100):
+    return _user_files_query(db, user_id).order_by(
+        *[column.desc() for column in FILE_ORDER]
+    ).offset(skip).limit(limit).all()
+
+def get_user_files_page(db: Session, user_id: int, cursor: Optional[str] = None, limit: int = 100):
+    return keyset_paginate(_user_files_query(db, user_id), FILE_ORDER, cursor, limit)
+
 def create_file(db: Session, file: schemas.FileCreate, entry_id: int):
     db_file = models.File(**file.dict(), entry_id=entry_id)
     db.add(db_file)
@@ -148,8 +410,12 @@ def create_tag(db: Session, tag: schemas.TagCreate):
     return db_tag
 
 def add_tag_to_entry(db: Session, entry_id: int, tag_id: int):
-    entry = db.query(models.Entry).filter(models.Entry.entry_id == entry_id).first()
+    entry = db.query(models.Entry).options(selectinload(models.Entry.tags)).filter(
+        models.Entry.entry_id == entry_id
+    ).first()
     tag = db.query(models.Tag).filter(models.Tag.tag_id == tag_id).first()
+    if entry is None or tag is None:
+        return None
     if tag not in entry.tags:
         entry.tags.append(tag)
         db.commit()
@@ -0,0 +1,218 @@
+"""
+Async counterparts of the crud.py functions used by the REST routers.
+
+Every function accepts either an AsyncSession or a sync Session: with a sync
+Session the matching crud.py function runs in the threadpool, so the routers
+work unchanged whichever session ASYNC_DB_ENABLED selects.
+"""
+
+import functools
+from typing import Optional, Sequence, Union
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
+
+from . import crud, models, schemas
+from .crud import TOPIC_ORDER, ENTRY_ORDER, FILE_ORDER, entry_load_options
+from .pagination import keyset_query, split_page
+
+AnySession = Union[AsyncSession, Session]
+
+
+def _sync_fallback(sync_func):
+    """Run `sync_func` in the threadpool when called with a sync Session"""
+    def decorator(async_func):
+        @functools.wraps(async_func)
+        async def wrapper(db: AnySession, *args, **kwargs):
+            if isinstance(db, Session):
+                return await run_in_threadpool(sync_func, db, *args, **kwargs)
+            return await async_func(db, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+async def _save(db: AsyncSession, instance):
+    db.add(instance)
+    await db.commit()
+    await db.refresh(instance)
+    return instance
+
+
+async def _page(db: AsyncSession, stmt, columns, cursor: Optional[str], limit: int, descending: bool = True):
+    rows = (await db.scalars(keyset_query(stmt, columns, cursor, limit, descending))).all()
+    return split_page(rows, columns, limit)
+
+
+# Topic CRUD
+@_sync_fallback(crud.get_topics)
+async def get_topics(db: AsyncSession, user_id: int, skip: int = 0, limit: int = 100):
+    stmt = select(models.Topic).filter(models.Topic.user_id == user_id).order_by(
+        *[column.asc() for column in TOPIC_ORDER]
+    ).offset(skip).limit(limit)
+    return (await db.scalars(stmt)).all()
+
+@_sync_fallback(crud.get_topics_page)
+async def get_topics_page(db: AsyncSession, user_id: int, cursor: Optional[str] = None, limit: int = 100):
+    stmt = select(models.Topic).filter(models.Topic.user_id == user_id)
+    return await _page(db, stmt, TOPIC_ORDER, cursor, limit, descending=False)
+
+@_sync_fallback(crud.create_topic)
+async def create_topic(db: AsyncSession, topic: schemas.TopicCreate, user_id: int):
+    return await _save(db, models.Topic(**topic.dict(), user_id=user_id))
+
+@_sync_fallback(crud.get_topic)
+async def get_topic(db: AsyncSession, topic_id: int, user_id: int):
+    return await db.scalar(select(models.Topic).filter(
+        models.Topic.topic_id == topic_id,
+        models.Topic.user_id == user_id
+    ))
+
+@_sync_fallback(crud.update_topic)
+async def update_topic(db: AsyncSession, topic_id: int, topic: schemas.TopicUpdate):
+    db_topic = await db.get(models.Topic, topic_id)
+    if db_topic:
+        for key, value in topic.dict(exclude_unset=True).items():
+            setattr(db_topic, key, value)
+        await db.commit()
+        await db.refresh(db_topic)
+    return db_topic
+
+@_sync_fallback(crud.delete_topic)
+async def delete_topic(db: AsyncSession, topic_id: int):
+    db_topic = await db.get(models.Topic, topic_id)
+    if db_topic:
+        await db.delete(db_topic)
+        await db.commit()
+    return db_topic
+
+# Entry CRUD
+@_sync_fallback(crud.get_entries)
+async def get_entries(db: AsyncSession, user_id: int, skip: int = 0, limit: int = 100, include: Sequence[str] = ()):
+    stmt = select(models.Entry).options(*entry_load_options(include)).filter(
+        models.Entry.user_id == user_id
+    ).order_by(*[column.desc() for column in ENTRY_ORDER]).offset(skip).limit(limit)
+    return (await db.scalars(stmt)).all()
+
+@_sync_fallback(crud.get_entries_page)
+async def get_entries_page(db: AsyncSession, user_id: int, cursor: Optional[str] = None, limit: int = 100, include: Sequence[str] = ()):
+    stmt = select(models.Entry).options(*entry_load_options(include)).filter(models.Entry.user_id == user_id)
+    return await _page(db, stmt, ENTRY_ORDER, cursor, limit)
+
+@_sync_fallback(crud.get_entries_by_topic)
+async def get_entries_by_topic(db: AsyncSession, topic_id: int, user_id: int, skip: int = 0, limit: int = 100, include: Sequence[str] = ()):
+    stmt = select(models.Entry).options(*entry_load_options(include)).filter(
+        models.Entry.topic_id == topic_id,
+        models.Entry.user_id == user_id
+    ).order_by(*[column.desc() for column in ENTRY_ORDER]).offset(skip).limit(limit)
+    return (await db.scalars(stmt)).all()
+
+@_sync_fallback(crud.get_entries_by_topic_page)
+async def get_entries_by_topic_page(db: AsyncSession, topic_id: int, user_id: int, cursor: Optional[str] = None, limit: int = 100, include: Sequence[str] = ()):
+    stmt = select(models.Entry).options(*entry_load_options(include)).filter(
+        models.Entry.topic_id == topic_id,
+        models.Entry.user_id == user_id
+    )
+    return await _page(db, stmt, ENTRY_ORDER, cursor, limit)
+
+@_sync_fallback(crud.search_entries)
+async def search_entries(db: AsyncSession, user_id: int, q: str, cursor: Optional[str] = None, limit: int = 20, **filters):
+    stmt, order = crud.build_entry_search(db.get_bind().dialect.name, user_id, q, **filters)
+    rows = (await db.execute(keyset_query(stmt, order, cursor, limit))).all()
+    return crud.split_search_page(rows, limit)
+
+@_sync_fallback(crud.get_entry_embedding)
+async def get_entry_embedding(db: AsyncSession, entry_id: int):
+    return await db.get(models.EntryEmbedding, entry_id)
+
+@_sync_fallback(crud.find_similar_entries)
+async def find_similar_entries(db: AsyncSession, user_id: int, embedding, model: str, limit: int = 10, exclude_entry_id: Optional[int] = None):
+    if not any(embedding):
+        return []
+    dialect = db.get_bind().dialect.name
+    setup = crud.similar_entries_setup(dialect, limit)
+    if setup is not None:
+        await db.execute(setup)
+    stmt = crud.build_similar_entries(dialect, user_id, embedding, model, limit, exclude_entry_id)
+    rows = (await db.execute(stmt)).all()
+    return crud.similar_entry_results(dialect, rows, embedding, limit)
+
+@_sync_fallback(crud.create_entry)
+async def create_entry(db: AsyncSession, entry: schemas.EntryCreate, user_id: int):
+    return await _save(db, crud.build_entry(entry, user_id))
+
+@_sync_fallback(crud.get_entry)
+async def get_entry(db: AsyncSession, entry_id: int):
+    return await db.get(models.Entry, entry_id)
+
+@_sync_fallback(crud.update_entry)
+async def update_entry(db: AsyncSession, entry_id: int, entry: schemas.EntryUpdate):
+    db_entry = await db.get(models.Entry, entry_id)
+    for key, value in entry.dict(exclude_unset=True).items():
+        setattr(db_entry, key, value)
+    await db.commit()
+    await db.refresh(db_entry)
+    return db_entry
+
+@_sync_fallback(crud.delete_entry)
+async def delete_entry(db: AsyncSession, entry_id: int):
+    db_entry = await db.get(models.Entry, entry_id)
+    await db.delete(db_entry)
+    await db.commit()
+    return db_entry
+
+# File CRUD
+@_sync_fallback(crud.get_files)
+async def get_files(db: AsyncSession, entry_id: int):
+    return (await db.scalars(select(models.File).filter(models.File.entry_id == entry_id))).all()
+
+def _user_files_select(user_id: int):
+    return select(models.File).join(
+        models.Entry, models.File.entry_id == models.Entry.entry_id
+    ).filter(models.Entry.user_id == user_id)
+
+@_sync_fallback(crud.get_user_files)
+async def get_user_files(db: AsyncSession, user_id: int, skip: int = 0, limit: int = 100):
+    stmt = _user_files_select(user_id).order_by(
+        *[column.desc() for column in FILE_ORDER]
+    ).offset(skip).limit(limit)
+    return (await db.scalars(stmt)).all()
+
+@_sync_fallback(crud.get_user_files_page)
+async def get_user_files_page(db: AsyncSession, user_id: int, cursor: Optional[str] = None, limit: int = 100):
+    return await _page(db, _user_files_select(user_id), FILE_ORDER, cursor, limit)
+
+@_sync_fallback(crud.create_file)
+async def create_file(db: AsyncSession, file: schemas.FileCreate, entry_id: int):
+    return await _save(db, models.File(**file.dict(), entry_id=entry_id))
+
+# Link CRUD
+@_sync_fallback(crud.get_links)
+async def get_links(db: AsyncSession, entry_id: int):
+    return (await db.scalars(select(models.Link).filter(models.Link.entry_id == entry_id))).all()
+
+@_sync_fallback(crud.create_link)
+async def create_link(db: AsyncSession, link: schemas.LinkCreate, entry_id: int):
+    return await _save(db, models.Link(**link.dict(), entry_id=entry_id))
+
+# Tag CRUD
+@_sync_fallback(crud.get_tags)
+async def get_tags(db: AsyncSession):
+    return (await db.scalars(select(models.Tag))).all()
+
+@_sync_fallback(crud.create_tag)
+async def create_tag(db: AsyncSession, tag: schemas.TagCreate):
+    return await _save(db, models.Tag(**tag.dict()))
+
+@_sync_fallback(crud.add_tag_to_entry)
+async def add_tag_to_entry(db: AsyncSession, entry_id: int, tag_id: int):
+    # Lazy loading is unavailable on AsyncSession, so load the tags up front
+    entry = await db.get(models.Entry, entry_id, options=[selectinload(models.Entry.tags)])
+    tag = await db.get(models.Tag, tag_id)
+    if entry is None or tag is None:
+        return None
+    if tag not in entry.tags:
+        entry.tags.append(tag)
+        await db.commit()
+    return entry
@@ -1,21 +1,285 @@
 import os
-from sqlalchemy import create_engine
+import time
+import threading
+from typing import TYPE_CHECKING, Any, Dict, Optional
+from sqlalchemy import create_engine, exc
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
 from dotenv import load_dotenv
 
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker
+
 load_dotenv()
 
-DATABASE_URL = os.getenv("DATABASE_URL")
+DATABASE_URL = os.getenv("DATABASE_URL", "")
+# Optional read replica for GET routes; reads use the primary when unset
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")
+# Seconds after a user's own write during which their reads stay on the primary
+DB_REPLICA_STALENESS_WINDOW = float(os.getenv("DB_REPLICA_STALENESS_WINDOW", "5"))
+# Serve the REST routers from an AsyncSession instead of the threadpool-bound Session
+ASYNC_DB_ENABLED = os.getenv("ASYNC_DB_ENABLED", "false").lower() == "true"
+# Optional explicit async URL; derived from DATABASE_URL when unset
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL")
+
+# Engine pool configuration (per process: multiply by the uvicorn worker count)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+
+
+class PoolMetrics:
+    """Checkout wait-time counters for one engine pool"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    def record_wait(self, seconds: float) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self.wait_time_total += seconds
+            self.wait_time_max = max(self.wait_time_max, seconds)
+
+    def record_timeout(self) -> None:
+        with self._lock:
+            self.timeouts += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_time_total_ms": round(self.wait_time_total * 1000, 3),
+                "wait_time_avg_ms": round(self.wait_time_total * 1000 / self.checkouts, 3) if self.checkouts else 0.0,
+                "wait_time_max_ms": round(self.wait_time_max * 1000, 3)
+            }
+
+
+class _TimedPoolMixin:
+    """Times how long each checkout takes to obtain a connection, including opening new ones"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.metrics.record_timeout()
+            raise
+        self.metrics.record_wait(time.perf_counter() - start)
+        return connection
+
+
+class TimedQueuePool(_TimedPoolMixin, QueuePool):
+    pass
+
+
+class TimedAsyncAdaptedQueuePool(_TimedPoolMixin, AsyncAdaptedQueuePool):
+    pass
 
-engine = create_engine(DATABASE_URL)
+
+def _pool_options(url: str, poolclass) -> Dict[str, Any]:
+    # SQLite connections are local files; keep SQLAlchemy's default pooling for them
+    if make_url(url).get_backend_name() == "sqlite":
+        return {}
+    return {
+        "poolclass": poolclass,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+def create_db_engine(url: str, **kwargs):
+    """Create a sync engine with the configured pool settings"""
+    return create_engine(url, **{**_pool_options(url, TimedQueuePool), **kwargs})
+
+
+def create_async_db_engine(url: str, **kwargs):
+    """Create an async engine with the configured pool settings"""
+    from sqlalchemy.ext.asyncio import create_async_engine
+    return create_async_engine(url, **{**_pool_options(url, TimedAsyncAdaptedQueuePool), **kwargs})
+
+
+engine = create_db_engine(DATABASE_URL)
+replica_engine = create_db_engine(DATABASE_REPLICA_URL) if DATABASE_REPLICA_URL else None
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=replica_engine or engine)
 
 Base = declarative_base()
 
+# Async engines are created lazily so sync-only deployments never import asyncpg
+_async_engines: Dict[str, "AsyncEngine"] = {}
+_async_session_factories: Dict[str, "async_sessionmaker"] = {}
+
+_ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def get_async_database_url(url: Optional[str] = None) -> str:
+    """Translate a sync database URL to its async driver equivalent"""
+    if ASYNC_DATABASE_URL and url is None:
+        return ASYNC_DATABASE_URL
+    parsed = make_url(url or DATABASE_URL)
+    backend = parsed.get_backend_name()
+    if backend not in _ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for {backend} databases")
+    return parsed.set(drivername=_ASYNC_DRIVERS[backend]).render_as_string(hide_password=False)
+
+
+def get_async_engine(replica: bool = False):
+    """Get the global async engine (primary or replica), creating it on first use"""
+    role = "replica" if replica and DATABASE_REPLICA_URL else "primary"
+    if role not in _async_engines:
+        url = get_async_database_url(DATABASE_REPLICA_URL) if role == "replica" else get_async_database_url()
+        _async_engines[role] = create_async_db_engine(url)
+    return _async_engines[role]
+
+
+def get_async_session_factory(replica: bool = False):
+    """Get the global AsyncSession factory"""
+    role = "replica" if replica and DATABASE_REPLICA_URL else "primary"
+    if role not in _async_session_factories:
+        from sqlalchemy.ext.asyncio import async_sessionmaker
+        # Keep attributes loaded after commit so responses serialize without lazy IO
+        _async_session_factories[role] = async_sessionmaker(
+            bind=get_async_engine(replica), autoflush=False, expire_on_commit=False
+        )
+    return _async_session_factories[role]
+
+
+async def dispose_async_engine():
+    """Close pooled async connections (called on application shutdown)"""
+    engines = list(_async_engines.values())
+    _async_engines.clear()
+    _async_session_factories.clear()
+    for async_engine in engines:
+        await async_engine.dispose()
+
+
+class ReplicaRouter:
+    """Sends a user's reads to the primary for a while after their own writes"""
+
+    def __init__(self, window: float = DB_REPLICA_STALENESS_WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self._last_write: Dict[int, float] = {}
+        self.replica_reads = 0
+        self.primary_reads = 0
+
+    def record_write(self, user_id: int) -> None:
+        with self._lock:
+            self._last_write[user_id] = time.monotonic()
+
+    def use_primary(self, user_id: Optional[int]) -> bool:
+        """Whether the replica may not have replayed this user's latest write yet"""
+        now = time.monotonic()
+        with self._lock:
+            last_write = self._last_write.get(user_id) if user_id is not None else None
+            recent = last_write is not None and now - last_write < self.window
+            if user_id is not None and last_write is not None and not recent:
+                del self._last_write[user_id]
+            if recent:
+                self.primary_reads += 1
+            else:
+                self.replica_reads += 1
+            return recent
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "staleness_window": self.window,
+                "tracked_users": len(self._last_write),
+                "replica_reads": self.replica_reads,
+                "primary_reads": self.primary_reads
+            }
+
+
+# Global replica router instance
+_replica_router = None
+
+
+def get_replica_router() -> ReplicaRouter:
+    """Get the global replica router instance"""
+    global _replica_router
+    if _replica_router is None:
+        _replica_router = ReplicaRouter()
+    return _replica_router
+
+
+def _pool_stats(pool) -> Dict[str, Any]:
+    stats: Dict[str, Any] = {"pool_class": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update({
+            "pool_size": pool.size(),
+            "max_overflow": pool._max_overflow,
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": max(pool.overflow(), 0),
+        })
+    metrics: Optional[PoolMetrics] = getattr(pool, "metrics", None)
+    if metrics is not None:
+        stats.update(metrics.get_stats())
+    return stats
+
+
+def get_engine_pool_stats() -> Dict[str, Any]:
+    """Get connection pool gauges for every engine of this worker process"""
+    stats = {"pid": os.getpid(), "primary": _pool_stats(engine.pool)}
+    if replica_engine is not None:
+        stats["replica"] = _pool_stats(replica_engine.pool)
+    for role, async_engine in _async_engines.items():
+        stats[f"async_{role}"] = _pool_stats(async_engine.sync_engine.pool)
+    if DATABASE_REPLICA_URL:
+        stats["replica_routing"] = get_replica_router().get_stats()
+    return stats
+
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
+
+
+def get_read_db():
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_db():
+    async with get_async_session_factory()() as db:
+        yield db
+
+
+async def get_async_read_db():
+    async with get_async_session_factory(replica=True)() as db:
+        yield db
+
+
+# Session dependency used by the REST routers; ASYNC_DB_ENABLED switches it for A/B runs
+db_dependency = get_async_db if ASYNC_DB_ENABLED else get_db
+# Session dependency for GET routes; identical to db_dependency without a replica
+if DATABASE_REPLICA_URL:
+    read_db_dependency = get_async_read_db if ASYNC_DB_ENABLED else get_read_db
+else:
+    read_db_dependency = db_dependency
@@ -1,5 +1,5 @@
 import logging
-from fastapi import FastAPI, Request, Response, status
+from fastapi import Depends, FastAPI, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from starlette.middleware.base import BaseHTTPMiddleware
@@ -11,6 +11,7 @@ import os
 from .database import engine, Base
 from . import models
 from .api import users, topics, entries, files, links, tags, auth, gallery, ai
+from .api.auth import get_current_active_user
 
 # Tạo thư mục uploads nếu chưa tồn tại
 uploads_dir = "uploads"
@@ -93,6 +94,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Cache"],
 )
 
 # Mount uploads directory to serve static files
@@ -140,6 +142,13 @@ async def debug_routes():
         })
     return {"routes": routes}
 
+# Database connection pool gauges for this worker process
+@app.get("/metrics")
+async def metrics(current_user: models.User = Depends(get_current_active_user)):
+    """Checked-out, overflow and wait-time gauges of the database engine pools"""
+    from .database import get_engine_pool_stats
+    return {"database": get_engine_pool_stats()}
+
 # IMPORTANT: Include API routers with explicit prefixes
 app.include_router(auth.router)
 app.include_router(users.router, prefix="/users")  # Add explicit prefix
@@ -173,6 +182,14 @@ async def startup_event():
     except Exception as e:
         logger.error(f"Error seeding database: {e}")
     
+    # Shared HTTP clients for LM Studio traffic
+    from .ai.lm_studio import init_http_clients
+    init_http_clients()
+    
+    # Background batch analysis workers
+    from .ai.jobs import start_job_workers
+    start_job_workers()
+    
     # Log all registered routes on startup in a cleaner format
     logger.info("Registered routes:")
     for route in app.routes:
@@ -190,4 +207,16 @@ async def startup_event():
         else:
             # For Mount objects or other special routes
             name = getattr(route, "name", "Unknown")
-            print(f"Special route: {name}")
\ No newline at end of file
+            print(f"Special route: {name}")
+
+# Release pooled connections on shutdown
+@app.on_event("shutdown")
+async def shutdown_event():
+    from .ai.sql_pool import close_pools
+    from .ai.lm_studio import close_http_clients
+    from .ai.jobs import stop_job_workers
+    from .database import dispose_async_engine
+    await stop_job_workers()
+    await close_pools()
+    await close_http_clients()
+    await dispose_async_engine()
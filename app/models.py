@@ -1,13 +1,16 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Date, Boolean, ForeignKey, Table
+import os
+from sqlalchemy import Column, Integer, String, Text, DateTime, Date, Boolean, ForeignKey, Table, UniqueConstraint, Index, DDL, event
 from sqlalchemy.orm import relationship
+from pgvector.sqlalchemy import Vector
 from .database import Base
+from .ai.response_cache import invalidate_entry
 from datetime import datetime
 
 entry_tags = Table(
     "entry_tags",
     Base.metadata,
     Column("entry_id", ForeignKey("entries.entry_id"), primary_key=True),
-    Column("tag_id", ForeignKey("tags.tag_id"), primary_key=True)
+    Column("tag_id", ForeignKey("tags.tag_id"), primary_key=True, index=True)
 )
 
 class User(Base):
@@ -26,6 +29,10 @@ class User(Base):
 
 class Topic(Base):
     __tablename__ = "topics"
+    __table_args__ = (
+        # Keyset pagination of a user's topics
+        Index("ix_topics_user_created_id", "user_id", "created_at", "topic_id"),
+    )
 
     topic_id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.user_id"), nullable=False)
@@ -39,6 +46,11 @@ class Topic(Base):
 
 class Entry(Base):
     __tablename__ = "entries"
+    __table_args__ = (
+        # Keyset pagination by (entry_date, entry_id) per user and per topic
+        Index("ix_entries_user_date_id", "user_id", "entry_date", "entry_id"),
+        Index("ix_entries_topic_user_date_id", "topic_id", "user_id", "entry_date", "entry_id"),
+    )
 
     entry_id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.user_id"), nullable=False)
@@ -58,12 +70,41 @@ class Entry(Base):
     files = relationship("File", back_populates="entry")
     links = relationship("Link", back_populates="entry")
     tags = relationship("Tag", secondary=entry_tags, back_populates="entries")
+    analyses = relationship("EntryAnalysis", back_populates="entry", cascade="all, delete-orphan")
+    embedding = relationship("EntryEmbedding", back_populates="entry", uselist=False, cascade="all, delete-orphan")
+
+# Full-text search document of an entry; title lexemes rank above content lexemes
+ENTRY_SEARCH_CONFIG = os.getenv("SEARCH_TEXT_CONFIG", "simple")
+ENTRY_SEARCH_DOCUMENT = (
+    f"setweight(to_tsvector('{ENTRY_SEARCH_CONFIG}', coalesce(title, '')), 'A') || "
+    f"setweight(to_tsvector('{ENTRY_SEARCH_CONFIG}', coalesce(content, '')), 'B')"
+)
+
+# Postgres-only generated tsvector column with a GIN index; it is not mapped so
+# other databases (SQLite in tests) keep working and entry queries never load it
+event.listen(Entry.__table__, "after_create", DDL(
+    "ALTER TABLE entries ADD COLUMN IF NOT EXISTS search_vector tsvector "
+    f"GENERATED ALWAYS AS ({ENTRY_SEARCH_DOCUMENT}) STORED"
+).execute_if(dialect="postgresql"))
+event.listen(Entry.__table__, "after_create", DDL(
+    "CREATE INDEX IF NOT EXISTS ix_entries_search_vector ON entries USING gin (search_vector)"
+).execute_if(dialect="postgresql"))
+
+# Drop cached analyses whenever an entry changes, whichever code path edits it
+@event.listens_for(Entry, "after_update")
+@event.listens_for(Entry, "after_delete")
+def _invalidate_entry_analysis_cache(mapper, connection, target):
+    invalidate_entry(target.entry_id)
 
 class File(Base):
     __tablename__ = "files"
+    __table_args__ = (
+        # Gallery listing ordered by (uploaded_at, file_id)
+        Index("ix_files_uploaded_id", "uploaded_at", "file_id"),
+    )
 
     file_id = Column(Integer, primary_key=True, index=True)
-    entry_id = Column(Integer, ForeignKey("entries.entry_id"), nullable=False)
+    entry_id = Column(Integer, ForeignKey("entries.entry_id"), nullable=False, index=True)
     file_name = Column(String, nullable=False)
     file_path = Column(String, nullable=False)
     file_type = Column(String)
@@ -76,7 +117,7 @@ class Link(Base):
     __tablename__ = "links"
 
     link_id = Column(Integer, primary_key=True, index=True)
-    entry_id = Column(Integer, ForeignKey("entries.entry_id"), nullable=False)
+    entry_id = Column(Integer, ForeignKey("entries.entry_id"), nullable=False, index=True)
     url = Column(String, nullable=False)
     title = Column(String)
     description = Column(Text)
@@ -91,4 +132,85 @@ class Tag(Base):
     tag_name = Column(String, unique=True, index=True, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
 
-    entries = relationship("Entry", secondary=entry_tags, back_populates="tags") 
\ No newline at end of file
+    entries = relationship("Entry", secondary=entry_tags, back_populates="tags")
+
+class EntryAnalysis(Base):
+    __tablename__ = "entry_analyses"
+    __table_args__ = (
+        UniqueConstraint("entry_id", "analysis_type", name="uq_entry_analyses_entry_type"),
+    )
+
+    analysis_id = Column(Integer, primary_key=True, index=True)
+    entry_id = Column(Integer, ForeignKey("entries.entry_id", ondelete="CASCADE"), nullable=False)
+    analysis_type = Column(String, nullable=False)
+    think = Column(Text)
+    answer = Column(Text, nullable=False)
+    raw_content = Column(Text, nullable=False)
+    model = Column(String)
+    prompt_version = Column(String, nullable=False)
+    content_hash = Column(String(64), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    entry = relationship("Entry", back_populates="analyses")
+
+# Output size of the embedding model; the vector column is created with it
+ENTRY_EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", "768"))
+# HNSW candidate list size per query; higher trades latency for recall
+ENTRY_EMBEDDING_EF_SEARCH = int(os.getenv("EMBEDDING_HNSW_EF_SEARCH", "100"))
+
+class EntryEmbedding(Base):
+    __tablename__ = "entry_embeddings"
+
+    entry_id = Column(Integer, ForeignKey("entries.entry_id", ondelete="CASCADE"), primary_key=True)
+    model = Column(String, nullable=False)
+    content_hash = Column(String(64), nullable=False)
+    embedding = Column(Vector(ENTRY_EMBEDDING_DIMENSIONS), nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    entry = relationship("Entry", back_populates="embedding")
+
+# pgvector type and cosine-distance HNSW index; other databases store the vectors as text
+event.listen(EntryEmbedding.__table__, "before_create", DDL(
+    "CREATE EXTENSION IF NOT EXISTS vector"
+).execute_if(dialect="postgresql"))
+event.listen(EntryEmbedding.__table__, "after_create", DDL(
+    "CREATE INDEX IF NOT EXISTS ix_entry_embeddings_embedding_hnsw ON entry_embeddings "
+    "USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64)"
+).execute_if(dialect="postgresql"))
+
+class AnalysisJob(Base):
+    __tablename__ = "analysis_jobs"
+
+    job_id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.user_id"), nullable=False, index=True)
+    status = Column(String, nullable=False, default="pending")  # pending, running, completed, cancelled
+    model = Column(String)
+    force = Column(Boolean, default=False)
+    total_items = Column(Integer, nullable=False, default=0)
+    completed_items = Column(Integer, nullable=False, default=0)
+    failed_items = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
+    items = relationship("AnalysisJobItem", back_populates="job", cascade="all, delete-orphan")
+
+class AnalysisJobItem(Base):
+    __tablename__ = "analysis_job_items"
+    __table_args__ = (
+        Index("ix_analysis_job_items_status_available", "status", "available_at"),
+    )
+
+    item_id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(Integer, ForeignKey("analysis_jobs.job_id", ondelete="CASCADE"), nullable=False, index=True)
+    entry_id = Column(Integer, ForeignKey("entries.entry_id", ondelete="CASCADE"), nullable=False)
+    analysis_type = Column(String, nullable=False)
+    status = Column(String, nullable=False, default="pending")  # pending, running, done, failed, cancelled
+    attempts = Column(Integer, nullable=False, default=0)
+    error = Column(Text)
+    available_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    job = relationship("AnalysisJob", back_populates="items")
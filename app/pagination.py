@@ -0,0 +1,118 @@
+import json
+import base64
+from datetime import date, datetime
+from typing import Any, List, Optional, Sequence, Tuple
+
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Query
+
+# Upper bound for page sizes requested by clients
+MAX_PAGE_SIZE = 500
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    if isinstance(value, date):
+        return {"d": value.isoformat()}
+    return value
+
+
+def _decode_value(value: Any) -> Any:
+    if isinstance(value, dict):
+        if "dt" in value:
+            return datetime.fromisoformat(value["dt"])
+        if "d" in value:
+            return date.fromisoformat(value["d"])
+    return value
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """Encode the sort key of the last row into an opaque cursor"""
+    payload = json.dumps([_encode_value(value) for value in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _expected_type(column: Any) -> Optional[type]:
+    try:
+        return column.type.python_type
+    except (AttributeError, NotImplementedError):
+        return None
+
+
+def _matches(value: Any, expected: Optional[type]) -> bool:
+    if expected is None:
+        return True
+    # bool is an int subclass but never a valid sort key
+    if isinstance(value, bool) and expected is not bool:
+        return False
+    if expected is float:
+        return isinstance(value, (int, float))
+    if expected is date:
+        return isinstance(value, date) and not isinstance(value, datetime)
+    return isinstance(value, expected)
+
+
+def decode_cursor(cursor: str, columns: Sequence[Any]) -> List[Any]:
+    """Decode a cursor produced by encode_cursor, raising ValueError if it is malformed
+    or its values do not fit the order columns"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        values = [_decode_value(value) for value in values]
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list) or len(values) != len(columns):
+        raise ValueError("Invalid cursor")
+    # A tampered value would otherwise reach the database as a bad bind parameter
+    if not all(_matches(value, _expected_type(column)) for value, column in zip(values, columns)):
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def cursor_for(row: Any, columns: Sequence[Any]) -> str:
+    """Build the cursor pointing just past the given row"""
+    return encode_cursor([getattr(row, column.key) for column in columns])
+
+
+def keyset_query(query, columns: Sequence[Any], cursor: Optional[str], limit: int, descending: bool = True):
+    """Restrict a Query or Select to the page after `cursor`, fetching one extra row"""
+    if cursor:
+        key = tuple_(*columns)
+        values = tuple_(*decode_cursor(cursor, columns))
+        query = query.filter(key < values if descending else key > values)
+
+    order_by = [column.desc() if descending else column.asc() for column in columns]
+    # The extra row tells whether another page exists
+    return query.order_by(*order_by).limit(limit + 1)
+
+
+def split_page(rows: Sequence[Any], columns: Sequence[Any], limit: int) -> Tuple[List[Any], Optional[str]]:
+    """Split rows fetched by keyset_query into the page and the next cursor"""
+    rows = list(rows)
+    next_cursor = cursor_for(rows[limit - 1], columns) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def keyset_paginate(
+    query: Query,
+    columns: Sequence[Any],
+    cursor: Optional[str],
+    limit: int,
+    descending: bool = True
+) -> Tuple[List[Any], Optional[str]]:
+    """Return one page of rows ordered by `columns` plus the cursor of the next page"""
+    rows = keyset_query(query, columns, cursor, limit, descending).all()
+    return split_page(rows, columns, limit)
+
+
+def page_limit(limit: int) -> int:
+    """Clamp a client supplied page size"""
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def set_next_cursor(response, next_cursor: Optional[str]) -> None:
+    """Expose the next page cursor as a response header"""
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
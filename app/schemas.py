@@ -46,6 +46,10 @@ class Topic(TopicBase):
     class Config:
         orm_mode = True
 
+class TopicPage(BaseModel):
+    items: List[Topic]
+    next_cursor: Optional[str] = None
+
 # Entry schemas
 class EntryBase(BaseModel):
     title: str
@@ -97,6 +101,10 @@ class File(FileBase):
     class Config:
         orm_mode = True
 
+class FilePage(BaseModel):
+    items: List[File]
+    next_cursor: Optional[str] = None
+
 # Link schemas
 class LinkBase(BaseModel):
     url: HttpUrl
@@ -128,6 +136,29 @@ class Tag(TagBase):
     class Config:
         orm_mode = True
 
+# Entry with the relations requested through include=; relations not requested are omitted
+class EntryWithRelations(Entry):
+    topic: Optional[Topic] = None
+    tags: Optional[List[Tag]] = None
+    files: Optional[List[File]] = None
+    links: Optional[List[Link]] = None
+
+class EntryPage(BaseModel):
+    items: List[EntryWithRelations]
+    next_cursor: Optional[str] = None
+
+# Full-text search hit; headline holds matching fragments wrapped in <mark> tags
+class EntrySearchResult(Entry):
+    rank: float
+    headline: Optional[str] = None
+
+class EntrySearchPage(BaseModel):
+    items: List[EntrySearchResult]
+    next_cursor: Optional[str] = None
+
+class EntrySimilarResult(Entry):
+    similarity: float
+
 # Authentication schemas
 class Token(BaseModel):
     access_token: str
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the listing/join query patterns with and without the composite indexes.
+
+Seeds N users x M entries (plus files, links and tags) into the given database,
+then reports query plans and median latency before and after creating the indexes.
+
+Usage:
+    python scripts/benchmark_indexes.py --database-url postgresql://user:pw@localhost/bench_db \\
+        --users 50 --entries 2000
+
+Run it against a scratch database: seeded rows are removed afterwards unless --keep is given.
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from sqlalchemy import create_engine, text, insert, select
+
+# Imported in main(): app.database builds its engine from DATABASE_URL at import time
+models = None
+
+# Indexes under test: (name, table, columns)
+BENCHMARK_INDEXES = [
+    ("ix_entries_user_date_id", "entries", "user_id, entry_date, entry_id"),
+    ("ix_entries_topic_user_date_id", "entries", "topic_id, user_id, entry_date, entry_id"),
+    ("ix_topics_user_created_id", "topics", "user_id, created_at, topic_id"),
+    ("ix_files_entry_id", "files", "entry_id"),
+    ("ix_files_uploaded_id", "files", "uploaded_at, file_id"),
+    ("ix_links_entry_id", "links", "entry_id"),
+    ("ix_entry_tags_tag_id", "entry_tags", "tag_id"),
+]
+
+# Query patterns used by the API, parameterised by a sample user/topic/entry/tag
+QUERIES = {
+    "entries_by_user": (
+        "SELECT * FROM entries WHERE user_id = :user_id "
+        "ORDER BY entry_date DESC, entry_id DESC LIMIT 50"
+    ),
+    "entries_by_topic": (
+        "SELECT * FROM entries WHERE topic_id = :topic_id AND user_id = :user_id "
+        "ORDER BY entry_date DESC, entry_id DESC LIMIT 50"
+    ),
+    "topics_by_user": (
+        "SELECT * FROM topics WHERE user_id = :user_id "
+        "ORDER BY created_at, topic_id LIMIT 100"
+    ),
+    "gallery_files": (
+        "SELECT files.* FROM files JOIN entries ON files.entry_id = entries.entry_id "
+        "WHERE entries.user_id = :user_id ORDER BY files.uploaded_at DESC, files.file_id DESC LIMIT 100"
+    ),
+    "files_by_entry": "SELECT * FROM files WHERE entry_id = :entry_id",
+    "links_by_entry": "SELECT * FROM links WHERE entry_id = :entry_id",
+    "entries_by_tag": (
+        "SELECT entries.entry_id FROM entries JOIN entry_tags ON entries.entry_id = entry_tags.entry_id "
+        "WHERE entry_tags.tag_id = :tag_id"
+    ),
+}
+
+
+def seed(engine, users: int, entries: int, prefix: str) -> dict:
+    """Insert benchmark rows in bulk and return sample ids for the queries"""
+    random.seed(42)
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        tag_ids = [
+            conn.execute(insert(models.Tag).values(tag_name=f"{prefix}_tag_{i}").returning(models.Tag.tag_id)).scalar_one()
+            for i in range(20)
+        ]
+        user_ids = []
+        for u in range(users):
+            user_id = conn.execute(insert(models.User).values(
+                username=f"{prefix}_user_{u}", email=f"{prefix}_{u}@bench.local", password_hash="x"
+            ).returning(models.User.user_id)).scalar_one()
+            user_ids.append(user_id)
+            topic_ids = [
+                conn.execute(insert(models.Topic).values(
+                    user_id=user_id, topic_name=f"Topic {t}", created_at=now - timedelta(days=t)
+                ).returning(models.Topic.topic_id)).scalar_one()
+                for t in range(10)
+            ]
+            conn.execute(insert(models.Entry), [
+                {
+                    "user_id": user_id,
+                    "topic_id": random.choice(topic_ids),
+                    "title": f"Entry {e}",
+                    "content": "benchmark content " * 20,
+                    "entry_date": date(2020, 1, 1) + timedelta(days=random.randint(0, 1800)),
+                }
+                for e in range(entries)
+            ])
+            entry_ids = conn.execute(select(models.Entry.entry_id).where(models.Entry.user_id == user_id)).scalars().all()
+            conn.execute(insert(models.File), [
+                {"entry_id": entry_id, "file_name": "f.png", "file_path": "/uploads/f.png",
+                 "uploaded_at": now - timedelta(minutes=random.randint(0, 500000))}
+                for entry_id in entry_ids if random.random() < 0.3
+            ] or [{"entry_id": entry_ids[0], "file_name": "f.png", "file_path": "/uploads/f.png"}])
+            conn.execute(insert(models.Link), [
+                {"entry_id": entry_id, "url": "https://example.com"}
+                for entry_id in entry_ids if random.random() < 0.3
+            ] or [{"entry_id": entry_ids[0], "url": "https://example.com"}])
+            conn.execute(insert(models.entry_tags), [
+                {"entry_id": entry_id, "tag_id": tag_id}
+                for entry_id in entry_ids
+                for tag_id in random.sample(tag_ids, 2)
+            ])
+
+        sample_user = user_ids[len(user_ids) // 2]
+        sample_entry = conn.execute(
+            select(models.Entry.entry_id, models.Entry.topic_id).where(models.Entry.user_id == sample_user).limit(1)
+        ).first()
+    return {
+        "user_id": sample_user,
+        "topic_id": sample_entry.topic_id,
+        "entry_id": sample_entry.entry_id,
+        "tag_id": tag_ids[0],
+        "user_ids": user_ids,
+        "tag_ids": tag_ids,
+    }
+
+
+def cleanup(engine, sample: dict) -> None:
+    with engine.begin() as conn:
+        entry_ids = select(models.Entry.entry_id).where(models.Entry.user_id.in_(sample["user_ids"]))
+        conn.execute(models.entry_tags.delete().where(models.entry_tags.c.entry_id.in_(entry_ids)))
+        conn.execute(models.File.__table__.delete().where(models.File.entry_id.in_(entry_ids)))
+        conn.execute(models.Link.__table__.delete().where(models.Link.entry_id.in_(entry_ids)))
+        conn.execute(models.Entry.__table__.delete().where(models.Entry.user_id.in_(sample["user_ids"])))
+        conn.execute(models.Topic.__table__.delete().where(models.Topic.user_id.in_(sample["user_ids"])))
+        conn.execute(models.User.__table__.delete().where(models.User.user_id.in_(sample["user_ids"])))
+        conn.execute(models.Tag.__table__.delete().where(models.Tag.tag_id.in_(sample["tag_ids"])))
+
+
+def set_indexes(engine, enabled: bool) -> None:
+    with engine.begin() as conn:
+        for name, table, columns in BENCHMARK_INDEXES:
+            if enabled:
+                conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})"))
+            else:
+                conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+        conn.execute(text("ANALYZE"))
+
+
+def explain(engine, sql: str, params: dict) -> str:
+    if engine.dialect.name == "postgresql":
+        prefix = "EXPLAIN (ANALYZE, COSTS OFF, TIMING OFF, SUMMARY OFF) "
+    else:
+        prefix = "EXPLAIN QUERY PLAN "
+    with engine.connect() as conn:
+        rows = conn.execute(text(prefix + sql), params).all()
+    return "\n".join("    " + str(row[-1]) for row in rows)
+
+
+def time_query(engine, sql: str, params: dict, runs: int) -> float:
+    """Median latency in milliseconds"""
+    timings = []
+    with engine.connect() as conn:
+        conn.execute(text(sql), params).all()  # warm up
+        for _ in range(runs):
+            start = time.perf_counter()
+            conn.execute(text(sql), params).all()
+            timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def run_phase(engine, label: str, params: dict, runs: int, show_plans: bool) -> dict:
+    print(f"\n=== {label} ===")
+    results = {}
+    for name, sql in QUERIES.items():
+        results[name] = time_query(engine, sql, params, runs)
+        print(f"  {name:<18} {results[name]:8.3f} ms")
+        if show_plans:
+            print(explain(engine, sql, params))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark listing queries with and without indexes")
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"), help="Scratch database to seed")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--entries", type=int, default=1000, help="Entries per user")
+    parser.add_argument("--runs", type=int, default=20, help="Timed runs per query")
+    parser.add_argument("--no-plans", action="store_true", help="Only report latency")
+    parser.add_argument("--keep", action="store_true", help="Keep seeded rows and indexes")
+    args = parser.parse_args()
+
+    if not args.database_url:
+        parser.error("--database-url or DATABASE_URL is required")
+
+    global models
+    os.environ.setdefault("DATABASE_URL", args.database_url)
+    from app import models
+
+    engine = create_engine(args.database_url)
+    models.Base.metadata.create_all(bind=engine)
+
+    prefix = f"bench{int(time.time())}"
+    print(f"Seeding {args.users} users x {args.entries} entries into {engine.url.render_as_string(hide_password=True)}")
+    start = time.perf_counter()
+    sample = seed(engine, args.users, args.entries, prefix)
+    print(f"Seeded in {time.perf_counter() - start:.1f}s")
+
+    params = {key: sample[key] for key in ("user_id", "topic_id", "entry_id", "tag_id")}
+    try:
+        set_indexes(engine, enabled=False)
+        before = run_phase(engine, "Without indexes", params, args.runs, not args.no_plans)
+        set_indexes(engine, enabled=True)
+        after = run_phase(engine, "With indexes", params, args.runs, not args.no_plans)
+
+        print("\n=== Summary (median ms) ===")
+        print(f"  {'query':<18} {'before':>10} {'after':>10} {'speedup':>9}")
+        for name in QUERIES:
+            speedup = before[name] / after[name] if after[name] else float("inf")
+            print(f"  {name:<18} {before[name]:10.3f} {after[name]:10.3f} {speedup:8.1f}x")
+    finally:
+        # The indexes belong to the schema, so always leave them in place
+        set_indexes(engine, enabled=True)
+        if not args.keep:
+            cleanup(engine, sample)
+            print("\nRemoved seeded rows")
+
+
+if __name__ == "__main__":
+    main()
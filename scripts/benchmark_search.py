@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Benchmark for /entries/search on a large journal.
+
+Seeds N entries of generated text, spread over U users, into the given Postgres
+database, then reports the query plan and median latency of crud.search_entries
+for one user and a few query shapes (first page, next page, filters, websearch syntax).
+
+Usage:
+    python scripts/benchmark_search.py --database-url postgresql://user:pw@localhost/bench_db \\
+        --entries 1000000 --users 1000
+
+Run it against a scratch database: seeded rows are removed afterwards unless --keep is given.
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from datetime import date
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from sqlalchemy import create_engine, text, insert
+from sqlalchemy.orm import Session
+
+from app.pagination import keyset_query
+
+# Imported in main(): app.database builds its engine from DATABASE_URL at import time
+models = None
+crud = None
+
+# Vocabulary the generated entries are drawn from; "quantum" is rare, the rest common
+WORDS = [
+    "python", "garden", "coffee", "running", "meeting", "family", "reading", "travel",
+    "music", "project", "weather", "dinner", "morning", "evening", "work", "friends",
+]
+
+SEED_SQL = """
+INSERT INTO entries (user_id, topic_id, title, content, mood, entry_date)
+SELECT u[1 + i % cardinality(u)], t[1 + i % cardinality(t)],
+       initcap(w[1 + (i % 16)]) || ' ' || w[1 + ((i / 16) % 16)] || ' notes',
+       w[1 + ((i * 7) % 16)] || ' and ' || w[1 + ((i * 11) % 16)] || ' today. '
+         || repeat(w[1 + ((i * 13) % 16)] || ' ', 1 + i % 30)
+         || CASE WHEN i % 5000 = 0 THEN ' quantum computing' ELSE '' END,
+       (ARRAY['happy', 'calm', 'tired', 'anxious'])[1 + i % 4],
+       DATE '2015-01-01' + (i % 3650)
+FROM generate_series(1, :entries) AS i,
+     (SELECT CAST(:words AS text[]) AS w, CAST(:user_ids AS int[]) AS u, CAST(:topic_ids AS int[]) AS t) AS ids
+"""
+
+# (label, query, filters, page)
+CASES = [
+    ("common term", "python", {}, 1),
+    ("common term, page 2", "python", {}, 2),
+    ("rare term", "quantum", {}, 1),
+    ("two terms", "garden coffee", {}, 1),
+    ("websearch syntax", '"quantum computing" -garden', {}, 1),
+    ("term + mood", "python", {"mood": "happy"}, 1),
+    ("term + date range", "python", {"date_from": date(2020, 1, 1), "date_to": date(2020, 3, 31)}, 1),
+]
+
+
+def ensure_search_column(engine) -> None:
+    """Add search_vector to an existing entries table, as the migration does"""
+    with engine.begin() as conn:
+        conn.execute(text(
+            "ALTER TABLE entries ADD COLUMN IF NOT EXISTS search_vector tsvector "
+            f"GENERATED ALWAYS AS ({models.ENTRY_SEARCH_DOCUMENT}) STORED"
+        ))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_entries_search_vector ON entries USING gin (search_vector)"))
+
+
+def seed(engine, users: int, entries: int, prefix: str) -> dict:
+    """Insert benchmark rows in bulk and return the user ids"""
+    with engine.begin() as conn:
+        user_ids = conn.execute(insert(models.User).returning(models.User.user_id), [
+            {"username": f"{prefix}_user_{u}", "email": f"{prefix}_{u}@bench.local", "password_hash": "x"}
+            for u in range(users)
+        ]).scalars().all()
+        topic_ids = conn.execute(insert(models.Topic).returning(models.Topic.topic_id), [
+            {"user_id": user_id, "topic_name": "Search benchmark"} for user_id in user_ids
+        ]).scalars().all()
+        conn.execute(text(SEED_SQL), {
+            "entries": entries, "words": WORDS, "user_ids": list(user_ids), "topic_ids": list(topic_ids)
+        })
+        conn.execute(text("ANALYZE entries"))
+    return {"user_id": user_ids[0], "user_ids": list(user_ids)}
+
+
+def cleanup(engine, sample: dict) -> None:
+    with engine.begin() as conn:
+        conn.execute(models.Entry.__table__.delete().where(models.Entry.user_id.in_(sample["user_ids"])))
+        conn.execute(models.Topic.__table__.delete().where(models.Topic.user_id.in_(sample["user_ids"])))
+        conn.execute(models.User.__table__.delete().where(models.User.user_id.in_(sample["user_ids"])))
+
+
+def time_search(engine, user_id: int, q: str, filters: dict, page: int, limit: int, runs: int) -> tuple:
+    """Median latency in milliseconds and the number of rows on the page"""
+    timings = []
+    with Session(engine) as db:
+        cursor = None
+        for _ in range(page - 1):
+            _, cursor = crud.search_entries(db, user_id, q, cursor, limit, **filters)
+        rows, _ = crud.search_entries(db, user_id, q, cursor, limit, **filters)  # warm up
+        for _ in range(runs):
+            start = time.perf_counter()
+            crud.search_entries(db, user_id, q, cursor, limit, **filters)
+            timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), len(rows)
+
+
+def explain(engine, user_id: int, q: str, limit: int) -> str:
+    stmt, order = crud.build_entry_search(engine.dialect.name, user_id, q)
+    compiled = keyset_query(stmt, order, None, limit).compile(engine, compile_kwargs={"literal_binds": True})
+    with engine.connect() as conn:
+        rows = conn.execute(text(f"EXPLAIN (ANALYZE, COSTS OFF, SUMMARY OFF) {compiled}")).all()
+    return "\n".join("    " + row[0] for row in rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark full-text entry search")
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"), help="Scratch Postgres database to seed")
+    parser.add_argument("--entries", type=int, default=1000000, help="Total entries")
+    parser.add_argument("--users", type=int, default=1000, help="Users the entries are spread over")
+    parser.add_argument("--limit", type=int, default=20, help="Page size")
+    parser.add_argument("--runs", type=int, default=20, help="Timed runs per query")
+    parser.add_argument("--no-plans", action="store_true", help="Only report latency")
+    parser.add_argument("--keep", action="store_true", help="Keep seeded rows")
+    args = parser.parse_args()
+
+    if not args.database_url:
+        parser.error("--database-url or DATABASE_URL is required")
+
+    global models, crud
+    os.environ.setdefault("DATABASE_URL", args.database_url)
+    from app import crud, models
+
+    engine = create_engine(args.database_url)
+    if engine.dialect.name != "postgresql":
+        parser.error("full-text search needs a PostgreSQL database")
+    models.Base.metadata.create_all(bind=engine)
+    ensure_search_column(engine)
+
+    prefix = f"search{int(time.time())}"
+    print(f"Seeding {args.entries} entries for {args.users} users into {engine.url.render_as_string(hide_password=True)}")
+    start = time.perf_counter()
+    sample = seed(engine, args.users, args.entries, prefix)
+    print(f"Seeded in {time.perf_counter() - start:.1f}s")
+
+    try:
+        if not args.no_plans:
+            print("\n=== Plan: common term, first page ===")
+            print(explain(engine, sample["user_id"], "python", args.limit))
+        print(f"\n=== Search latency (median of {args.runs}, limit {args.limit}) ===")
+        for label, q, filters, page in CASES:
+            median, count = time_search(engine, sample["user_id"], q, filters, page, args.limit, args.runs)
+            print(f"  {label:<22} {median:9.3f} ms  ({count} rows)")
+    finally:
+        if not args.keep:
+            cleanup(engine, sample)
+            print("\nRemoved seeded rows")
+
+
+if __name__ == "__main__":
+    main()
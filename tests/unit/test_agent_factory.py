@@ -0,0 +1,116 @@
+"""
+Unit Tests for the agent template cache
+Stubs out the LLM and agent construction so no LM Studio server is needed
+"""
+
+import pytest
+
+from app.ai import agent as agent_module
+from app.ai.agent import AgentFactory
+
+
+@pytest.fixture
+def build_calls(monkeypatch):
+    calls = []
+
+    def fake_create_agent(llm, tools, prompt):
+        calls.append(prompt)
+        from langchain_core.runnables import RunnableLambda
+        return RunnableLambda(lambda _: None)
+
+    monkeypatch.delenv("DATABASE_URL", raising=False)
+    monkeypatch.setattr(agent_module, "get_chatopen_ai_instance", lambda **kwargs: object())
+    monkeypatch.setattr(agent_module, "create_openai_functions_agent", fake_create_agent)
+    return calls
+
+
+class TestAgentFactory:
+    """Test template reuse, isolation and eviction"""
+
+    def test_template_reused_with_isolated_memory(self, build_calls):
+        factory = AgentFactory(max_size=2)
+
+        first = factory.get_agent(model_name="m1", system_prompt="prompt")
+        second = factory.get_agent(model_name="m1", system_prompt="prompt")
+
+        assert len(build_calls) == 1
+        assert first.agent is second.agent
+        assert first.memory is not second.memory
+        assert first.agent_executor is not second.agent_executor
+        assert factory.get_stats()["hits"] == 1
+        assert factory.get_stats()["misses"] == 1
+
+    def test_different_prompt_builds_new_template(self, build_calls):
+        factory = AgentFactory(max_size=2)
+
+        factory.get_agent(model_name="m1", system_prompt="prompt a")
+        factory.get_agent(model_name="m1", system_prompt="prompt b")
+
+        assert len(build_calls) == 2
+
+    def test_lru_eviction(self, build_calls):
+        factory = AgentFactory(max_size=1)
+
+        factory.get_agent(model_name="m1", system_prompt="prompt")
+        factory.get_agent(model_name="m2", system_prompt="prompt")
+        factory.get_agent(model_name="m1", system_prompt="prompt")
+
+        stats = factory.get_stats()
+        assert len(build_calls) == 3
+        assert stats["evictions"] == 2
+        assert stats["size"] == 1
+
+
+class StubSQLTool:
+    """Schema snapshot stand-in for the SQL prompt"""
+
+    def get_database_schema(self):
+        def table(name, columns, references=()):
+            return {
+                "table_name": name,
+                "columns": [{"column_name": column, "data_type": "text", "is_nullable": "YES"} for column in columns],
+                "primary_keys": [columns[0]],
+                "foreign_keys": [
+                    {"column_name": f"{target[:-1]}_id", "foreign_table": target, "foreign_column": f"{target[:-1]}_id"}
+                    for target in references
+                ]
+            }
+        tables = [
+            table("users", ["user_id", "username"]),
+            table("entries", ["entry_id", "mood", "user_id"], ["users"]),
+            table("tags", ["tag_id", "name"]),
+            table("files", ["file_id", "file_path", "entry_id"], ["entries"]),
+        ]
+        return {"success": True, "tables": tables, "schema": "", "version": "v1"}
+
+    def generate_learning_prompt_addition(self):
+        return ""
+
+    def get_langchain_tools(self):
+        return []
+
+
+class TestSchemaSelection:
+    """Test that templates are keyed by the tables a question needs"""
+
+    @pytest.fixture
+    def factory(self, build_calls, monkeypatch):
+        monkeypatch.setenv("DATABASE_URL", "postgresql://stub/db")
+        monkeypatch.setattr(agent_module, "get_sql_tool", lambda database_url: StubSQLTool())
+        monkeypatch.setattr(agent_module.schema_selector, "SQL_SCHEMA_MAX_TABLES", 2)
+        return AgentFactory(max_size=4)
+
+    def test_prompt_describes_only_relevant_tables(self, factory):
+        agent = factory.get_agent(model_name="m1", system_prompt="prompt", question="average mood of entries")
+        assert "Table: entries" in agent.system_prompt and "Table: users" in agent.system_prompt
+        assert "Table: tags" not in agent.system_prompt
+        assert "Other tables (use get_database_schema for details): tags, files" in agent.system_prompt
+
+    def test_questions_needing_the_same_tables_share_a_template(self, factory, build_calls):
+        first = factory.get_agent(model_name="m1", system_prompt="prompt", question="mood of my entries")
+        second = factory.get_agent(model_name="m1", system_prompt="prompt", question="entries by mood")
+        third = factory.get_agent(model_name="m1", system_prompt="prompt", question="file paths")
+
+        assert first.agent is second.agent
+        assert third.agent is not first.agent
+        assert len(build_calls) == 2
@@ -0,0 +1,137 @@
+"""
+Unit Tests for the background batch analysis queue
+Drives the worker step by step with the LLM call patched out
+"""
+
+import asyncio
+import pytest
+from datetime import date, datetime, timedelta
+from unittest.mock import patch, AsyncMock
+
+from app import crud, models
+from app.ai import jobs
+from app.ai.jobs import AnalysisJobWorker
+from tests.conftest import TestingSessionLocal
+
+
+@pytest.fixture
+def queued_job():
+    db = TestingSessionLocal()
+    user = models.User(username="batchuser", email="batch@example.com", password_hash="x")
+    db.add(user)
+    db.commit()
+    topic = models.Topic(user_id=user.user_id, topic_name="Batch")
+    db.add(topic)
+    db.commit()
+    entries = [
+        models.Entry(user_id=user.user_id, topic_id=topic.topic_id, title=f"Entry {i}",
+                     content="Some content", entry_date=date.today())
+        for i in range(2)
+    ]
+    db.add_all(entries)
+    db.commit()
+    job = crud.create_analysis_job(db, user.user_id, [e.entry_id for e in entries], ["mood"])
+
+    yield job.job_id
+
+    db.query(models.AnalysisJobItem).delete()
+    db.query(models.AnalysisJob).delete()
+    db.query(models.Entry).filter(models.Entry.user_id == user.user_id).delete()
+    db.delete(topic)
+    db.delete(user)
+    db.commit()
+    db.close()
+
+
+def _drain(worker):
+    while True:
+        claim = worker.claim_next()
+        if claim is None:
+            return
+        asyncio.run(worker.process(claim))
+
+
+def _get_job(job_id):
+    db = TestingSessionLocal()
+    try:
+        return db.get(models.AnalysisJob, job_id)
+    finally:
+        db.close()
+
+
+class TestAnalysisJobWorker:
+    """Test claiming, retries, progress and cancellation"""
+
+    def test_job_completes_with_retry(self, queued_job):
+        worker = AnalysisJobWorker(session_factory=TestingSessionLocal, max_retries=1, retry_delay=0)
+        results = [{"answer": "timeout", "error": True}, {"answer": "ok"}, {"answer": "ok"}]
+        with patch.object(jobs, "analyze_entry_incremental", AsyncMock(side_effect=results)):
+            _drain(worker)
+
+        job = _get_job(queued_job)
+        assert job.status == "completed"
+        assert job.completed_items == 2
+        assert job.failed_items == 0
+        assert worker.get_stats()["retried"] == 1
+
+    def test_exhausted_retries_mark_failed(self, queued_job):
+        worker = AnalysisJobWorker(session_factory=TestingSessionLocal, max_retries=0, retry_delay=0)
+        with patch.object(jobs, "analyze_entry_incremental", AsyncMock(side_effect=RuntimeError("down"))):
+            _drain(worker)
+
+        job = _get_job(queued_job)
+        assert job.status == "completed"
+        assert job.failed_items == 2
+
+    def test_cancel_stops_remaining_items(self, queued_job):
+        worker = AnalysisJobWorker(session_factory=TestingSessionLocal)
+        db = TestingSessionLocal()
+        crud.cancel_analysis_job(db, db.get(models.AnalysisJob, queued_job))
+        db.close()
+
+        assert worker.claim_next() is None
+        assert _get_job(queued_job).status == "cancelled"
+
+    def test_recover_requeues_only_expired_leases(self, queued_job):
+        worker = AnalysisJobWorker(session_factory=TestingSessionLocal, lease_seconds=60)
+        claim = worker.claim_next()
+
+        # Another live worker's item is left running
+        assert worker.recover() == 0
+
+        db = TestingSessionLocal()
+        db.get(models.AnalysisJobItem, claim["item_id"]).updated_at = datetime.utcnow() - timedelta(seconds=120)
+        db.commit()
+        db.close()
+
+        assert worker.recover() == 1
+        assert worker.claim_next()["item_id"] == claim["item_id"]
+
+    def test_worker_survives_failed_finish(self, queued_job):
+        worker = AnalysisJobWorker(session_factory=TestingSessionLocal, retry_delay=0, poll_interval=0.01)
+        real_finish = worker.finish
+        calls = []
+
+        def flaky_finish(claim, error, retryable=True):
+            calls.append(error)
+            if len(calls) == 1:
+                raise RuntimeError("database gone")
+            real_finish(claim, error, retryable)
+
+        worker.finish = flaky_finish
+
+        async def run():
+            worker._wakeup = asyncio.Event()
+            task = asyncio.create_task(worker._run(0))
+            while _get_job(queued_job).status != "completed":
+                await asyncio.sleep(0.01)
+            worker._stopping = True
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+        with patch.object(jobs, "analyze_entry_incremental", AsyncMock(return_value={"answer": "ok"})):
+            asyncio.run(asyncio.wait_for(run(), timeout=5))
+
+        job = _get_job(queued_job)
+        assert calls[:2] == [None, "database gone"]
+        assert (job.completed_items, job.failed_items) == (1, 1)
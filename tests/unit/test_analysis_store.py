@@ -0,0 +1,80 @@
+"""
+Unit Tests for persisted entry analyses
+Patches the LLM call so no AI server is needed
+"""
+
+import asyncio
+import pytest
+from unittest.mock import patch, AsyncMock
+from sqlalchemy import event
+
+from app.ai import analysis_store
+from app.ai.analysis_store import analyze_entry_incremental
+from app import models
+from tests.conftest import create_test_topic, create_test_entry
+
+
+@pytest.fixture
+def entry(db_session):
+    user = models.User(username="analysisuser", email="analysis@example.com", password_hash="x")
+    db_session.add(user)
+    db_session.commit()
+    topic = create_test_topic(db_session, user.user_id)
+    return create_test_entry(db_session, user.user_id, topic.topic_id)
+
+
+def _llm_result(answer="Looks positive"):
+    return {"think": "hmm", "answer": answer, "raw_content": answer, "analysis_type": "mood"}
+
+
+class TestAnalysisStore:
+    """Test stored analysis reuse and re-analysis on change"""
+
+    def test_unchanged_entry_served_from_store(self, db_session, entry):
+        mock_analyze = AsyncMock(return_value=_llm_result())
+        with patch.object(analysis_store, "analyze_journal_entry", mock_analyze):
+            first = asyncio.run(analyze_entry_incremental(db_session, entry, "mood", model="m"))
+            second = asyncio.run(analyze_entry_incremental(db_session, entry, "mood", model="m"))
+
+        assert mock_analyze.await_count == 1
+        assert first["cached"] is False
+        assert second["cached"] is True
+        assert second["answer"] == "Looks positive"
+
+    def test_changed_content_reanalyzed(self, db_session, entry):
+        mock_analyze = AsyncMock(side_effect=[_llm_result("old"), _llm_result("new")])
+        with patch.object(analysis_store, "analyze_journal_entry", mock_analyze):
+            asyncio.run(analyze_entry_incremental(db_session, entry, "mood", model="m"))
+            entry.content = "Completely different content"
+            db_session.commit()
+            result = asyncio.run(analyze_entry_incremental(db_session, entry, "mood", model="m"))
+
+        assert mock_analyze.await_count == 2
+        assert result["answer"] == "new"
+        assert len(entry.analyses) == 1
+
+    def test_force_and_errors(self, db_session, entry):
+        mock_analyze = AsyncMock(side_effect=[_llm_result(), {"answer": "timeout", "raw_content": "timeout", "error": True}])
+        with patch.object(analysis_store, "analyze_journal_entry", mock_analyze):
+            asyncio.run(analyze_entry_incremental(db_session, entry, "mood", model="m"))
+            failed = asyncio.run(analyze_entry_incremental(db_session, entry, "mood", model="m", force=True))
+            stored = analysis_store.get_stored_analysis(db_session, entry, "mood", model="m")
+
+        assert failed["cached"] is False
+        assert stored["answer"] == "Looks positive"
+
+    def test_entry_not_reloaded_after_storing(self, db_session, entry):
+        # The threaded commit expires the entry; reading it afterwards would refresh it on the loop
+        refreshes = []
+
+        def on_refresh(target, context, attrs):
+            refreshes.append(target)
+
+        event.listen(models.Entry, "refresh", on_refresh)
+        try:
+            with patch.object(analysis_store, "analyze_journal_entry", AsyncMock(return_value=_llm_result())):
+                asyncio.run(analyze_entry_incremental(db_session, entry, "mood", model="m"))
+        finally:
+            event.remove(models.Entry, "refresh", on_refresh)
+
+        assert refreshes == []
@@ -0,0 +1,92 @@
+"""
+Unit Tests for the async CRUD path
+"""
+
+import asyncio
+import pytest
+
+from app import crud_async, models, schemas
+from app.database import Base, get_async_database_url
+
+
+class TestAsyncDatabaseUrl:
+    """Test translation of sync URLs to async drivers"""
+
+    def test_postgres_uses_asyncpg(self):
+        url = get_async_database_url("postgresql://user:pw@localhost:5432/tcc_log")
+        assert url == "postgresql+asyncpg://user:pw@localhost:5432/tcc_log"
+
+    def test_explicit_sync_driver_replaced(self):
+        url = get_async_database_url("postgresql+psycopg2://user:pw@localhost/tcc_log")
+        assert url.startswith("postgresql+asyncpg://")
+
+    def test_sqlite_uses_aiosqlite(self):
+        assert get_async_database_url("sqlite:///./test.db") == "sqlite+aiosqlite:///./test.db"
+
+    def test_unsupported_backend_rejected(self):
+        with pytest.raises(ValueError):
+            get_async_database_url("mssql+pyodbc://user:pw@host/db")
+
+
+class TestSyncSessionFallback:
+    """crud_async functions accept a sync Session and run crud.py in the threadpool"""
+
+    def test_listing_with_sync_session(self, db_session):
+        user = models.User(username="asyncfallback", email="fallback@example.com", password_hash="x")
+        db_session.add(user)
+        db_session.commit()
+
+        async def run():
+            topic = await crud_async.create_topic(db_session, schemas.TopicCreate(topic_name="Fallback"), user.user_id)
+            for day in range(1, 4):
+                await crud_async.create_entry(db_session, schemas.EntryCreate(
+                    topic_id=topic.topic_id, title=f"Day {day}", entry_date=f"2024-03-0{day}", is_public=False
+                ), user.user_id)
+            first, cursor = await crud_async.get_entries_page(db_session, user.user_id, None, 2)
+            second, last_cursor = await crud_async.get_entries_page(db_session, user.user_id, cursor, 2)
+            return first, second, last_cursor
+
+        first, second, last_cursor = asyncio.run(run())
+        assert [entry.title for entry in first + second] == ["Day 3", "Day 2", "Day 1"]
+        assert last_cursor is None
+
+    def test_tagging_missing_entry(self, db_session):
+        tag = asyncio.run(crud_async.create_tag(db_session, schemas.TagCreate(tag_name="orphan")))
+        assert asyncio.run(crud_async.add_tag_to_entry(db_session, 999999, tag.tag_id)) is None
+
+
+class TestAsyncSession:
+    """Run the async implementations against an AsyncSession"""
+
+    def test_crud_round_trip(self, tmp_path):
+        pytest.importorskip("aiosqlite")
+        from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+        async def run():
+            engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'async.db'}")
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+            session_factory = async_sessionmaker(bind=engine, expire_on_commit=False)
+            try:
+                async with session_factory() as db:
+                    user = models.User(username="asyncuser", email="async@example.com", password_hash="x")
+                    db.add(user)
+                    await db.commit()
+                    topic = await crud_async.create_topic(db, schemas.TopicCreate(topic_name="Async"), user.user_id)
+                    entry = await crud_async.create_entry(db, schemas.EntryCreate(
+                        topic_id=topic.topic_id, title="Async entry", entry_date="2024-03-01", is_public=False
+                    ), user.user_id)
+                    tag = await crud_async.create_tag(db, schemas.TagCreate(tag_name="async"))
+                    tagged = await crud_async.add_tag_to_entry(db, entry.entry_id, tag.tag_id)
+                    assert await crud_async.add_tag_to_entry(db, entry.entry_id + 1, tag.tag_id) is None
+                    page, next_cursor = await crud_async.get_entries_page(db, user.user_id, None, 10)
+                    by_topic = await crud_async.get_entries_by_topic(db, topic.topic_id, user.user_id)
+                    return tagged, page, next_cursor, by_topic
+            finally:
+                await engine.dispose()
+
+        tagged, page, next_cursor, by_topic = asyncio.run(run())
+        assert [tag.tag_name for tag in tagged.tags] == ["async"]
+        assert [entry.title for entry in page] == ["Async entry"]
+        assert next_cursor is None
+        assert len(by_topic) == 1
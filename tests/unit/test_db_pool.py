@@ -0,0 +1,80 @@
+"""
+Unit Tests for engine pool configuration and telemetry
+"""
+
+import pytest
+from sqlalchemy import create_engine, exc, text
+from fastapi.testclient import TestClient
+
+from app import database, models
+from app.api.auth import get_current_active_user
+from app.database import TimedQueuePool, PoolMetrics, _pool_options, _pool_stats
+from app.main import app
+
+
+class TestPoolOptions:
+    """Test pool settings applied by the engine factory"""
+
+    def test_postgres_gets_tuned_pool(self):
+        options = _pool_options("postgresql://user:pw@localhost/tcc_log", TimedQueuePool)
+        assert options["poolclass"] is TimedQueuePool
+        assert options["pool_size"] == database.DB_POOL_SIZE
+        assert options["max_overflow"] == database.DB_MAX_OVERFLOW
+        assert options["pool_pre_ping"] == database.DB_POOL_PRE_PING
+
+    def test_sqlite_keeps_default_pool(self):
+        assert _pool_options("sqlite:///./test.db", TimedQueuePool) == {}
+
+
+class TestPoolMetrics:
+    """Test checkout wait-time tracking"""
+
+    def test_wait_statistics(self):
+        metrics = PoolMetrics()
+        metrics.record_wait(0.010)
+        metrics.record_wait(0.030)
+        stats = metrics.get_stats()
+        assert stats["checkouts"] == 2
+        assert stats["wait_time_avg_ms"] == pytest.approx(20.0)
+        assert stats["wait_time_max_ms"] == pytest.approx(30.0)
+
+    def test_timed_pool_records_checkouts_and_timeouts(self, tmp_path):
+        engine = create_engine(
+            f"sqlite:///{tmp_path / 'pool.db'}",
+            poolclass=TimedQueuePool,
+            pool_size=1,
+            max_overflow=0,
+            pool_timeout=0.05
+        )
+        try:
+            with engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+                stats = _pool_stats(engine.pool)
+                assert stats["checked_out"] == 1
+                with pytest.raises(exc.TimeoutError):
+                    engine.connect()
+
+            stats = _pool_stats(engine.pool)
+            assert stats["checked_out"] == 0
+            assert stats["checkouts"] == 1
+            assert stats["timeouts"] == 1
+        finally:
+            engine.dispose()
+
+
+class TestMetricsEndpoint:
+    """Test the /metrics endpoint"""
+
+    def test_requires_authentication(self):
+        assert TestClient(app).get("/metrics").status_code == 401
+
+    def test_reports_primary_pool(self):
+        app.dependency_overrides[get_current_active_user] = lambda: models.User(user_id=1, username="metrics")
+        try:
+            response = TestClient(app).get("/metrics")
+        finally:
+            del app.dependency_overrides[get_current_active_user]
+        assert response.status_code == 200
+        data = response.json()["database"]
+        assert "pid" in data
+        assert "pool_class" in data["primary"]
@@ -0,0 +1,111 @@
+"""
+Unit Tests for include= eager loading on entry listings
+"""
+
+import pytest
+from contextlib import contextmanager
+from datetime import date, timedelta
+from sqlalchemy import event
+
+from app import models
+from app.api.auth import get_current_active_user
+from app.database import get_db
+from app.main import app
+from tests.conftest import TestingSessionLocal, override_get_db, test_engine
+
+
+@contextmanager
+def count_queries():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(test_engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(test_engine, "before_cursor_execute", before_cursor_execute)
+
+
+@pytest.fixture
+def journal_with_relations():
+    # Committed outside db_session: each API request's session would roll back the shared connection
+    db = TestingSessionLocal()
+    user = models.User(username="eageruser", email="eager@example.com", password_hash="x")
+    tag = models.Tag(tag_name="eager-tag")
+    db.add_all([user, tag])
+    db.commit()
+    topic = models.Topic(user_id=user.user_id, topic_name="Eager")
+    db.add(topic)
+    db.commit()
+    for i in range(6):
+        entry = models.Entry(
+            user_id=user.user_id,
+            topic_id=topic.topic_id,
+            title=f"Entry {i}",
+            entry_date=date(2024, 1, 1) + timedelta(days=i)
+        )
+        entry.tags.append(tag)
+        entry.files.append(models.File(file_name=f"f{i}.png", file_path=f"f{i}.png"))
+        entry.links.append(models.Link(url=f"https://example.com/{i}"))
+        db.add(entry)
+    db.commit()
+    # Load the user now so the counted requests do not refresh it
+    db.refresh(user)
+    app.dependency_overrides[get_current_active_user] = lambda: user
+    # Importing tests/config/test_config.py points get_db at another database
+    previous_get_db = app.dependency_overrides.get(get_db)
+    app.dependency_overrides[get_db] = override_get_db
+
+    yield user, topic
+
+    del app.dependency_overrides[get_current_active_user]
+    if previous_get_db is None:
+        app.dependency_overrides.pop(get_db, None)
+    else:
+        app.dependency_overrides[get_db] = previous_get_db
+    entry_ids = [entry_id for (entry_id,) in db.query(models.Entry.entry_id).filter(models.Entry.user_id == user.user_id)]
+    db.execute(models.entry_tags.delete().where(models.entry_tags.c.entry_id.in_(entry_ids)))
+    db.query(models.File).filter(models.File.entry_id.in_(entry_ids)).delete()
+    db.query(models.Link).filter(models.Link.entry_id.in_(entry_ids)).delete()
+    db.query(models.Entry).filter(models.Entry.user_id == user.user_id).delete()
+    db.delete(topic)
+    db.delete(tag)
+    db.delete(user)
+    db.commit()
+    db.close()
+
+
+class TestEntryIncludes:
+    """Test include= on /entries and /topics/{id}/entries"""
+
+    def test_default_response_has_no_relations(self, journal_with_relations, test_client):
+        response = test_client.get("/entries/?limit=3")
+        assert response.status_code == 200
+        assert "tags" not in response.json()[0]
+
+    def test_included_relations_are_serialized(self, journal_with_relations, test_client):
+        _, topic = journal_with_relations
+        response = test_client.get(f"/topics/{topic.topic_id}/entries?include=tags,links,topic")
+        assert response.status_code == 200
+        entry = response.json()[0]
+        assert [tag["tag_name"] for tag in entry["tags"]] == ["eager-tag"]
+        assert len(entry["links"]) == 1
+        assert entry["topic"]["topic_name"] == "Eager"
+        assert "files" not in entry
+
+    def test_unknown_include_rejected(self, journal_with_relations, test_client):
+        assert test_client.get("/entries/?include=comments").status_code == 400
+
+    def test_query_count_does_not_grow_with_rows(self, journal_with_relations, test_client):
+        include = "tags,files,links,topic"
+        with count_queries() as few:
+            small = test_client.get(f"/entries/?limit=2&include={include}")
+        with count_queries() as many:
+            large = test_client.get(f"/entries/?cursor=&limit=6&include={include}")
+
+        assert len(small.json()) == 2
+        assert len(large.json()["items"]) == 6
+        # One query for the entries plus one per included relation
+        assert len(few) == len(many) == 5
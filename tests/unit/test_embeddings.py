@@ -0,0 +1,169 @@
+"""
+Unit Tests for entry embeddings, similar entries and semantic search
+"""
+
+import asyncio
+import json
+import pytest
+import httpx
+from datetime import date
+
+from app import crud, models
+from app.ai import embeddings
+from app.api.auth import get_current_active_user
+from app.main import app
+from tests.conftest import TestingSessionLocal
+
+
+@pytest.fixture
+def hashing_provider(monkeypatch):
+    monkeypatch.setattr(embeddings, "EMBEDDING_PROVIDER", "hashing")
+    monkeypatch.setattr(embeddings, "SessionLocal", TestingSessionLocal)
+
+
+@pytest.fixture
+def embedded_journal(hashing_provider):
+    # Committed outside db_session: each API request's session would roll back the shared connection
+    db = TestingSessionLocal()
+    user = models.User(username="embeduser", email="embed@example.com", password_hash="x")
+    other = models.User(username="embedother", email="embedother@example.com", password_hash="x")
+    db.add_all([user, other])
+    db.commit()
+    topic = models.Topic(user_id=user.user_id, topic_name="Embed")
+    other_topic = models.Topic(user_id=other.user_id, topic_name="Other")
+    db.add_all([topic, other_topic])
+    db.commit()
+    rows = [
+        (user, topic, "Python decorators", "closures and decorators in python code"),
+        (user, topic, "Python asyncio", "event loops and python coroutines code"),
+        (user, topic, "Gardening", "planted tomatoes and basil in the garden"),
+        (user, topic, "Garden update", "the tomatoes in the garden are growing"),
+        (other, other_topic, "Someone else's garden", "tomatoes in the garden"),
+    ]
+    entries = []
+    for owner, owner_topic, title, content in rows:
+        entry = models.Entry(
+            user_id=owner.user_id, topic_id=owner_topic.topic_id,
+            title=title, content=content, entry_date=date(2024, 1, 1)
+        )
+        db.add(entry)
+        db.commit()
+        entries.append(entry)
+    entry_ids = [entry.entry_id for entry in entries]
+    asyncio.run(embeddings.refresh_entry_embeddings(entry_ids))
+    db.refresh(user)
+    app.dependency_overrides[get_current_active_user] = lambda: user
+
+    yield user, entries
+
+    del app.dependency_overrides[get_current_active_user]
+    db.query(models.EntryEmbedding).filter(models.EntryEmbedding.entry_id.in_(entry_ids)).delete()
+    db.query(models.Entry).filter(models.Entry.entry_id.in_(entry_ids)).delete()
+    db.query(models.Topic).filter(models.Topic.topic_id.in_([topic.topic_id, other_topic.topic_id])).delete()
+    db.query(models.User).filter(models.User.user_id.in_([user.user_id, other.user_id])).delete()
+    db.commit()
+    db.close()
+
+
+def mock_lm_studio(monkeypatch, handler):
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(embeddings, "get_async_http_client", lambda: client)
+    monkeypatch.setattr(embeddings, "EMBEDDING_PROVIDER", "lm_studio")
+
+
+class TestHashingEmbedding:
+    """Test the local hashing embedding model"""
+
+    def test_deterministic_and_normalized(self):
+        first = embeddings.hashing_embedding("Morning run by the river")
+        assert first == embeddings.hashing_embedding("Morning run by the river")
+        assert len(first) == embeddings.EMBEDDING_DIMENSIONS
+        assert sum(x * x for x in first) == pytest.approx(1.0)
+
+    def test_related_texts_are_closer(self):
+        base = embeddings.hashing_embedding("tomatoes in the garden")
+        related = embeddings.hashing_embedding("the garden tomatoes are growing")
+        unrelated = embeddings.hashing_embedding("python event loops")
+        assert crud._cosine_similarity(base, related) > crud._cosine_similarity(base, unrelated)
+
+    def test_text_without_words_is_zero(self):
+        assert not any(embeddings.hashing_embedding("?!"))
+
+
+class TestLMStudioEmbeddings:
+    """Test batched calls to the /embeddings endpoint"""
+
+    def test_batches_and_orders_by_index(self, monkeypatch):
+        requests = []
+
+        def handler(request):
+            texts = json.loads(request.content)["input"]
+            requests.append(texts)
+            data = [
+                {"index": i, "embedding": [float(len(text))] + [0.0] * (embeddings.EMBEDDING_DIMENSIONS - 1)}
+                for i, text in enumerate(texts)
+            ]
+            return httpx.Response(200, json={"data": list(reversed(data))})
+
+        mock_lm_studio(monkeypatch, handler)
+        monkeypatch.setattr(embeddings, "EMBEDDING_BATCH_SIZE", 2)
+        vectors = asyncio.run(embeddings.embed_texts(["a", "bb", "ccc", "dddd", "eeeee"]))
+
+        assert requests == [["a", "bb"], ["ccc", "dddd"], ["eeeee"]]
+        assert len(vectors) == 5
+        assert all(vector[0] == pytest.approx(1.0) for vector in vectors)
+
+    def test_dimension_mismatch_raises(self, monkeypatch):
+        mock_lm_studio(monkeypatch, lambda request: httpx.Response(200, json={"data": [{"index": 0, "embedding": [1.0, 0.0]}]}))
+        with pytest.raises(ValueError):
+            asyncio.run(embeddings.embed_texts(["text"]))
+
+
+class TestRefreshEntryEmbeddings:
+    """Test incremental embedding of entries"""
+
+    def test_unchanged_entries_are_skipped(self, embedded_journal):
+        _, entries = embedded_journal
+        entry_ids = [entry.entry_id for entry in entries]
+        assert asyncio.run(embeddings.refresh_entry_embeddings(entry_ids)) == {"embedded": 0, "skipped": 5, "failed": 0}
+
+        db = TestingSessionLocal()
+        db.get(models.Entry, entry_ids[0]).content = "rewritten"
+        db.commit()
+        db.close()
+        result = asyncio.run(embeddings.refresh_entry_embeddings(entry_ids))
+        assert result == {"embedded": 1, "skipped": 4, "failed": 0}
+
+    def test_provider_failure_is_counted(self, embedded_journal, monkeypatch):
+        _, entries = embedded_journal
+        mock_lm_studio(monkeypatch, lambda request: httpx.Response(500))
+        result = asyncio.run(embeddings.refresh_entry_embeddings([entries[0].entry_id], force=True))
+        assert result == {"embedded": 0, "skipped": 0, "failed": 1}
+
+
+class TestSimilarEntries:
+    """Test /entries/{id}/similar and /entries/search/semantic"""
+
+    def test_similar_entries(self, embedded_journal, test_client):
+        _, entries = embedded_journal
+        response = test_client.get(f"/entries/{entries[2].entry_id}/similar?limit=2")
+        assert response.status_code == 200
+        results = response.json()
+        assert [item["title"] for item in results][0] == "Garden update"
+        assert len(results) == 2
+        assert results[0]["similarity"] >= results[1]["similarity"]
+
+    def test_similar_entries_of_another_user(self, embedded_journal, test_client):
+        _, entries = embedded_journal
+        assert test_client.get(f"/entries/{entries[4].entry_id}/similar").status_code == 404
+
+    def test_semantic_search(self, embedded_journal, test_client):
+        response = test_client.get("/entries/search/semantic?q=python code")
+        assert response.status_code == 200
+        titles = [item["title"] for item in response.json()]
+        assert titles[:2] == ["Python decorators", "Python asyncio"]
+        assert "Someone else's garden" not in titles
+
+    def test_embedding_status(self, embedded_journal, test_client):
+        status = test_client.get("/ai/embeddings/status").json()
+        assert status["total_entries"] == status["embedded_entries"] == 4
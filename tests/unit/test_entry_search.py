@@ -0,0 +1,94 @@
+"""
+Unit Tests for /entries/search
+"""
+
+import pytest
+from datetime import date
+
+from app import models
+from app.api.auth import get_current_active_user
+from app.main import app
+from tests.conftest import TestingSessionLocal
+
+
+@pytest.fixture
+def searchable_journal():
+    # Committed outside db_session: each API request's session would roll back the shared connection
+    db = TestingSessionLocal()
+    user = models.User(username="searchuser", email="search@example.com", password_hash="x")
+    tag = models.Tag(tag_name="search-tag")
+    db.add_all([user, tag])
+    db.commit()
+    topic = models.Topic(user_id=user.user_id, topic_name="Search")
+    db.add(topic)
+    db.commit()
+    rows = [
+        ("Learning Python decorators", "Closures in Python", "happy", date(2024, 1, 1)),
+        ("Python asyncio", "Event loops and tasks", "tired", date(2024, 2, 1)),
+        ("Rust ownership", "Borrowing rules", "happy", date(2024, 3, 1)),
+        ("Python 100% coverage", "Testing everything", "happy", date(2024, 4, 1)),
+    ]
+    for title, content, mood, entry_date in rows:
+        entry = models.Entry(
+            user_id=user.user_id, topic_id=topic.topic_id, title=title,
+            content=content, mood=mood, entry_date=entry_date
+        )
+        if mood == "tired":
+            entry.tags.append(tag)
+        db.add(entry)
+    db.commit()
+    db.refresh(user)
+    app.dependency_overrides[get_current_active_user] = lambda: user
+
+    yield user, topic
+
+    del app.dependency_overrides[get_current_active_user]
+    entry_ids = [entry_id for (entry_id,) in db.query(models.Entry.entry_id).filter(models.Entry.user_id == user.user_id)]
+    db.execute(models.entry_tags.delete().where(models.entry_tags.c.entry_id.in_(entry_ids)))
+    db.query(models.Entry).filter(models.Entry.user_id == user.user_id).delete()
+    db.delete(topic)
+    db.delete(tag)
+    db.delete(user)
+    db.commit()
+    db.close()
+
+
+def titles(response):
+    return sorted(item["title"] for item in response.json()["items"])
+
+
+class TestEntrySearch:
+    """Test GET /entries/search (substring fallback outside Postgres)"""
+
+    def test_matches_title_and_content(self, searchable_journal, test_client):
+        response = test_client.get("/entries/search?q=python")
+        assert response.status_code == 200
+        assert titles(response) == ["Learning Python decorators", "Python 100% coverage", "Python asyncio"]
+        assert {"rank", "headline"} <= set(response.json()["items"][0])
+
+    def test_like_wildcards_are_literal(self, searchable_journal, test_client):
+        assert titles(test_client.get("/entries/search?q=100%25")) == ["Python 100% coverage"]
+        assert titles(test_client.get("/entries/search?q=_")) == []
+
+    def test_filters(self, searchable_journal, test_client):
+        assert titles(test_client.get("/entries/search?q=python&mood=happy")) == [
+            "Learning Python decorators", "Python 100% coverage"
+        ]
+        assert titles(test_client.get("/entries/search?q=python&tag=search-tag")) == ["Python asyncio"]
+        assert titles(test_client.get(
+            "/entries/search?q=python&date_from=2024-01-15&date_to=2024-03-15"
+        )) == ["Python asyncio"]
+
+    def test_keyset_pages_cover_all_matches_once(self, searchable_journal, test_client):
+        seen = []
+        cursor = ""
+        while cursor is not None:
+            response = test_client.get(f"/entries/search?q=python&limit=1&cursor={cursor}")
+            assert response.status_code == 200
+            seen += [item["entry_id"] for item in response.json()["items"]]
+            cursor = response.json()["next_cursor"]
+        assert len(seen) == len(set(seen)) == 3
+
+    def test_invalid_cursor_and_missing_query(self, searchable_journal, test_client):
+        assert test_client.get("/entries/search?q=python&cursor=garbage").status_code == 400
+        assert test_client.get("/entries/search").status_code == 422
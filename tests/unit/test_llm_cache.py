@@ -0,0 +1,50 @@
+"""
+Unit Tests for the keyed ChatOpenAI instance cache
+"""
+
+import pytest
+
+from app.ai import lm_studio
+
+
+@pytest.fixture(autouse=True)
+def empty_cache(monkeypatch):
+    monkeypatch.setattr(lm_studio, "LM_LLM_CACHE_SIZE", 2)
+    lm_studio.clear_llm_cache()
+    for key in lm_studio._llm_stats:
+        monkeypatch.setitem(lm_studio._llm_stats, key, 0)
+    yield
+    lm_studio.clear_llm_cache()
+
+
+class TestLLMCache:
+    """Test parameter-keyed reuse and eviction"""
+
+    def test_mixed_parameters_do_not_rebuild(self):
+        analysis = lm_studio.get_chatopen_ai_instance("m", 0.7, 800)
+        writing = lm_studio.get_chatopen_ai_instance("m", 0.3, 1500)
+
+        assert lm_studio.get_chatopen_ai_instance("m", 0.7, 800) is analysis
+        assert lm_studio.get_chatopen_ai_instance("m", 0.3, 1500) is writing
+        stats = lm_studio.get_llm_cache_stats()
+        assert stats["builds"] == 2
+        assert stats["hits"] == 2
+
+    def test_instances_share_http_client(self):
+        first = lm_studio.get_chatopen_ai_instance("m", 0.7, 800)
+        second = lm_studio.get_chatopen_ai_instance("m", 0.3, 1500)
+
+        assert first.http_async_client is second.http_async_client
+
+    def test_lru_eviction(self):
+        lm_studio.get_chatopen_ai_instance("a", 0.1, 100)
+        lm_studio.get_chatopen_ai_instance("b", 0.1, 100)
+        lm_studio.get_chatopen_ai_instance("a", 0.1, 100)
+        lm_studio.get_chatopen_ai_instance("c", 0.1, 100)
+
+        stats = lm_studio.get_llm_cache_stats()
+        assert stats["evictions"] == 1
+        assert stats["size"] == 2
+        # "b" was least recently used
+        lm_studio.get_chatopen_ai_instance("a", 0.1, 100)
+        assert lm_studio.get_llm_cache_stats()["builds"] == 3
@@ -0,0 +1,110 @@
+"""
+Unit Tests for keyset (cursor) pagination
+"""
+
+import pytest
+from datetime import date, timedelta
+
+from app import crud, models
+from app.api.auth import get_current_active_user
+from app.main import app
+from app.pagination import encode_cursor, decode_cursor
+from tests.conftest import TestingSessionLocal
+
+
+@pytest.fixture
+def journal():
+    # Committed outside db_session: each API request's session would roll back the shared connection
+    db = TestingSessionLocal()
+    user = models.User(username="pageuser", email="page@example.com", password_hash="x")
+    db.add(user)
+    db.commit()
+    topic = models.Topic(user_id=user.user_id, topic_name="Paging")
+    db.add(topic)
+    db.commit()
+    # Several entries share a date so the entry_id tiebreaker matters
+    for i in range(7):
+        db.add(models.Entry(
+            user_id=user.user_id,
+            topic_id=topic.topic_id,
+            title=f"Entry {i}",
+            entry_date=date(2024, 1, 1) + timedelta(days=i // 3)
+        ))
+    db.commit()
+
+    yield user, topic
+
+    db.query(models.Entry).filter(models.Entry.user_id == user.user_id).delete()
+    db.delete(topic)
+    db.delete(user)
+    db.commit()
+    db.close()
+
+
+class TestCursor:
+    """Test cursor encoding"""
+
+    def test_round_trip(self):
+        values = [date(2024, 5, 1), 42]
+        assert decode_cursor(encode_cursor(values), crud.ENTRY_ORDER) == values
+
+    def test_malformed_cursor_rejected(self):
+        with pytest.raises(ValueError):
+            decode_cursor("not-a-cursor", crud.ENTRY_ORDER)
+
+    def test_values_checked_against_order_columns(self):
+        _, order = crud.build_entry_search("sqlite", 1, "walk")
+        assert decode_cursor(encode_cursor([3, 7]), order) == [3, 7]
+        with pytest.raises(ValueError):
+            decode_cursor(encode_cursor(["0.5", 7]), order)
+        with pytest.raises(ValueError):
+            decode_cursor(encode_cursor([date(2024, 5, 1), "42"]), crud.ENTRY_ORDER)
+        with pytest.raises(ValueError):
+            decode_cursor(encode_cursor([date(2024, 5, 1), 42]), crud.TOPIC_ORDER)
+
+
+class TestKeysetPagination:
+    """Test page traversal over entries"""
+
+    def test_pages_cover_all_rows_once(self, db_session, journal):
+        user, _ = journal
+        seen = []
+        cursor = None
+        while True:
+            items, cursor = crud.get_entries_page(db_session, user.user_id, cursor, limit=3)
+            seen.extend(items)
+            if cursor is None:
+                break
+
+        assert len(seen) == 7
+        assert len({entry.entry_id for entry in seen}) == 7
+        assert seen == crud.get_entries(db_session, user.user_id, limit=100)
+
+    def test_endpoint_page_and_header(self, journal, test_client):
+        user, _ = journal
+        app.dependency_overrides[get_current_active_user] = lambda: user
+        try:
+            first = test_client.get("/entries/?cursor=&limit=5")
+            data = first.json()
+            second = test_client.get(f"/entries/?cursor={data['next_cursor']}&limit=5")
+            legacy = test_client.get("/entries/?limit=5")
+        finally:
+            del app.dependency_overrides[get_current_active_user]
+
+        assert first.status_code == 200
+        assert len(data["items"]) == 5
+        assert first.headers["X-Next-Cursor"] == data["next_cursor"]
+        assert len(second.json()["items"]) == 2
+        assert second.json()["next_cursor"] is None
+        assert isinstance(legacy.json(), list)
+        assert legacy.headers["X-Next-Cursor"] == data["next_cursor"]
+
+    def test_tampered_cursor_is_bad_request(self, journal, test_client):
+        user, _ = journal
+        app.dependency_overrides[get_current_active_user] = lambda: user
+        try:
+            response = test_client.get(f"/entries/?cursor={encode_cursor(['yesterday', 1])}")
+        finally:
+            del app.dependency_overrides[get_current_active_user]
+
+        assert response.status_code == 400
@@ -0,0 +1,72 @@
+"""
+Unit Tests for token-budgeted prompt assembly
+"""
+
+import asyncio
+import pytest
+
+from app.ai import lm_studio, prompt_budget
+
+
+@pytest.fixture(autouse=True)
+def word_tokenizer(monkeypatch):
+    # One token per whitespace-separated word keeps the budgets below easy to reason about
+    monkeypatch.setattr(prompt_budget, "_tokenizer", lambda text: len(text.split()))
+    monkeypatch.setattr(prompt_budget, "_tokenizer_name", "words")
+
+
+def message(role, words):
+    return {"role": role, "content": " ".join([role] * words)}
+
+
+class TestHistoryBudget:
+    """Test history trimming against the context window"""
+
+    def test_history_is_trimmed_oldest_first(self):
+        history = [message("user", 50), message("assistant", 50), message("user", 10), message("assistant", 10)]
+        kept, report = prompt_budget.budget_chat_messages(
+            "system " * 20, history, "hello", completion_tokens=40, context_window=120
+        )
+        assert kept == history[2:]
+        assert report["dropped_history"] == 2
+        assert report["sections"] == {"system": 24, "message": 5, "history": 28}
+        assert report["prompt_tokens"] == 24 + 5 + 28 + prompt_budget.REPLY_PRIMING_TOKENS
+        assert report["tokenizer"] == "words"
+
+    def test_history_that_fits_is_kept(self):
+        history = [message("user", 5), message("assistant", 5)]
+        kept, report = prompt_budget.budget_chat_messages("system", history, "hi", 100, context_window=4096)
+        assert kept == history and report["dropped_history"] == 0
+
+    def test_create_ai_request_applies_budget(self, monkeypatch):
+        monkeypatch.setattr(prompt_budget, "PROMPT_CONTEXT_WINDOW", 100)
+        history = [message("user", 60), message("assistant", 5)]
+        request = asyncio.run(lm_studio.create_ai_request("question", "system", max_tokens=50, history=history))
+        assert [msg.role for msg in request.messages] == ["system", "assistant", "user"]
+        assert request.budget["dropped_history"] == 1
+        assert request.budget["prompt_tokens"] == prompt_budget.count_message_tokens(
+            [msg.dict() for msg in request.messages]
+        )
+
+
+class TestTruncation:
+    """Test cutting text to a token budget"""
+
+    def test_truncate_to_tokens(self):
+        text = "\n".join(f"example {i} line" for i in range(100))
+        truncated = prompt_budget.truncate_to_tokens(text, 30)
+        assert prompt_budget.count_tokens(truncated) <= 30
+        assert truncated.startswith("example 0 line") and truncated.endswith("…")
+        assert prompt_budget.truncate_to_tokens("short text", 30) == "short text"
+
+
+class TestTokenizer:
+    """Test tokenizer loading"""
+
+    def test_unavailable_tokenizer_falls_back_to_estimate(self, monkeypatch):
+        monkeypatch.setattr(prompt_budget, "_tokenizer", None)
+        monkeypatch.setattr(prompt_budget, "_tokenizer_name", None)
+        monkeypatch.setattr(prompt_budget, "PROMPT_TOKENIZER", "no-such-encoding")
+        assert prompt_budget.count_tokens("one two three, four") >= 5
+        assert prompt_budget.get_tokenizer_name() == "estimate"
+        assert prompt_budget.count_tokens("") == 0
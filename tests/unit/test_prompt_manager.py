@@ -0,0 +1,103 @@
+"""
+Unit Tests for compiled prompt templates and hot reload
+"""
+
+import hashlib
+import json
+import os
+import pytest
+
+from app.ai import prompt_manager
+from app.ai.prompt_manager import PromptManager
+
+
+PROMPTS = {
+    "system_prompts": {
+        "default_chat": "Be helpful.",
+        "sql_agent": {
+            "intro": "Schema:\n{schema_text}\n",
+            "workflow": "Workflow.\n",
+            "examples": [{"title": "Count", "query_intent": "count", "sql": "SELECT 1;"}],
+            "remember": ["Use LIMIT"]
+        },
+        "analysis_prompts": {"general": "Analyze.", "mood": "Read the mood."}
+    },
+    "dummy_schema": {"description": "No tables."}
+}
+
+
+def write_prompts(path, prompts, mtime_offset=0):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(prompts, f)
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime, stat.st_mtime + mtime_offset))
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    monkeypatch.setattr(prompt_manager, "PROMPTS_RELOAD_INTERVAL", 0)
+    monkeypatch.setattr(prompt_manager, "PROMPTS_HOT_RELOAD", True)
+    path = tmp_path / "prompts.json"
+    write_prompts(path, PROMPTS)
+    return PromptManager(str(path))
+
+
+class TestCompiledPrompts:
+    """Test precompiled sections and memoized rendering"""
+
+    def test_sql_prompt_is_rendered_from_compiled_sections(self, manager):
+        prompt = manager.get_sql_prompt("Table: entries {x}")
+        assert prompt.startswith("Schema:\nTable: entries {{x}}\nWorkflow.\n")
+        assert "**Example 1 - Count:**" in prompt and "SELECT 1;" in prompt
+        assert prompt.endswith("\n### REMEMBER:\n- Use LIMIT\n")
+        assert manager.get_sql_prompt("").startswith("Schema:\nNo tables.")
+
+    def test_rendering_is_memoized_per_schema(self, manager):
+        first = manager.get_sql_prompt("Table: entries")
+        assert manager.get_sql_prompt("Table: entries") is first
+        manager.get_sql_prompt("Table: tags")
+        stats = manager.get_stats()
+        assert stats["render_hits"] == 1 and stats["render_misses"] == 2 and stats["rendered"] == 2
+
+    def test_analysis_versions_fingerprint_the_prompt_text(self, manager):
+        assert manager.get_prompt_version("analysis:mood") == hashlib.sha256(b"Read the mood.").hexdigest()[:16]
+        # Unknown types fall back to the general prompt, like get_analysis_prompt
+        assert manager.get_prompt_version("analysis:nope") == manager.get_prompt_version("analysis:general")
+
+
+class TestHotReload:
+    """Test reloading on prompts.json changes"""
+
+    def test_edit_is_picked_up_and_versions_change(self, manager):
+        version = manager.get_version()
+        sql_version = manager.get_prompt_version("sql_agent")
+        chat_version = manager.get_prompt_version("default_chat")
+        manager.get_sql_prompt("Table: entries")
+
+        edited = json.loads(json.dumps(PROMPTS))
+        edited["system_prompts"]["sql_agent"]["workflow"] = "New workflow.\n"
+        write_prompts(manager.prompts_file, edited, mtime_offset=5)
+
+        assert "New workflow." in manager.get_sql_prompt("Table: entries")
+        assert manager.get_version() != version
+        assert manager.get_prompt_version("sql_agent") != sql_version
+        assert manager.get_prompt_version("default_chat") == chat_version
+        assert manager.get_stats()["reloads"] == 1
+
+    def test_invalid_file_keeps_last_good_prompts(self, manager):
+        version = manager.get_version()
+        with open(manager.prompts_file, "w", encoding="utf-8") as f:
+            f.write("{ not json")
+        stat = os.stat(manager.prompts_file)
+        os.utime(manager.prompts_file, (stat.st_atime, stat.st_mtime + 5))
+
+        snapshot = manager._compiled
+        assert manager.get_system_prompt() == "Be helpful."
+        assert manager.get_version() == version
+        assert manager._compiled is snapshot
+
+    def test_update_prompt_saves_and_swaps(self, manager):
+        assert manager.update_prompt("system_prompts", "default_chat", "Be brief.")
+        assert manager.get_system_prompt() == "Be brief."
+        assert json.loads(open(manager.prompts_file, encoding="utf-8").read())["system_prompts"]["default_chat"] == "Be brief."
+        assert not os.path.exists(f"{manager.prompts_file}.tmp")
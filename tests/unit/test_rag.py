@@ -0,0 +1,138 @@
+"""
+Unit Tests for retrieval-augmented chat
+"""
+
+import asyncio
+import json
+import pytest
+from datetime import date
+
+from app import models
+from app.ai import embeddings, lm_studio, rag
+from app.ai.stream_events import Token
+from app.api.auth import get_current_active_user
+from app.main import app
+from tests.conftest import TestingSessionLocal
+
+
+@pytest.fixture
+def journal(monkeypatch):
+    monkeypatch.setattr(embeddings, "EMBEDDING_PROVIDER", "hashing")
+    monkeypatch.setattr(embeddings, "SessionLocal", TestingSessionLocal)
+    monkeypatch.setattr(rag, "ReadSessionLocal", TestingSessionLocal)
+    # Committed outside db_session: each API request's session would roll back the shared connection
+    db = TestingSessionLocal()
+    user = models.User(username="raguser", email="rag@example.com", password_hash="x")
+    db.add(user)
+    db.commit()
+    topic = models.Topic(user_id=user.user_id, topic_name="RAG")
+    db.add(topic)
+    db.commit()
+    rows = [
+        ("Garden", "planted tomatoes and basil in the garden", date(2024, 4, 1)),
+        ("Garden update", "the tomatoes in the garden are growing tall", date(2024, 5, 1)),
+        ("Python", "event loops and python coroutines", date(2024, 6, 1)),
+    ]
+    entries = []
+    for title, content, entry_date in rows:
+        entry = models.Entry(user_id=user.user_id, topic_id=topic.topic_id, title=title, content=content, entry_date=entry_date)
+        db.add(entry)
+        db.commit()
+        entries.append(entry)
+    entry_ids = [entry.entry_id for entry in entries]
+    asyncio.run(embeddings.refresh_entry_embeddings(entry_ids))
+    db.refresh(user)
+    app.dependency_overrides[get_current_active_user] = lambda: user
+
+    yield user, entries
+
+    del app.dependency_overrides[get_current_active_user]
+    db.query(models.EntryEmbedding).filter(models.EntryEmbedding.entry_id.in_(entry_ids)).delete()
+    db.query(models.Entry).filter(models.Entry.entry_id.in_(entry_ids)).delete()
+    db.delete(topic)
+    db.delete(user)
+    db.commit()
+    db.close()
+
+
+def source(entry_id, content="text"):
+    return {"entry_id": entry_id, "title": f"Entry {entry_id}", "entry_date": "2024-01-01", "mood": None, "content": content}
+
+
+class TestRagHelpers:
+    """Test query building, fusion, packing and citation parsing"""
+
+    def test_keyword_query_drops_stopwords(self):
+        assert rag.keyword_query("What did I write about my garden tomatoes?") == "garden or tomatoes"
+
+    def test_fusion_rewards_entries_found_by_both_retrievers(self):
+        fused = rag.fuse_rankings([[source(1), source(2)], [source(3), source(2)]], limit=3)
+        assert [item["entry_id"] for item in fused] == [2, 1, 3]
+
+    def test_pack_context_respects_budget(self):
+        sources = [source(1, "a" * 400), source(2, "b" * 4000), source(3, "c" * 40)]
+        context, included = rag.pack_context(sources, budget_tokens=200, entry_max_tokens=1000)
+        assert [item["entry_id"] for item in included] == [1, 3]
+        assert "[entry 1]" in context and "[entry 2]" not in context
+        assert rag.count_tokens(context) <= 200
+
+    def test_long_entries_are_truncated(self):
+        block = rag.format_entry(source(1, "word " * 1000), max_tokens=50)
+        assert len(block) < 300
+
+    def test_extract_citations_ignores_unknown_ids(self):
+        answer = "You planted tomatoes [entry 1], see also [Entry #3] and [entry 99]. [entry 1]"
+        assert rag.extract_citations(answer, [source(1), source(3)]) == [1, 3]
+
+
+class TestRetrieval:
+    """Test retrieval of the user's entries"""
+
+    def test_vector_retrieval_finds_relevant_entries(self, journal):
+        user, entries = journal
+        results = asyncio.run(rag.retrieve_entries(user.user_id, "tomatoes in my garden", top_k=2, retrieval="vector"))
+        assert {item["entry_id"] for item in results} == {entries[0].entry_id, entries[1].entry_id}
+
+    def test_hybrid_retrieval_merges_fulltext(self, journal):
+        user, entries = journal
+        results = asyncio.run(rag.retrieve_entries(user.user_id, "coroutines", top_k=3, retrieval="hybrid"))
+        assert results[0]["entry_id"] == entries[2].entry_id
+
+
+class TestRagChat:
+    """Test use_rag on /ai/chat and /ai/chat-stream"""
+
+    def test_chat_returns_sources_and_citations(self, journal, test_client, monkeypatch):
+        _, entries = journal
+        prompts = []
+
+        async def fake_query(request, max_retries=3):
+            prompts.append(request.messages[0].content)
+            return lm_studio.AIResponse(content=f"You planted tomatoes [entry {entries[0].entry_id}].", model="test")
+
+        monkeypatch.setattr(lm_studio, "query_lm_studio", fake_query)
+        response = test_client.post("/ai/chat", json={"message": "What did I plant in the garden?", "use_rag": True})
+
+        assert response.status_code == 200
+        body = response.json()
+        assert body["citations"] == [entries[0].entry_id]
+        assert entries[0].entry_id in [item["entry_id"] for item in body["sources"]]
+        assert f"[entry {entries[0].entry_id}]" in prompts[0]
+
+    def test_stream_emits_sources_and_citations(self, journal, test_client, monkeypatch):
+        _, entries = journal
+
+        async def fake_stream(request):
+            yield Token("Tomatoes ")
+            yield Token(f"[entry {entries[1].entry_id}]")
+
+        monkeypatch.setattr(lm_studio, "query_lm_studio_stream", fake_stream)
+        response = test_client.post("/ai/chat-stream", json={"message": "garden tomatoes", "use_rag": True})
+
+        events = [json.loads(line[6:]) for line in response.text.splitlines() if line.startswith("data: ")]
+        types = [event["type"] for event in events]
+        assert types[0] == "sources"
+        citations = next(event for event in events if event["type"] == "citations")
+        assert citations["entry_ids"] == [entries[1].entry_id]
+        answer = "".join(event["content"] for event in events if event["type"] == "answer")
+        assert answer == f"Tomatoes [entry {entries[1].entry_id}]"
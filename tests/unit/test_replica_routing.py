@@ -0,0 +1,87 @@
+"""
+Unit Tests for read-replica routing
+"""
+
+import asyncio
+import pytest
+
+from app.ai import sql_tool
+from app.ai.sql_tool import SQLTool, is_read_only_query
+from app.database import ReplicaRouter
+
+
+class TestReplicaRouter:
+    """Test the read-your-writes staleness fallback"""
+
+    def test_reads_go_to_primary_right_after_a_write(self):
+        router = ReplicaRouter(window=60)
+        router.record_write(1)
+        assert router.use_primary(1) is True
+        assert router.use_primary(2) is False
+
+    def test_window_expiry_returns_reads_to_replica(self):
+        router = ReplicaRouter(window=0)
+        router.record_write(1)
+        assert router.use_primary(1) is False
+        assert router.get_stats()["tracked_users"] == 0
+        assert router.get_stats()["replica_reads"] == 1
+
+
+class TestReadOnlyQueries:
+    """Test classification of agent SQL for replica routing"""
+
+    @pytest.mark.parametrize("query", [
+        "SELECT * FROM entries",
+        "  with recent AS (SELECT * FROM entries) SELECT count(*) FROM recent;",
+        "SELECT title FROM entries WHERE content LIKE '%update%'",
+        "EXPLAIN SELECT * FROM topics",
+    ])
+    def test_reads(self, query):
+        assert is_read_only_query(query)
+
+    @pytest.mark.parametrize("query", [
+        "UPDATE entries SET title = 'x'",
+        "WITH gone AS (DELETE FROM entries RETURNING *) SELECT * FROM gone",
+        "SELECT * INTO backup FROM entries",
+        "SELECT * FROM entries FOR UPDATE",
+        "SELECT 1; DROP TABLE entries",
+        "SELECT nextval('entries_entry_id_seq')",
+    ])
+    def test_writes(self, query):
+        assert not is_read_only_query(query)
+
+
+class TestSQLToolRouting:
+    """Test that SQLTool sends only read-only queries to the replica"""
+
+    def test_query_url(self):
+        tool = SQLTool("postgresql://primary/db", replica_url="postgresql://replica/db")
+        assert tool._query_url("SELECT 1") == "postgresql://replica/db"
+        assert tool._query_url("DELETE FROM entries") == "postgresql://primary/db"
+
+    def test_reads_right_after_own_write_use_primary(self, monkeypatch):
+        router = ReplicaRouter(window=60)
+        monkeypatch.setattr(sql_tool, "get_replica_router", lambda: router)
+        tool = SQLTool("postgresql://primary/db", replica_url="postgresql://replica/db")
+        router.record_write(1)
+
+        assert tool._query_url("SELECT 1", user_id=1) == "postgresql://primary/db"
+        assert tool._query_url("SELECT 1", user_id=2) == "postgresql://replica/db"
+
+        async def agent_query(user_id):
+            sql_tool.set_query_user(user_id)
+            return tool._query_url("SELECT 1")
+
+        assert asyncio.run(agent_query(1)) == "postgresql://primary/db"
+        assert asyncio.run(agent_query(2)) == "postgresql://replica/db"
+
+    def test_without_replica_everything_uses_primary(self):
+        tool = SQLTool("postgresql://primary/db")
+        assert tool._query_url("SELECT 1") == "postgresql://primary/db"
+
+    def test_schema_catalog_reads_use_primary(self, monkeypatch):
+        tool = SQLTool("postgresql://primary/db", replica_url="postgresql://replica/db")
+        urls = []
+        monkeypatch.setattr(SQLTool, "_run_query", lambda self, query, url=None: urls.append(url) or [])
+        tool._load_schema_tables()
+        assert urls == ["postgresql://primary/db"]
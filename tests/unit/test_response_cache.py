@@ -0,0 +1,145 @@
+"""
+Unit Tests for the AI response cache
+Patches the LM Studio call so no AI server is needed
+"""
+
+import asyncio
+import pytest
+from datetime import date
+from unittest.mock import patch, AsyncMock
+
+from app import models
+from app.ai import lm_studio
+from app.ai import response_cache
+from app.ai.response_cache import ResponseCache, make_cache_key
+
+
+@pytest.fixture
+def fresh_cache(monkeypatch):
+    cache = ResponseCache(max_size=2, ttl=60)
+    monkeypatch.setattr(response_cache, "_response_cache", cache)
+    return cache
+
+
+class TestResponseCache:
+    """Test LRU, TTL, tag invalidation and the SQLite tier"""
+
+    def test_lru_eviction(self, fresh_cache):
+        fresh_cache.set("a", {"answer": "a"})
+        fresh_cache.set("b", {"answer": "b"})
+        fresh_cache.get("a")
+        fresh_cache.set("c", {"answer": "c"})
+
+        assert fresh_cache.get("b") is None
+        assert fresh_cache.get("a") == {"answer": "a"}
+        assert fresh_cache.get_stats()["evictions"] == 1
+
+    def test_expired_entry_is_miss(self):
+        cache = ResponseCache(max_size=2, ttl=-1)
+        cache.set("a", {"answer": "a"})
+
+        assert cache.get("a") is None
+
+    def test_invalidate_tag(self, fresh_cache):
+        fresh_cache.set("a", {"answer": "a"}, tags=["entry:1"])
+        fresh_cache.set("b", {"answer": "b"}, tags=["entry:2"])
+
+        assert response_cache.invalidate_entry(1) == 1
+        assert fresh_cache.get("a") is None
+        assert fresh_cache.get("b") is not None
+
+    def test_sqlite_tier_survives_memory_loss(self, tmp_path):
+        db_path = str(tmp_path / "cache.db")
+        ResponseCache(db_path=db_path).set("a", {"answer": "a"}, tags=["entry:1"])
+
+        cache = ResponseCache(db_path=db_path)
+        assert cache.get("a") == {"answer": "a"}
+        assert cache.get_stats()["disk_hits"] == 1
+
+        cache.invalidate_tag("entry:1")
+        assert ResponseCache(db_path=db_path).get("a") is None
+
+    def test_unused_worker_invalidates_shared_tier(self, tmp_path, monkeypatch):
+        db_path = str(tmp_path / "cache.db")
+        ResponseCache(db_path=db_path).set("a", {"answer": "a"}, tags=["entry:1"])
+        monkeypatch.setattr(response_cache, "_response_cache", None)
+        monkeypatch.setattr(response_cache, "ResponseCache", lambda: ResponseCache(db_path=db_path))
+
+        assert response_cache.invalidate_entry(1) == 1
+        assert ResponseCache(db_path=db_path).get("a") is None
+
+    def test_entry_edit_invalidates_without_api_router(self, fresh_cache, db_session):
+        user = models.User(username="cacheuser", email="cache@example.com", password_hash="x")
+        db_session.add(user)
+        db_session.commit()
+        topic = models.Topic(user_id=user.user_id, topic_name="Cache")
+        db_session.add(topic)
+        db_session.commit()
+        entry = models.Entry(user_id=user.user_id, topic_id=topic.topic_id, title="Entry",
+                             content="Some content", entry_date=date.today())
+        db_session.add(entry)
+        db_session.commit()
+        fresh_cache.set("a", {"answer": "a"}, tags=[f"entry:{entry.entry_id}"])
+
+        entry.title = "Edited"
+        db_session.commit()
+
+        assert fresh_cache.get("a") is None
+
+    def test_similar_content_within_scope(self, fresh_cache):
+        fresh_cache.set("a", {"answer": "a"}, scope="s1", vector=[1.0, 0.0])
+
+        assert fresh_cache.get_similar("s1", [0.96, 0.28], threshold=0.95) == {"answer": "a"}
+        assert fresh_cache.get_similar("s1", [0.6, 0.8], threshold=0.95) is None
+        assert fresh_cache.get_similar("s2", [1.0, 0.0], threshold=0.95) is None
+        assert fresh_cache.get_stats()["semantic_hits"] == 1
+
+        fresh_cache.invalidate_tag("unrelated")
+        fresh_cache.set("b", {"answer": "b"})
+        fresh_cache.set("c", {"answer": "c"})
+        # Evicted entries leave the similarity index too
+        assert fresh_cache.get_similar("s1", [1.0, 0.0], threshold=0.95) is None
+
+    def test_key_depends_on_generation_parameters(self):
+        base = make_cache_key("sys", "content", "model", 0.7, 800)
+
+        assert base == make_cache_key("sys", "content", "model", 0.7, 800)
+        assert base != make_cache_key("sys", "content", "model", 0.3, 800)
+        assert base != make_cache_key("sys", "content", "other", 0.7, 800)
+
+
+class TestProcessAIRequestCaching:
+    """Test cache integration around process_ai_request"""
+
+    def test_second_call_served_from_cache(self, fresh_cache):
+        reply = lm_studio.AIResponse(content="<think>hmm</think>Answer", model="m")
+        with patch.object(lm_studio, "query_lm_studio", AsyncMock(return_value=reply)) as mock_query:
+            first = asyncio.run(lm_studio.process_ai_request("text", "sys", model="m"))
+            second = asyncio.run(lm_studio.process_ai_request("text", "sys", model="m"))
+
+        assert mock_query.await_count == 1
+        assert first == second
+        assert second["answer"] == "Answer"
+
+    def test_near_identical_content_served_from_semantic_tier(self, fresh_cache, monkeypatch):
+        from app.ai import embeddings
+        monkeypatch.setattr(embeddings, "EMBEDDING_PROVIDER", "hashing")
+        monkeypatch.setattr(lm_studio, "AI_RESPONSE_CACHE_SEMANTIC_THRESHOLD", 0.9)
+        text = "Long walk by the river this morning, felt calm and rested after a good night of sleep"
+        reply = lm_studio.AIResponse(content="Answer", model="m")
+        with patch.object(lm_studio, "query_lm_studio", AsyncMock(return_value=reply)) as mock_query:
+            first = asyncio.run(lm_studio.process_ai_request(text, "sys", model="m"))
+            second = asyncio.run(lm_studio.process_ai_request(text + ".", "sys", model="m"))
+            asyncio.run(lm_studio.process_ai_request(text + ".", "other sys", model="m"))
+
+        assert first == second
+        assert mock_query.await_count == 2
+        assert fresh_cache.get_stats()["semantic_hits"] == 1
+
+    def test_errors_are_not_cached(self, fresh_cache):
+        with patch.object(lm_studio, "query_lm_studio", AsyncMock(side_effect=RuntimeError("down"))) as mock_query:
+            asyncio.run(lm_studio.process_ai_request("text", "sys", model="m"))
+            asyncio.run(lm_studio.process_ai_request("text", "sys", model="m"))
+
+        assert mock_query.await_count == 2
+        assert fresh_cache.get_stats()["size"] == 0
@@ -0,0 +1,111 @@
+"""
+Unit Tests for the SQLTool schema snapshot cache
+Uses a stub tool so no PostgreSQL connection is needed
+"""
+
+from app import models
+from app.ai import sql_tool
+from app.ai.sql_tool import _SchemaCache, SQLTool
+from app.api import ai
+from app.api.auth import get_current_active_user
+from app.main import app
+
+
+class StubSchemaTool:
+    """Minimal stand-in exposing the hooks _SchemaCache relies on"""
+
+    def __init__(self, db_url="postgresql://stub/db"):
+        self._db_url = db_url
+        self.fingerprint = "v1"
+        self.fingerprint_calls = 0
+        self.load_calls = 0
+
+    def _get_schema_fingerprint(self):
+        self.fingerprint_calls += 1
+        return self.fingerprint
+
+    def _load_schema_tables(self):
+        self.load_calls += 1
+        return [{
+            "table_name": "entries",
+            "columns": [{"column_name": "entry_id", "data_type": "integer", "is_nullable": "NO", "column_default": None}],
+            "primary_keys": ["entry_id"],
+            "foreign_keys": []
+        }]
+
+    def _format_schema_as_text(self, tables):
+        return SQLTool._format_schema_as_text(self, tables)
+
+
+class TestSchemaCache:
+    """Test schema snapshot reuse and invalidation"""
+
+    def test_snapshot_reused_within_check_interval(self, monkeypatch):
+        monkeypatch.setattr(sql_tool, "SCHEMA_CACHE_CHECK_INTERVAL", 3600)
+        cache = _SchemaCache()
+        tool = StubSchemaTool()
+
+        first = cache.get_snapshot(tool)
+        second = cache.get_snapshot(tool)
+
+        assert first is second
+        assert tool.load_calls == 1
+        assert "Table: entries" in first["schema"]
+        assert "entry_id: integer (PK)" in first["schema"]
+
+    def test_unchanged_fingerprint_skips_rebuild(self, monkeypatch):
+        monkeypatch.setattr(sql_tool, "SCHEMA_CACHE_CHECK_INTERVAL", 0)
+        cache = _SchemaCache()
+        tool = StubSchemaTool()
+
+        cache.get_snapshot(tool)
+        cache.get_snapshot(tool)
+
+        assert tool.load_calls == 1
+        assert cache.get_stats()["validations"] == 1
+
+    def test_changed_fingerprint_rebuilds(self, monkeypatch):
+        monkeypatch.setattr(sql_tool, "SCHEMA_CACHE_CHECK_INTERVAL", 0)
+        cache = _SchemaCache()
+        tool = StubSchemaTool()
+
+        cache.get_snapshot(tool)
+        tool.fingerprint = "v2"
+        snapshot = cache.get_snapshot(tool)
+
+        assert tool.load_calls == 2
+        assert snapshot["version"] == "v2"
+
+    def test_invalidate_forces_rebuild(self, monkeypatch):
+        monkeypatch.setattr(sql_tool, "SCHEMA_CACHE_CHECK_INTERVAL", 3600)
+        cache = _SchemaCache()
+        tool = StubSchemaTool()
+
+        cache.get_snapshot(tool)
+        cache.invalidate(tool._db_url)
+        cache.get_snapshot(tool)
+
+        assert tool.load_calls == 2
+        assert cache.get_stats()["builds"] == 2
+
+
+class TestSchemaRefreshEndpoint:
+    """Test that only allow-listed users can rebuild the snapshot"""
+
+    def test_requires_allow_listed_user(self, test_client, monkeypatch):
+        class StubTool:
+            def get_database_schema(self, force_refresh=False):
+                return {"success": True, "version": "v2", "tables": []}
+
+        monkeypatch.setenv("DATABASE_URL", "postgresql://stub/db")
+        monkeypatch.setattr(sql_tool, "get_sql_tool", lambda url: StubTool())
+        app.dependency_overrides[get_current_active_user] = lambda: models.User(user_id=1, username="admin")
+        try:
+            assert test_client.post("/ai/schema/refresh").status_code == 403
+
+            monkeypatch.setattr(ai, "SCHEMA_REFRESH_USERS", frozenset({"admin"}))
+            response = test_client.post("/ai/schema/refresh")
+            assert response.status_code == 200
+            assert response.json()["version"] == "v2"
+        finally:
+            del app.dependency_overrides[get_current_active_user]
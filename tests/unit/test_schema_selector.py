@@ -0,0 +1,84 @@
+"""
+Unit Tests for relevant-table schema selection
+Uses schema snapshot tables shaped like SQLTool's, so no PostgreSQL connection is needed
+"""
+
+from app.ai import prompt_budget, schema_selector
+
+
+def table(name, columns, foreign_keys=()):
+    return {
+        "table_name": name,
+        "columns": [
+            {"column_name": column, "data_type": "integer", "is_nullable": "NO", "column_default": None}
+            for column in columns
+        ],
+        "primary_keys": [columns[0]],
+        "foreign_keys": [
+            {"column_name": column, "foreign_table": target, "foreign_column": column}
+            for column, target in foreign_keys
+        ]
+    }
+
+
+TABLES = [
+    table("users", ["user_id", "username", "email"]),
+    table("topics", ["topic_id", "user_id", "topic_name"], [("user_id", "users")]),
+    table("entries", ["entry_id", "user_id", "topic_id", "title", "mood"], [("user_id", "users"), ("topic_id", "topics")]),
+    table("tags", ["tag_id", "name"]),
+    table("entry_tags", ["entry_id", "tag_id"], [("entry_id", "entries"), ("tag_id", "tags")]),
+    table("files", ["file_id", "entry_id", "file_path"], [("entry_id", "entries")]),
+    table("links", ["link_id", "entry_id", "url"], [("entry_id", "entries")]),
+    table("ai_analyses", ["analysis_id", "entry_id", "sentiment"], [("entry_id", "entries")]),
+]
+
+
+class TestSelectTables:
+    """Test scoring and foreign key closure"""
+
+    def test_small_schema_is_kept_whole(self):
+        assert schema_selector.select_tables(TABLES[:3], "anything", max_tables=6) == ["users", "topics", "entries"]
+
+    def test_matching_tables_come_first_with_referenced_tables(self):
+        selected = schema_selector.select_tables(TABLES, "Average mood of my entries", max_tables=4)
+        assert selected == ["entries", "users", "topics"]
+
+    def test_link_table_between_selected_tables_is_added(self):
+        selected = schema_selector.select_tables(TABLES, "Which tags are on entries about work?", max_tables=6)
+        assert selected[:2] == ["entries", "tags"]
+        assert "entry_tags" in selected
+
+    def test_column_names_match(self):
+        selected = schema_selector.select_tables(TABLES, "urls I saved", max_tables=3)
+        assert selected[0] == "links"
+
+    def test_cap_is_respected(self):
+        selected = schema_selector.select_tables(TABLES, "entries tags files links users topics", max_tables=3)
+        assert len(selected) == 3
+
+    def test_unmatched_question_uses_most_referenced_tables(self):
+        assert schema_selector.select_tables(TABLES, "hello there", max_tables=2) == ["entries", "users"]
+
+
+class TestRenderSchema:
+    """Test prompt text for the selected tables"""
+
+    def test_other_tables_are_indexed_on_one_line(self):
+        text = schema_selector.select_schema(TABLES, "Average mood of my entries", max_tables=3)
+        assert "Table: entries" in text and "  - mood: integer (nullable: NO)" in text
+        assert "Table: tags" not in text
+        assert text.splitlines()[-1] == (
+            "Other tables (use get_database_schema for details): tags, entry_tags, files, links, ai_analyses"
+        )
+
+    def test_token_budget_moves_tables_to_the_index(self, monkeypatch):
+        monkeypatch.setattr(prompt_budget, "_tokenizer", lambda text: len(text.split()))
+        monkeypatch.setattr(prompt_budget, "_tokenizer_name", "words")
+        text = schema_selector.render_schema(TABLES, ["entries", "users"], budget_tokens=30)
+        assert "Table: entries" in text and "Table: users" not in text
+        assert text.splitlines()[-1].startswith("Other tables (use get_database_schema for details): users,")
+
+    def test_whole_schema_has_no_index(self):
+        text = schema_selector.select_schema(TABLES[:2])
+        assert "Other tables" not in text
+        assert text.startswith("Table: users")
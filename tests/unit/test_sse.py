@@ -0,0 +1,163 @@
+"""
+Unit Tests for the SSE response: framing, token batching and heartbeats
+"""
+
+import asyncio
+import json
+
+from app.api import ai as ai_api
+from app.api.sse import HEARTBEAT_FRAME, EventSourceResponse, encode_event
+
+
+def answer(text):
+    return {"type": "answer", "content": text}
+
+
+def frames(source, **options):
+    async def run():
+        response = EventSourceResponse(source, **options)
+        return [frame async for frame in response.body_iterator]
+    return asyncio.run(run())
+
+
+def payloads(raw_frames):
+    return [json.loads(frame.split(b"data: ", 1)[1]) for frame in raw_frames if b"data: " in frame]
+
+
+class TestEncoding:
+    """Test SSE frame layout"""
+
+    def test_frame_with_id(self):
+        assert encode_event({"type": "answer", "content": "é"}, "7") == (
+            b'id: 7\ndata: {"type":"answer","content":"\xc3\xa9"}\n\n'
+        )
+
+    def test_stream_starts_with_retry_and_numbers_frames(self):
+        async def source():
+            yield {"type": "stats", "tokens_per_second": 2.0}
+            yield {"type": "done", "content": ""}
+
+        raw = frames(source(), retry_ms=1500)
+        assert raw[0] == b"retry: 1500\n\n"
+        assert [frame.split(b"\n", 1)[0] for frame in raw[1:]] == [b"id: 1", b"id: 2"]
+
+
+class TestBatching:
+    """Test merging of tokens that arrive within the window"""
+
+    def test_burst_is_one_frame(self):
+        async def source():
+            for i, text in enumerate(["Hel", "lo", " world"]):
+                yield {**answer(text), "chunk_id": i}
+            yield {"type": "thinking", "content": "hmm"}
+            yield {"type": "done", "content": ""}
+
+        assert payloads(frames(source(), batch_window_ms=50)) == [
+            {"type": "answer", "content": "Hello world", "chunk_id": 2},
+            {"type": "thinking", "content": "hmm"},
+            {"type": "done", "content": ""},
+        ]
+
+    def test_window_expiry_sends_frame(self):
+        async def source():
+            yield answer("a")
+            yield answer("b")
+            await asyncio.sleep(0.05)
+            yield answer("c")
+
+        assert payloads(frames(source(), batch_window_ms=10)) == [answer("ab"), answer("c")]
+
+    def test_payloads_with_extra_fields_are_not_merged(self):
+        async def source():
+            yield answer("a")
+            yield {**answer("result"), "is_real_result": True}
+
+        assert payloads(frames(source(), batch_window_ms=50)) == [answer("a"), {**answer("result"), "is_real_result": True}]
+
+    def test_zero_window_disables_batching(self):
+        async def source():
+            yield answer("a")
+            yield answer("b")
+
+        assert payloads(frames(source(), batch_window_ms=0)) == [answer("a"), answer("b")]
+
+
+class TestHeartbeat:
+    """Test keep-alive comments while the source is quiet"""
+
+    def test_comment_during_long_tool_call(self):
+        async def source():
+            yield answer("calling tool")
+            await asyncio.sleep(0.2)
+            yield answer("done")
+
+        raw = frames(source(), batch_window_ms=0, heartbeat_seconds=0.05)
+        assert HEARTBEAT_FRAME in raw
+        assert payloads(raw) == [answer("calling tool"), answer("done")]
+
+    def test_closing_the_response_closes_the_source(self):
+        closed = []
+
+        async def source():
+            try:
+                yield answer("a")
+                await asyncio.sleep(10)
+            finally:
+                closed.append(True)
+
+        async def run():
+            body = EventSourceResponse(source(), batch_window_ms=0).body_iterator
+            assert await body.__anext__() == b"retry: 3000\n\n"
+            await body.__anext__()
+            await body.aclose()
+
+        asyncio.run(run())
+        assert closed == [True]
+
+
+class TestDisconnect:
+    """Test that a client disconnect stops the work behind a response"""
+
+    def test_disconnect_message_stops_a_quiet_stream(self):
+        closed = []
+        sent = []
+
+        async def source():
+            try:
+                yield answer("a")
+                await asyncio.sleep(10)
+            finally:
+                closed.append(True)
+
+        async def receive():
+            await asyncio.sleep(0.05)
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            sent.append(message)
+
+        async def run():
+            scope = {"type": "http", "asgi": {"spec_version": "2.4"}}
+            await asyncio.wait_for(EventSourceResponse(source(), batch_window_ms=0)(scope, receive, send), 1)
+
+        asyncio.run(run())
+        assert closed == [True]
+        assert sent[0]["type"] == "http.response.start"
+
+    def test_chat_work_is_cancelled_when_client_leaves(self, monkeypatch):
+        monkeypatch.setattr(ai_api, "CHAT_DISCONNECT_POLL_SECONDS", 0.01)
+        cancelled = []
+
+        class GoneRequest:
+            async def is_disconnected(self):
+                return True
+
+        async def generation():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        assert asyncio.run(ai_api._until_disconnected(GoneRequest(), generation())) is None
+        assert cancelled == [True]
@@ -0,0 +1,173 @@
+"""
+Unit Tests for resumable chat streams and Last-Event-ID replay
+"""
+
+import asyncio
+import json
+import pytest
+
+from app import models
+from app.ai import lm_studio
+from app.ai.stream_buffer import ChatStreamRegistry, parse_event_id
+from app.ai.stream_events import Token
+from app.api.auth import get_current_active_user
+from app.main import app
+
+
+def payload(i):
+    return {"type": "answer", "content": str(i)}
+
+
+async def numbers(count, gate=None, runs=None):
+    if runs is not None:
+        runs.append(1)
+    for i in range(1, count + 1):
+        if gate is not None and i == 3:
+            await gate.wait()
+        yield payload(i)
+
+
+class TestChatStream:
+    """Test buffering, replay and eviction"""
+
+    def test_reconnect_replays_and_follows_running_generation(self):
+        async def run():
+            registry = ChatStreamRegistry()
+            gate = asyncio.Event()
+            runs = []
+            stream = registry.start(1, numbers(5, gate, runs))
+
+            # First connection drops after two payloads
+            first = stream.subscribe()
+            received = [await first.__anext__(), await first.__anext__()]
+            await first.aclose()
+            assert stream.subscribers == 0 and not stream.finished
+
+            resumed = registry.resume(stream.stream_id, 1, after_seq=received[-1][0])
+            assert resumed is stream
+            gate.set()
+            received += [item async for item in resumed.subscribe(after_seq=2)]
+            return received, runs, registry.get_stats()
+
+        received, runs, stats = asyncio.run(run())
+        assert received == [(i, payload(i)) for i in range(1, 6)]
+        assert runs == [1]
+        assert stats["resumed"] == 1 and stats["running"] == 0
+
+    def test_only_buffered_positions_of_own_streams_resume(self):
+        async def run():
+            registry = ChatStreamRegistry(max_events=3)
+            stream = registry.start(1, numbers(10))
+            await stream.task
+            return registry, stream
+
+        registry, stream = asyncio.run(run())
+        assert stream.first_seq == 8
+        assert registry.resume(stream.stream_id, 1, after_seq=7) is stream
+        assert registry.resume(stream.stream_id, 1, after_seq=10) is stream
+        assert registry.resume(stream.stream_id, 1, after_seq=6) is None
+        assert registry.resume(stream.stream_id, 2, after_seq=9) is None
+        assert registry.resume("unknown", 1, after_seq=9) is None
+
+    def test_finished_streams_expire(self):
+        async def run():
+            registry = ChatStreamRegistry(ttl=60, max_streams=1)
+            old = registry.start(1, numbers(1))
+            await old.task
+            old.finished_at -= 120
+            kept = registry.start(1, numbers(1))
+            await kept.task
+            newest = registry.start(1, numbers(1))
+            await newest.task
+            return registry, old, kept, newest
+
+        registry, old, kept, newest = asyncio.run(run())
+        assert registry.resume(old.stream_id, 1, 0) is None
+        # Beyond max_streams the oldest finished stream goes first
+        assert registry.resume(kept.stream_id, 1, 0) is None
+        assert registry.resume(newest.stream_id, 1, 0) is newest
+        assert registry.expired == 2
+
+    def test_abandoned_generation_is_cancelled(self):
+        closed = []
+
+        async def endless():
+            try:
+                yield payload(1)
+                await asyncio.sleep(10)
+            finally:
+                closed.append(True)
+
+        async def run():
+            registry = ChatStreamRegistry(resume_grace=0)
+            stream = registry.start(1, endless())
+            subscription = stream.subscribe()
+            await subscription.__anext__()
+            await subscription.aclose()
+            await asyncio.wait({stream.task}, timeout=1)
+            return registry, stream
+
+        registry, stream = asyncio.run(run())
+        assert closed == [True]
+        assert stream.cancelled and stream.finished and registry.abandoned == 1
+        assert registry.resume(stream.stream_id, 1, after_seq=1) is None
+
+    def test_reconnect_within_grace_keeps_generation(self):
+        async def run():
+            registry = ChatStreamRegistry(resume_grace=0.05)
+            gate = asyncio.Event()
+            stream = registry.start(1, numbers(4, gate))
+            first = stream.subscribe()
+            await first.__anext__()
+            await first.aclose()
+            second = registry.resume(stream.stream_id, 1, after_seq=1).subscribe(after_seq=1)
+            received = [await second.__anext__()]
+            await asyncio.sleep(0.1)
+            gate.set()
+            received += [item async for item in second]
+            return registry, stream, received
+
+        registry, stream, received = asyncio.run(run())
+        assert [seq for seq, _ in received] == [2, 3, 4]
+        assert not stream.cancelled and registry.abandoned == 0
+
+    def test_parse_event_id(self):
+        assert parse_event_id("abc-_1:42") == ("abc-_1", 42)
+        assert parse_event_id("42") is None
+        assert parse_event_id("abc:") is None
+        assert parse_event_id(None) is None
+
+
+class TestResumeEndpoint:
+    """Test Last-Event-ID on /ai/chat-stream"""
+
+    @pytest.fixture
+    def user(self):
+        app.dependency_overrides[get_current_active_user] = lambda: models.User(user_id=1, username="stream")
+        yield
+        del app.dependency_overrides[get_current_active_user]
+
+    def test_reconnect_does_not_start_a_new_generation(self, user, test_client, monkeypatch):
+        calls = []
+
+        async def fake_chat(**kwargs):
+            calls.append(kwargs)
+            for text in ["one ", "two ", "three"]:
+                yield Token(text)
+                await asyncio.sleep(0.05)
+
+        monkeypatch.setattr(lm_studio, "chat_with_ai", fake_chat)
+        first = test_client.post("/ai/chat-stream", json={"message": "count"})
+        stream_id = first.headers["X-Stream-Id"]
+        ids = [line[4:] for line in first.text.splitlines() if line.startswith("id: ")]
+        assert ids[0] == f"{stream_id}:1" and len(ids) == 4
+
+        resumed = test_client.post("/ai/chat-stream", json={"message": "count"}, headers={"Last-Event-ID": ids[0]})
+        events = [json.loads(line[6:]) for line in resumed.text.splitlines() if line.startswith("data: ")]
+        assert events[-1]["type"] == "done"
+        assert "".join(event["content"] for event in events if event["type"] == "answer") == "two three"
+        assert len(calls) == 1
+
+    def test_unknown_stream_is_gone(self, user, test_client):
+        response = test_client.post("/ai/chat-stream", json={"message": "count"}, headers={"Last-Event-ID": "nope:3"})
+        assert response.status_code == 410
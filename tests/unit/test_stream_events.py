@@ -0,0 +1,118 @@
+"""
+Unit Tests for typed stream events from the LM Studio streaming query
+Uses a fake OpenAI client, so no LM Studio server is needed
+"""
+
+import asyncio
+import pytest
+from types import SimpleNamespace
+
+from app.ai import lm_studio, prompt_budget
+from app.ai.stream_events import Error, Stats, Thinking, Token
+
+
+def chunk(content=None, reasoning=None, usage=None):
+    choices = []
+    if content is not None or reasoning is not None:
+        delta = SimpleNamespace(content=content)
+        if reasoning is not None:
+            delta.reasoning_content = reasoning
+        choices = [SimpleNamespace(delta=delta)]
+    return SimpleNamespace(choices=choices, usage=usage)
+
+
+class FakeStream:
+    """AsyncStream stand-in that records close()"""
+
+    def __init__(self, chunks, closed):
+        self.chunks = chunks
+        self.closed = closed
+
+    async def __aiter__(self):
+        for item in self.chunks:
+            await asyncio.sleep(0)
+            yield item
+
+    async def close(self):
+        self.closed.append(True)
+
+
+@pytest.fixture
+def server(monkeypatch):
+    calls = []
+
+    def use(chunks):
+        async def create(**kwargs):
+            calls.append(kwargs)
+            return FakeStream(chunks, calls)
+
+        client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+        monkeypatch.setattr(lm_studio, "get_async_openai_client", lambda: client)
+        return calls
+
+    async def model(name=None):
+        return "test-model"
+
+    monkeypatch.setattr(lm_studio, "validate_and_get_model", model)
+    return use
+
+
+def collect(request):
+    async def run():
+        return [event async for event in lm_studio.query_lm_studio_stream(request)]
+    return asyncio.run(run())
+
+
+REQUEST = lm_studio.AIRequest(messages=[lm_studio.AIMessage(role="user", content="hello")])
+
+
+class TestQueryStream:
+    """Test events and usage of query_lm_studio_stream"""
+
+    def test_server_usage_is_reported(self, server):
+        usage = SimpleNamespace(prompt_tokens=17, completion_tokens=3, total_tokens=20)
+        calls = server([chunk(reasoning="hmm"), chunk("Hel"), chunk("lo"), chunk(usage=usage)])
+
+        events = collect(REQUEST)
+
+        assert calls[0]["stream_options"] == {"include_usage": True}
+        assert calls[1:] == [True]
+        assert events[:3] == [Thinking("hmm"), Token("Hel"), Token("lo")]
+        stats = events[-1]
+        assert isinstance(stats, Stats) and len(events) == 4
+        assert (stats.prompt_tokens, stats.completion_tokens, stats.total_tokens) == (17, 3, 20)
+        assert stats.usage_source == "server" and stats.time_to_first_token is not None
+
+    def test_counts_tokens_without_usage_chunk(self, server, monkeypatch):
+        monkeypatch.setattr(prompt_budget, "_tokenizer", lambda text: len(text.split()))
+        monkeypatch.setattr(prompt_budget, "_tokenizer_name", "words")
+        server([chunk("one two "), chunk("three")])
+
+        stats = collect(REQUEST)[-1]
+
+        assert stats.completion_tokens == 3 and stats.usage_source == "words"
+        assert stats.prompt_tokens == prompt_budget.count_message_tokens([{"role": "user", "content": "hello"}])
+
+    def test_failure_is_an_error_event(self, monkeypatch):
+        def broken():
+            raise RuntimeError("offline")
+
+        monkeypatch.setattr(lm_studio, "get_async_openai_client", broken)
+        assert collect(REQUEST) == [Error("offline")]
+
+
+    def test_closing_early_aborts_the_request(self, server, monkeypatch):
+        monkeypatch.setattr(prompt_budget, "_tokenizer", lambda text: len(text.split()))
+        monkeypatch.setattr(lm_studio, "_generation_stats", {"cancelled": 0, "max_tokens_saved": 0})
+        calls = server([chunk(f"t{i} ") for i in range(100)])
+        request = lm_studio.AIRequest(messages=REQUEST.messages, max_tokens=500)
+
+        async def run():
+            events = lm_studio.query_lm_studio_stream(request)
+            assert await events.__anext__() == Token("t0 ")
+            await events.__anext__()
+            await events.aclose()
+
+        asyncio.run(run())
+        assert calls[1:] == [True]
+        assert lm_studio.get_generation_stats() == {"cancelled": 1, "max_tokens_saved": 498}
@@ -0,0 +1,123 @@
+"""
+Unit Tests for the incremental think/answer stream parser
+"""
+
+import json
+import tracemalloc
+import pytest
+
+from app import models
+from app.ai import lm_studio
+from app.ai.stream_events import Error, Stats, Token, ToolEnd, ToolStart
+from app.ai.stream_parser import ChatStreamParser, ThinkTagParser, split_think
+from app.api.auth import get_current_active_user
+from app.main import app
+
+RESPONSE = "Sure. <think>The user wants x < y.</think>\n\nThe answer is <b>42</b>."
+
+
+def chunks_of(text, cuts):
+    bounds = [0, *cuts, len(text)]
+    return [text[start:end] for start, end in zip(bounds, bounds[1:])]
+
+
+class TestThinkTagParser:
+    """Test tag routing across chunk boundaries"""
+
+    def test_every_two_and_three_way_split(self):
+        expected = ("The user wants x < y.", "Sure. The answer is <b>42</b>.")
+        for first in range(1, len(RESPONSE)):
+            assert split_think(chunks_of(RESPONSE, [first])) == expected
+            for second in range(first + 1, len(RESPONSE), 7):
+                assert split_think(chunks_of(RESPONSE, [first, second])) == expected
+
+    def test_single_character_chunks(self):
+        assert split_think(list(RESPONSE)) == ("The user wants x < y.", "Sure. The answer is <b>42</b>.")
+
+    def test_only_a_possible_tag_prefix_is_held_back(self):
+        parser = ThinkTagParser()
+        assert parser.feed("answer </th") == [("answer", "answer </th")]
+        assert parser.feed("<thi") == []
+        assert parser.feed("nk>") == []
+        assert parser.section == "thinking"
+        assert parser.feed("hmm </THINK>done") == [("thinking", "hmm "), ("answer", "done")]
+
+    def test_unclosed_prefix_is_flushed(self):
+        parser = ThinkTagParser()
+        assert parser.feed("a <th") == [("answer", "a ")]
+        assert parser.flush() == [("answer", "<th")]
+
+
+class TestChatStreamParser:
+    """Test routing of typed chat stream events"""
+
+    def test_event_kinds(self):
+        parser = ChatStreamParser()
+        events = []
+        for chunk in [Token("<think>plan"), Token("</think>Hi <"), ToolStart("run_sql"), ToolEnd("x" * 300, tool="run_sql"),
+                      {"error": True, "content": "boom"}, Token('{"type":"stats"}'), Error("late")]:
+            events.extend(parser.feed(chunk))
+        events.extend(parser.close())
+        assert events == [
+            {"type": "thinking", "content": "plan"},
+            {"type": "answer", "content": "Hi "},
+            # Held-back text is released before the tool event to keep the order
+            {"type": "answer", "content": "<"},
+            {"type": "thinking", "event": "tool_start", "tool": "run_sql", "content": "\n🔧 Using tool: run_sql...\n"},
+            {"type": "thinking", "event": "tool_end", "tool": "run_sql", "content": f"📋 Tool result: {'x' * 200}...\n"},
+            {"type": "error", "content": "boom"},
+            # Model text that looks like a control event stays answer text
+            {"type": "answer", "content": '{"type":"stats"}'},
+            {"type": "error", "content": "late"},
+        ]
+
+    def test_memory_is_constant_over_100k_chunks(self):
+        parser = ChatStreamParser()
+        pattern = ["<th", "ink>", "reasoning ", "step </thi", "nk>", "answer token ", "with < and ", "<b>"]
+
+        def stream(count):
+            for i in range(count):
+                for event in parser.feed(Token(pattern[i % len(pattern)])):
+                    assert event["type"] in ("thinking", "answer")
+
+        stream(1000)
+        tracemalloc.start()
+        try:
+            stream(10_000)
+            _, peak_small = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            stream(100_000)
+            current, peak_large = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        # Ten times the chunks must not need more memory: nothing accumulates across chunks
+        assert peak_large < peak_small + 4096
+        assert current < 4096
+        assert len(parser.think._pending) < len("</think>")
+
+
+class TestChatStreamEndpoint:
+    """Test /ai/chat-stream events"""
+
+    @pytest.fixture
+    def user(self):
+        app.dependency_overrides[get_current_active_user] = lambda: models.User(user_id=1, username="stream")
+        yield
+        del app.dependency_overrides[get_current_active_user]
+
+    def test_split_tags_and_stats(self, user, test_client, monkeypatch):
+        async def fake_chat(**kwargs):
+            for chunk in ["<thi", "nk>checking", "</th", "ink>\n\nIt is ", "42"]:
+                yield Token(chunk)
+            yield Stats(inference_time=12, tokens_per_second=3.5, prompt_tokens=20, completion_tokens=6)
+
+        monkeypatch.setattr(lm_studio, "chat_with_ai", fake_chat)
+        response = test_client.post("/ai/chat-stream", json={"message": "question"})
+
+        events = [json.loads(line[6:]) for line in response.text.splitlines() if line.startswith("data: ")]
+        # Tokens arriving together may share a frame
+        assert "".join(event["content"] for event in events if event["type"] == "thinking") == "checking"
+        assert "".join(event["content"] for event in events if event["type"] == "answer") == "It is 42"
+        assert events[-1]["type"] == "done"
+        assert events[-1]["inference_time"] == 12 and events[-1]["tokens_per_second"] == 3.5
+        assert events[-1]["usage"] == {"prompt_tokens": 20, "completion_tokens": 6, "total_tokens": 26, "usage_source": "server"}